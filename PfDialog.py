@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import io
 import logging
 import os
 import subprocess
@@ -411,6 +412,7 @@ class TreeViewer(QWidget):
         self.setLayout(self.layout)
         self.m_app = QApplication.instance()
         self.newick_tree_list = []
+        self.tree_file_index = None
         self.treeobj_hash = {}
         self.bookmarked_newick_tree_list = []
         self.bookmarked_treeobj_hash = {}
@@ -613,6 +615,10 @@ class TreeViewer(QWidget):
         # self.btn_reset.setFixedWidth(80)
         self.buttons_layout.addWidget(self.btn_timetable)
 
+        self.btn_tree_lengths = QPushButton("Show Tree Lengths")
+        self.btn_tree_lengths.clicked.connect(self.on_btn_tree_lengths_clicked)
+        self.buttons_layout.addWidget(self.btn_tree_lengths)
+
         self.btn_bookmark = QPushButton("Add Bookmark")
         self.btn_bookmark.clicked.connect(self.on_btn_bookmark_clicked)
         # self.btn_save.setFixedWidth(80)
@@ -698,8 +704,31 @@ class TreeViewer(QWidget):
         self.timetable_layout.addWidget(self.btn_save_tiemtable)
         self.btn_save_tiemtable.clicked.connect(self.on_btn_save_timetable_clicked)
 
+        """ tree length widget """
+        self.tree_length_widget = QWidget()
+        self.tree_length_widget.setFixedWidth(200)
+        self.tree_length_layout = QVBoxLayout()
+        self.tree_length_widget.setLayout(self.tree_length_layout)
+        self.tree_layout.addWidget(self.tree_length_widget)
+
+        self.tbl_tree_lengths = QTableWidget()
+        self.tbl_tree_lengths.setColumnCount(2)
+        self.tbl_tree_lengths.setHorizontalHeaderLabels(["Tree", "Length"])
+        self.tbl_tree_lengths.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.tbl_tree_lengths.verticalHeader().hide()
+        self.tbl_tree_lengths.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tbl_tree_lengths.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tbl_tree_lengths.setSortingEnabled(True)
+        self.tbl_tree_lengths.sortByColumn(1, Qt.AscendingOrder)
+        self.tbl_tree_lengths.cellClicked.connect(self.on_tbl_tree_lengths_cellClicked)
+        self.tree_length_layout.addWidget(self.tbl_tree_lengths)
+        # parsimony lengths of the trees in the tree file, scored while the table is shown
+        self.tree_lengths = None
+        self.parsimony_scorer = None
+
         self.timetable_widget.hide()
         self.character_list_widget.hide()
+        self.tree_length_widget.hide()
 
         self.tree_label = TreeLabel()
         # self.scroll_area.setWidget(self.tree_label)
@@ -712,6 +741,7 @@ class TreeViewer(QWidget):
         self.tree_list = []
         self.consensus_tree = None
         self.current_tree = None
+        self.current_newick_tree = None
         self.slider = QSlider()
         self.slider.setOrientation(Qt.Horizontal)
         self.slider.setRange(0, 100)
@@ -856,6 +886,58 @@ class TreeViewer(QWidget):
             self.timetable_widget.hide()
             self.btn_timetable.setText("Edit Timetable")
 
+    def on_btn_tree_lengths_clicked(self):
+        if self.tree_length_widget.isHidden():
+            self.tree_length_widget.show()
+            self.btn_tree_lengths.setText("Hide Tree Lengths")
+            self.update_tree_lengths()
+        else:
+            self.tree_length_widget.hide()
+            self.btn_tree_lengths.setText("Show Tree Lengths")
+
+    def update_tree_lengths(self):
+        """List the parsimony length of the trees not yet scored, against the analysis matrix."""
+        if self.tree_length_widget.isHidden() or self.tree_file_index is None:
+            return
+        if self.tree_lengths is None:
+            self.tree_lengths = []
+            self.tbl_tree_lengths.setRowCount(0)
+        n_scored = len(self.tree_lengths)
+        if n_scored >= len(self.tree_file_index):
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if self.parsimony_scorer is None:
+                dm = self.analysis.datamatrix
+                self.parsimony_scorer = pu.ParsimonyScorer(
+                    dm.datamatrix_as_list(), dm.get_taxa_list()
+                )
+            lengths = self.parsimony_scorer.score_file(self.tree_file_index, start=n_scored)
+        except (ValueError, pu.DataParsingError) as e:
+            self.logger.warning(f"Could not score trees of {self.tree_file_index.file_path}: {e}")
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        self.tree_lengths.extend(lengths.tolist())
+        self.tbl_tree_lengths.setSortingEnabled(False)
+        self.tbl_tree_lengths.setRowCount(len(self.tree_lengths))
+        for row in range(n_scored, len(self.tree_lengths)):
+            # numbers as display data sort numerically
+            tree_item = QTableWidgetItem()
+            tree_item.setData(Qt.DisplayRole, row + 1)
+            length_item = QTableWidgetItem()
+            length_item.setData(Qt.DisplayRole, self.tree_lengths[row])
+            self.tbl_tree_lengths.setItem(row, 0, tree_item)
+            self.tbl_tree_lengths.setItem(row, 1, length_item)
+        self.tbl_tree_lengths.setSortingEnabled(True)
+
+    def on_tbl_tree_lengths_cellClicked(self, row, column):
+        if self.tree_type != 1:
+            self.rb_tree_type1.setChecked(True)
+            self.on_rb_tree_type1_clicked()
+        self.slider.setValue(self.tbl_tree_lengths.item(row, 0).data(Qt.DisplayRole) - 1)
+
     def on_combo_font_size_currentIndexChanged(self, index):
         font_size = int(self.combo_font_size.currentText())
         self.tree_label.font_size = font_size
@@ -917,15 +999,7 @@ class TreeViewer(QWidget):
                 tree_to_save.tree_name = (
                     TREE_TYPE_POSTERIOR + " " + str(self.tree_current_index + 1)
                 )
-            string_io = io.StringIO()
-            # Write the tree in Newick format to the text stream
-            Phylo.write(self.current_tree, string_io, "newick")
-            # Get the Newick string from the text stream
-            newick_string = string_io.getvalue()
-            # Close the StringIO object if it's not needed anymore
-            string_io.close()
-
-            tree_to_save.newick_text = newick_string
+            tree_to_save.newick_text = self.current_newick_tree.to_newick()
             tree_options = {}
             tree_options["tree_style"] = self.tree_label.tree_style
             tree_options["align_taxa"] = self.tree_label.align_taxa
@@ -1061,6 +1135,8 @@ class TreeViewer(QWidget):
         # print("treeview update_info", analysis.analysis_name, analysis.analysis_status, analysis.completion_percentage)
         if analysis.completion_percentage == 100:
             self.load_trees()
+        elif analysis.analysis_status == ANALYSIS_STATUS_RUNNING:
+            self.refresh_trees()
 
     def on_rb_tree_type1_clicked(self):
         # print("on_rb_tree_type1_clicked")
@@ -1096,37 +1172,33 @@ class TreeViewer(QWidget):
         self.tree_current_index = value
         self.edt_tree_index.setText(str(self.tree_current_index + 1))
 
-        tree = None
+        newick_tree = None
 
         if self.tree_type == 1:
+            # parsed trees are kept as arrays; Clade objects are built only for the tree shown
             if self.tree_current_index not in self.treeobj_hash.keys():
                 if self.tree_current_index < len(self.newick_tree_list):
-                    tree = Phylo.read(
-                        io.StringIO(self.newick_tree_list[self.tree_current_index - 1]), "newick"
+                    newick_tree = self.tree_file_index.tree(self.tree_current_index)
+                    # TNT numbers taxa from 0, MrBayes from 1
+                    newick_tree.translate(
+                        self.analysis.datamatrix.get_taxa_list(),
+                        first_number=0 if self.tree_file_index.file_type == "tre" else 1,
                     )
-                    self.treeobj_hash[self.tree_current_index] = tree
-                    for clade in tree.find_clades():
-                        if clade.name:
-                            try:
-                                taxon_index = int(clade.name) - 1
-                                taxa_list = self.analysis.datamatrix.get_taxa_list()
-                                clade.name = taxa_list[taxon_index]
-                            except (ValueError, IndexError):
-                                pass
+                    self.treeobj_hash[self.tree_current_index] = newick_tree
                     if self.analysis and self.analysis.analysis_type == ANALYSIS_TYPE_PARSIMONY:
                         self.combo_tree_style.setCurrentIndex(0)
                     else:
                         self.combo_tree_style.setCurrentIndex(1)
             else:
-                tree = self.treeobj_hash[self.tree_current_index]
+                newick_tree = self.treeobj_hash[self.tree_current_index]
         elif self.tree_type == 2:
             if self.tree_current_index < len(self.bookmarked_newick_tree_list):
                 # self.stored_tree_list = PfTree.select().where(PfTree.analysis == self.analysis)
                 # self.stored_newick_tree_list = [tree.newick_text for tree in self.stored_tree_list]
                 # print("tree_current_index:", self.tree_current_index, len(self.bookmarked_newick_tree_list),self.bookmarked_treeobj_hash.keys())
                 treeobj = self.bookmarked_treeobj_hash[self.tree_current_index]
-                tree = Phylo.read(
-                    io.StringIO(self.bookmarked_newick_tree_list[self.tree_current_index]), "newick"
+                newick_tree = pu.NewickTree.parse(
+                    self.bookmarked_newick_tree_list[self.tree_current_index]
                 )
                 tree_options = treeobj.get_tree_options()
                 # self.cbx_apply_branch_length.setChecked(tree_options['apply_branch_length'])
@@ -1144,11 +1216,13 @@ class TreeViewer(QWidget):
                 self.edt_tree_name.setText(treeobj.tree_name)
                 self.edt_node_minimum_offset.setText(str(tree_options["node_minimum_offset"]))
 
-        if tree is None:
-            self.tree_label.set_tree(tree)
+        if newick_tree is None:
+            self.tree_label.set_tree(None)
             # self.tree_label.clear()
             self.tree_label.repaint()
             return
+        tree = newick_tree.to_phylo()
+        self.current_newick_tree = newick_tree
         self.current_tree = tree
         # print("selection changed. tree:", tree)
         # self.edt_tree_width.setText(str(self.tree_label.width()))
@@ -1248,37 +1322,55 @@ class TreeViewer(QWidget):
         self.tree_label.character_index_list = self.character_model.get_selected_indices()
         self.tree_label.repaint()
 
-    def load_trees(self):
-        # print("load trees")
+    def get_tree_file(self):
+        """Get the (filename, file_type) of the trees of the analysis, or None."""
         tree_dir = self.analysis.result_directory
-        if not os.path.exists(tree_dir):
-            return
-
         if self.analysis.analysis_type == ANALYSIS_TYPE_ML:
-            tf = pu.PhyloTreefile()
             filename = os.path.join(
                 tree_dir,
                 self.analysis.datamatrix.datamatrix_name.replace(" ", "_") + ".phy.boottrees",
             )
             # print("ML tree filename:", filename)
-            tf.readtree(filename, "treefile")
-            self.newick_tree_list = tf.tree_list
-            # print("tree list:", self.newick_tree_list)
+            file_type = "treefile"
 
         elif self.analysis.analysis_type == ANALYSIS_TYPE_PARSIMONY:
-            tf = pu.PhyloTreefile()
-            tf.readtree(os.path.join(tree_dir, "tmp.tre"), "tre")
-            self.newick_tree_list = tf.tree_list
+            filename = os.path.join(tree_dir, "tmp.tre")
+            file_type = "tre"
 
         elif self.analysis.analysis_type == ANALYSIS_TYPE_BAYESIAN:
-            tf = pu.PhyloTreefile()
-            tf.readtree(
-                os.path.join(
-                    tree_dir, self.analysis.datamatrix.datamatrix_name.replace(" ", "_") + ".nex.t"
-                ),
-                "Nexus",
+            filename = os.path.join(
+                tree_dir, self.analysis.datamatrix.datamatrix_name.replace(" ", "_") + ".nex.t"
             )
-            self.newick_tree_list = tf.tree_list
+            file_type = "Nexus"
+
+        else:
+            return None
+        return filename, file_type
+
+    def load_trees(self):
+        # print("load trees")
+        tree_dir = self.analysis.result_directory
+        if not os.path.exists(tree_dir):
+            return
+
+        tree_file = self.get_tree_file()
+        if tree_file is None:
+            return
+        filename, file_type = tree_file
+
+        # trees are read from the mapped file as they are shown
+        if self.tree_file_index is not None:
+            self.tree_file_index.close()
+            self.tree_file_index = None
+        self.treeobj_hash = {}
+        self.tree_lengths = None
+        self.parsimony_scorer = None
+        try:
+            self.tree_file_index = pu.TreeFileIndex(filename, file_type)
+            self.newick_tree_list = self.tree_file_index
+        except OSError as e:
+            self.logger.warning(f"Could not read trees from {filename}: {e}")
+            self.newick_tree_list = []
 
         self.slider.setRange(0, len(self.newick_tree_list) - 1)
         self.slider.setValue(0)
@@ -1289,6 +1381,7 @@ class TreeViewer(QWidget):
         self.on_slider_valueChanged(0)
         self.edt_tree_name.hide()
         self.lbl_tree_name.hide()
+        self.update_tree_lengths()
 
         self.bookmarked_tree_list = PfTree.select().where(PfTree.analysis == self.analysis)
         self.bookmarked_newick_tree_list = [tree.newick_text for tree in self.bookmarked_tree_list]
@@ -1297,6 +1390,55 @@ class TreeViewer(QWidget):
         # for tree in stored_tree_list:
         #    self.add_stored_tree(tree.newick_text)
 
+    def refresh_trees(self):
+        """Show the trees appended to the tree file of a running analysis.
+
+        Only the newly written trees are indexed, and the tree being shown
+        stays selected.
+        """
+        tree_file = self.get_tree_file()
+        if tree_file is None:
+            return
+        filename, _file_type = tree_file
+        if self.tree_file_index is None or self.tree_file_index.file_path != Path(filename):
+            # the first trees of the analysis
+            if os.path.exists(filename):
+                self.load_trees()
+            return
+
+        generation = self.tree_file_index.generation
+        try:
+            added = self.tree_file_index.refresh()
+        except OSError as e:
+            self.logger.warning(f"Could not read trees from {filename}: {e}")
+            return
+        rewritten = self.tree_file_index.generation != generation
+        if not added and not rewritten:
+            return
+        if rewritten:
+            # the file was written again from the start, possibly with no trees yet
+            self.treeobj_hash = {}
+            self.tree_lengths = None
+        self.update_tree_lengths()
+        if self.tree_type == 1:
+            self.slider.setRange(0, len(self.newick_tree_list) - 1)
+            self.lbl_total_trees.setText("/" + str(len(self.newick_tree_list)))
+            if rewritten:
+                self.on_slider_valueChanged(self.slider.value())
+
+    def update_cells(self, datamatrix, edits):
+        """Follow cell edits saved to the datamatrix of the analysis.
+
+        Args:
+            datamatrix: The edited PfDatamatrix.
+            edits: (row_index, col_index, value) tuples of the edited cells.
+        """
+        self.analysis.datamatrix = datamatrix
+        self.parsimony_scorer = None
+        self.tree_lengths = None
+        self.update_tree_lengths()
+        self.tree_label.update_cells(edits)
+
     def set_tree_image(self, tree_image):
         self.tree_label.set_tree_image(tree_image)
 
@@ -1368,6 +1510,13 @@ class TreeLabel(QLabel):
         self.font_size = 10
         self.show_axis = False
         self.character_index_list = []
+        # Fitch reconstruction of the tree shown, kept to follow cell edits
+        self.reconstruction = None
+        # reconstructions from pu.ancestral_state_cache are shared with other trees
+        self.reconstruction_shared = False
+        # content hash of the mapped datamatrix and the version it was computed for
+        self.matrix_hash = None
+        self.matrix_hash_version = None
 
         self.leaf_count = 0
         self.min_clade_depth = 0
@@ -1671,18 +1820,58 @@ class TreeLabel(QLabel):
             self.draw_text(painter, 0, self.leaf_count - 1, "Tree Length: " + str(tree_length))
 
     def map_characters_to_nodes(self):
-        # return
-        pu.reconstruct_ancestral_states(
-            self.tree,
-            self.analysis.datamatrix.datamatrix_as_list(),
-            self.analysis.datamatrix.get_taxa_list(),
-        )
+        # the states stay on the clades, and update_cells() follows cell edits
+        if self.reconstruction is None:
+            datamatrix = self.analysis.datamatrix
+            self.reconstruction = pu.reconstruct_ancestral_states(
+                self.tree,
+                datamatrix.datamatrix_as_list(),
+                datamatrix.get_taxa_list(),
+                cache=pu.ancestral_state_cache,
+                matrix_hash=self.get_matrix_hash(datamatrix),
+            )
+            self.reconstruction_shared = True
 
         clade_depths = {}
         self.calculate_depths(self.tree.root, clade_depths)
         return clade_depths
         # clade_depths = {}
 
+    def update_cells(self, edits):
+        """Update the mapped characters after cell edits of the matrix.
+
+        Only the characters of the edited cells are reconstructed again.
+
+        Args:
+            edits: (row_index, col_index, value) tuples of the edited cells.
+        """
+        if self.reconstruction is None:
+            return
+        if self.reconstruction_shared:
+            # the cached reconstruction still describes the matrix before the edits
+            self.reconstruction = self.reconstruction.copy()
+            self.reconstruction_shared = False
+        for row, col, value in edits:
+            pu.update_ancestral_states(self.tree, self.reconstruction, row, col, value)
+        self.repaint()
+
+    def get_matrix_hash(self, datamatrix):
+        """Get the content hash of a datamatrix, computed once per saved version.
+
+        Args:
+            datamatrix: The PfDatamatrix mapped on the tree.
+
+        Returns:
+            pu.matrix_content_hash() of its taxa and cells.
+        """
+        version = (id(datamatrix), datamatrix.id, datamatrix.modified_at)
+        if self.matrix_hash is None or self.matrix_hash_version != version:
+            self.matrix_hash = pu.matrix_content_hash(
+                datamatrix.get_taxa_list(), None, datamatrix.datamatrix_as_list()
+            )
+            self.matrix_hash_version = version
+        return self.matrix_hash
+
     def calculate_depths(self, node, clade_depths, depth=0):
         clade_depths[node] = depth + len(node.changed_characters)
         for child in node:
@@ -1968,8 +2157,10 @@ class TreeLabel(QLabel):
 
     def set_analysis(self, analysis):
         self.analysis = analysis
+        self.reconstruction = None
 
     def set_tree(self, tree):
+        self.reconstruction = None
         if tree is None:
             # clear label
             self.tree = None
@@ -2288,76 +2479,82 @@ class AnalysisDialog(QDialog):
         if self.cbxBayesian.isChecked():
             analysis_type_list.append(ANALYSIS_TYPE_BAYESIAN)
 
-        for analysis_type in analysis_type_list:
-            analysis = PfAnalysis()
-            # analysis.project = self.parent.selected_project
-            # if analysis.project is None:
-            #    return
-            analysis.datamatrix = self.parent.selected_datamatrix
-            if analysis.datamatrix is None:
-                return
-
-            if analysis_type == ANALYSIS_TYPE_PARSIMONY:
-                analysis.analysis_name = self.edtAnalysisNameParsimony.text()  # .replace(" ", "_")
-                # add current time to the name
-                directory_name = (
-                    analysis.datamatrix.datamatrix_name
-                    + " "
-                    + analysis.analysis_name
-                    + " "
-                    + datetime.datetime.now().strftime("%H%M%S")
-                )
-                # Normalize path for OS-appropriate separators
-                analysis.result_directory = os.path.normpath(
-                    os.path.join(result_directory_base, directory_name.replace(" ", "_"))
-                )  # TNT does not like space in file name
-            elif analysis_type == ANALYSIS_TYPE_ML:
-                analysis.analysis_name = self.edtAnalysisNameML.text()
-                analysis.ml_bootstrap_type = self.cbBootstrapType.currentText()
-                analysis.ml_bootstrap = int(self.edtBootstrapCount.text())
-                directory_name = (
-                    analysis.datamatrix.datamatrix_name
-                    + " "
-                    + analysis.analysis_name
-                    + " "
-                    + datetime.datetime.now().strftime("%H%M%S")
-                )
-                # Normalize path for OS-appropriate separators
-                analysis.result_directory = os.path.normpath(
-                    os.path.join(result_directory_base, directory_name)
-                )
+        # all selected analyses are committed together
+        with bulk_write():
+            snapshot = None
+            for analysis_type in analysis_type_list:
+                analysis = PfAnalysis()
+                # analysis.project = self.parent.selected_project
+                # if analysis.project is None:
+                #    return
+                analysis.datamatrix = self.parent.selected_datamatrix
+                if analysis.datamatrix is None:
+                    return
+
+                if analysis_type == ANALYSIS_TYPE_PARSIMONY:
+                    analysis.analysis_name = (
+                        self.edtAnalysisNameParsimony.text()
+                    )  # .replace(" ", "_")
+                    # add current time to the name
+                    directory_name = (
+                        analysis.datamatrix.datamatrix_name
+                        + " "
+                        + analysis.analysis_name
+                        + " "
+                        + datetime.datetime.now().strftime("%H%M%S")
+                    )
+                    # Normalize path for OS-appropriate separators
+                    analysis.result_directory = os.path.normpath(
+                        os.path.join(result_directory_base, directory_name.replace(" ", "_"))
+                    )  # TNT does not like space in file name
+                elif analysis_type == ANALYSIS_TYPE_ML:
+                    analysis.analysis_name = self.edtAnalysisNameML.text()
+                    analysis.ml_bootstrap_type = self.cbBootstrapType.currentText()
+                    analysis.ml_bootstrap = int(self.edtBootstrapCount.text())
+                    directory_name = (
+                        analysis.datamatrix.datamatrix_name
+                        + " "
+                        + analysis.analysis_name
+                        + " "
+                        + datetime.datetime.now().strftime("%H%M%S")
+                    )
+                    # Normalize path for OS-appropriate separators
+                    analysis.result_directory = os.path.normpath(
+                        os.path.join(result_directory_base, directory_name)
+                    )
 
-            elif analysis_type == ANALYSIS_TYPE_BAYESIAN:
-                analysis.analysis_name = self.edtAnalysisNameBayesian.text()
-                analysis.mcmc_burnin = int(self.edtMCMCBurnin.text())
-                analysis.mcmc_relburnin = self.edtMCMCRelBurnin.isChecked()
-                analysis.mcmc_burninfrac = float(self.edtMCMCBurninFrac.text())
-                analysis.mcmc_ngen = int(self.edtMCMCNGen.text())
-                analysis.mcmc_nst = int(self.edtMCMCNst.text())
-                analysis.mcmc_nrates = self.cbMCMCNRates.currentText()
-                analysis.mcmc_printfreq = int(self.edtPrintFreq.text())
-                analysis.mcmc_samplefreq = int(self.edtSampleFreq.text())
-                analysis.mcmc_nruns = int(self.edtNRuns.text())
-                analysis.mcmc_nchains = int(self.edtNChains.text())
-                directory_name = (
-                    analysis.datamatrix.datamatrix_name
-                    + " "
-                    + analysis.analysis_name
-                    + " "
-                    + datetime.datetime.now().strftime("%H%M%S")
-                )
-                # Normalize path for OS-appropriate separators
-                analysis.result_directory = os.path.normpath(
-                    os.path.join(result_directory_base, directory_name.replace(" ", "_"))
-                )
-                # analysis.result_directory = os.path.join( result_directory_base, directory_name )
+                elif analysis_type == ANALYSIS_TYPE_BAYESIAN:
+                    analysis.analysis_name = self.edtAnalysisNameBayesian.text()
+                    analysis.mcmc_burnin = int(self.edtMCMCBurnin.text())
+                    analysis.mcmc_relburnin = self.edtMCMCRelBurnin.isChecked()
+                    analysis.mcmc_burninfrac = float(self.edtMCMCBurninFrac.text())
+                    analysis.mcmc_ngen = int(self.edtMCMCNGen.text())
+                    analysis.mcmc_nst = int(self.edtMCMCNst.text())
+                    analysis.mcmc_nrates = self.cbMCMCNRates.currentText()
+                    analysis.mcmc_printfreq = int(self.edtPrintFreq.text())
+                    analysis.mcmc_samplefreq = int(self.edtSampleFreq.text())
+                    analysis.mcmc_nruns = int(self.edtNRuns.text())
+                    analysis.mcmc_nchains = int(self.edtNChains.text())
+                    directory_name = (
+                        analysis.datamatrix.datamatrix_name
+                        + " "
+                        + analysis.analysis_name
+                        + " "
+                        + datetime.datetime.now().strftime("%H%M%S")
+                    )
+                    # Normalize path for OS-appropriate separators
+                    analysis.result_directory = os.path.normpath(
+                        os.path.join(result_directory_base, directory_name.replace(" ", "_"))
+                    )
+                    # analysis.result_directory = os.path.join( result_directory_base, directory_name )
 
-            analysis.analysis_status = ANALYSIS_STATUS_READY
-            analysis.analysis_type = analysis_type
-            analysis.taxa_list_json = analysis.datamatrix.taxa_list_json
-            analysis.character_list_json = analysis.datamatrix.character_list_json
-            analysis.datamatrix_json = analysis.datamatrix.datamatrix_json
-            analysis.save()
+                analysis.analysis_status = ANALYSIS_STATUS_READY
+                analysis.analysis_type = analysis_type
+                # analyses launched together share one snapshot of the input matrix
+                if snapshot is None:
+                    snapshot = PfMatrixSnapshot.from_datamatrix(analysis.datamatrix)
+                analysis.snapshot = snapshot
+                analysis.save()
 
         self.accept()
 
@@ -2801,9 +2998,6 @@ class DatamatrixDialog(QDialog):
         elif self.rbCombined.isChecked():
             self.datamatrix.datatype = DATATYPE_COMBINED
 
-        # Load old datamatrix
-        old_datamatrix = self.datamatrix.datamatrix_as_list()
-
         # Collect new taxa with metadata
         new_taxa_list = []
         taxa_metadata = []
@@ -2828,37 +3022,18 @@ class DatamatrixDialog(QDialog):
                 metadata = {"original_name": None, "original_index": None, "is_new": True}
             char_metadata.append(metadata)
 
-        # Create new datamatrix with proper dimensions
-        new_datamatrix = []
-        for new_row_idx in range(len(new_taxa_list)):
-            row = []
-            for new_col_idx in range(len(new_char_list)):
-                # Default value for new cells
-                cell_value = "?"
-
-                # Check if this taxon and character are both from old datamatrix
-                taxon_meta = taxa_metadata[new_row_idx]
-                char_meta = char_metadata[new_col_idx]
-
-                if not taxon_meta["is_new"] and not char_meta["is_new"]:
-                    # Both are existing items, try to copy old value
-                    old_row_idx = taxon_meta["original_index"]
-                    old_col_idx = char_meta["original_index"]
-
-                    if old_row_idx is not None and old_col_idx is not None:
-                        if old_row_idx < len(old_datamatrix):
-                            if old_col_idx < len(old_datamatrix[old_row_idx]):
-                                cell_value = old_datamatrix[old_row_idx][old_col_idx]
-
-                row.append(cell_value)
-            new_datamatrix.append(row)
+        # Rows and columns of the old datamatrix to keep, None for new ones
+        row_sources = [None if meta["is_new"] else meta["original_index"] for meta in taxa_metadata]
+        column_sources = [
+            None if meta["is_new"] else meta["original_index"] for meta in char_metadata
+        ]
 
         # Update datamatrix
         self.datamatrix.taxa_list_json = json.dumps(new_taxa_list)
         self.datamatrix.character_list_json = json.dumps(new_char_list)
         self.datamatrix.n_taxa = len(new_taxa_list)
         self.datamatrix.n_chars = len(new_char_list)
-        self.datamatrix.datamatrix_json = json.dumps(new_datamatrix)
+        self.datamatrix.rearrange(row_sources, column_sources)
 
         # Save
         self.datamatrix.save()
@@ -3222,6 +3397,21 @@ class PreferencesDialog(QDialog):
         self.lang_widget = QWidget()
         self.lang_widget.setLayout(self.lang_layout)
 
+        # the connection keeps its pragmas, so a new profile applies on restart
+        self.comboDatabaseProfile = QComboBox()
+        self.comboDatabaseProfile.addItem(self.tr("Local disk"), "local")
+        self.comboDatabaseProfile.addItem(self.tr("Network drive"), "network")
+        self.comboDatabaseProfile.setCurrentIndex(
+            max(self.comboDatabaseProfile.findData(self.m_app.database_profile), 0)
+        )
+        self.comboDatabaseProfile.currentIndexChanged.connect(self.comboDatabaseProfileIndexChanged)
+        self.lblDatabaseProfile = QLabel(self.tr("Takes effect after restarting PhyloForester"))
+        self.database_profile_layout = QHBoxLayout()
+        self.database_profile_layout.addWidget(self.comboDatabaseProfile)
+        self.database_profile_layout.addWidget(self.lblDatabaseProfile)
+        self.database_profile_widget = QWidget()
+        self.database_profile_widget.setLayout(self.database_profile_layout)
+
         self.btnOkay = QPushButton()
         self.btnOkay.setText("Close")
         self.btnOkay.clicked.connect(self.Okay)
@@ -3236,6 +3426,7 @@ class PreferencesDialog(QDialog):
         self.main_layout.addRow("Toolbar Icon Size", self.gbToolbarIconSize)
         self.main_layout.addRow("Language", self.lang_widget)
         self.main_layout.addRow("Result Path", self.gbResultPath)
+        self.main_layout.addRow("Database Storage", self.database_profile_widget)
         self.main_layout.addRow("Softwares", self.gbSoftwarePaths)
         self.main_layout.addRow("", self.btnOkay)
 
@@ -3271,6 +3462,9 @@ class PreferencesDialog(QDialog):
             self.edtMrBayesPath.setText(mrbayes_path)
             self.m_app.mrbayes_path = Path(mrbayes_path).resolve()
 
+    def comboDatabaseProfileIndexChanged(self, index):
+        self.m_app.database_profile = self.comboDatabaseProfile.itemData(index)
+
     def comboLangIndexChanged(self, index):
         if index == 0:
             self.m_app.language = "en"
@@ -3296,6 +3490,9 @@ class PreferencesDialog(QDialog):
             os.path.normpath(result_value) if result_value else pu.DEFAULT_RESULT_DIRECTORY
         )
         self.m_app.language = self.m_app.settings.value("Language", "en")
+        self.m_app.database_profile = self.m_app.settings.value(
+            "DatabaseProfile", DEFAULT_DATABASE_PROFILE
+        )
 
         # print("toolbar_icon_size:", self.m_app.toolbar_icon_size)
         if self.m_app.toolbar_icon_size.lower() == "small":
@@ -3343,6 +3540,7 @@ class PreferencesDialog(QDialog):
             "ResultPath", os.path.normpath(self.m_app.result_path) if self.m_app.result_path else ""
         )
         self.m_app.settings.setValue("Language", self.m_app.language)
+        self.m_app.settings.setValue("DatabaseProfile", self.m_app.database_profile)
 
         if self.m_app.remember_geometry is True:
             self.m_app.settings.setValue("WindowGeometry/PreferencesDialog", self.geometry())
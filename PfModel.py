@@ -12,10 +12,20 @@ Database Location:
     Default: ~/PaleoBytes/PhyloForester/PhyloForester.db
     Can be customized via setup_database_location()
 
+Connection Tuning:
+    Connections use the SQLite pragmas of a profile in DATABASE_PROFILES
+    ("local" by default: WAL journal, synchronous=NORMAL, larger page
+    cache, memory-mapped reads; "network" for databases on network file
+    systems), selected with use_database_profile(). Use bulk_write() to
+    group many saves into one transaction.
+
 Main Models:
     PfProject: Top-level project container
     PfDatamatrix: Character matrix data storage
+    PfPolymorphicCell: Polymorphic cells of a compactly stored datamatrix
+    PfCellEdit: Journal of edited datamatrix cells
     PfPackage: External analysis software metadata
+    PfMatrixSnapshot: Deduplicated analysis input matrices
     PfAnalysis: Analysis configuration and execution tracking
     PfTree: Phylogenetic tree storage and visualization options
 
@@ -38,15 +48,19 @@ Example:
 from __future__ import annotations
 
 import datetime
+import io
 import json
 import logging
 import os
 
 # from MdUtils import *
-from collections import Counter
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
 
 from Bio import Phylo
 from peewee import *
+from peewee import FieldAccessor
 
 import PfUtils as pu
 
@@ -80,24 +94,263 @@ TREE_TYPE_MPT: str = "MPT"
 
 LINE_SEPARATOR: str = "\n"
 
+# pending cell edits folded into the stored matrix by record_cell_edits()
+CELL_EDIT_COMPACT_THRESHOLD: int = 256
+
+# write buffer of exported data files, in bytes
+MATRIX_EXPORT_BUFFER_SIZE: int = 1 << 20
+
+# SQLite pragmas applied to every connection, by storage profile
+DATABASE_PROFILES: dict[str, dict] = {
+    # local disks: WAL lets readers run during writes and only syncs at
+    # checkpoints, so a commit costs one append instead of a full fsync
+    "local": {
+        "foreign_keys": 1,
+        "journal_mode": "wal",
+        "synchronous": 1,  # NORMAL
+        "cache_size": -64 * 1024,  # 64 MiB
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": 2,  # MEMORY
+    },
+    # network file systems lack the shared memory WAL needs
+    "network": {
+        "foreign_keys": 1,
+        "journal_mode": "truncate",
+        "synchronous": 1,  # NORMAL
+        "cache_size": -64 * 1024,
+        "mmap_size": 0,
+        "temp_store": 2,
+    },
+}
+DEFAULT_DATABASE_PROFILE: str = "local"
+
+
+def database_pragmas(profile: str = DEFAULT_DATABASE_PROFILE, **overrides) -> dict:
+    """Get the SQLite pragmas of a database profile.
+
+    Args:
+        profile: Key of DATABASE_PROFILES.
+        **overrides: Pragma values replacing those of the profile.
+
+    Returns:
+        Dictionary of pragma names and values.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile not in DATABASE_PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}")
+    pragmas = dict(DATABASE_PROFILES[profile])
+    pragmas.update(overrides)
+    return pragmas
+
+
 database_path: str = os.path.join(pu.DEFAULT_DB_DIRECTORY, "PhyloForester.db")
 
-gDatabase: SqliteDatabase = SqliteDatabase(database_path, pragmas={"foreign_keys": 1})
+gDatabase: SqliteDatabase = SqliteDatabase(database_path, pragmas=database_pragmas())
 
 
-def setup_database_location(database_dir: str) -> SqliteDatabase:
+def setup_database_location(
+    database_dir: str, profile: str = DEFAULT_DATABASE_PROFILE, **overrides
+) -> SqliteDatabase:
     """Set up database location.
 
     Args:
         database_dir: Directory path for database
+        profile: Key of DATABASE_PROFILES selecting the connection pragmas.
+        **overrides: Pragma values replacing those of the profile.
 
     Returns:
         Database handle
     """
-    database_handle: SqliteDatabase = SqliteDatabase(database_path, pragmas={"foreign_keys": 1})
+    database_handle: SqliteDatabase = SqliteDatabase(
+        os.path.join(database_dir, "PhyloForester.db"),
+        pragmas=database_pragmas(profile, **overrides),
+    )
     return database_handle
 
 
+def use_database_profile(profile: str = DEFAULT_DATABASE_PROFILE, **overrides) -> None:
+    """Switch the application database to the pragmas of a profile.
+
+    gDatabase is initialized again in place, so the models stay bound to
+    it. An open connection is closed; the pragmas apply from the next one.
+
+    Args:
+        profile: Key of DATABASE_PROFILES.
+        **overrides: Pragma values replacing those of the profile.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    pragmas = database_pragmas(profile, **overrides)
+    if not gDatabase.is_closed():
+        gDatabase.close()
+    gDatabase.init(database_path, pragmas=pragmas)
+
+
+@contextmanager
+def bulk_write(database: Database | None = None):
+    """Group many model saves into a single transaction.
+
+    Each save() outside a transaction commits, and syncs, on its own.
+    Inside bulk_write() the saves are committed together when the block
+    exits, or rolled back together if it raises. Blocks may be nested; an
+    inner block becomes a savepoint of the outer one.
+
+    Args:
+        database: Database to write to. Defaults to the one the models are
+            bound to.
+
+    Yields:
+        The transaction (or savepoint) object.
+
+    Example:
+        Marking many analyses in one commit::
+
+            with bulk_write():
+                for analysis in analyses:
+                    analysis.analysis_status = ANALYSIS_STATUS_FAILED
+                    analysis.save()
+    """
+    if database is None:
+        database = PfProject._meta.database
+    with database.atomic() as transaction:
+        yield transaction
+
+
+class DeferredFieldAccessor(FieldAccessor):
+    """Field accessor that fetches deferred columns on first access.
+
+    Instances selected with select_summary() do not carry the heavy
+    columns. Reading any of them loads all missing deferred columns of the
+    instance in a single query.
+    """
+
+    def __get__(self, instance, instance_type=None):
+        if instance is not None and self.name not in instance.__data__:
+            instance.load_deferred_fields()
+        return super().__get__(instance, instance_type)
+
+
+def deferred(field: Field) -> Field:
+    """Mark a field as deferred so that select_summary() leaves it out.
+
+    Args:
+        field: Field to mark.
+
+    Returns:
+        The same field, using DeferredFieldAccessor.
+    """
+    field.accessor_class = DeferredFieldAccessor
+    return field
+
+
+class DeferredFieldsMixin:
+    """Lightweight metadata projections for models with heavy columns.
+
+    Models mark large text/blob fields with deferred(). select_summary()
+    selects everything else, and the deferred columns are fetched on demand
+    when first read, so listing many rows only costs their metadata.
+
+    Example:
+        Listing datamatrices without loading their matrices::
+
+            for dm in PfDatamatrix.select_summary().where(PfDatamatrix.project == project):
+                print(dm.datamatrix_name)  # no matrix data loaded
+            dm.datamatrix_as_list()  # fetches the deferred columns
+    """
+
+    @classmethod
+    def deferred_fields(cls) -> list[Field]:
+        """Get the fields marked with deferred()."""
+        return [
+            field
+            for field in cls._meta.sorted_fields
+            if field.accessor_class is DeferredFieldAccessor
+        ]
+
+    @classmethod
+    def select_summary(cls) -> ModelSelect:
+        """Select all columns except the deferred ones."""
+        return cls.select(
+            *[
+                field
+                for field in cls._meta.sorted_fields
+                if field.accessor_class is not DeferredFieldAccessor
+            ]
+        )
+
+    def load_deferred_fields(self) -> None:
+        """Fetch deferred columns that have not been loaded or assigned yet."""
+        missing = [field for field in self.deferred_fields() if field.name not in self.__data__]
+        if not missing or self.get_id() is None:
+            return
+        model = type(self)
+        row = model.select(*missing).where(model._meta.primary_key == self.get_id()).dicts().first()
+        for field in missing:
+            self.__data__[field.name] = row.get(field.name) if row else None
+
+
+class ParsedValueCache:
+    """Bounded process-wide cache of parsed datamatrix values.
+
+    Entries are keyed by (datamatrix id, modified_at, value name). Since
+    PfDatamatrix.save() bumps modified_at whenever a parsed column changes,
+    a key always refers to one version of the data and entries never need
+    explicit invalidation; old versions simply age out of the LRU order.
+
+    Hits and misses of the per-instance caches are counted here as well, so
+    stats() describes all parsing done through PfDatamatrix getters.
+
+    Attributes:
+        max_entries: Maximum number of cached values.
+        hits: Number of lookups answered without parsing.
+        misses: Number of lookups that had to parse.
+    """
+
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def lookup(self, key):
+        """Get a cached value.
+
+        Returns:
+            Tuple of (found, value).
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return True, self._entries[key]
+        return False, None
+
+    def store(self, key, value) -> None:
+        """Cache a value, evicting the least recently used beyond max_entries."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Get cache counters.
+
+        Returns:
+            Dictionary with hits, misses and entries (current size).
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+parsed_value_cache: ParsedValueCache = ParsedValueCache()
+
+
 class PfProject(Model):
     """Project model representing a phylogenetic analysis project.
 
@@ -134,6 +387,41 @@ class PfProject(Model):
     class Meta:
         database = gDatabase
 
+    @classmethod
+    def select_hierarchy(cls) -> list[PfProject]:
+        """Load all projects with their datamatrices and analyses.
+
+        Runs one query per level regardless of the number of rows, and
+        fills project.datamatrices and datamatrix.analyses with lists of
+        metadata-only instances (see DeferredFieldsMixin.select_summary()).
+
+        Returns:
+            List of projects, ordered by id.
+        """
+        return prefetch(
+            cls.select().order_by(cls.id),
+            PfDatamatrix.select_summary().order_by(PfDatamatrix.id),
+            PfAnalysis.select_summary().order_by(PfAnalysis.id),
+        )
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the project and collect snapshots orphaned by the cascade.
+
+        Overlay copies of its datamatrices in other projects are materialized
+        first.
+        """
+        with self._meta.database.atomic():
+            own_datamatrices = PfDatamatrix.select(PfDatamatrix.id).where(
+                PfDatamatrix.project == self.id
+            )
+            for datamatrix in PfDatamatrix.select_overlays().where(
+                PfDatamatrix.parent.in_(own_datamatrices) & (PfDatamatrix.project != self.id)
+            ):
+                datamatrix.materialize()
+            ret = super().delete_instance(*args, **kwargs)
+            PfMatrixSnapshot.collect_garbage()
+        return ret
+
     def get_taxa_list(self) -> list[str]:
         """Get list of taxa names.
 
@@ -145,13 +433,15 @@ class PfProject(Model):
         return []
 
 
-class PfDatamatrix(Model):
+class PfDatamatrix(DeferredFieldsMixin, Model):
     """Datamatrix model storing character matrix data.
 
     Represents a character matrix (alignment) containing taxa and their
-    character states. Stores data as JSON for flexibility with polymorphic
-    characters. Supports importing from various file formats (Nexus, Phylip,
-    TNT) and exporting to standard phylogenetic formats.
+    character states. Cell data is stored as a dense uint8 state-code BLOB
+    with polymorphic cells kept in the PfPolymorphicCell side table, so the
+    row size scales with taxa x characters. Supports importing from various
+    file formats (Nexus, Phylip, TNT) and exporting to standard phylogenetic
+    formats.
 
     The datamatrix is the central data structure for phylogenetic analysis,
     containing the character observations for each taxon. Character states
@@ -168,8 +458,18 @@ class PfDatamatrix(Model):
         taxa_list_json: JSON string of taxon names.
         taxa_timetable_json: JSON string of temporal ranges for taxa.
         character_list_json: JSON string of character names.
-        datamatrix_json: JSON string of the character matrix data.
-        whole_text: Original file content as text.
+        datamatrix_json: Legacy JSON string of the character matrix data.
+            Only used for rows that could not be stored compactly.
+        datamatrix_blob: State codes of the character matrix (see
+            PfUtils.encode_datamatrix).
+        state_alphabet_json: JSON list of states indexed by state code - 1.
+        parent: Datamatrix this one was copied from, if any.
+        parent_edit_id: Last PfCellEdit id of the parent seen by the copy.
+        row_map_json: JSON list of the parent row each row is taken from
+            (null for added rows). None keeps the parent's rows.
+        column_map_json: Same as row_map_json, for characters.
+        whole_text: Original file content as text. Nexus and Phylip files
+            are streamed and not kept.
         created_at: Timestamp when created.
         modified_at: Timestamp of last modification.
 
@@ -183,6 +483,9 @@ class PfDatamatrix(Model):
     Relations:
         analyses: One-to-many relationship to PfAnalysis.
             Cascade deletes when datamatrix is deleted.
+        polymorphic_cells: One-to-many relationship to PfPolymorphicCell.
+            Cascade deletes when datamatrix is deleted.
+        children: One-to-many relationship to copies made with copy().
 
     Example:
         Creating a datamatrix from a file::
@@ -201,8 +504,22 @@ class PfDatamatrix(Model):
             matrix = dm.datamatrix_as_list()
 
     Note:
-        Character states are stored as either strings or lists (for
-        polymorphic characters). The JSON encoding handles both cases.
+        Character states are either strings or lists (for polymorphic
+        characters). Always write cell data through set_datamatrix() and
+        read it through datamatrix_as_list(), or iter_rows() to go through
+        the rows without building the whole matrix.
+
+        get_taxa_list(), get_character_list(), datamatrix_as_list() and
+        get_taxa_timetable() cache their parsed result on the instance and
+        in parsed_value_cache. Assigning a source column or calling save()
+        invalidates the instance cache. The returned lists are shared, so
+        copy them before modifying.
+
+        copy() creates an overlay: a row without cells of its own that is
+        resolved from the parent as of the copy, through row_map_json and
+        column_map_json, plus its own cell edit journal. Overlays are
+        materialized before their parent's cells change or the parent is
+        deleted.
     """
 
     project = ForeignKeyField(PfProject, backref="datamatrices", on_delete="CASCADE")
@@ -212,11 +529,17 @@ class PfDatamatrix(Model):
     datatype = CharField(default=DATATYPE_MORPHOLOGY)
     n_taxa = IntegerField()
     n_chars = IntegerField()
-    taxa_list_json = CharField(null=True)
-    taxa_timetable_json = CharField(null=True)
-    character_list_json = CharField(null=True)
-    datamatrix_json = CharField(null=True)
-    whole_text = CharField(null=True)
+    taxa_list_json = deferred(CharField(null=True))
+    taxa_timetable_json = deferred(CharField(null=True))
+    character_list_json = deferred(CharField(null=True))
+    datamatrix_json = deferred(CharField(null=True))
+    datamatrix_blob = deferred(BlobField(null=True))
+    state_alphabet_json = deferred(CharField(null=True))
+    parent = ForeignKeyField("self", null=True, backref="children", on_delete="SET NULL")
+    parent_edit_id = IntegerField(null=True)
+    row_map_json = deferred(CharField(null=True))
+    column_map_json = deferred(CharField(null=True))
+    whole_text = deferred(CharField(null=True))
     created_at = DateTimeField(default=datetime.datetime.now)
     modified_at = DateTimeField(default=datetime.datetime.now)
 
@@ -225,10 +548,178 @@ class PfDatamatrix(Model):
     characters_list = []
     DEFAULTS = {"gap": "-", "missing": "?", "datatype": "standard"}
     nexus_command_hash = None
+    _pending_polymorphic_cells = None
+
+    # parsed value name -> columns it is parsed from
+    PARSED_VALUE_SOURCES = {
+        "taxa_list": ("taxa_list_json",),
+        "character_list": ("character_list_json", "n_chars"),
+        "datamatrix": (
+            "datamatrix_json",
+            "datamatrix_blob",
+            "state_alphabet_json",
+            "parent",
+            "parent_edit_id",
+            "row_map_json",
+            "column_map_json",
+        ),
+        "taxa_timetable": ("taxa_timetable_json", "n_taxa"),
+    }
 
     class Meta:
         database = gDatabase
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        parsed_values = self.__dict__.get("_parsed_values")
+        if parsed_values:
+            for value_name, sources in self.PARSED_VALUE_SOURCES.items():
+                if name in sources:
+                    parsed_values.pop(value_name, None)
+
+    @classmethod
+    def parse_cache_stats(cls) -> dict:
+        """Get hit/miss counters of the parsed-value cache.
+
+        Returns:
+            Dictionary with hits, misses and entries.
+        """
+        return parsed_value_cache.stats()
+
+    def _get_parsed(self, value_name, parse):
+        """Get a parsed value from the caches, parsing it on a miss.
+
+        Args:
+            value_name: Key of PARSED_VALUE_SOURCES.
+            parse: Callable producing the value from the current columns.
+
+        Returns:
+            The cached or freshly parsed value.
+        """
+        parsed_values = self.__dict__.setdefault("_parsed_values", {})
+        if value_name in parsed_values:
+            parsed_value_cache.hits += 1
+            return parsed_values[value_name]
+
+        # the shared cache only describes saved versions of the row
+        shared_key = None
+        if (
+            self.id is not None
+            and self.modified_at is not None
+            and not self._dirty.intersection(self.PARSED_VALUE_SOURCES[value_name])
+            and (value_name != "datamatrix" or self._pending_polymorphic_cells is None)
+        ):
+            shared_key = (self.id, self.modified_at, value_name)
+            found, value = parsed_value_cache.lookup(shared_key)
+            if found:
+                parsed_value_cache.hits += 1
+                parsed_values[value_name] = value
+                return value
+
+        parsed_value_cache.misses += 1
+        value = parse()
+        parsed_values[value_name] = value
+        if shared_key is not None:
+            parsed_value_cache.store(shared_key, value)
+        return value
+
+    def save(self, *args, **kwargs):
+        """Save the datamatrix and any polymorphic cells set since the last save.
+
+        The row and its PfPolymorphicCell entries are written in a single
+        transaction so the side table never gets out of step with the BLOB.
+        Replacing the matrix also marks pending PfCellEdit entries as
+        compacted, and materializes overlay copies of the old matrix first.
+        modified_at is bumped when a parsed column changed, and the instance's
+        parsed-value cache is cleared.
+
+        Returns:
+            Number of rows modified, as returned by Model.save().
+        """
+        parsed_sources = {
+            name for sources in self.PARSED_VALUE_SOURCES.values() for name in sources
+        }
+        if self._dirty.intersection(parsed_sources):
+            self.modified_at = datetime.datetime.now()
+        matrix_changed = self.id is not None and bool(
+            self._dirty.intersection(self.PARSED_VALUE_SOURCES["datamatrix"])
+        )
+        self.__dict__.pop("_parsed_values", None)
+        with self._meta.database.atomic():
+            if matrix_changed:
+                self._materialize_children()
+            ret = super().save(*args, **kwargs)
+            if self._pending_polymorphic_cells is not None:
+                PfPolymorphicCell.delete().where(PfPolymorphicCell.datamatrix == self.id).execute()
+                rows = [
+                    {
+                        "datamatrix": self.id,
+                        "row_index": row_idx,
+                        "col_index": col_idx,
+                        "states_json": json.dumps(states),
+                    }
+                    for row_idx, col_idx, states in self._pending_polymorphic_cells
+                ]
+                for batch in chunked(rows, 100):
+                    PfPolymorphicCell.insert_many(batch).execute()
+                self._pending_polymorphic_cells = None
+                # the new matrix already contains every journaled edit
+                PfCellEdit.update(compacted=True).where(
+                    (PfCellEdit.datamatrix == self.id) & (PfCellEdit.compacted == False)  # noqa: E712
+                ).execute()
+        return ret
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the datamatrix and collect snapshots orphaned by the cascade.
+
+        Overlay copies of the datamatrix are materialized first.
+        """
+        with self._meta.database.atomic():
+            self._materialize_children()
+            ret = super().delete_instance(*args, **kwargs)
+            PfMatrixSnapshot.collect_garbage()
+        return ret
+
+    @classmethod
+    def select_overlays(cls) -> ModelSelect:
+        """Select copies that store no cells and are resolved from their parent."""
+        return cls.select().where(
+            cls.parent.is_null(False)
+            & cls.datamatrix_blob.is_null()
+            & cls.datamatrix_json.is_null()
+        )
+
+    def is_overlay(self) -> bool:
+        """Check whether the cells are resolved from the parent datamatrix."""
+        return (
+            self.parent_id is not None
+            and self.datamatrix_blob is None
+            and self.datamatrix_json is None
+        )
+
+    def materialize(self) -> bool:
+        """Store the resolved cells of an overlay in this datamatrix.
+
+        The row, column and parent journal references are replaced by a
+        matrix of its own; parent is kept as lineage. Pending cell edits are
+        folded in.
+
+        Returns:
+            True if the datamatrix was an overlay, False otherwise.
+        """
+        if not self.is_overlay():
+            return False
+        self.set_datamatrix(self.datamatrix_as_list())
+        self.save()
+        return True
+
+    def _materialize_children(self):
+        """Materialize the overlays resolved from the stored state of this datamatrix."""
+        if self.id is None:
+            return
+        for child in PfDatamatrix.select_overlays().where(PfDatamatrix.parent == self.id):
+            child.materialize()
+
     def get_taxa_timetable(self):
         """Get temporal ranges for taxa.
 
@@ -239,6 +730,9 @@ class PfDatamatrix(Model):
             List of [start, end] temporal range pairs for each taxon.
             Returns [[0, 0], ...] if no valid timetable exists.
         """
+        return self._get_parsed("taxa_timetable", self._parse_taxa_timetable)
+
+    def _parse_taxa_timetable(self):
         timetable = []
         if self.taxa_timetable_json is not None:
             try:
@@ -284,14 +778,16 @@ class PfDatamatrix(Model):
     def copy(self):
         """Create a copy of this datamatrix.
 
-        Creates a new PfDatamatrix instance with all the same data,
-        but as a separate database record. Useful for duplicating
-        datamatrices within a project.
+        The copy is an overlay: it points at this datamatrix and the last
+        cell edit journaled so far instead of duplicating the cells, so
+        copying is cheap regardless of the matrix size. Edits made to either
+        side afterwards are not seen by the other. Unsaved datamatrices and
+        unsaved matrix changes are copied in full.
 
         Returns:
             New PfDatamatrix instance with copied data.
         """
-        new_datamatrix = PfDatamatrix.create(
+        new_datamatrix = PfDatamatrix(
             project=self.project,
             datamatrix_name=self.datamatrix_name,
             datamatrix_desc=self.datamatrix_desc,
@@ -301,17 +797,109 @@ class PfDatamatrix(Model):
             n_chars=self.n_chars,
             taxa_list_json=self.taxa_list_json,
             character_list_json=self.character_list_json,
-            datamatrix_json=self.datamatrix_json,
-            whole_text=self.whole_text,
         )
+        matrix_dirty = self._dirty.intersection(self.PARSED_VALUE_SOURCES["datamatrix"])
+        if self.id is None or matrix_dirty or self._pending_polymorphic_cells is not None:
+            new_datamatrix.set_datamatrix(self.datamatrix_as_list())
+        elif self.is_overlay() and self._last_cell_edit_id() == 0:
+            # nothing of our own to point at, so share the parent version
+            new_datamatrix.parent = self.parent_id
+            new_datamatrix.parent_edit_id = self.parent_edit_id
+            new_datamatrix.row_map_json = self.row_map_json
+            new_datamatrix.column_map_json = self.column_map_json
+        else:
+            new_datamatrix.parent = self.id
+            new_datamatrix.parent_edit_id = self._last_cell_edit_id()
+        new_datamatrix.save()
         return new_datamatrix
 
+    def rearrange(self, row_sources, column_sources) -> None:
+        """Select, reorder and add rows and columns of the matrix.
+
+        Overlays without pending cell edits only update their row and column
+        maps; other datamatrices are rewritten with set_datamatrix(). Taxon
+        and character lists are left to the caller.
+
+        Args:
+            row_sources: For each new row, the index of the current row it is
+                taken from, or None for a row of missing states.
+            column_sources: Same as row_sources, for columns.
+        """
+        row_sources = list(row_sources)
+        column_sources = list(column_sources)
+        if self.is_overlay() and not self._get_cell_edits():
+            row_map = json.loads(self.row_map_json) if self.row_map_json else None
+            column_map = json.loads(self.column_map_json) if self.column_map_json else None
+            self.row_map_json = json.dumps(self._compose_map(row_map, row_sources))
+            self.column_map_json = json.dumps(self._compose_map(column_map, column_sources))
+            return
+
+        current = self.datamatrix_as_list()
+        if row_sources == list(range(len(current))) and all(
+            column_sources == list(range(len(row))) for row in current
+        ):
+            return
+        self.set_datamatrix(
+            self._project_matrix(current, row_sources, column_sources, self.DEFAULTS["missing"])
+        )
+
+    @staticmethod
+    def _compose_map(index_map, sources):
+        if index_map is None:
+            return sources
+        return [
+            index_map[source] if source is not None and source < len(index_map) else None
+            for source in sources
+        ]
+
+    @staticmethod
+    def _project_matrix(datamatrix, row_map, column_map, fill):
+        """Build a matrix from selected rows and columns of another.
+
+        Args:
+            datamatrix: Source matrix.
+            row_map: Source row index per row (None for a row of fill), or
+                None for all rows.
+            column_map: Source column index per column, or None for all
+                columns.
+            fill: State of cells without a source.
+
+        Returns:
+            New list of rows.
+        """
+        if row_map is None:
+            row_map = range(len(datamatrix))
+        if column_map is not None:
+            n_columns = len(column_map)
+        else:
+            n_columns = len(datamatrix[0]) if datamatrix else 0
+        projected = []
+        for row_idx in row_map:
+            if row_idx is None or row_idx >= len(datamatrix):
+                projected.append([fill] * n_columns)
+                continue
+            row = datamatrix[row_idx]
+            if column_map is None:
+                projected.append(list(row))
+            else:
+                projected.append(
+                    [
+                        row[col_idx] if col_idx is not None and col_idx < len(row) else fill
+                        for col_idx in column_map
+                    ]
+                )
+        return projected
+
     def get_character_list(self) -> list[str]:
         """Get list of character names.
 
         Returns:
             List of character names
         """
+        self.character_list = self._get_parsed("character_list", self._parse_character_list)
+        return self.character_list
+
+    def _parse_character_list(self):
         self.character_list = []
         if self.character_list_json:
             try:
@@ -326,12 +914,104 @@ class PfDatamatrix(Model):
 
         return self.character_list
 
+    def set_datamatrix(self, datamatrix: list[list[str]]) -> None:
+        """Store the character matrix in compact binary form.
+
+        Encodes the matrix into datamatrix_blob and state_alphabet_json and
+        queues its polymorphic cells for the next save(). Matrices that
+        cannot be encoded (more than 254 distinct states or non-string
+        cells) fall back to compact JSON in datamatrix_json. An overlay
+        becomes a datamatrix with cells of its own.
+
+        Args:
+            datamatrix: List of rows of states; polymorphic cells are lists.
+        """
+        self.row_map_json = None
+        self.column_map_json = None
+        try:
+            blob, alphabet, polymorphic_cells = pu.encode_datamatrix(datamatrix)
+        except pu.DataParsingError as e:
+            logger.warning(f"Storing {self.datamatrix_name} as JSON: {e}")
+            self.datamatrix_blob = None
+            self.state_alphabet_json = None
+            self.datamatrix_json = json.dumps(datamatrix)
+            self._pending_polymorphic_cells = []
+            return
+        self.datamatrix_blob = blob
+        self.state_alphabet_json = json.dumps(alphabet)
+        self.datamatrix_json = None
+        self._pending_polymorphic_cells = polymorphic_cells
+
+    def _get_polymorphic_cells(self):
+        """Get polymorphic cells as (row_index, col_index, states) tuples."""
+        if self._pending_polymorphic_cells is not None:
+            return self._pending_polymorphic_cells
+        if self.id is None:
+            return []
+        query = (
+            PfPolymorphicCell.select(
+                PfPolymorphicCell.row_index,
+                PfPolymorphicCell.col_index,
+                PfPolymorphicCell.states_json,
+            )
+            .where(PfPolymorphicCell.datamatrix == self.id)
+            .tuples()
+        )
+        return [
+            (row_idx, col_idx, json.loads(states_json)) for row_idx, col_idx, states_json in query
+        ]
+
     def datamatrix_as_list(self) -> list[list[str]]:
         """Get datamatrix as list of lists.
 
+        Decodes the compact BLOB storage when present, otherwise falls back
+        to the legacy JSON column; overlays are resolved from their parent.
+        Pending cell edits from the journal are applied on top.
+
         Returns:
             Datamatrix as nested list
         """
+        return self._get_parsed("datamatrix", self._parse_datamatrix)
+
+    def _parse_datamatrix(self):
+        return self._matrix_at()
+
+    def _matrix_at(self, last_edit_id=None):
+        """Build the matrix with pending cell edits up to last_edit_id applied."""
+        datamatrix = self._decode_stored_datamatrix()
+        for row_idx, col_idx, value in self._get_cell_edits(last_edit_id):
+            if row_idx < len(datamatrix) and col_idx < len(datamatrix[row_idx]):
+                datamatrix[row_idx][col_idx] = value
+        return datamatrix
+
+    def _resolve_overlay(self):
+        parent = PfDatamatrix.get_or_none(PfDatamatrix.id == self.parent_id)
+        if parent is None:
+            logger.error(f"Parent of overlay {self.datamatrix_name} not found")
+            return []
+        datamatrix = parent._matrix_at(self.parent_edit_id)
+        if self.row_map_json is None and self.column_map_json is None:
+            return datamatrix
+        return self._project_matrix(
+            datamatrix,
+            json.loads(self.row_map_json) if self.row_map_json else None,
+            json.loads(self.column_map_json) if self.column_map_json else None,
+            self.DEFAULTS["missing"],
+        )
+
+    def _decode_stored_datamatrix(self):
+        if self.is_overlay():
+            return self._resolve_overlay()
+        if self.datamatrix_blob is not None:
+            try:
+                return pu.decode_datamatrix(
+                    bytes(self.datamatrix_blob),
+                    json.loads(self.state_alphabet_json or "[]"),
+                    self._get_polymorphic_cells(),
+                )
+            except (pu.DataParsingError, json.JSONDecodeError) as e:
+                logger.error(f"Error decoding datamatrix for {self.datamatrix_name}: {e}")
+                return []
         if self.datamatrix_json:
             try:
                 formatted_data_list: list[list[str]] = json.loads(self.datamatrix_json)
@@ -342,12 +1022,137 @@ class PfDatamatrix(Model):
         else:
             return []
 
+    def _get_cell_edits(self, last_edit_id=None):
+        """Get pending journal entries as (row_index, col_index, value) tuples.
+
+        Args:
+            last_edit_id: Only return entries up to this PfCellEdit id.
+        """
+        if self.id is None:
+            return []
+        query = (
+            PfCellEdit.select(PfCellEdit.row_index, PfCellEdit.col_index, PfCellEdit.new_value_json)
+            .where((PfCellEdit.datamatrix == self.id) & (PfCellEdit.compacted == False))  # noqa: E712
+            .order_by(PfCellEdit.id)
+            .tuples()
+        )
+        if last_edit_id is not None:
+            query = query.where(PfCellEdit.id <= last_edit_id)
+        return [(row_idx, col_idx, json.loads(value)) for row_idx, col_idx, value in query]
+
+    def _last_cell_edit_id(self):
+        """Get the id of the latest journal entry, or 0 if there is none."""
+        return (
+            PfCellEdit.select(fn.MAX(PfCellEdit.id))
+            .where(PfCellEdit.datamatrix == self.id)
+            .scalar()
+            or 0
+        )
+
+    def record_cell_edits(self, edits) -> int:
+        """Save edited cells by appending them to the cell edit journal.
+
+        Only the edited cells are written, so the cost of a save grows with
+        the number of edits rather than the size of the matrix. Edits that
+        do not change a cell are skipped. Once CELL_EDIT_COMPACT_THRESHOLD
+        edits are pending they are folded into the stored matrix.
+
+        Args:
+            edits: Iterable of (row_index, col_index, value) tuples; values
+                of polymorphic cells are lists of states.
+
+        Returns:
+            Number of edits recorded.
+
+        Raises:
+            ValueError: If the datamatrix has not been saved yet.
+        """
+        if self.id is None:
+            raise ValueError("Datamatrix must be saved before recording cell edits")
+        current = self.datamatrix_as_list()
+        now = datetime.datetime.now()
+        rows = []
+        for row_idx, col_idx, value in edits:
+            old_value = current[row_idx][col_idx]
+            if old_value == value:
+                continue
+            rows.append(
+                {
+                    "datamatrix": self.id,
+                    "row_index": row_idx,
+                    "col_index": col_idx,
+                    "old_value_json": json.dumps(old_value),
+                    "new_value_json": json.dumps(value),
+                    "edited_at": now,
+                }
+            )
+        if not rows:
+            return 0
+
+        with self._meta.database.atomic():
+            for batch in chunked(rows, 100):
+                PfCellEdit.insert_many(batch).execute()
+            PfDatamatrix.update(modified_at=now).where(PfDatamatrix.id == self.id).execute()
+        # only modified_at changed on the row, so keep it out of the next save()
+        self.__data__["modified_at"] = now
+        self.__dict__.get("_parsed_values", {}).pop("datamatrix", None)
+
+        pending = (
+            PfCellEdit.select()
+            .where((PfCellEdit.datamatrix == self.id) & (PfCellEdit.compacted == False))  # noqa: E712
+            .count()
+        )
+        if pending >= CELL_EDIT_COMPACT_THRESHOLD:
+            self.compact_cell_edits()
+        return len(rows)
+
+    def compact_cell_edits(self) -> int:
+        """Fold pending cell edits into the stored matrix.
+
+        Journal entries are kept and flagged as compacted, so cell_history()
+        still reports them.
+
+        Returns:
+            Number of edits folded into the matrix.
+        """
+        pending = len(self._get_cell_edits())
+        if pending == 0:
+            return 0
+        with self._meta.database.atomic():
+            self.set_datamatrix(self.datamatrix_as_list())
+            self.save()
+        logger.info(f"Compacted {pending} cell edits into {self.datamatrix_name}")
+        return pending
+
+    def cell_history(self, row_index=None, col_index=None) -> list[PfCellEdit]:
+        """Get journaled cell edits, oldest first.
+
+        Row and column indices refer to the matrix shape at the time of the
+        edit; adding taxa or characters does not renumber older entries.
+
+        Args:
+            row_index: Only return edits of this row, if given.
+            col_index: Only return edits of this column, if given.
+
+        Returns:
+            List of PfCellEdit instances.
+        """
+        query = PfCellEdit.select().where(PfCellEdit.datamatrix == self.id)
+        if row_index is not None:
+            query = query.where(PfCellEdit.row_index == row_index)
+        if col_index is not None:
+            query = query.where(PfCellEdit.col_index == col_index)
+        return list(query.order_by(PfCellEdit.id))
+
     def get_taxa_list(self) -> list[str]:
         """Get list of taxa names.
 
         Returns:
             List of taxon names
         """
+        return self._get_parsed("taxa_list", self._parse_taxa_list)
+
+    def _parse_taxa_list(self):
         if self.taxa_list_json:
             try:
                 return json.loads(self.taxa_list_json)
@@ -357,15 +1162,19 @@ class PfDatamatrix(Model):
         else:
             return []
 
-    def import_file(self, file_path):
+    def import_file(self, file_path, progress_callback=None):
         """Import phylogenetic data from a file.
 
         Loads and parses data from various phylogenetic file formats
-        (Nexus, Phylip, TNT). Automatically detects data type (DNA, RNA,
+        (Nexus, Phylip, FASTA, TNT), optionally gzip, bzip2 or xz compressed.
+        Files imported before are loaded from PfUtils.parse_cache instead of
+        being parsed again. Automatically detects data type (DNA, RNA,
         protein, morphology) by analyzing character composition.
 
         Args:
             file_path: Path to the data file to import.
+            progress_callback: Optional callable taking the number of bytes
+                read and the file size, see PfUtils.open_data_file().
 
         Returns:
             True if import succeeded, False if parsing failed.
@@ -376,7 +1185,7 @@ class PfDatamatrix(Model):
         """
         try:
             datafile_obj = pu.PhyloDatafile()
-            ret = datafile_obj.loadfile(file_path)
+            ret = datafile_obj.loadfile(file_path, progress_callback, cache=pu.parse_cache)
 
             if not ret:
                 raise pu.DataParsingError(f"Failed to parse file: {file_path}")
@@ -399,7 +1208,7 @@ class PfDatamatrix(Model):
             if len(self.taxa_list) > 0:
                 self.taxa_list_json = json.dumps(self.taxa_list)
             if len(self.datamatrix) > 0:
-                self.datamatrix_json = json.dumps(self.datamatrix, indent=4)
+                self.set_datamatrix(self.datamatrix)
 
             type_count = {
                 DATATYPE_DNA: 0,
@@ -408,24 +1217,10 @@ class PfDatamatrix(Model):
                 DATATYPE_MORPHOLOGY: 0,
                 DATATYPE_COMBINED: 0,
             }
-            for char_idx in range(self.n_chars):
-                char_str = ""
-                for taxon_idx in range(self.n_taxa):
-                    char = self.datamatrix[taxon_idx][char_idx]
-                    if isinstance(char, list):
-                        char_str += "".join(char)
-                    else:
-                        char_str += char
-
-                count = {}
-                count[DATATYPE_DNA] = self.count_dna(char_str)
-                count[DATATYPE_RNA] = self.count_rna(char_str)
-                count[DATATYPE_PROTEIN] = self.count_protein(char_str)
-                count[DATATYPE_MORPHOLOGY] = self.count_morphology(char_str)
-                max_datatype = max(count, key=count.get)
-                max_value = count[max_datatype]
-                type_count[max_datatype] += 1
-                # print("char idx:",char_idx, "char_str", char_str,"max:",max_datatype,"max_value:",max_value)
+            # columns per best-matching alphabet, as count_dna() etc. would decide
+            type_count.update(
+                pu.count_column_datatypes(self.datamatrix[: self.n_taxa], self.n_chars)
+            )
 
             max_datatype = max(type_count, key=type_count.get)
             self.datatype = max_datatype
@@ -528,6 +1323,132 @@ class PfDatamatrix(Model):
         )
         return count
 
+    def iter_rows(self):
+        """Iterate over the rows of the datamatrix.
+
+        Rows of the compact BLOB storage are decoded one at a time, with
+        their pending cell edits applied, so the whole matrix is not built
+        in memory. Overlays and matrices stored as JSON, or already parsed,
+        are read through datamatrix_as_list().
+
+        Yields:
+            Rows as in datamatrix_as_list(); decoded rows are new lists.
+        """
+        parsed_values = self.__dict__.get("_parsed_values") or {}
+        if "datamatrix" in parsed_values or self.is_overlay() or self.datamatrix_blob is None:
+            yield from self.datamatrix_as_list()
+            return
+
+        row_edits = {}
+        for row_idx, col_idx, value in self._get_cell_edits():
+            row_edits.setdefault(row_idx, {})[col_idx] = value
+        try:
+            rows = pu.iter_decoded_rows(
+                self.datamatrix_blob,
+                json.loads(self.state_alphabet_json or "[]"),
+                self._get_polymorphic_cells(),
+            )
+            for row_idx, row in enumerate(rows):
+                for col_idx, value in row_edits.get(row_idx, {}).items():
+                    if col_idx < len(row):
+                        row[col_idx] = value
+                yield row
+        except (pu.DataParsingError, json.JSONDecodeError) as e:
+            logger.error(f"Error decoding datamatrix for {self.datamatrix_name}: {e}")
+
+    def validate(self, **kwargs) -> dict:
+        """Find every problem of the datamatrix in one pass.
+
+        The stored state codes are checked directly unless cell edits are
+        pending or the datamatrix is an overlay.
+
+        Args:
+            **kwargs: Passed on to PfUtils.validate_encoded_datamatrix(),
+                such as valid_states.
+
+        Returns:
+            Report of PfUtils.validate_encoded_datamatrix(), with rows
+            expected to have n_chars characters.
+        """
+        taxa_list = self.get_taxa_list()
+        if (
+            self.datamatrix_blob is not None
+            and not self.is_overlay()
+            and not self._get_cell_edits()
+        ):
+            try:
+                return pu.validate_encoded_datamatrix(
+                    taxa_list,
+                    self.datamatrix_blob,
+                    json.loads(self.state_alphabet_json or "[]"),
+                    self._get_polymorphic_cells(),
+                    self.n_chars,
+                    **kwargs,
+                )
+            except (pu.DataParsingError, json.JSONDecodeError) as e:
+                logger.error(f"Error decoding datamatrix for {self.datamatrix_name}: {e}")
+        return pu.validate_datamatrix(taxa_list, self.datamatrix_as_list(), self.n_chars, **kwargs)
+
+    def get_matrix_writer(self, file, file_format, **kwargs):
+        """Get a writer of the datamatrix in a file format.
+
+        Args:
+            file: Text file object to write to.
+            file_format: "nexus", "phylip" or "tnt".
+            **kwargs: Passed on to the writer, such as parens and separator.
+
+        Returns:
+            A PfUtils.MatrixWriter.
+
+        Raises:
+            ValueError: If file_format is not known.
+        """
+        if file_format not in pu.MATRIX_WRITERS:
+            raise ValueError(f"Unknown matrix file format: {file_format}")
+        if file_format == "nexus":
+            kwargs = dict(command_hash=self.nexus_command_hash, **self.DEFAULTS, **kwargs)
+        elif file_format == "tnt":
+            kwargs = dict(title=self.datamatrix_name, **kwargs)
+        return pu.MATRIX_WRITERS[file_format](file, **kwargs)
+
+    def write_matrix(self, file, file_format, **kwargs):
+        """Write the datamatrix to a text file object, one row at a time.
+
+        Args:
+            file: Text file object to write to.
+            file_format: "nexus", "phylip" or "tnt".
+            **kwargs: Passed on to the writer, see get_matrix_writer().
+        """
+        writer = self.get_matrix_writer(file, file_format, **kwargs)
+        writer.write(self.get_taxa_list(), self.iter_rows(), self.n_chars)
+
+    def export_file(self, file_path, file_format):
+        """Export the datamatrix to a file.
+
+        The file is written row by row through a large buffer, so exporting
+        takes little memory beyond the stored matrix.
+
+        Args:
+            file_path: Path of the file to write; missing parent directories
+                are created.
+            file_format: "nexus", "phylip" or "tnt".
+
+        Raises:
+            FileOperationError: If the file cannot be written.
+            ValueError: If file_format is not known.
+        """
+        if file_format not in pu.MATRIX_WRITERS:
+            raise ValueError(f"Unknown matrix file format: {file_format}")
+        file_path = Path(file_path)
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with file_path.open("w", encoding="utf-8", buffering=MATRIX_EXPORT_BUFFER_SIZE) as f:
+                self.write_matrix(f, file_format)
+        except PermissionError as e:
+            raise pu.FileOperationError(f"Permission denied: {file_path}") from e
+        except OSError as e:
+            raise pu.FileOperationError(f"OS error writing {file_path}: {e}") from e
+
     # when exporting as file
     def matrix_as_string(self, parens=["(", ")"], separator=" "):
         """Convert datamatrix to string format for export.
@@ -545,26 +1466,15 @@ class PfDatamatrix(Model):
         Returns:
             Multi-line string with one taxon per line.
         """
-        matrix_string = ""
-        datamatrix = self.datamatrix_as_list()
-        taxa_list = json.loads(self.taxa_list_json)
-        # print("datamatrix:",datamatrix)
-        for idx, data in enumerate(datamatrix):
-            # print("data:",data)
-            taxon_string = ""
-            taxon_name = taxa_list[idx]
-            # print("taxon:",taxon_name)
-            # print(formatted_data)
-            taxon_string += taxon_name + separator
-            for char_state in data:
-                # print("char:",char_state)
-                if type(char_state) is list:
-                    taxon_string += parens[0] + separator.join(char_state) + parens[1]
-                    # print("poly:",parens[0] + separator.join(char_state) + parens[1])
-                else:
-                    taxon_string += char_state
-            matrix_string += taxon_string + "\n"
-        return matrix_string
+        output = io.StringIO()
+        writer = pu.MatrixWriter(output, parens, separator)
+        writer.write(self.get_taxa_list(), self.iter_rows(), self.n_chars)
+        return output.getvalue()
+
+    def _format_as_string(self, file_format):
+        output = io.StringIO()
+        self.write_matrix(output, file_format)
+        return output.getvalue()
 
     def as_phylip_format(self):
         """Export datamatrix as Phylip format string.
@@ -573,11 +1483,7 @@ class PfDatamatrix(Model):
             String in Phylip sequential format with dimensions header
             and matrix data.
         """
-        phylip_string = ""
-        data_string = self.matrix_as_string()
-        phylip_string += str(self.n_taxa) + " " + str(self.n_chars) + "\n"
-        phylip_string += data_string
-        return phylip_string
+        return self._format_as_string("phylip")
 
     def as_tnt_format(self):
         """Export datamatrix as TNT format string.
@@ -585,20 +1491,7 @@ class PfDatamatrix(Model):
         Returns:
             String in TNT xread format with dataset name and matrix data.
         """
-        tnt_string = ""
-        data_string = self.matrix_as_string()
-        tnt_string += (
-            "xread '"
-            + self.dataset_name
-            + "' "
-            + str(self.phylo_matrix.n_chars)
-            + " "
-            + str(self.phylo_matrix.n_taxa)
-            + "\n"
-        )
-        tnt_string += data_string
-        tnt_string += ";\n"
-        return tnt_string
+        return self._format_as_string("tnt")
 
     def as_nexus_format(self):
         """Export datamatrix as Nexus format string.
@@ -607,17 +1500,7 @@ class PfDatamatrix(Model):
             String in Nexus format with data block including dimensions,
             format commands, and matrix data.
         """
-        nexus_string = ""
-        data_string = self.matrix_as_string()
-        command_string = self.command_as_string()
-        nexus_string += "#NEXUS\n\n"
-        nexus_string += "begin data;\n"
-        nexus_string += command_string
-        nexus_string += "matrix\n"
-        nexus_string += data_string
-        nexus_string += ";\n"
-        nexus_string += "end;\n"
-        return nexus_string
+        return self._format_as_string("nexus")
 
     def command_as_string(self):
         """Generate Nexus format command strings.
@@ -628,22 +1511,62 @@ class PfDatamatrix(Model):
         Returns:
             Multi-line string of Nexus commands (dimensions, format, etc.).
         """
-        command_string = ""
-        if self.nexus_command_hash:
-            for key1 in self.nexus_command_hash.keys():
-                variable_list = []
-                for key2 in self.nexus_command_hash[key1].keys():
-                    variable_list.append(key2 + "=" + self.nexus_command_hash[key1][key2])
-                command_string += key1 + " " + " ".join(variable_list) + ";\n"
-            # print(command_string)
-        else:
-            command_string += f"dimensions ntax={self.n_taxa} nchar={self.n_chars};\n"
-            command_string += "format datatype={datatype} gap={gap} missing={missing};\n".format(
-                datatype=self.DEFAULTS["datatype"],
-                gap=self.DEFAULTS["gap"],
-                missing=self.DEFAULTS["missing"],
-            )
-        return command_string
+        writer = self.get_matrix_writer(None, "nexus")
+        return writer.commands(self.n_taxa, self.n_chars)
+
+
+class PfPolymorphicCell(Model):
+    """Polymorphic cell of a compactly stored datamatrix.
+
+    Cells holding more than one state cannot be represented by a single
+    state code, so PfDatamatrix stores code 0 in its BLOB and keeps the
+    actual states here. Rows are rewritten as a whole by PfDatamatrix.save().
+
+    Attributes:
+        datamatrix: Foreign key to the owning PfDatamatrix.
+        row_index: Taxon (row) index of the cell.
+        col_index: Character (column) index of the cell.
+        states_json: JSON list of the states in the cell.
+    """
+
+    datamatrix = ForeignKeyField(PfDatamatrix, backref="polymorphic_cells", on_delete="CASCADE")
+    row_index = IntegerField()
+    col_index = IntegerField()
+    states_json = CharField()
+
+    class Meta:
+        database = gDatabase
+        indexes = ((("datamatrix", "row_index", "col_index"), True),)
+
+
+class PfCellEdit(Model):
+    """Journal entry for one edited datamatrix cell.
+
+    Saving edits from the datamatrix table appends entries here instead of
+    rewriting the stored matrix. Pending entries are applied on top of the
+    stored matrix when it is read, and compacted into it periodically.
+
+    Attributes:
+        datamatrix: Foreign key to the edited PfDatamatrix.
+        row_index: Taxon (row) index of the cell.
+        col_index: Character (column) index of the cell.
+        old_value_json: JSON of the cell value before the edit.
+        new_value_json: JSON of the cell value after the edit.
+        edited_at: Timestamp of the edit.
+        compacted: Whether the edit is already part of the stored matrix.
+    """
+
+    datamatrix = ForeignKeyField(PfDatamatrix, backref="cell_edits", on_delete="CASCADE")
+    row_index = IntegerField()
+    col_index = IntegerField()
+    old_value_json = CharField()
+    new_value_json = CharField()
+    edited_at = DateTimeField(default=datetime.datetime.now)
+    compacted = BooleanField(default=False)
+
+    class Meta:
+        database = gDatabase
+        indexes = ((("datamatrix", "compacted"), False),)
 
 
 class PfPackage(Model):
@@ -688,7 +1611,140 @@ class PfPackage(Model):
         database = gDatabase
 
 
-class PfAnalysis(Model):
+class PfMatrixSnapshot(DeferredFieldsMixin, Model):
+    """Content-addressed snapshot of an analysis input matrix.
+
+    Analyses keep the matrix they were run on so results stay reproducible
+    after the source datamatrix is edited. Snapshots are keyed by a hash of
+    their contents (see PfUtils.matrix_content_hash), so analyses launched
+    from the same data share one row instead of each storing a copy.
+
+    ref_count tracks how many analyses reference the snapshot. It is
+    maintained by PfAnalysis.save() and PfAnalysis.delete_instance(); a
+    snapshot is deleted when its count drops to zero. Analyses removed by
+    cascade are handled by collect_garbage().
+
+    Attributes:
+        content_hash: SHA-256 of taxa, character names and cells.
+        taxa_list_json: JSON string of taxon names.
+        character_list_json: JSON string of character names.
+        datamatrix_blob: State codes of the matrix (see PfUtils.encode_datamatrix).
+        state_alphabet_json: JSON list of states indexed by state code - 1.
+        polymorphic_cells_json: JSON list of [row, col, states] entries.
+        datamatrix_json: JSON matrix, only for matrices that cannot be encoded.
+        ref_count: Number of analyses referencing this snapshot.
+        created_at: Timestamp when the snapshot was stored.
+
+    Relations:
+        analyses: One-to-many relationship to PfAnalysis.
+
+    Example:
+        Sharing one snapshot between analyses::
+
+            snapshot = PfMatrixSnapshot.from_datamatrix(datamatrix)
+            PfAnalysis.create(datamatrix=datamatrix, snapshot=snapshot, ...)
+    """
+
+    content_hash = CharField(unique=True)
+    taxa_list_json = deferred(CharField(null=True))
+    character_list_json = deferred(CharField(null=True))
+    datamatrix_blob = deferred(BlobField(null=True))
+    state_alphabet_json = deferred(CharField(null=True))
+    polymorphic_cells_json = deferred(CharField(null=True))
+    datamatrix_json = deferred(CharField(null=True))
+    ref_count = IntegerField(default=0)
+    created_at = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        database = gDatabase
+
+    @classmethod
+    def store(cls, taxa_list, character_list, datamatrix) -> PfMatrixSnapshot:
+        """Get the snapshot for the given contents, storing it if it is new.
+
+        Args:
+            taxa_list: List of taxon names.
+            character_list: List of character names.
+            datamatrix: Datamatrix as a list of rows.
+
+        Returns:
+            Existing or newly saved PfMatrixSnapshot. References are counted
+            when an analysis pointing to it is saved.
+        """
+        content_hash = pu.matrix_content_hash(taxa_list, character_list, datamatrix)
+        snapshot = cls.get_or_none(cls.content_hash == content_hash)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = cls(
+            content_hash=content_hash,
+            taxa_list_json=json.dumps(taxa_list),
+            character_list_json=json.dumps(character_list),
+        )
+        try:
+            blob, alphabet, polymorphic_cells = pu.encode_datamatrix(datamatrix)
+            snapshot.datamatrix_blob = blob
+            snapshot.state_alphabet_json = json.dumps(alphabet)
+            snapshot.polymorphic_cells_json = json.dumps(polymorphic_cells)
+        except pu.DataParsingError:
+            snapshot.datamatrix_json = json.dumps(datamatrix)
+        snapshot.save()
+        return snapshot
+
+    @classmethod
+    def from_datamatrix(cls, datamatrix: PfDatamatrix) -> PfMatrixSnapshot:
+        """Get the snapshot of the current contents of a datamatrix."""
+        return cls.store(
+            datamatrix.get_taxa_list(),
+            datamatrix.get_character_list(),
+            datamatrix.datamatrix_as_list(),
+        )
+
+    @classmethod
+    def add_reference(cls, snapshot_id: int) -> None:
+        """Increment the reference count of a snapshot."""
+        cls.update(ref_count=cls.ref_count + 1).where(cls.id == snapshot_id).execute()
+
+    @classmethod
+    def release(cls, snapshot_id: int) -> None:
+        """Decrement the reference count of a snapshot, deleting it at zero."""
+        cls.update(ref_count=cls.ref_count - 1).where(cls.id == snapshot_id).execute()
+        cls.delete().where((cls.id == snapshot_id) & (cls.ref_count <= 0)).execute()
+
+    @classmethod
+    def collect_garbage(cls) -> int:
+        """Recount references and delete snapshots no analysis uses.
+
+        Returns:
+            Number of snapshots deleted.
+        """
+        references = PfAnalysis.select(fn.COUNT(PfAnalysis.id)).where(PfAnalysis.snapshot == cls.id)
+        cls.update(ref_count=references).execute()
+        deleted = cls.delete().where(cls.ref_count <= 0).execute()
+        if deleted:
+            logger.info(f"Removed {deleted} unreferenced matrix snapshot(s)")
+        return deleted
+
+    def get_taxa_list(self) -> list[str]:
+        """Get list of taxa names."""
+        return json.loads(self.taxa_list_json or "[]")
+
+    def get_character_list(self) -> list[str]:
+        """Get list of character names."""
+        return json.loads(self.character_list_json or "[]")
+
+    def datamatrix_as_list(self) -> list[list[str]]:
+        """Get the snapshot matrix as list of lists."""
+        if self.datamatrix_blob is not None:
+            return pu.decode_datamatrix(
+                bytes(self.datamatrix_blob),
+                json.loads(self.state_alphabet_json or "[]"),
+                json.loads(self.polymorphic_cells_json or "[]"),
+            )
+        return json.loads(self.datamatrix_json or "[]")
+
+
+class PfAnalysis(DeferredFieldsMixin, Model):
     """Analysis configuration and execution tracking model.
 
     Stores configuration parameters and runtime state for phylogenetic
@@ -697,8 +1753,9 @@ class PfAnalysis(Model):
     from creation through execution to completion.
 
     The analysis model stores both the input configuration and the
-    execution state. It maintains copies of the datamatrix at analysis
-    time to preserve reproducibility even if the source data changes.
+    execution state. It references a PfMatrixSnapshot of the datamatrix at
+    analysis time to preserve reproducibility even if the source data
+    changes.
 
     Attributes:
         datamatrix: Foreign key to source PfDatamatrix.
@@ -708,9 +1765,10 @@ class PfAnalysis(Model):
         analysis_status: Current status (Ready, Running, Completed, etc.).
         result_directory: File system path where results are stored.
         datafile: Path to exported data file used as input.
-        taxa_list_json: Snapshot of taxa at analysis time.
-        character_list_json: Snapshot of character names at analysis time.
-        datamatrix_json: Snapshot of matrix data at analysis time.
+        snapshot: Foreign key to the PfMatrixSnapshot of the input matrix.
+        taxa_list_json: Legacy snapshot of taxa at analysis time.
+        character_list_json: Legacy snapshot of character names.
+        datamatrix_json: Legacy snapshot of matrix data.
         completion_percentage: Progress indicator (0-100).
         start_datetime: When analysis execution began.
         finish_datetime: When analysis execution completed.
@@ -752,14 +1810,15 @@ class PfAnalysis(Model):
 
     datamatrix = ForeignKeyField(PfDatamatrix, backref="analyses", on_delete="CASCADE")
     package = ForeignKeyField(PfPackage, backref="analyses", null=True)
+    snapshot = ForeignKeyField(PfMatrixSnapshot, backref="analyses", null=True)
     analysis_type = CharField()
     analysis_name = CharField()
     analysis_status = CharField(null=True)
     result_directory = CharField(null=True)
     datafile = CharField(null=True)
-    taxa_list_json = CharField(null=True)
-    character_list_json = CharField(null=True)
-    datamatrix_json = CharField(null=True)
+    taxa_list_json = deferred(CharField(null=True))
+    character_list_json = deferred(CharField(null=True))
+    datamatrix_json = deferred(CharField(null=True))
     completion_percentage = IntegerField(default=0)
     start_datetime = DateTimeField(default=datetime.datetime.now)
     finish_datetime = DateTimeField(null=True)
@@ -783,6 +1842,59 @@ class PfAnalysis(Model):
 
     class Meta:
         database = gDatabase
+        # status lookups of the run queue and interrupted-analysis check
+        indexes = (
+            (("analysis_status", "created_at"), False),
+            (("analysis_status", "start_datetime"), False),
+        )
+
+    @classmethod
+    def select_ready(cls) -> ModelSelect:
+        """Select analyses waiting to run, oldest first."""
+        return (
+            cls.select()
+            .where(cls.analysis_status == ANALYSIS_STATUS_READY)
+            .order_by(cls.created_at)
+        )
+
+    @classmethod
+    def select_running(cls) -> ModelSelect:
+        """Select analyses marked as running, most recently started first."""
+        return (
+            cls.select()
+            .where(cls.analysis_status == ANALYSIS_STATUS_RUNNING)
+            .order_by(cls.start_datetime.desc())
+        )
+
+    def save(self, *args, **kwargs):
+        """Save the analysis and update snapshot reference counts.
+
+        Returns:
+            Number of rows modified, as returned by Model.save().
+        """
+        with self._meta.database.atomic():
+            snapshot_changed = "snapshot" in self._dirty
+            old_snapshot_id = None
+            if snapshot_changed and self.id is not None:
+                old_snapshot_id = (
+                    PfAnalysis.select(PfAnalysis.snapshot).where(PfAnalysis.id == self.id).scalar()
+                )
+            ret = super().save(*args, **kwargs)
+            if snapshot_changed and old_snapshot_id != self.snapshot_id:
+                if self.snapshot_id is not None:
+                    PfMatrixSnapshot.add_reference(self.snapshot_id)
+                if old_snapshot_id is not None:
+                    PfMatrixSnapshot.release(old_snapshot_id)
+        return ret
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the analysis and release its snapshot."""
+        with self._meta.database.atomic():
+            snapshot_id = self.snapshot_id
+            ret = super().delete_instance(*args, **kwargs)
+            if snapshot_id is not None:
+                PfMatrixSnapshot.release(snapshot_id)
+        return ret
 
     def has_tree(self):
         """Check if analysis has produced a tree file.
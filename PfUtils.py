@@ -7,6 +7,8 @@ application, including:
 - Phylogenetic data file parsing (Nexus, Phylip, TNT formats)
 - Phylogenetic tree file parsing (Newick, Nexus tree formats)
 - Ancestral state reconstruction (Fitch algorithm)
+- Compact binary encoding of character matrices for database storage
+- Datatype detection of imported character matrices
 - Path handling for cross-platform compatibility
 - Resource path resolution for PyInstaller bundles
 
@@ -31,12 +33,34 @@ Example:
             print(f"Matrix dimensions: {datafile.n_taxa} x {datafile.n_chars}")
 """
 
+import bisect
+import bz2
+import copy
+import gzip
+import hashlib
+import io
 import json
 import logging
+import lzma
+import math
+import mmap
+import multiprocessing
 import os
 import platform
 import re
+import struct
 import sys
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, suppress
+from functools import partial
+from operator import itemgetter
+from pathlib import Path
+
+import numpy as np
+from Bio.Phylo import Newick
 
 # from stl import mesh
 # Import version from version.py (Single Source of Truth)
@@ -175,7 +199,7 @@ USER_PROFILE_DIRECTORY = os.path.expanduser("~")
 
 DEFAULT_DB_DIRECTORY = os.path.join(USER_PROFILE_DIRECTORY, COMPANY_NAME, PROGRAM_NAME)
 DEFAULT_LOG_DIRECTORY = os.path.join(USER_PROFILE_DIRECTORY, COMPANY_NAME, PROGRAM_NAME)
-# DEFAULT_STORAGE_DIRECTORY = os.path.join(DEFAULT_DB_DIRECTORY, "data/")
+DEFAULT_STORAGE_DIRECTORY = os.path.join(DEFAULT_DB_DIRECTORY, "data")
 
 
 def get_available_windows_drives():
@@ -427,26 +451,444 @@ class PhyloMatrix:
         return separator.join(self.char_list)
 
 
+# Tokens outside the matrix: quoted words, punctuation and bare words
+NEXUS_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|[;=]|[^\s;='\"]+")
+NEXUS_QUOTED_NAME_PATTERN = re.compile(r"'((?:[^']|'')*)'")
+# taxon name written without quotes
+NEXUS_WORD_PATTERN = re.compile(r"[^\s()\[\]{}/\\,;:=*'\"`<>]+")
+# matrix rows without these characters are one cell per character
+NEXUS_CELL_SPECIALS_PATTERN = re.compile(r"[\s(){},]")
+NEXUS_PARSED_BLOCKS = ("DATA", "TAXA", "CHARACTERS")
+# a bracketed polymorphic cell, possibly unclosed at the end of the row
+POLYMORPHIC_CELL_PATTERN = re.compile(r"[(\[{]([^(){}\[\]]*)([)\]}]?)")
+# blanks between cells, such as those between blocks of ten in Phylip files
+ROW_BLANK_PATTERN = re.compile(r"\s+")
+# leading part of a file searched for #NEXUS when the extension is unknown
+FILE_TYPE_SNIFF_SIZE = 65536
+# data file formats by extension, after any compression suffix is removed
+DATA_FILE_TYPES = {
+    ".NEX": "Nexus",
+    ".NEXUS": "Nexus",
+    ".PHY": "Phylip",
+    ".PHYLIP": "Phylip",
+    ".TNT": "TNT",
+    ".FAS": "FASTA",
+    ".FASTA": "FASTA",
+    ".FA": "FASTA",
+    ".FNA": "FASTA",
+    ".FAA": "FASTA",
+}
+# decompressors for data files, wrapping the open compressed file
+COMPRESSED_FILE_OPENERS = {
+    ".GZ": gzip.open,
+    ".BZ2": bz2.open,
+    ".XZ": lzma.open,
+}
+# errors of reading a corrupt or truncated data file
+DATA_FILE_READ_ERRORS = (OSError, EOFError, UnicodeDecodeError, lzma.LZMAError)
+# characters read between two progress reports
+PROGRESS_REPORT_SIZE = 1 << 20
+
+
+def split_compression_ext(file_path):
+    """Split a .gz, .bz2 or .xz suffix off a file path.
+
+    Returns:
+        Tuple of the path without the suffix and the upper case suffix, or
+        the path and "" if it is not compressed.
+    """
+    base, ext = os.path.splitext(file_path)
+    if ext.upper() in COMPRESSED_FILE_OPENERS:
+        return base, ext.upper()
+    return file_path, ""
+
+
+@contextmanager
+def open_data_file(file_path, progress_callback=None):
+    """Open a data file for reading text lines, decompressing on the fly.
+
+    Files ending in .gz, .bz2 or .xz are decompressed while they are read,
+    so neither the compressed nor the decompressed text is held in memory
+    or written to disk.
+
+    Args:
+        file_path: Path to the file.
+        progress_callback: Optional callable taking the number of bytes read
+            from the file and its size, called about every
+            PROGRESS_REPORT_SIZE characters and at the end. Compressed files
+            report compressed bytes. It may raise to stop reading.
+
+    Yields:
+        Iterable of the lines of the file.
+
+    Raises:
+        OSError: If the file cannot be opened.
+    """
+    with open(file_path, "rb") as raw:
+        opener = COMPRESSED_FILE_OPENERS.get(split_compression_ext(file_path)[1])
+        text = io.TextIOWrapper(opener(raw) if opener else raw, encoding="utf-8")
+        if progress_callback is None:
+            yield text
+        else:
+            yield _report_read_progress(
+                text, raw, os.fstat(raw.fileno()).st_size, progress_callback
+            )
+
+
+def _report_read_progress(lines, raw, total_size, progress_callback):
+    """Yield lines, reporting the position in the underlying file."""
+    progress_callback(0, total_size)
+    unreported = 0
+    for line in lines:
+        unreported += len(line)
+        if unreported >= PROGRESS_REPORT_SIZE:
+            progress_callback(raw.tell(), total_size)
+            unreported = 0
+        yield line
+    progress_callback(total_size, total_size)
+
+
+def split_nexus_cells(data):
+    """Split the states of a NEXUS matrix row into cells.
+
+    Whitespace between cells is ignored. States grouped in ( ) or { } form
+    one polymorphic cell, returned as a list of states.
+
+    Args:
+        data: Row text following the taxon name.
+
+    Returns:
+        List of cells.
+    """
+    if not NEXUS_CELL_SPECIALS_PATTERN.search(data):
+        return list(data)
+    cells = []
+    group = None
+    for char in data:
+        if group is not None:
+            if char in ")}":
+                cells.append(group)
+                group = None
+            elif not char.isspace() and char != ",":
+                group.append(char)
+        elif char in "({":
+            group = []
+        elif not char.isspace():
+            cells.append(char)
+    if group is not None:
+        cells.append(group)
+    return cells
+
+
+def decode_row(data):
+    """Split a Phylip or TNT data string into cells.
+
+    Every character is a cell, except that ( ), { } and [ ] enclose a
+    polymorphic cell whose space-separated states are returned as a list.
+    Whitespace between cells is ignored. Rows without brackets, such as
+    most molecular rows, are split directly.
+
+    Args:
+        data: Row text following the taxon name.
+
+    Returns:
+        List of cells.
+    """
+    if "(" not in data and "{" not in data and "[" not in data:
+        return list(ROW_BLANK_PATTERN.sub("", data))
+    cells = []
+    position = 0
+    for match in POLYMORPHIC_CELL_PATTERN.finditer(data):
+        cells.extend(ROW_BLANK_PATTERN.sub("", data[position : match.start()]))
+        states = match.group(1).split(" ")
+        # an unclosed group only keeps the states followed by a space
+        cells.append(states if match.group(2) else states[:-1])
+        position = match.end()
+    cells.extend(ROW_BLANK_PATTERN.sub("", data[position:]))
+    return cells
+
+
+class LabelledRows(Sequence):
+    """Read-only view of matrix rows prefixed with their taxon name.
+
+    Stands in for a list of [taxon, cell, cell, ...] rows without copying
+    the matrix.
+    """
+
+    def __init__(self, labels, rows):
+        self.labels = labels
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return [self.labels[index], *self.rows[index]]
+
+
+class InterleaveAssembler:
+    """Assemble matrix rows from chunks of cells.
+
+    Interleaved matrices give the cells of each taxon in several chunks.
+    Rows are preallocated to n_chars cells when the count is known, and each
+    chunk is written in place after the previous one, so assembly is linear
+    in the number of cells and no row is rebuilt.
+
+    Attributes:
+        n_chars: Expected number of cells per row, 0 if unknown.
+        taxa_list: Taxon names in order of their first row.
+        rows: Cell lists, one per entry of taxa_list.
+    """
+
+    def __init__(self, n_chars=0):
+        self.n_chars = n_chars
+        self.taxa_list = []
+        self.rows = []
+        self._lengths = []
+        self._row_index = {}
+
+    def start_row(self, name):
+        """Start a new row for a taxon.
+
+        Returns:
+            Index of the row.
+        """
+        row_index = len(self.rows)
+        self._row_index.setdefault(name, row_index)
+        self.taxa_list.append(name)
+        self.rows.append([None] * self.n_chars)
+        self._lengths.append(0)
+        return row_index
+
+    def extend(self, row_index, cells):
+        """Write cells after the filled part of a row."""
+        start = self._lengths[row_index]
+        end = start + len(cells)
+        self.rows[row_index][start:end] = cells
+        self._lengths[row_index] = end
+
+    def add(self, name, cells):
+        """Append cells to the row of a taxon, starting the row if it is new."""
+        row_index = self._row_index.get(name)
+        if row_index is None:
+            row_index = self.start_row(name)
+        self.extend(row_index, cells)
+
+    def set_row(self, name, cells):
+        """Set the complete row of a taxon, replacing any earlier row."""
+        row_index = self._row_index.get(name)
+        if row_index is None:
+            self._row_index[name] = len(self.rows)
+            self.taxa_list.append(name)
+            self.rows.append(cells)
+            self._lengths.append(len(cells))
+        else:
+            self.rows[row_index] = cells
+            self._lengths[row_index] = len(cells)
+
+    def finish(self):
+        """Drop the unfilled cells of short rows.
+
+        Returns:
+            The rows.
+        """
+        for row, length in zip(self.rows, self._lengths):
+            if len(row) > length:
+                del row[length:]
+        return self.rows
+
+
+class NexusReader:
+    """Single-pass streaming reader for NEXUS data files.
+
+    Reads one line at a time, so a file object is never held in memory as a
+    whole; rows are split into cells as they are read. Comments (nested or
+    spanning lines) are skipped, quoted tokens are kept together and
+    commands may span several lines. key=value pairs are collected from the
+    commands of DATA, TAXA and CHARACTERS blocks. Interleaved matrices are
+    assembled with InterleaveAssembler.
+
+    Attributes:
+        taxa_list: Taxon names in matrix order.
+        datamatrix: Rows of cells; polymorphic cells are lists of states.
+        command_hash: Dictionary of command -> {key: value}, uppercased.
+            INTERLEAVE is left out, as it only describes the file layout.
+        block_names: Names of the blocks read, uppercased.
+        interleave: Whether FORMAT declared an interleaved matrix.
+
+    Example:
+        Reading a file::
+
+            with open("data.nex", encoding="utf-8") as f:
+                reader = NexusReader().read(f)
+            print(reader.taxa_list, reader.command_hash["DIMENSIONS"])
+    """
+
+    def __init__(self):
+        self._rows = InterleaveAssembler()
+        self.taxa_list = self._rows.taxa_list
+        self.datamatrix = self._rows.rows
+        self.command_hash = {}
+        self.block_names = []
+        self.interleave = False
+        self._comment_depth = 0
+        self._block = None
+        self._command = []
+        self._in_matrix = False
+
+    def read(self, lines):
+        """Read an iterable of lines, such as an open text file.
+
+        Returns:
+            The reader, for chaining.
+        """
+        for line in lines:
+            line = self._strip_comments(line)
+            if self._in_matrix:
+                line = self._read_matrix_line(line)
+            if line:
+                self._read_command_text(line)
+        # tolerate a missing semicolon after the last command
+        self._execute(self._command)
+        self._command = []
+        self._rows.finish()
+        return self
+
+    def _strip_comments(self, line):
+        if self._comment_depth == 0 and "[" not in line:
+            return line
+        kept = []
+        quoted = False
+        for char in line:
+            if self._comment_depth:
+                if char == "[":
+                    self._comment_depth += 1
+                elif char == "]":
+                    self._comment_depth -= 1
+            elif char == "[" and not quoted:
+                self._comment_depth = 1
+            else:
+                if char == "'":
+                    quoted = not quoted
+                kept.append(char)
+        return "".join(kept)
+
+    def _read_command_text(self, text):
+        for match in NEXUS_TOKEN_PATTERN.finditer(text):
+            token = match.group()
+            if token == ";":
+                self._execute(self._command)
+                self._command = []
+            elif token.upper() == "MATRIX" and self._block in NEXUS_PARSED_BLOCKS:
+                # commands before MATRIX may lack their semicolon
+                self._execute(self._command)
+                self._command = []
+                self._in_matrix = True
+                self._rows.n_chars = self._declared_n_chars()
+                rest = self._read_matrix_line(text[match.end() :])
+                if rest:
+                    self._read_command_text(rest)
+                return
+            elif self._command or token.upper() != "#NEXUS":
+                self._command.append(token)
+
+    def _execute(self, tokens):
+        if not tokens:
+            return
+        name = tokens[0].upper()
+        if name == "BEGIN":
+            self._block = tokens[1].upper() if len(tokens) > 1 else ""
+            self.block_names.append(self._block)
+        elif name in ("END", "ENDBLOCK"):
+            self._block = None
+        elif self._block in NEXUS_PARSED_BLOCKS:
+            variables = {
+                tokens[i - 1].upper(): tokens[i + 1].upper()
+                for i in range(2, len(tokens) - 1)
+                if tokens[i] == "="
+            }
+            if name == "FORMAT":
+                self._read_interleave(tokens)
+                variables.pop("INTERLEAVE", None)
+            if variables:
+                self.command_hash.setdefault(name, {}).update(variables)
+
+    def _read_interleave(self, tokens):
+        for i, token in enumerate(tokens):
+            if token.upper() == "INTERLEAVE":
+                if i + 2 < len(tokens) and tokens[i + 1] == "=":
+                    self.interleave = tokens[i + 2].upper() not in ("NO", "FALSE")
+                else:
+                    self.interleave = True
+
+    def _declared_n_chars(self):
+        try:
+            return int(self.command_hash.get("DIMENSIONS", {}).get("NCHAR", 0))
+        except ValueError:
+            return 0
+
+    def _read_matrix_line(self, text):
+        """Read matrix rows from a line.
+
+        Returns:
+            Text following the end of the matrix, or "" if it continues.
+        """
+        end = text.find(";")
+        body = (text if end < 0 else text[:end]).strip()
+        if body and body.split(None, 1)[0].upper() in ("END", "ENDBLOCK"):
+            # matrix without its terminating semicolon
+            self._in_matrix = False
+            return text
+        if body:
+            self._read_row(body)
+        if end < 0:
+            return ""
+        self._in_matrix = False
+        return text[end + 1 :]
+
+    def _read_row(self, text):
+        match = NEXUS_QUOTED_NAME_PATTERN.match(text)
+        if match:
+            name = match.group(1).replace("''", "'")
+            data = text[match.end() :]
+        else:
+            name, *rest = text.split(None, 1)
+            data = rest[0] if rest else ""
+        cells = split_nexus_cells(data)
+        if self.interleave:
+            self._rows.add(name, cells)
+        else:
+            # a repeated taxon replaces its earlier row
+            self._rows.set_row(name, cells)
+
+
 class PhyloDatafile:
     """Phylogenetic data file parser.
 
     Parses and loads phylogenetic data from multiple file formats including
-    Nexus, Phylip, and TNT formats. Automatically detects format based on
-    file extension and content. Extracts taxa names, character data, and
+    Nexus, Phylip, FASTA, and TNT formats. Automatically detects format based
+    on file extension and content. Extracts taxa names, character data, and
     format-specific metadata.
 
     Supports:
         - Nexus format with multiple blocks (DATA, TAXA, CHARACTERS, MRBAYES)
+          and sequential or interleaved matrices
         - Phylip sequential and interleaved formats
+        - FASTA alignments
         - TNT xread format
+        - Any of these compressed with gzip, bzip2 or xz (.gz, .bz2, .xz)
 
     Attributes:
         dataset_name: Name extracted from filename or file content.
-        file_text: Complete text content of the file.
-        file_type: Detected file format ('Nexus', 'Phylip', or 'TNT').
-        line_list: List of lines from the file.
-        block_list: List of parsed Nexus blocks.
-        block_hash: Dictionary mapping block names to block content.
+        file_text: Complete text content of the file. Nexus, Phylip and
+            FASTA files are streamed and leave it None.
+        file_type: Detected file format ('Nexus', 'Phylip', 'FASTA', or 'TNT').
+        line_list: List of lines from the file (only filled for TNT).
+        block_list: List of {"name": ...} dicts of the Nexus blocks read.
+        block_hash: Dictionary mapping block names to block content (not
+            filled for Nexus).
         nexus_command_hash: Dictionary of Nexus commands (dimensions, format, etc.).
         phylo_matrix: PhyloMatrix object containing parsed data.
         character_definition_hash: Dictionary of character definitions.
@@ -489,144 +931,116 @@ class PhyloDatafile:
         self.n_chars = 0
         self.n_taxa = 0
 
-    def loadfile(self, a_filepath):
-        filepath, filename = os.path.split(a_filepath)
+    def loadfile(self, a_filepath, progress_callback=None, cache=None):
+        """Load and parse a data file.
+
+        The format is taken from the file extension, or detected from the
+        start of the file. Files ending in .gz, .bz2 or .xz are decompressed
+        while they are read.
+
+        Args:
+            a_filepath: Path to the data file.
+            progress_callback: Optional callable taking the number of bytes
+                read and the file size, see open_data_file().
+            cache: Optional ParseCache to load the parsed file from, and to
+                store it in when it has to be parsed.
+
+        Returns:
+            True if the file was read, False otherwise.
+        """
+        filepath, filename = os.path.split(split_compression_ext(a_filepath)[0])
         filename, fileext = os.path.splitext(filename.upper())
         self.dataset_name = filename
 
+        digest = None
+        if cache is not None:
+            try:
+                digest = cache.fingerprint(a_filepath)
+            except OSError as e:
+                logger.error(f"Error loading file {a_filepath}: {e}")
+                return False
+            if cache.load(digest, self):
+                return True
+
         # determine by filetype
-        if fileext.upper() in [".NEX", ".NEXUS"]:
-            self.file_type = "Nexus"
-        elif fileext.upper() in [".PHY", ".PHYLIP"]:
-            self.file_type = "Phylip"
-        elif fileext.upper() in [".TNT"]:
-            self.file_type = "TNT"
+        self.file_type = DATA_FILE_TYPES.get(fileext) or self.sniff_file_type(a_filepath)
         # print("filetype:", self.file_type, filename, fileext)
 
-        # Read file with error handling
         try:
-            self.file_text = safe_file_read(a_filepath)
-        except FileOperationError as e:
+            with open_data_file(a_filepath, progress_callback) as lines:
+                if self.file_type == "Nexus":
+                    self.parse_nexus_file(lines)
+                elif self.file_type == "Phylip":
+                    self.parse_phylip_file(lines)
+                elif self.file_type == "FASTA":
+                    self.parse_fasta_file(lines)
+                else:
+                    self.file_text = "".join(lines)
+        except DATA_FILE_READ_ERRORS as e:
             logger.error(f"Error loading file {a_filepath}: {e}")
             return False
 
-        self.line_list = self.file_text.split("\n")
-        if not self.file_type:
-            upper_file_text = self.file_text.upper()
-            # first_line = self.line_list[0].upper()
-            if upper_file_text.find("#NEXUS") > -1:
-                self.file_type = "Nexus"
-            elif upper_file_text.find("XREAD") > -1:
-                self.file_type = "TNT"
-        # print("File type:", self.file_type)
+        if self.file_text is not None:
+            self.line_list = self.file_text.split("\n")
+            if not self.file_type:
+                upper_file_text = self.file_text.upper()
+                if upper_file_text.find("XREAD") > -1:
+                    self.file_type = "TNT"
+            # print("File type:", self.file_type)
 
-        if self.file_type == "Nexus":
-            # print("nexus file")
-            self.parse_nexus_file()
-            if "DATA" in self.block_hash.keys():
-                self.parse_nexus_block(self.block_hash["DATA"])
-            if "TAXA" in self.block_hash.keys():
-                # print('taxa block')
-                self.parse_nexus_block(self.block_hash["TAXA"])
-                # print('nchar, ntax', self.n_chars, self.n_taxa)
-            if "CHARACTERS" in self.block_hash.keys():
-                logger.debug("Processing CHARACTERS block")
-                self.parse_nexus_block(self.block_hash["CHARACTERS"])
-                # print('nchar, ntax', self.n_chars, self.n_taxa)
-            if "MRBAYES" in self.block_hash.keys():
-                # print("mr bayes block exists")
-                pass
-        elif self.file_type == "Phylip":
-            # print("phylip file")
-            self.parse_phylip_file(self.line_list)
-        elif self.file_type == "TNT":
-            # print("TNT file")
-            self.parse_tnt_file(self.line_list)
-            # self.parse_tnt_File()
+            if self.file_type == "TNT":
+                # print("TNT file")
+                self.parse_tnt_file(self.line_list)
+                # self.parse_tnt_File()
 
         if self.phylo_matrix.dataset_name != "":
             self.dataset_name = self.phylo_matrix.dataset_name
+        if digest is not None:
+            cache.store(digest, self)
         # print("file parsing done")
         return True
 
-    def parse_nexus_file(self, line_list=None):
-        if not line_list:
-            line_list = self.line_list
-        curr_block = None
-        in_block = False
-        for line in line_list:
-            # print(line)
-            begin_line = re.match(r"\s*begin\s+(\w+)", line, flags=re.IGNORECASE)
-            end_line = re.match(r"\s*end\s*;", line, flags=re.IGNORECASE)
+    @staticmethod
+    def sniff_file_type(a_filepath):
+        """Detect a Nexus or FASTA file from its start.
 
-            if begin_line:
-                # print("begin", begin_line)
-                curr_block = {}
-                curr_block["name"] = begin_line.group(1).upper()
-                curr_block["text"] = []
-                in_block = True
-            elif end_line:
-                # print("end block")
-                self.block_list.append(curr_block)
-                # if curr_block['name'] == 'DATA':
-                self.block_hash[curr_block["name"]] = curr_block["text"]
-                in_block = False
-            elif in_block:
-                # print(line)
-                curr_block["text"].append(line)
-        return  # block_list
+        Returns:
+            "Nexus" if the #NEXUS header is found, "FASTA" if the file starts
+            with a ">" sequence header, None otherwise.
+        """
+        try:
+            with open_data_file(a_filepath) as f:
+                head = f.read(FILE_TYPE_SNIFF_SIZE)
+        except DATA_FILE_READ_ERRORS:
+            return None
+        if "#NEXUS" in head.upper():
+            return "Nexus"
+        if head.lstrip().startswith(">"):
+            return "FASTA"
+        return None
 
-    def parse_nexus_block(self, line_list):
-        in_matrix = False
-        for line in line_list:
-            # print(line)
-            matrix_begin = re.match(r"\s*matrix\s*", line, flags=re.IGNORECASE)
-            if matrix_begin:
-                # self.taxa_list = []
-                # self.data_list = []
-                # self.data_hash = {}
-                # self.nexus_command_hash = {}
-                in_matrix = True
-            elif in_matrix:
-                matrix_match = re.match(r"^\s*(\S+)\s+(.+);*", line)
-                if matrix_match:
-                    # print("matrix:",line)
-                    species_name = matrix_match.group(1)
-                    data_line = matrix_match.group(2)
-                    if species_name not in self.taxa_list:
-                        self.taxa_list.append(species_name)
-                    self.data_list.append(data_line)
-                    self.data_hash[species_name] = data_line
-            else:
-                # in data block but not in matrix ==> command/variable
-                command_match = re.match(r"^\s*(\S+)\s+(.*);", line.upper(), flags=re.IGNORECASE)
-                if command_match:
-                    # print("command:",line)
-                    command = command_match.group(1)
-                    variable_string = command_match.group(2)
-                    variable_list = re.findall(r"(\w+)\s*=\s*(\S+)", variable_string)
-                    # print(command,variable_list)
-                    if command not in self.nexus_command_hash.keys():
-                        self.nexus_command_hash[command] = {}
-                    for variable in variable_list:
-                        self.nexus_command_hash[command][variable[0]] = variable[1]
-                    # print(self.nexus_command_hash)
-                # pass
-
-            matrix_end = re.match(".*;.*", line)
-            if matrix_end:
-                in_matrix = False
-            # print(self.nexus_command_hash)
-        if "DIMENSIONS" in self.nexus_command_hash.keys():
-            if "NTAX" in self.nexus_command_hash["DIMENSIONS"]:
-                ntax = int(self.nexus_command_hash["DIMENSIONS"]["NTAX"])
-                self.n_taxa = int(ntax)
-            if "NCHAR" in self.nexus_command_hash["DIMENSIONS"]:
-                nchar = int(self.nexus_command_hash["DIMENSIONS"]["NCHAR"])
-                self.n_chars = int(nchar)
-        # print("number of taxa", ntax, len(self.taxa_list))
-        # print("number of char", nchar)
-        self.format_datamatrix()
+    def parse_nexus_file(self, line_list=None):
+        """Parse NEXUS data in a single pass with NexusReader.
+
+        Fills taxa_list, datamatrix and nexus_command_hash, and n_taxa and
+        n_chars from the DIMENSIONS command. data_hash, formatted_data_hash
+        and formatted_data_list share the rows of datamatrix instead of
+        copying them.
+
+        Args:
+            line_list: Iterable of lines, such as an open file. Defaults to
+                line_list.
+        """
+        reader = NexusReader().read(line_list if line_list is not None else self.line_list)
+        self._set_matrix(reader.taxa_list, reader.datamatrix)
+        self.nexus_command_hash = reader.command_hash
+        self.block_list = [{"name": name} for name in reader.block_names]
+
+        dimensions = self.nexus_command_hash.get("DIMENSIONS", {})
+        if "NTAX" in dimensions:
+            self.n_taxa = int(dimensions["NTAX"])
+        if "NCHAR" in dimensions:
+            self.n_chars = int(dimensions["NCHAR"])
 
     def parse_tnt_file(self, line_list):
         in_header = False
@@ -656,81 +1070,256 @@ class PhyloDatafile:
         self.format_datamatrix()
 
     def parse_phylip_file(self, line_list):
-        total_linenum = len(line_list)
-        sequential_format = False
-        interleaved_format = False
-        taxon_data_count = 0
+        """Parse sequential or interleaved PHYLIP data in a single pass.
+
+        The first n_taxa rows carry the taxon names. Any further non-empty
+        lines are interleaved continuation chunks, appended to the taxa in
+        turn with InterleaveAssembler. Blanks between blocks of cells are
+        ignored.
+
+        Args:
+            line_list: Iterable of lines, such as an open file.
+
+        Raises:
+            DataParsingError: If a row does not have the number of
+                characters given in the header.
+        """
+        rows = InterleaveAssembler()
+        n_taxa = 0
+        continuation_count = 0
         for line in line_list:
             # check if first line contains dataset name and taxa/chars count
-            count_match = re.match(r"^\s*(\d+)\s+(\d+)\s*$", line)
+            if not rows.rows and not n_taxa:
+                count_match = re.match(r"^\s*(\d+)\s+(\d+)\s*$", line)
+                if count_match:
+                    self.n_taxa = count_match.group(1)
+                    self.n_chars = count_match.group(2)
+                    n_taxa = int(self.n_taxa)
+                    rows.n_chars = int(self.n_chars)
+                    continue
+
+            if n_taxa and len(rows.rows) >= n_taxa:
+                data = line.strip()
+                if data:
+                    rows.extend(continuation_count % n_taxa, decode_row(data))
+                    continuation_count += 1
+                continue
+
             data_match = re.match(r"^(\S+)\s+(.+)\s*$", line)
-            interleaved_data_match = re.match(r"^\s+(.+)\s*$", line)
-            if count_match:
-                self.n_chars = count_match.group(2)
-                self.n_taxa = count_match.group(1)
-                if int(total_linenum) > 2 * int(self.n_taxa):
-                    logger.debug("Detected interleaved PHYLIP format")
-                    interleaved_format = True
-                else:
-                    logger.debug("Detected sequential PHYLIP format")
-                    sequential_format = True
+            if data_match:
+                row_index = rows.start_row(data_match.group(1))
+                rows.extend(row_index, decode_row(data_match.group(2)))
+
+        if continuation_count:
+            logger.debug("Detected interleaved PHYLIP format")
+        datamatrix = rows.finish()
+        if rows.n_chars:
+            for taxon, row in zip(rows.taxa_list, datamatrix):
+                if len(row) != rows.n_chars:
+                    raise DataParsingError(
+                        f"Taxon {taxon} has {len(row)} characters, expected {rows.n_chars}"
+                    )
+        self._set_matrix(rows.taxa_list, datamatrix)
 
-            if not count_match and data_match:
-                taxon_name = data_match.group(1)
-                data = data_match.group(2)
-                self.taxa_list.append(taxon_name)
-                self.data_list.append(data)
-                self.data_hash[taxon_name] = data
-                taxon_data_count += 1
+    def parse_fasta_file(self, line_list):
+        """Parse FASTA data in a single pass.
 
-            if interleaved_data_match:
-                pass
+        Each ">" header line starts a taxon, named by its first word, and the
+        sequence lines following it are appended to its row with
+        InterleaveAssembler. Lines starting with ";" are comments.
 
-        self.format_datamatrix()
+        Args:
+            line_list: Iterable of lines, such as an open file.
+        """
+        rows = InterleaveAssembler()
+        row_index = None
+        for line in line_list:
+            if line.startswith(">"):
+                name = line[1:].split(None, 1)
+                row_index = rows.start_row(name[0] if name else f"Taxon_{len(rows.rows) + 1}")
+            elif row_index is not None and not line.startswith(";"):
+                data = line.strip()
+                if data:
+                    rows.extend(row_index, decode_row(data))
+
+        self._set_matrix(rows.taxa_list, rows.finish())
+        self.n_taxa = len(self.taxa_list)
+        self.n_chars = max((len(row) for row in self.datamatrix), default=0)
+
+    def _set_matrix(self, taxa_list, datamatrix):
+        """Set the parsed matrix and the per-taxon views sharing its rows."""
+        self.taxa_list = taxa_list
+        self.datamatrix = datamatrix
+        self.data_hash = dict(zip(taxa_list, datamatrix))
+        self.formatted_data_hash = self.data_hash
+        self.formatted_data_list = LabelledRows(taxa_list, datamatrix)
 
     def format_datamatrix(self):
-        self.datamatrix = []
+        """Split the data strings of taxa_list into datamatrix rows.
 
+        formatted_data_hash and formatted_data_list share the rows instead of
+        copying them.
+        """
+        self.datamatrix = []
         for species in self.taxa_list:
-            data = self.data_hash[species]
-            array_data = []
-            poly_char = ""
-            # print(species, data)
-            # print(species,len(data),data)
-            is_poly = False
-            for char in data:
-                # print(char,)
-                if char in ["(", "{", "["]:
-                    is_poly = True
-                    array_data.append([])
-                elif char in [")", "}", "]"]:
-                    array_data[-1].append(poly_char)
-                    poly_char = ""
-                    is_poly = False
-                else:
-                    if is_poly:
-                        if char == " ":
-                            array_data[-1].append(poly_char)
-                            poly_char = ""
-                        else:
-                            poly_char += char
-                    else:
-                        array_data.append(char)
-
+            array_data = decode_row(self.data_hash[species])
             self.formatted_data_hash[species] = array_data
-            formatted_data = [species]
-            formatted_data.extend(array_data)
-            self.formatted_data_list.append(formatted_data)
             self.datamatrix.append(array_data)
-            # print(species, len(array_data),array_data)
+        self.formatted_data_list = LabelledRows(self.taxa_list, self.datamatrix)
+
+
+class MatrixWriter:
+    """Streaming writer of a character matrix to a text file object.
 
-            # formatted_data = data.split()
-            # print(array_data)
-            # if len(data) != nchar:
-            # else:
+    Rows are formatted and written one at a time, so the rows can come from
+    a generator such as PfDatamatrix.iter_rows() and the file text is never
+    built in memory. Subclasses add the header and footer of a file format.
 
-        # print(data_hash)
-        # print(self.command_hash)
+    Attributes:
+        file: Text file object written to.
+        parens: Opening and closing characters of polymorphic cells.
+        separator: Text between a taxon name and its states, and between
+            the states of a polymorphic cell.
+
+    Example:
+        Writing a matrix to a Phylip file::
+
+            with open("data.phy", "w", encoding="utf-8") as f:
+                PhylipWriter(f).write(taxa_list, datamatrix, n_chars)
+    """
+
+    PARENS = ("(", ")")
+
+    def __init__(self, file, parens=None, separator=" "):
+        self.file = file
+        self.parens = parens or self.PARENS
+        self.separator = separator
+
+    def write(self, taxa_list, rows, n_chars):
+        """Write a whole matrix.
+
+        Args:
+            taxa_list: Taxon names in row order.
+            rows: Iterable of rows of states; polymorphic cells are lists.
+            n_chars: Number of characters, for the header.
+        """
+        self.write_header(len(taxa_list), n_chars)
+        for taxon_name, row in zip(taxa_list, rows):
+            self.write_row(taxon_name, row)
+        self.write_footer()
+
+    def write_header(self, n_taxa, n_chars):
+        """Write the text before the first row."""
+
+    def write_footer(self):
+        """Write the text after the last row."""
+
+    def write_row(self, taxon_name, row):
+        """Write the line of one taxon."""
+        self.file.write(
+            self.format_name(taxon_name) + self.separator + self.format_states(row) + "\n"
+        )
+
+    def format_name(self, taxon_name):
+        return taxon_name
+
+    def format_states(self, row):
+        """Join the states of a row, enclosing polymorphic cells in parens."""
+        try:
+            text = "".join(row)
+            if len(text) == len(row):
+                return text
+        except TypeError:
+            pass
+        opening, closing = self.parens
+        return "".join(
+            cell if isinstance(cell, str) else opening + self.separator.join(cell) + closing
+            for cell in row
+        )
+
+
+class PhylipWriter(MatrixWriter):
+    """Writer of sequential Phylip files, headed by the matrix dimensions."""
+
+    def write_header(self, n_taxa, n_chars):
+        self.file.write(f"{n_taxa} {n_chars}\n")
+
+
+class NexusWriter(MatrixWriter):
+    """Writer of Nexus files with a single DATA block.
+
+    Taxon names that are not a single Nexus word are quoted.
+
+    Attributes:
+        command_hash: Dictionary of command -> {key: value} written before
+            MATRIX, such as PhyloDatafile.nexus_command_hash. If empty,
+            DIMENSIONS and FORMAT commands are written from the matrix size
+            and the datatype, gap and missing symbols.
+    """
+
+    def __init__(
+        self, file, command_hash=None, datatype="standard", gap="-", missing="?", **kwargs
+    ):
+        super().__init__(file, **kwargs)
+        self.command_hash = command_hash
+        self.datatype = datatype
+        self.gap = gap
+        self.missing = missing
+
+    def commands(self, n_taxa, n_chars):
+        """Get the text of the commands before MATRIX."""
+        if self.command_hash:
+            return "".join(
+                key1
+                + " "
+                + " ".join(key2 + "=" + value for key2, value in variables.items())
+                + ";\n"
+                for key1, variables in self.command_hash.items()
+            )
+        return (
+            f"dimensions ntax={n_taxa} nchar={n_chars};\n"
+            f"format datatype={self.datatype} gap={self.gap} missing={self.missing};\n"
+        )
+
+    def write_header(self, n_taxa, n_chars):
+        self.file.write("#NEXUS\n\nbegin data;\n" + self.commands(n_taxa, n_chars) + "matrix\n")
+
+    def write_footer(self):
+        self.file.write(";\nend;\n")
+
+    def format_name(self, taxon_name):
+        if NEXUS_WORD_PATTERN.fullmatch(taxon_name):
+            return taxon_name
+        return "'{}'".format(taxon_name.replace("'", "''"))
+
+
+class TntWriter(MatrixWriter):
+    """Writer of TNT xread files.
+
+    Polymorphic cells are enclosed in [ ], and spaces in taxon names, which
+    TNT does not allow, are replaced by underscores.
+
+    Attributes:
+        title: Dataset name written after xread.
+    """
+
+    PARENS = ("[", "]")
+
+    def __init__(self, file, title="", **kwargs):
+        super().__init__(file, **kwargs)
+        self.title = title
+
+    def write_header(self, n_taxa, n_chars):
+        self.file.write(f"xread\n'{self.title}'\n{n_chars} {n_taxa}\n")
+
+    def write_footer(self):
+        self.file.write(";\n")
+
+    def format_name(self, taxon_name):
+        return "_".join(taxon_name.split())
+
+
+MATRIX_WRITERS = {"nexus": NexusWriter, "phylip": PhylipWriter, "tnt": TntWriter}
 
 
 class PhyloTreefile:
@@ -921,49 +1510,17 @@ class PhyloTreefile:
                 self.tree_list.append(tree_text)
 
     def parse_tre_file(self, line_list):
-        header_found = False
-        for line in line_list:
-            # find "tread" line
-            if re.match(r"tread.*", line, flags=re.IGNORECASE):
-                # self.file_type = 'tread'
-                header_found = True
-                continue
-            if re.match(r"proc.*", line, flags=re.IGNORECASE):
-                # self.file_type = 'proc'
+        try:
+            for tree in read_tnt_trees("\n".join(line_list)):
+                # without the closing ";", like the trees of other file types
+                self.tree_list.append(tree.to_newick(plain=True)[:-1])
+        except DataParsingError as e:
+            logger.warning(f"Stopped reading TNT trees after {len(self.tree_list)} trees: {e}")
 
-                break
-            if header_found:
-                tree_text = line.replace(";", "")
-                tree_text = tree_text.replace("*", "")
-                tree_text = tree_text.replace("(", "( ")
-                tree_text = tree_text.replace(")", " ) ")
-                str_list = []
-                raw_list = tree_text.split(" ")
-                for item in raw_list:
-                    if item != "":
-                        if len(str_list) > 0:
-                            if item == "(":
-                                if str_list[-1] != "(":
-                                    str_list.append(",")
-                            else:
-                                try:
-                                    int(item)
-                                    try:
-                                        int(str_list[-1])
-                                        if int(str_list[-1]) > 0 and int(item) > 0:
-                                            str_list.append(",")
-                                    except (ValueError, IndexError):
-                                        pass
-                                except (ValueError, TypeError):
-                                    pass  # str_list.append(item)
-
-                                # int(str_list[-1]) > 0 and int(item) > 0:
-                                # str_list.append(",")
-
-                        str_list.append(item)
-                tree_text = "".join(str_list)
-                self.tree_list.append(tree_text)
-                # print(tree_text)
+    @staticmethod
+    def tnt_tree_to_newick(tree_text):
+        """Convert a tree of a TNT tread file to Newick text, without the closing ";"."""
+        return NewickTree.parse_tnt(tree_text).to_newick(plain=True)[:-1]
 
     def remove_comment(self, tree_text):
         # print(tree_text[15],tree_text[20])
@@ -1069,141 +1626,1491 @@ class PhyloTreefile:
         return  # block_list
 
 
+TREE_INDEX_SUFFIX = ".pfidx"
+TREE_INDEX_MAGIC = b"PFTI"
+TREE_INDEX_VERSION = 3
+# magic, version, file size, file mtime_ns, tree count, metadata length
+TREE_INDEX_HEADER = struct.Struct("<4sBQqQI")
+# bytes before the scan offset compared to tell an appended file from a rewritten one
+TREE_INDEX_TAIL_SIZE = 256
+NEXUS_TREES_BEGIN_PATTERN = re.compile(rb"begin\s+trees\s*;", re.IGNORECASE)
+# whitespace and comments before a command
+NEXUS_BLANK_PATTERN = re.compile(rb"(?:\s|\[[^\]]*\])*")
+NEXUS_BLOCK_END_PATTERN = re.compile(rb"end(block)?\s*;", re.IGNORECASE)
+NEXUS_TRANSLATE_PATTERN = re.compile(rb"translate\b", re.IGNORECASE)
+NEXUS_TREE_PATTERN = re.compile(rb"tree\s+([^=]*?)\s*=\s*", re.IGNORECASE)
+TNT_TREAD_LINE_PATTERN = re.compile(rb"^[ \t]*tread\b(?:\s*'[^']*')?", re.IGNORECASE | re.MULTILINE)
+TNT_PROC_PATTERN = re.compile(rb"proc", re.IGNORECASE)
+TNT_BLANK_PATTERN = re.compile(rb"\s*")
+TNT_TREE_END_PATTERN = re.compile(rb"[*;]")
+
+
+class TreeFileIndex(Sequence):
+    """Lazily read the trees of a tree file through an index of byte offsets.
+
+    The file is memory-mapped and scanned once for the start and end of
+    every tree. The offsets are saved next to the file (with
+    TREE_INDEX_SUFFIX appended to its name) and reused while the file keeps
+    its size and mtime, so opening a large tree sample again takes no scan.
+    Trees are decoded only when indexed, giving the same text as the
+    tree_list of PhyloTreefile.readtree() for the same file type.
+
+    The scan stops before a tree that is still being written and remembers
+    where it stopped. refresh() continues from there, so following the
+    output of a running analysis costs only the newly appended trees. A
+    saved index of a file that has grown since is resumed the same way.
+
+    Supported file types are those of readtree(): "Nexus" (such as MrBayes
+    .t files), "tre" (TNT tread output) and "treefile" (one Newick tree per
+    line, such as IQ-TREE .boottrees).
+
+    Attributes:
+        file_path: Path of the tree file.
+        file_type: File type the trees are read as.
+        taxa_list: Taxon names of a Nexus translate command.
+        taxa_hash: Dictionary mapping translate keys to taxon names.
+        tree_names: Names of the Nexus trees, in order.
+        generation: Number of times refresh() found the file rewritten and
+            indexed it again from the start; trees read before are gone.
+
+    Example:
+        Reading a sample of trees::
+
+            with TreeFileIndex("run.nex.t", "Nexus") as trees:
+                print(f"{len(trees)} trees, last: {trees[-1][:50]}")
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the file type is not supported.
+    """
+
+    def __init__(self, a_filepath, filetype):
+        if filetype not in ("Nexus", "tre", "treefile"):
+            raise ValueError(f"Unsupported tree file type: {filetype}")
+        self.file_path = Path(a_filepath)
+        self.file_type = filetype
+        self.generation = 0
+        self._data = b""
+        self._reset()
+        self._map_file()
+        saved_key = self._load_index()
+        if saved_key is not None and not self._tail_matches():
+            saved_key = None
+        if saved_key is None:
+            self._reset()
+        if saved_key != self._file_key:
+            self._scan()
+            self._save_index()
+        self._unsaved = False
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        text = self._data[self._starts[index] : self._ends[index]].decode("utf-8")
+        if self.file_type == "Nexus":
+            return " ".join(text.splitlines()).strip()
+        if self.file_type == "tre":
+            return PhyloTreefile.tnt_tree_to_newick(text)
+        return text.rstrip("\r").replace(";", "")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tree(self, index):
+        """Parse a tree of the file.
+
+        Args:
+            index: Index of the tree.
+
+        Returns:
+            The NewickTree, labelled as in the file.
+        """
+        if self.file_type == "tre":
+            return NewickTree.parse_tnt(
+                self._data[self._starts[index] : self._ends[index]].decode("utf-8")
+            )
+        return NewickTree.parse(self[index])
+
+    @property
+    def index_path(self):
+        """Path of the saved index."""
+        return self.file_path.with_name(self.file_path.name + TREE_INDEX_SUFFIX)
+
+    def refresh(self):
+        """Index the trees appended to the file since the last scan.
+
+        Only the bytes after the last complete tree are scanned. If the file
+        was rewritten rather than appended to, it is indexed again from the
+        start and generation is incremented, even if it has no trees yet.
+
+        Returns:
+            Number of trees added to the index; after a rewrite, the number
+            of trees of the rewritten file.
+
+        Raises:
+            OSError: If the file cannot be read.
+        """
+        stat = self.file_path.stat()
+        if (stat.st_size, stat.st_mtime_ns) == self._file_key:
+            return 0
+        n_trees = len(self)
+        self._map_file()
+        if not self._tail_matches():
+            logger.debug(f"{self.file_path} was rewritten, indexing it again")
+            self._reset()
+            self.generation += 1
+            n_trees = 0
+        self._scan()
+        self._unsaved = True
+        return len(self) - n_trees
+
+    def close(self):
+        """Save a refreshed index and unmap the file.
+
+        Trees can no longer be read afterwards.
+        """
+        if self._unsaved:
+            self._save_index()
+            self._unsaved = False
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+    def _reset(self):
+        """Forget all indexed trees, to scan the file from the start."""
+        self.taxa_list = []
+        self.taxa_hash = {}
+        self.tree_names = []
+        self._starts = array("Q")
+        self._ends = array("Q")
+        # where the next scan starts, and whether the trees section was entered or left
+        self._scan_offset = 0
+        self._in_trees = False
+        self._scan_done = False
+        self._scan_tail = None
+
+    def _map_file(self):
+        """Map the current contents of the file, replacing an earlier mapping."""
+        with self.file_path.open("rb") as f:
+            stat = os.fstat(f.fileno())
+            # empty files cannot be mapped
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = data
+        self._file_key = (stat.st_size, stat.st_mtime_ns)
+
+    def _tail(self):
+        """Get a digest of the bytes just before the scan offset."""
+        start = max(0, self._scan_offset - TREE_INDEX_TAIL_SIZE)
+        return hashlib.sha256(self._data[start : self._scan_offset]).hexdigest()
+
+    def _tail_matches(self):
+        """Check that the file still holds the bytes scanned so far."""
+        return self._scan_offset <= len(self._data) and self._tail() == self._scan_tail
+
+    def _lines(self, start=0):
+        """Yield (start, end) offsets of the lines from start, without newlines."""
+        data = self._data
+        size = len(data)
+        while start < size:
+            end = data.find(b"\n", start)
+            if end < 0:
+                end = size
+            yield start, end
+            start = end + 1
+
+    def _scan(self):
+        """Index the trees from the scan offset to the end of the file."""
+        if not self._scan_done:
+            if self.file_type == "Nexus":
+                self._scan_nexus_trees()
+            elif self.file_type == "tre":
+                self._scan_tnt_trees()
+            else:
+                self._scan_tree_lines()
+        self._scan_tail = self._tail()
+
+    def _scan_tree_lines(self):
+        """Find the trees of a treefile file, one per line."""
+        data = self._data
+        size = len(data)
+        for start, end in self._lines(self._scan_offset):
+            line = data[start:end]
+            # a last line without a newline is still being written, unless the tree is closed
+            if end == size and not line.rstrip().endswith(b";"):
+                return
+            self._scan_offset = min(end + 1, size)
+            if b";" in line:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def _scan_tnt_trees(self):
+        """Find the trees of a TNT tread command, each closed by "*" or ";"."""
+        data = self._data
+        pos = self._scan_offset
+        if not self._in_trees:
+            tread = TNT_TREAD_LINE_PATTERN.search(data, pos)
+            if tread is None:
+                return
+            pos = self._scan_offset = tread.end()
+            self._in_trees = True
+        while True:
+            pos = TNT_BLANK_PATTERN.match(data, pos).end()
+            # the closing ";" of the tread command, or the next command
+            if data[pos : pos + 1] == b";" or TNT_PROC_PATTERN.match(data, pos):
+                self._scan_done = True
+                return
+            tree_end = TNT_TREE_END_PATTERN.search(data, pos)
+            # the end of the file, or a tree still being written
+            if tree_end is None:
+                return
+            self._starts.append(pos)
+            self._ends.append(tree_end.start())
+            pos = self._scan_offset = tree_end.end()
+            if tree_end.group() == b";":
+                self._scan_done = True
+                return
+
+    def _scan_nexus_trees(self):
+        """Find the translate command and trees of the first TREES block."""
+        data = self._data
+        pos = self._scan_offset
+        if not self._in_trees:
+            trees_begin = NEXUS_TREES_BEGIN_PATTERN.search(data, pos)
+            if trees_begin is None:
+                return
+            pos = self._scan_offset = trees_begin.end()
+            self._in_trees = True
+        while True:
+            pos = NEXUS_BLANK_PATTERN.match(data, pos).end()
+            command_end = data.find(b";", pos)
+            # the end of the file, or a command still being written
+            if command_end < 0:
+                return
+            if NEXUS_BLOCK_END_PATTERN.match(data, pos, command_end + 1):
+                self._scan_done = True
+                return
+            translate = NEXUS_TRANSLATE_PATTERN.match(data, pos, command_end)
+            tree = NEXUS_TREE_PATTERN.match(data, pos, command_end)
+            if translate:
+                self._read_translate(data[translate.end() : command_end].decode("utf-8"))
+            elif tree:
+                self.tree_names.append(tree.group(1).decode("utf-8"))
+                self._starts.append(tree.end())
+                self._ends.append(command_end)
+            pos = self._scan_offset = command_end + 1
+
+    def _read_translate(self, text):
+        for taxon in text.split(","):
+            taxon_line = re.search(r"(\S+)\s+(\S+)", taxon.strip())
+            if taxon_line:
+                self.taxa_list.append(taxon_line.group(2))
+                self.taxa_hash[taxon_line.group(1)] = taxon_line.group(2)
+
+    def _load_index(self):
+        """Read the saved index if it was made for this file.
+
+        The caller checks whether the file was only appended to since.
+
+        Returns:
+            The (size, mtime_ns) of the file when the index was saved, or
+            None if there is no usable index.
+        """
+        try:
+            data = self.index_path.read_bytes()
+            magic, version, size, mtime_ns, n_trees, metadata_length = (
+                TREE_INDEX_HEADER.unpack_from(data)
+            )
+            if (magic, version) != (TREE_INDEX_MAGIC, TREE_INDEX_VERSION):
+                return None
+            start = TREE_INDEX_HEADER.size
+            metadata = json.loads(data[start : start + metadata_length])
+            if metadata["file_type"] != self.file_type:
+                return None
+            offsets = array("Q")
+            offsets.frombytes(data[start + metadata_length :])
+            if len(offsets) != 2 * n_trees:
+                return None
+            self._scan_offset = metadata["scan_offset"]
+            self._in_trees = metadata["in_trees"]
+            self._scan_done = metadata["scan_done"]
+            self._scan_tail = metadata["scan_tail"]
+            self.taxa_list = metadata["taxa_list"]
+            self.taxa_hash = metadata["taxa_hash"]
+            self.tree_names = metadata["tree_names"]
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        # offsets are saved little-endian
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self._starts = offsets[:n_trees]
+        self._ends = offsets[n_trees:]
+        return (size, mtime_ns)
+
+    def _save_index(self):
+        metadata = json.dumps(
+            {
+                "file_type": self.file_type,
+                "scan_offset": self._scan_offset,
+                "in_trees": self._in_trees,
+                "scan_done": self._scan_done,
+                "scan_tail": self._scan_tail,
+                "taxa_list": self.taxa_list,
+                "taxa_hash": self.taxa_hash,
+                "tree_names": self.tree_names,
+            }
+        ).encode("utf-8")
+        header = TREE_INDEX_HEADER.pack(
+            TREE_INDEX_MAGIC, TREE_INDEX_VERSION, *self._file_key, len(self), len(metadata)
+        )
+        offsets = self._starts + self._ends
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        # readers only ever see a complete index, also while worker processes
+        # of the same folder save theirs
+        temp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            with temp_path.open("wb") as f:
+                f.write(header)
+                f.write(metadata)
+                f.write(offsets.tobytes())
+            temp_path.replace(self.index_path)
+        except OSError as e:
+            # the index is only an optimization, e.g. for read-only result folders
+            logger.debug(f"Could not save tree index {self.index_path}: {e}")
+            temp_path.unlink(missing_ok=True)
+
+
+class ParameterFileReader:
+    """Incrementally read the samples of a MrBayes .p parameter file.
+
+    A .p file starts with an "[ID: ...]" comment and a tab-separated header
+    line (Gen, LnL, LnPr, TL, ...), followed by one line per sample.
+    refresh() reads only what was appended since the last call and keeps a
+    trailing line without a newline for the next call, so the trace of a
+    running analysis can be followed at the cost of the new samples.
+
+    Attributes:
+        file_path: Path of the parameter file.
+        header: Column names, empty until the header line was read.
+        columns: Dictionary mapping column names to arrays of sampled values.
+
+    Example:
+        Following a running MrBayes analysis::
+
+            trace = ParameterFileReader("run.nex.run1.p")
+            ...
+            if trace.refresh():
+                print(f"{len(trace)} samples, LnL {trace.columns['LnL'][-1]}")
+    """
+
+    def __init__(self, a_filepath):
+        self.file_path = Path(a_filepath)
+        self.header = []
+        self.columns = {}
+        self._offset = 0
+        self.refresh()
+
+    def __len__(self):
+        return len(self.columns[self.header[0]]) if self.header else 0
+
+    def refresh(self):
+        """Read the samples appended to the file since the last refresh.
+
+        A file that does not exist yet has no samples. A file that shrank
+        was rewritten and is read again from the start.
+
+        Returns:
+            Number of samples added.
+
+        Raises:
+            OSError: If the file exists but cannot be read.
+        """
+        n_samples = len(self)
+        try:
+            with self.file_path.open("rb") as f:
+                if os.fstat(f.fileno()).st_size < self._offset:
+                    self.header = []
+                    self.columns = {}
+                    self._offset = n_samples = 0
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        # only complete lines; the rest is still being written
+        complete = data.rfind(b"\n") + 1
+        self._offset += complete
+        for line in data[:complete].decode("utf-8").splitlines():
+            fields = line.rstrip().split("\t")
+            if not self.header:
+                if line.strip() and not line.startswith("["):
+                    self.header = [field.strip() for field in fields]
+                    self.columns = {name: array("d") for name in self.header}
+                continue
+            try:
+                values = [float(field) for field in fields]
+            except ValueError:
+                logger.debug(f"Skipping malformed sample in {self.file_path}: {line!r}")
+                continue
+            if len(values) != len(self.header):
+                continue
+            for name, value in zip(self.header, values):
+                self.columns[name].append(value)
+        return len(self) - n_samples
+
+
+TNT_TREE_TOKEN_PATTERN = re.compile(r"[()*;]|[^\s()*;]+")
+# the tread command that starts the trees of a TNT tree file, with its optional comment
+TNT_TREAD_COMMAND_PATTERN = re.compile(r"^\s*tread\b(?:\s*'[^']*')?", re.IGNORECASE | re.MULTILINE)
+# the tokens of Bio.Phylo's Newick parser: labels, quoted labels, comments and branch lengths
+NEWICK_TOKEN_PATTERN = re.compile(
+    r"\[(?:\\.|[^\]])*\]|'(?:[^']|'')*'|:\s?[+-]?[0-9]*\.?[0-9]+(?:[eE][+-]?[0-9]+)?"
+    r"|[(),;]|[^\s()\[\]':;,]+"
+)
+# a comment before the tree, such as the [&U] of MrBayes trees
+NEWICK_LEADING_COMMENT_PATTERN = re.compile(r"\s*\[((?:\\.|[^\]])*)\]")
+# shorter trees are parsed faster token by token than with array operations
+NEWICK_ARRAY_PARSE_SIZE = 1500
+# delimiters mapped to NUL, to split labels and branch lengths apart with str.split()
+NEWICK_DELIMITER_TABLE = bytes.maketrans(b"(),:", b"\0\0\0\0")
+NEWICK_WHITESPACE_PATTERN = re.compile(r"\s")
+NEWICK_DELIMITER_SPACE_PATTERN = re.compile(r"\s*([(),:])\s*")
+NEWICK_DELIMITERS = np.zeros(256, dtype=bool)
+NEWICK_DELIMITERS[list(b"(),:")] = True
+NEWICK_UNQUOTED_LABEL_PATTERN = re.compile(r"[^\s()\[\]':;,]+")
+
+
+def _take(items, indices):
+    """Get the items at an array of indices as a list."""
+    if len(indices) == 0:
+        return []
+    taken = itemgetter(*indices.tolist())(items)
+    return list(taken) if len(indices) > 1 else [taken]
+
+
+class NewickTree:
+    """Rooted tree parsed from Newick text into flat arrays.
+
+    Nodes are numbered in the order they appear in the text, which is a
+    preorder with the root as node 0, so reversed node numbers visit
+    children before their parents. The children of a node are
+    children[child_offsets[node] : child_offsets[node + 1]], in the order of
+    the text. A tree of a few thousand taxa takes a handful of arrays instead
+    of a Bio.Phylo Clade object per node; to_phylo() builds those when they
+    are needed, such as for drawing.
+
+    Labels are read as by Bio.Phylo.read(): numeric labels of internal
+    nodes are support values, and comments are kept with the node they
+    follow.
+
+    Attributes:
+        parent: Parent of every node, -1 for the root.
+        child_offsets: Start of the children of every node in children,
+            followed by the number of child links.
+        children: Child nodes, grouped by parent.
+        names: Label of every node, or None.
+        branch_lengths: Branch length of every node, NaN where not given.
+        support: Support value of every node, NaN where not given.
+        comments: Comment of every node, or None.
+
+    Example:
+        Reading and renaming a MrBayes tree::
+
+            tree = NewickTree.parse("((1:0.1,2:0.2)0.95:0.05,3:0.3);")
+            tree.translate({"1": "TaxonA", "2": "TaxonB", "3": "TaxonC"})
+            print(tree.to_newick())
+    """
+
+    def __init__(self, parent, names, branch_lengths, support=None, comments=None):
+        self.parent = np.asarray(parent, dtype=np.int32)
+        n_nodes = len(self.parent)
+        self.names = list(names)
+        self.branch_lengths = np.asarray(branch_lengths, dtype=np.float64)
+        self.support = (
+            np.full(n_nodes, np.nan) if support is None else np.asarray(support, dtype=np.float64)
+        )
+        self.comments = [None] * n_nodes if comments is None else list(comments)
+
+        # group the child links by parent; a stable sort keeps siblings in order
+        child_nodes = np.flatnonzero(self.parent >= 0)
+        child_parents = self.parent[child_nodes]
+        self.children = child_nodes[np.argsort(child_parents, kind="stable")].astype(np.int32)
+        self.child_offsets = np.zeros(n_nodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(child_parents, minlength=n_nodes), out=self.child_offsets[1:])
+
+    def __len__(self):
+        return len(self.parent)
+
+    @classmethod
+    def parse(cls, newick_text):
+        """Parse one Newick tree.
+
+        Args:
+            newick_text: Newick text of the tree; text after ";" is ignored.
+
+        Returns:
+            The parsed NewickTree.
+
+        Raises:
+            DataParsingError: If the parentheses are not balanced.
+        """
+        leading_comment = NEWICK_LEADING_COMMENT_PATTERN.match(newick_text)
+        text = newick_text[leading_comment.end() :] if leading_comment else newick_text
+        if len(text) < NEWICK_ARRAY_PARSE_SIZE or "[" in text or "'" in text:
+            tree = cls._parse_tokens(newick_text)
+        else:
+            tree = cls._parse_plain(text.split(";", 1)[0])
+            if leading_comment:
+                tree.comments[0] = leading_comment.group(1)
+
+        # numeric labels of internal nodes are support values
+        internal = np.flatnonzero(np.diff(tree.child_offsets))
+        names = np.array(tree.names, dtype=object)
+        labelled = internal[np.not_equal(names[internal], None)]
+        try:
+            tree.support[labelled] = np.array(names[labelled], dtype=np.float64)
+            names[labelled] = None
+        except ValueError:
+            for node in labelled.tolist():
+                with suppress(ValueError):
+                    tree.support[node] = float(names[node])
+                    names[node] = None
+        tree.names = names.tolist()
+        return tree
+
+    @classmethod
+    def _parse_plain(cls, text):
+        """Parse a tree without comments or quoted labels, without a token loop.
+
+        Every "(" and "," starts a node one level deeper than or at the same
+        level as the node before, and ")" returns to the parent. The node a
+        label or branch length belongs to is then the node most recently
+        started at the current depth, which is found for all delimiters at
+        once by a binary search over the nodes sorted by depth and position.
+        """
+        text = text.strip()
+        if NEWICK_WHITESPACE_PATTERN.search(text):
+            text = NEWICK_DELIMITER_SPACE_PATTERN.sub(r"\1", text)
+        data = text.encode("utf-8")
+        codes = np.frombuffer(data, dtype=np.uint8)
+        delimiters = codes[NEWICK_DELIMITERS[codes]]
+        # segments[k] is the label or branch length after delimiter k - 1
+        segments = data.translate(NEWICK_DELIMITER_TABLE).decode("utf-8").split("\0")
+        n_delimiters = len(delimiters)
+        is_open = delimiters == ord("(")
+        is_comma = delimiters == ord(",")
+        depth = np.cumsum(is_open.astype(np.int64) - (delimiters == ord(")")))
+        if n_delimiters and (depth.min() < 0 or depth[-1] != 0):
+            raise DataParsingError("Parenthesis mismatch in Newick tree")
+        if np.any(depth[is_comma] == 0):
+            raise DataParsingError("Newick tree is not enclosed in parentheses")
+
+        positions = np.arange(1, n_delimiters + 1)
+        starts = is_open | is_comma
+        node_positions = np.concatenate(([0], positions[starts]))
+        node_depths = np.concatenate(([0], depth[starts]))
+        stride = n_delimiters + 1
+        node_order = np.argsort(node_depths * stride + node_positions)
+        sorted_keys = (node_depths * stride + node_positions)[node_order]
+
+        def open_nodes(depths, positions):
+            keys = depths * stride + positions
+            return node_order[np.searchsorted(sorted_keys, keys, side="right") - 1]
+
+        n_nodes = len(node_positions)
+        parent = np.full(n_nodes, -1, dtype=np.int32)
+        parent[1:] = open_nodes(node_depths[1:] - 1, node_positions[1:])
+        current = open_nodes(depth, positions)
+
+        # a terminal is labelled after the delimiter starting it, an internal node after its ")"
+        label_positions = node_positions.copy()
+        closes = np.flatnonzero(delimiters == ord(")"))
+        label_positions[current[closes]] = closes + 1
+        names = [name or None for name in _take(segments, label_positions)]
+        branch_lengths = np.full(n_nodes, np.nan)
+        length_indices = np.flatnonzero(delimiters == ord(":"))
+        try:
+            branch_lengths[current[length_indices]] = np.array(
+                _take(segments, length_indices + 1), dtype=np.float64
+            )
+        except ValueError as e:
+            raise DataParsingError(f"Invalid branch length in Newick tree: {e}") from e
+        return cls(parent, names, branch_lengths)
+
+    @classmethod
+    def _parse_tokens(cls, newick_text):
+        """Parse a tree token by token, as Bio.Phylo's Newick parser does."""
+        parent = [-1]
+        # labels, branch lengths and comments by node
+        names = {}
+        branch_lengths = {}
+        comments = {}
+        current = 0
+        for token in NEWICK_TOKEN_PATTERN.findall(newick_text):
+            first = token[0]
+            if first == "(":
+                # the first child of the current node
+                parent.append(current)
+                current = len(parent) - 1
+            elif first == ",":
+                current = parent[current]
+                if current < 0:
+                    raise DataParsingError("Newick tree is not enclosed in parentheses")
+                parent.append(current)
+                current = len(parent) - 1
+            elif first == ")":
+                current = parent[current]
+                if current < 0:
+                    raise DataParsingError("Parenthesis mismatch in Newick tree")
+            elif first == ":":
+                branch_lengths[current] = token[1:]
+            elif first == "[":
+                comments[current] = token[1:-1]
+            elif first == ";":
+                break
+            elif first == "'":
+                names[current] = token[1:-1].replace("''", "'")
+            else:
+                names[current] = token
+        if current != 0:
+            raise DataParsingError("Parenthesis mismatch in Newick tree")
+
+        nodes = range(len(parent))
+        lengths = np.full(len(parent), np.nan)
+        lengths[list(branch_lengths)] = np.array(list(branch_lengths.values()), dtype=np.float64)
+        return cls(
+            parent,
+            list(map(names.get, nodes)),
+            lengths,
+            comments=list(map(comments.get, nodes)),
+        )
+
+    @classmethod
+    def parse_tnt(cls, tree_text):
+        """Parse one tree of a TNT tread command.
+
+        TNT trees list taxon numbers or names separated by spaces, such as
+        "(0 (1 2 ))", and may be split over several lines. A closing "*" or
+        ";" and anything after it is ignored.
+
+        Args:
+            tree_text: Text of the tree.
+
+        Returns:
+            The parsed NewickTree, with taxon numbers or names as labels.
+
+        Raises:
+            DataParsingError: If the text is not a complete tree.
+        """
+        tokens = iter(TNT_TREE_TOKEN_PATTERN.findall(tree_text))
+        tree = cls._read_tnt_tree(tokens, next(tokens, ";"))
+        if tree is None:
+            raise DataParsingError("Empty TNT tree")
+        return tree
+
+    @classmethod
+    def _read_tnt_tree(cls, tokens, token):
+        """Read a TNT tree from its first token to its closing "*" or ";".
+
+        Args:
+            tokens: Iterator over the tokens after token.
+            token: First token of the tree.
+
+        Returns:
+            The tree, or None if token does not start one.
+        """
+        if token != "(":
+            return None
+        parent = [-1]
+        names = [None]
+        current = 0
+        for token in tokens:
+            if token == "(":
+                parent.append(current)
+                names.append(None)
+                current = len(parent) - 1
+            elif token == ")":
+                current = parent[current]
+                if current < 0:
+                    break
+            elif token == "*" or token == ";":
+                break
+            else:
+                parent.append(current)
+                names.append(token)
+        if current >= 0:
+            raise DataParsingError("Parenthesis mismatch in TNT tree")
+        return cls(parent, names, np.full(len(parent), np.nan))
+
+    def is_terminal(self, node):
+        """Check whether a node has no children."""
+        return self.child_offsets[node] == self.child_offsets[node + 1]
+
+    def child_nodes(self, node):
+        """Get the children of a node, in order."""
+        return self.children[self.child_offsets[node] : self.child_offsets[node + 1]]
+
+    def terminals(self):
+        """Get the terminal nodes from left to right."""
+        return np.flatnonzero(np.diff(self.child_offsets) == 0)
+
+    def translate(self, table, first_number=1):
+        """Replace node labels by the names they stand for.
+
+        Labels missing from the table are kept.
+
+        Args:
+            table: Dictionary mapping labels to names, such as the taxa_hash
+                of a Nexus translate command, or a list of names indexed by
+                the numbers of the labels.
+            first_number: Number of the first name of a list; TNT numbers
+                taxa from 0.
+        """
+        is_mapping = isinstance(table, dict)
+        for node, name in enumerate(self.names):
+            if name is None:
+                continue
+            with suppress(KeyError, ValueError, IndexError):
+                if is_mapping:
+                    self.names[node] = table[name]
+                elif int(name) >= first_number:
+                    self.names[node] = table[int(name) - first_number]
+
+    def to_newick(self, plain=False):
+        """Write the tree as Newick text.
+
+        The text is the same as that of Bio.Phylo.write() for the tree
+        returned by to_phylo(), without the trailing newline.
+
+        Args:
+            plain: Whether to leave out branch lengths and support values.
+
+        Returns:
+            Newick text ending with ";".
+        """
+        info = []
+        is_internal = (np.diff(self.child_offsets) > 0).tolist()
+        branch_lengths = self.branch_lengths.tolist()
+        support = self.support.tolist()
+        for node in range(len(self)):
+            label = self.names[node] or ""
+            if label and not label.isalnum():
+                match = NEWICK_UNQUOTED_LABEL_PATTERN.match(label)
+                if match is None or match.end() < len(label):
+                    label = "'{}'".format(label.replace("'", "''"))
+            if not plain:
+                length = 0.0 if math.isnan(branch_lengths[node]) else branch_lengths[node]
+                if is_internal[node] and not math.isnan(support[node]):
+                    label += f"{support[node]:1.2f}"
+                label += f":{length:1.8g}"
+            comment = self.comments[node]
+            if comment:
+                label += "[{}]".format(comment.replace("[", "\\[").replace("]", "\\]"))
+            info.append(label)
+
+        # nodes are in preorder; close the open nodes that are not ancestors of the next one
+        is_first_child = np.zeros(len(self), dtype=bool)
+        is_first_child[self.children[self.child_offsets[:-1][np.array(is_internal, bool)]]] = True
+        is_first_child = is_first_child.tolist()
+        parts = []
+        open_nodes = []
+        for node, parent in enumerate(self.parent.tolist()):
+            while open_nodes and open_nodes[-1] != parent:
+                parts.append(")" + info[open_nodes.pop()])
+            if parent >= 0 and not is_first_child[node]:
+                parts.append(",")
+            if is_internal[node]:
+                parts.append("(")
+                open_nodes.append(node)
+            else:
+                parts.append(info[node])
+        while open_nodes:
+            parts.append(")" + info[open_nodes.pop()])
+        parts.append(";")
+        return "".join(parts)
+
+    def to_phylo(self):
+        """Build the Bio.Phylo tree of this tree, as Bio.Phylo.read() would.
+
+        Returns:
+            A Bio.Phylo.Newick.Tree.
+        """
+        clades = []
+        for node in range(len(self)):
+            length = self.branch_lengths[node]
+            support = self.support[node]
+            clade = Newick.Clade(
+                branch_length=None if math.isnan(length) else float(length),
+                name=self.names[node],
+                confidence=None if math.isnan(support) else float(support),
+            )
+            clade.comment = self.comments[node]
+            parent = self.parent[node]
+            if parent >= 0:
+                clades[parent].clades.append(clade)
+            clades.append(clade)
+        return Newick.Tree(root=clades[0], rooted=False)
+
+
+def read_tnt_trees(text):
+    """Iterate over the trees of a TNT tree file in one pass.
+
+    The trees follow the first tread command and are separated by "*"; the
+    command ends at ";" or at the next command, such as "proc".
+
+    Args:
+        text: Text of the tree file.
+
+    Yields:
+        NewickTree of every tree, with taxon numbers or names as labels.
+
+    Raises:
+        DataParsingError: If a tree is not complete.
+    """
+    tread = TNT_TREAD_COMMAND_PATTERN.search(text)
+    if tread is None:
+        return
+    tokens = iter(TNT_TREE_TOKEN_PATTERN.findall(text, tread.end()))
+    for token in tokens:
+        if token == "*":
+            continue
+        tree = NewickTree._read_tnt_tree(tokens, token)
+        if tree is None:
+            return
+        yield tree
+
+
+# matrix rows whose states are ranked at a time by FitchMatrix
+FITCH_CHUNK_ROWS = 1024
+
+
+class FitchMatrix:
+    """Character matrix encoded as state bitmasks for Fitch parsimony.
+
+    The states of every character are ranked in sorted order and a cell
+    becomes the bitmask of its states: one bit for a single state, several
+    for a polymorphic cell, and all states of the character for missing
+    data. Intersections and unions of state sets then take one bitwise
+    operation for all characters of a node.
+
+    Attributes:
+        bits: Unsigned integer array (taxa x characters) of state bitmasks.
+        missing: Boolean array (taxa x characters) of missing cells,
+            including the padding of short rows.
+        state_table: Object array (ranks + 1 x characters) of the state of
+            every rank, shifted down one row; row 0 holds MISSING_STATE for
+            characters without any state.
+
+    Raises:
+        DataParsingError: If a character has more than 64 states.
+
+    Example:
+        Resolving the states of a node::
+
+            matrix = FitchMatrix([["0", "1"], [["0", "1"], "?"]])
+            matrix.decode(matrix.bits[1] & -matrix.bits[1])  # ['0', '1']
+    """
+
+    MISSING_STATES = frozenset(["?", "-"])
+    MISSING_STATE = "?"
+
+    def __init__(self, datamatrix):
+        try:
+            blob, alphabet, polymorphic_cells = encode_datamatrix(datamatrix)
+        except DataParsingError:
+            codes, alphabet, polymorphic_cells = _encode_wide(datamatrix)
+        else:
+            n_rows, n_cols = _blob_dimensions(blob)
+            codes = np.frombuffer(blob, dtype=np.uint8, offset=DATAMATRIX_BLOB_HEADER.size)
+            codes = codes.reshape(n_rows, n_cols)
+        n_rows, n_cols = codes.shape
+
+        # sorted state index of every state code; -1 for missing data
+        states = {state for _row, _col, cell in polymorphic_cells for state in cell}
+        states.update(state for state in alphabet if isinstance(state, str))
+        states = sorted(states - self.MISSING_STATES)
+        state_index = {state: index for index, state in enumerate(states)}
+        index_dtype = np.int16 if len(states) < np.iinfo(np.int16).max else np.int32
+        code_index = np.full(max(int(codes.max(initial=0)), len(alphabet)) + 1, -1, index_dtype)
+        for code, state in enumerate(alphabet, 1):
+            if isinstance(state, str):
+                code_index[code] = state_index.get(state, -1)
+        cell_index = code_index[codes]
+        self.missing = cell_index < 0
+        self.missing[codes == STATE_CODE_POLYMORPHIC] = False
+
+        # rank the states found in every character
+        present = np.zeros((len(states) + 1, n_cols), dtype=bool)
+        columns = np.arange(n_cols)
+        for start in range(0, n_rows, FITCH_CHUNK_ROWS):
+            present[cell_index[start : start + FITCH_CHUNK_ROWS] + 1, columns] = True
+        present[0] = False
+        poly_states = [
+            (row, col, [state_index[state] for state in cell if state in state_index])
+            for row, col, cell in polymorphic_cells
+        ]
+        for _row, col, indices in poly_states:
+            present[np.array(indices, dtype=np.int64) + 1, col] = True
+        ranks = np.cumsum(present, axis=0, dtype=np.int32) - 1
+        n_states = int(ranks[-1].max(initial=-1)) + 1
+        dtype = _bitmask_dtype(n_states)
+
+        rows, cols = np.nonzero(present)
+        self.state_table = np.full((n_states + 1, n_cols), self.MISSING_STATE, dtype=object)
+        self.state_table[ranks[rows, cols] + 1, cols] = np.array(states, dtype=object)[rows - 1]
+        one = dtype(1)
+        self.bits = np.left_shift(one, np.maximum(ranks[cell_index + 1, columns], 0).astype(dtype))
+        column_masks = np.zeros(n_cols, dtype=dtype)
+        for rank in range(n_states):
+            column_masks[ranks[-1] >= rank] |= one << dtype(rank)
+        self.bits[self.missing] = np.broadcast_to(column_masks, self.bits.shape)[self.missing]
+        for row, col, indices in poly_states:
+            cell_bits = dtype(0)
+            for index in indices:
+                cell_bits |= one << dtype(ranks[index + 1, col])
+            self.bits[row, col] = cell_bits or column_masks[col]
+
+    @property
+    def n_chars(self):
+        return self.bits.shape[1]
+
+    def decode(self, bits):
+        """Get the states of single-state bitmasks.
+
+        Args:
+            bits: Bitmasks with at most one bit set, of one node or of
+                several (nodes x characters); 0 gives MISSING_STATE.
+
+        Returns:
+            List of states, or a list of them per node.
+        """
+        rank_rows = np.frexp(bits.astype(np.float64))[1]
+        return self.state_table[rank_rows, np.arange(self.n_chars)].tolist()
+
+    def set_cell(self, row, col, value):
+        """Change one cell, ranking the states of its character again if needed.
+
+        Args:
+            row: Matrix row of the cell.
+            col: Character of the cell.
+            value: State, list of states of a polymorphic cell, or a
+                missing state.
+
+        Returns:
+            Whether the states found in the character changed. Their ranks
+            and the bitmask of its missing cells are then updated as well.
+
+        Raises:
+            DataParsingError: If the character gets more than 64 states.
+        """
+        cells = value if isinstance(value, list) else [value]
+        states = {state for state in cells if isinstance(state, str)} - self.MISSING_STATES
+        ranked = [
+            state for state in self.state_table[1:, col].tolist() if state != self.MISSING_STATE
+        ]
+
+        # states still found in the other cells of the character
+        others = ~self.missing[:, col]
+        others[row] = False
+        used = int(np.bitwise_or.reduce(self.bits[others, col])) if others.any() else 0
+        character_states = {state for rank, state in enumerate(ranked) if used >> rank & 1}
+        character_states = sorted(character_states | states)
+
+        self.missing[row, col] = not states
+        states_changed = character_states != ranked
+        if states_changed:
+            self._rank_character(col, ranked, character_states)
+        state_rank = {state: rank for rank, state in enumerate(character_states)}
+        cell_bits = sum(1 << state_rank[state] for state in states)
+        self.bits[row, col] = cell_bits or (1 << len(character_states)) - 1
+        return states_changed
+
+    def _rank_character(self, col, ranked, character_states):
+        """Move the state bits of a character from old ranks to new ones."""
+        if len(character_states) > np.iinfo(self.bits.dtype).bits:
+            self.bits = self.bits.astype(_bitmask_dtype(len(character_states)))
+        if len(character_states) >= len(self.state_table):
+            padding = np.full(
+                (len(character_states) + 1 - len(self.state_table), self.n_chars),
+                self.MISSING_STATE,
+                dtype=object,
+            )
+            self.state_table = np.vstack([self.state_table, padding])
+
+        state_rank = {state: rank for rank, state in enumerate(character_states)}
+        column = self.bits[:, col]
+        one = self.bits.dtype.type(1)
+        bits = np.zeros_like(column)
+        for rank, state in enumerate(ranked):
+            if state in state_rank:
+                bits |= ((column >> rank) & one) << state_rank[state]
+        bits[self.missing[:, col]] = (1 << len(character_states)) - 1
+        self.bits[:, col] = bits
+        self.state_table[1:, col] = self.MISSING_STATE
+        self.state_table[1 : len(character_states) + 1, col] = character_states
+
+    def reconstruct(self, parent, leaf_rows):
+        """Run both passes of the Fitch algorithm over a tree.
+
+        Args:
+            parent: Parent of every node in preorder, -1 for the root.
+            leaf_rows: Matrix row of every node; ignored for nodes with
+                children.
+
+        Returns:
+            The FitchReconstruction of the tree.
+        """
+        return FitchReconstruction(self, parent, leaf_rows)
+
+
+class FitchReconstruction:
+    """Ancestral states of a tree reconstructed with Fitch parsimony.
+
+    The bottom-up pass takes the intersection of the child state sets of a
+    node, or their union where it is empty. The top-down pass keeps the
+    state of the parent where it is possible, and otherwise takes the
+    lowest state. Every node takes a few bitwise operations over all
+    characters; choices between two values are made with masks rather than
+    boolean indexing, which is much slower.
+
+    The state sets of the bottom-up pass are kept, so that update_cell()
+    redoes only the character of an edited cell, and only on the path from
+    its leaf to the root and in the subtree whose states can follow. A
+    change to the states found in the character, which also changes its
+    missing cells, redoes the character over the whole tree.
+
+    Attributes:
+        matrix: FitchMatrix of the cells; update_cell() changes it.
+        parent: Parent of every node in preorder, -1 for the root.
+        leaf_rows: Matrix row of every node; ignored for nodes with
+            children.
+        down: State sets of the bottom-up pass (nodes x characters).
+        resolved: Single-state bitmasks of every node (nodes x characters).
+        changed: Whether each character changes on the branch to each node.
+
+    Example:
+        Following an edit of the first cell::
+
+            reconstruction = FitchMatrix(datamatrix).reconstruct(parent, leaf_rows)
+            nodes = reconstruction.update_cell(0, 0, "1")
+            reconstruction.changed[nodes, 0]
+    """
+
+    def __init__(self, matrix, parent, leaf_rows):
+        self.matrix = matrix
+        self.parent = np.asarray(parent)
+        self.leaf_rows = np.asarray(leaf_rows)
+        n_nodes = len(self.parent)
+        self._has_children = np.zeros(n_nodes, dtype=bool)
+        self._has_children[self.parent[self.parent >= 0]] = True
+
+        # children of every node and the end of every subtree, for updates of one character
+        self._children = [[] for _ in range(n_nodes)]
+        self._subtree_ends = list(range(1, n_nodes + 1))
+        parents = self.parent.tolist()
+        for node in range(n_nodes - 1, 0, -1):
+            self._children[parents[node]].insert(0, node)
+            self._subtree_ends[parents[node]] = max(
+                self._subtree_ends[parents[node]], self._subtree_ends[node]
+            )
+
+        self.down = self._down_pass()
+        self.resolved = self.down.copy()
+        self.changed = np.zeros((n_nodes, matrix.n_chars), dtype=bool)
+        self._resolve()
+
+    def _down_pass(self):
+        """Get the state sets of the bottom-up pass for all characters."""
+        parent, has_children = self.parent, self._has_children
+        bits = self.matrix.bits
+        # intersect child sets in place, keeping their union aside
+        all_states = np.bitwise_or.reduce(bits, axis=0) if len(bits) else 0
+        sets = np.empty((len(parent), self.matrix.n_chars), dtype=bits.dtype)
+        unions = np.zeros_like(sets)
+        sets[has_children] = all_states
+        sets[~has_children] = bits[self.leaf_rows[~has_children]]
+        for node in range(len(parent) - 1, -1, -1):
+            if has_children[node]:
+                sets[node] |= unions[node] & ~_nonzero_mask(sets[node])
+            if node:
+                sets[parent[node]] &= sets[node]
+                unions[parent[node]] |= sets[node]
+        return sets
+
+    def _resolve(self):
+        """Resolve every node against its parent for all characters."""
+        resolved, parent = self.resolved, self.parent
+        if len(resolved):
+            resolved[0] &= -resolved[0]
+        for node in range(1, len(resolved)):
+            parent_bits = resolved[parent[node]]
+            node_bits = resolved[node]
+            kept = node_bits & parent_bits
+            node_bits &= -node_bits
+            node_bits &= ~_nonzero_mask(kept)
+            node_bits |= kept
+            np.not_equal(node_bits, parent_bits, out=self.changed[node])
+
+    def update_cell(self, row, col, value):
+        """Change one cell and update the reconstruction of its character.
+
+        Args:
+            row: Matrix row of the cell.
+            col: Character of the cell.
+            value: State, list of states of a polymorphic cell, or a
+                missing state.
+
+        Returns:
+            Slice of the nodes whose states of the character were resolved
+            again; the other nodes are unchanged.
+
+        Raises:
+            DataParsingError: If the character gets more than 64 states.
+        """
+        states_changed = self.matrix.set_cell(row, col, value)
+        if self.down.dtype != self.matrix.bits.dtype:
+            self.down = self.down.astype(self.matrix.bits.dtype)
+            self.resolved = self.resolved.astype(self.matrix.bits.dtype)
+        if not len(self.parent):
+            return slice(0, 0)
+
+        down = self.down[:, col].tolist()
+        leaves = ~self._has_children
+        if states_changed:
+            # every leaf can have other bits; redo all nodes
+            leaf_bits = self.matrix.bits[self.leaf_rows, col]
+            self.down[leaves, col] = leaf_bits[leaves]
+            down = self.down[:, col].tolist()
+            for node in range(len(down) - 1, -1, -1):
+                if self._children[node]:
+                    down[node] = self._down_set(down, node)
+            top = 0
+        else:
+            edited = np.flatnonzero(leaves & (self.leaf_rows == row)).tolist()
+            if not edited:
+                return slice(0, 0)
+            top = node = edited[0]
+            down[node] = int(self.matrix.bits[row, col])
+            # go up while the state sets change
+            node = int(self.parent[node])
+            while node >= 0:
+                node_set = self._down_set(down, node)
+                if node_set == down[node]:
+                    break
+                down[node] = node_set
+                top = node
+                node = int(self.parent[node])
+        self.down[:, col] = down
+
+        # resolve the subtree of the highest changed node again
+        end = self._subtree_ends[top]
+        resolved = self.resolved[:, col].tolist()
+        parents = self.parent.tolist()
+        for node in range(top, end):
+            node_set = down[node]
+            parent_bits = resolved[parents[node]] if node else 0
+            resolved[node] = parent_bits if node_set & parent_bits else node_set & -node_set
+        self.resolved[top:end, col] = resolved[top:end]
+        nodes = slice(top, end)
+        self.changed[nodes, col] = (
+            self.resolved[nodes, col] != self.resolved[np.maximum(self.parent[nodes], 0), col]
+        )
+        return nodes
+
+    def _down_set(self, down, node):
+        """Get the bottom-up state set of a node from those of its children."""
+        intersection, union = -1, 0
+        for child in self._children[node]:
+            intersection &= down[child]
+            union |= down[child]
+        return intersection or union
+
+    def decode(self, nodes, col):
+        """Get the resolved states of nodes for one character."""
+        ranks = [int(bits).bit_length() for bits in self.resolved[nodes, col].tolist()]
+        return self.matrix.state_table[ranks, col].tolist()
+
+    @property
+    def nbytes(self):
+        """Bytes taken by the cells and state arrays."""
+        arrays = (self.down, self.resolved, self.changed, self.matrix.bits, self.matrix.missing)
+        return sum(array.nbytes for array in arrays) + self.matrix.state_table.nbytes
+
+    def copy(self):
+        """Get a copy whose cells and states can be updated independently.
+
+        The tree arrays, which update_cell() does not change, are shared.
+        """
+        reconstruction = copy.copy(self)
+        reconstruction.matrix = copy.copy(self.matrix)
+        reconstruction.matrix.bits = self.matrix.bits.copy()
+        reconstruction.matrix.missing = self.matrix.missing.copy()
+        reconstruction.matrix.state_table = self.matrix.state_table.copy()
+        reconstruction.down = self.down.copy()
+        reconstruction.resolved = self.resolved.copy()
+        reconstruction.changed = self.changed.copy()
+        return reconstruction
+
+
+def _bitmask_dtype(n_states):
+    """Get the smallest unsigned integer type with a bit for every state."""
+    if n_states > 64:
+        raise DataParsingError("A character has more than 64 states")
+    return next(
+        dtype
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64)
+        if n_states <= np.iinfo(dtype).bits
+    )
+
+
+def _nonzero_mask(bits):
+    """Get all bits set where bits is not 0, and 0 elsewhere."""
+    top_bit = bits.dtype.type(bits.itemsize * 8 - 1)
+    return -((bits | -bits) >> top_bit)
+
+
+# estimated bytes of the reconstructions kept by AncestralStateCache
+DEFAULT_ANCESTRAL_STATE_CACHE_SIZE = 256 * 1024 * 1024
+# reconstruction method and the states it takes as missing data, part of cache keys
+ANCESTRAL_STATE_OPTIONS = ("fitch", *sorted(FitchMatrix.MISSING_STATES))
+
+
+class AncestralStateCache:
+    """Bounded in-memory cache of ancestral state reconstructions.
+
+    Entries are keyed by a hash of the canonical topology of the tree with
+    the matrix row of every terminal, a content hash of the matrix (see
+    matrix_content_hash) and ANCESTRAL_STATE_OPTIONS. A key refers to one
+    version of the data, so entries never need explicit invalidation;
+    reconstructions of edited matrices simply age out of the LRU order.
+
+    Entries hold the FitchReconstruction together with the states and
+    changes of every node, so a tree shown again takes neither the Fitch
+    passes nor the decoding of its states. The least recently used entries
+    are dropped when their estimated size grows beyond max_size bytes; the
+    newest entry is always kept.
+
+    Attributes:
+        max_size: Maximum estimated size of the entries in bytes.
+        hits: Number of reconstructions found in the cache.
+        misses: Number of reconstructions that had to be computed.
+        evictions: Number of entries dropped to stay within max_size.
+    """
+
+    def __init__(self, max_size=DEFAULT_ANCESTRAL_STATE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def lookup(self, key):
+        """Get a cached entry.
+
+        Returns:
+            Tuple of (found, entry).
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, self._entries[key][0]
+        self.misses += 1
+        return False, None
+
+    def store(self, key, entry, size):
+        """Cache an entry, evicting the least recently used beyond max_size.
+
+        Args:
+            key: Key of the entry.
+            entry: Value to cache.
+            size: Estimated size of the entry in bytes.
+        """
+        if key in self._entries:
+            self._size -= self._entries[key][1]
+        self._entries[key] = (entry, size)
+        self._entries.move_to_end(key)
+        self._size += size
+        while self._size > self.max_size and len(self._entries) > 1:
+            _key, (_entry, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        self._entries.clear()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Get cache counters and size.
+
+        Returns:
+            Dictionary with hits, misses, evictions, entries (number of
+            cached reconstructions), size (estimated bytes) and max_size.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size": self._size,
+            "max_size": self.max_size,
+        }
+
+
+ancestral_state_cache = AncestralStateCache()
+
+
+def _canonical_clades(tree):
+    """Get the clades of a tree in preorder, with children in a canonical order.
+
+    Children are ordered by the first name among their terminals, so trees
+    of one topology list their clades in the same order however their
+    children were written. Fitch parsimony does not depend on that order.
+    """
+    clades = list(tree.find_clades(order="preorder"))
+    first_names = {}
+    for clade in reversed(clades):
+        first_names[id(clade)] = min(
+            (first_names[id(child)] for child in clade.clades), default=clade.name or ""
+        )
+    ordered = []
+    stack = [tree.root]
+    while stack:
+        clade = stack.pop()
+        ordered.append(clade)
+        stack.extend(sorted(clade.clades, key=lambda child: first_names[id(child)], reverse=True))
+    return ordered
+
+
 # Function to reconstruct ancestral states for all characters in the data matrix
-def reconstruct_ancestral_states(tree, datamatrix, taxa_list):
+def reconstruct_ancestral_states(tree, datamatrix, taxa_list, cache=None, matrix_hash=None):
     """Reconstruct ancestral character states using Fitch parsimony algorithm.
 
-    Implements the two-pass Fitch algorithm to infer ancestral character
-    states for all internal nodes in a phylogenetic tree. Handles polymorphic
-    characters (states represented as sets).
+    Encodes the matrix with FitchMatrix and runs both passes of the Fitch
+    algorithm for all characters at once. Polymorphic cells allow each of
+    their states, and missing data ("?" or "-") allows any state.
 
     Args:
         tree: Bio.Phylo tree object with terminal nodes.
         datamatrix: Nested list of character states [taxa][characters].
         taxa_list: List of taxon names matching tree terminal nodes.
+        cache: Optional AncestralStateCache to look the reconstruction up
+            in and store it to.
+        matrix_hash: matrix_content_hash() of taxa_list and datamatrix, for
+            the cache key. Computed from them if not given, which takes
+            about as long as a small reconstruction.
+
+    Returns:
+        The FitchReconstruction, to follow cell edits with
+        update_ancestral_states(). One found in or stored to a cache is
+        shared with other trees; edit a copy() of it.
+
+    Raises:
+        ValueError: If a terminal node is not in taxa_list.
 
     Note:
         Modifies tree nodes in-place by adding:
-            - character_states: List of inferred states per character
+            - character_states: List of inferred states per character;
+              terminal nodes keep their missing data
             - changed_characters: List of character indices that changed
     """
-    # Initialize ancestral states for each character
-    # print("taxa list:", taxa_list)
-    # print("morphological_data:", datamatrix, len(datamatrix[0]))
-    for node in tree.find_clades():
-        node.character_states = [None] * len(datamatrix[0])
-        node.changed_characters = []
-        # initialize terminal nodes with their character states
-        if node.is_terminal():
-            taxon_idx = taxa_list.index(node.name)
-            # print("taxon:", node.name, datamatrix[taxon_idx])
-            # print("node.confidence:", node.confidence)
-            for character, state in enumerate(datamatrix[taxon_idx]):
-                if isinstance(state, list):
-                    node.character_states[character] = set(state)
-                else:
-                    node.character_states[character] = set([state])
-                # print( character, state)
-
-    bottom_up_pass(tree.root, datamatrix)
-    # print("bottom up done, root.confidence:", tree.root.character_states)
-
-    # Perform the second pass (top-down traversal)
-    top_down_pass(tree.root, datamatrix)
-
-
-# Function to perform the first pass of the Fitch algorithm (bottom-up traversal)
-def bottom_up_pass(node, datamatrix):
-    """Perform bottom-up pass of Fitch algorithm.
-
-    First pass of Fitch parsimony: traverse tree from tips to root,
-    computing possible ancestral states at each internal node based on
-    child states. Uses set intersections and unions to minimize changes.
+    clades = _canonical_clades(tree)
+    clade_index = {id(clade): index for index, clade in enumerate(clades)}
+    taxon_rows = {taxon: row for row, taxon in enumerate(taxa_list)}
+    parent = np.full(len(clades), -1, dtype=np.int64)
+    leaf_rows = np.zeros(len(clades), dtype=np.int64)
+    for index, clade in enumerate(clades):
+        for child in clade.clades:
+            parent[clade_index[id(child)]] = index
+        if clade.is_terminal():
+            if clade.name not in taxon_rows:
+                raise ValueError(f"{clade.name} is not in the taxa list")
+            leaf_rows[index] = taxon_rows[clade.name]
+
+    key = None
+    if cache is not None:
+        if matrix_hash is None:
+            matrix_hash = matrix_content_hash(taxa_list, None, datamatrix)
+        topology_hash = hashlib.sha256(parent.tobytes() + leaf_rows.tobytes()).hexdigest()
+        key = (topology_hash, matrix_hash, ANCESTRAL_STATE_OPTIONS)
+        found, entry = cache.lookup(key)
+        if found:
+            reconstruction, node_states, node_changes = entry
+            for clade, states, changes in zip(clades, node_states, node_changes):
+                clade.character_states = list(states)
+                clade.changed_characters = list(changes)
+            return reconstruction
+
+    matrix = FitchMatrix(datamatrix)
+    reconstruction = matrix.reconstruct(parent, leaf_rows)
+    node_states = matrix.decode(reconstruction.resolved)
+    changed_nodes, changed_characters = np.nonzero(reconstruction.changed)
+    change_offsets = np.searchsorted(changed_nodes, np.arange(len(clades) + 1)).tolist()
+    changed_characters = changed_characters.tolist()
+    for index, clade in enumerate(clades):
+        clade.character_states = node_states[index]
+        clade.changed_characters = changed_characters[
+            change_offsets[index] : change_offsets[index + 1]
+        ]
+        if clade.is_terminal():
+            row = datamatrix[leaf_rows[index]]
+            for col in np.flatnonzero(matrix.missing[leaf_rows[index]]).tolist():
+                clade.character_states[col] = row[col] if col < len(row) else matrix.MISSING_STATE
+
+    if key is not None:
+        # tuples of strings are left alone by the garbage collector, unlike lists
+        node_states = [tuple(clade.character_states) for clade in clades]
+        node_changes = [tuple(clade.changed_characters) for clade in clades]
+        size = reconstruction.nbytes + 8 * (len(clades) * matrix.n_chars + len(changed_characters))
+        cache.store(key, (reconstruction, node_states, node_changes), size)
+    return reconstruction
+
+
+def update_ancestral_states(tree, reconstruction, row, col, value):
+    """Update the states reconstructed for a tree after a cell edit.
+
+    Only the edited character is reconstructed again, and only the nodes
+    whose states of it can change are updated.
 
     Args:
-        node: Current tree node being processed.
-        datamatrix: Character matrix [taxa][characters].
+        tree: Bio.Phylo tree passed to reconstruct_ancestral_states().
+        reconstruction: FitchReconstruction it returned.
+        row: Matrix row of the edited cell.
+        col: Character of the edited cell.
+        value: New value of the cell.
 
-    Note:
-        Recursively processes children first (post-order traversal).
-        Modifies node.character_states in-place.
+    Raises:
+        DataParsingError: If the character gets more than 64 states.
     """
-    if node.is_terminal():
-        return
-    for child in node:
-        bottom_up_pass(child, datamatrix)
-    for character in range(len(datamatrix[0])):
-        children_states = [child.character_states[character] for child in node]
-        # print("children_states:", children_states)
-        children_sets = [s for s in children_states if isinstance(s, set)]
-        # print("children_sets:", children_sets)
-        intersection = set.intersection(*children_sets) if children_sets else set()
-        # print("intersection:", intersection)
-        # check if intersection is empty
-        if not intersection:
-            union = set.union(*children_sets) if children_sets else set()
-            node.character_states[character] = union
-            # print("union:", union)
+    nodes = reconstruction.update_cell(row, col, value)
+    clades = _canonical_clades(tree)[nodes]
+    states = reconstruction.decode(nodes, col)
+    changed = reconstruction.changed[nodes, col].tolist()
+    missing = reconstruction.matrix.missing[:, col]
+    leaf_rows = reconstruction.leaf_rows[nodes].tolist()
+    for clade, state, is_changed, leaf_row in zip(clades, states, changed, leaf_rows):
+        if clade.is_terminal() and missing[leaf_row]:
+            # terminal nodes keep their missing data
+            if leaf_row == row:
+                clade.character_states[col] = value
         else:
-            node.character_states[character] = intersection
-        node.character_states[character] = set.union(*children_sets) if children_sets else set()
-        # print("node.confidence:", node.confidence)
-
-
-# Function to perform the second pass of the Fitch algorithm (top-down traversal)
-def top_down_pass(node, morphological_data, parent_states=None):
-    """Perform top-down pass of Fitch algorithm.
-
-    Second pass of Fitch parsimony: traverse tree from root to tips,
-    resolving ambiguous states and identifying character state changes
-    along branches.
-
-    Args:
-        node: Current tree node being processed.
-        morphological_data: Character matrix [taxa][characters].
-        parent_states: Character states of parent node (None for root).
-
-    Note:
-        Modifies node.character_states and node.changed_characters in-place.
-        Uses minimum state value to resolve ambiguities.
-    """
-    if not node.is_terminal():
-        # print("topdown node.confidence:", node.name, node.confidence, "parent confidence:", parent_state)
-        for character_index in range(len(morphological_data[0])):
-            if (
-                parent_states
-                and parent_states[character_index] in node.character_states[character_index]
-            ):
-                node.character_states[character_index] = parent_states[character_index]
-            else:
-                # node.character_states[character_index] = next(iter(node.character_states[character_index]))
-                node.character_states[character_index] = min(node.character_states[character_index])
-            if (
-                parent_states
-                and parent_states[character_index] != node.character_states[character_index]
-            ):
-                # print("changed character:", character_index, "parent:", parent_state[character_index], "node:", node.confidence[character_index])
-                node.changed_characters.append(character_index)
-    else:
-        # print("topdown terminal node.confidence:", node.name, node.confidence)
-        for character_index in range(len(morphological_data[0])):
-            # final_state = next(iter(node.character_states[character_index]))
-            final_state = min(node.character_states[character_index])
-            node.character_states[character_index] = final_state
-            if (
-                parent_states
-                and parent_states[character_index] != node.character_states[character_index]
-            ):
-                # print("changed character:", character_index, "parent:", parent_state[character_index], "node:", node.confidence[character_index])
-                node.changed_characters.append(character_index)
-            # print("node.confidence:", node.confidence)
-    #            if len(node.confidence[character_index]) == 0:
-    #                for child in node.clades:
-    #                    for state in child.confidence[character_index]:
-    #                        node.confidence[character_index].add(state)
-
-    for child in node.clades:
-        top_down_pass(child, morphological_data, node.character_states)
+            clade.character_states[col] = state
+        index = bisect.bisect_left(clade.changed_characters, col)
+        has_change = clade.changed_characters[index : index + 1] == [col]
+        if is_changed and not has_change:
+            clade.changed_characters.insert(index, col)
+        elif has_change and not is_changed:
+            del clade.changed_characters[index]
 
 
 def print_character_states(node, depth=0):
@@ -1229,6 +3136,195 @@ def print_character_states(node, depth=0):
         print_character_states(child, depth + 1)
 
 
+# trees a worker process scores per task
+PARSIMONY_CHUNK_TREES = 256
+# fewest trees worth starting worker processes for
+PARSIMONY_POOL_MIN_TREES = 1000
+
+
+class ParsimonyScorer:
+    """Score the Fitch parsimony length of many trees against one matrix.
+
+    The matrix is encoded once with FitchMatrix. Characters that are not
+    parsimony-informative (fewer than two states found in two taxa or more,
+    and no polymorphic cells) take the same number of steps on any tree, so
+    they are counted once in constant_length and left out of scoring. The
+    informative characters are merged into distinct patterns, each scored
+    once and weighted by the number of characters sharing it.
+
+    A polytomy is scored as resolved into a ladder, each child joining the
+    subtree of the children after it, which is an upper bound on the
+    length of its best resolution.
+
+    Attributes:
+        bits: State bitmasks (taxa x patterns) of the informative characters.
+        weights: Number of characters of every pattern.
+        constant_length: Steps of the uninformative characters.
+        n_informative: Number of informative characters.
+        taxon_rows: Dictionary mapping taxon names to matrix rows.
+
+    Example:
+        Scoring the trees of a TNT analysis::
+
+            scorer = ParsimonyScorer(datamatrix, taxa_list)
+            with TreeFileIndex("tmp.tre", "tre") as trees:
+                lengths = scorer.score_file(trees)
+    """
+
+    def __init__(self, datamatrix, taxa_list):
+        matrix = FitchMatrix(datamatrix)
+        bits = matrix.bits
+        one = bits.dtype.type(1)
+        single = ~matrix.missing & ((bits & (bits - one)) == 0)
+        polymorphic = np.any(~matrix.missing & ~single, axis=0)
+
+        # count the states found in any taxon and in two taxa or more
+        found = np.zeros(matrix.n_chars, dtype=np.int64)
+        shared = np.zeros(matrix.n_chars, dtype=np.int64)
+        for rank in range(int(bits.max(initial=0)).bit_length()):
+            n_taxa = np.count_nonzero(single & (bits == one << bits.dtype.type(rank)), axis=0)
+            found += n_taxa > 0
+            shared += n_taxa > 1
+        informative = polymorphic | (shared > 1)
+        self.constant_length = int(np.maximum(found[~informative] - 1, 0).sum())
+        self.n_informative = int(np.count_nonzero(informative))
+
+        patterns, weights = np.unique(bits[:, informative], axis=1, return_counts=True)
+        self.bits = np.ascontiguousarray(patterns)
+        self.weights = weights.astype(np.int64)
+        self.taxon_rows = {taxon: row for row, taxon in enumerate(taxa_list)}
+
+    def label_rows(self, taxa_hash=None, first_number=1):
+        """Get the matrix row of every leaf label a tree file may use.
+
+        Args:
+            taxa_hash: Dictionary mapping labels to taxon names, such as that
+                of a Nexus translate command.
+            first_number: Number of the first taxon; TNT numbers taxa from 0.
+
+        Returns:
+            Dictionary mapping taxon names, taxon names with spaces replaced
+            by underscores, taxon numbers and the keys of taxa_hash to rows.
+        """
+        rows = {str(row + first_number): row for row in self.taxon_rows.values()}
+        for taxon, row in self.taxon_rows.items():
+            rows["_".join(taxon.split())] = row
+        rows.update(self.taxon_rows)
+        for label, taxon in (taxa_hash or {}).items():
+            if taxon in self.taxon_rows:
+                rows[label] = self.taxon_rows[taxon]
+        return rows
+
+    def score(self, tree, label_rows=None):
+        """Get the parsimony length of a tree.
+
+        Args:
+            tree: NewickTree with the taxa as leaves.
+            label_rows: Dictionary mapping leaf labels to matrix rows;
+                taxon_rows by default.
+
+        Returns:
+            Number of steps of all characters.
+
+        Raises:
+            ValueError: If a leaf label is not in label_rows.
+        """
+        if label_rows is None:
+            label_rows = self.taxon_rows
+        leaves = tree.terminals()
+        try:
+            rows = [label_rows[tree.names[node]] for node in leaves.tolist()]
+        except KeyError as e:
+            raise ValueError(f"{e.args[0]} is not in the taxa list") from e
+
+        n_patterns = self.bits.shape[1]
+        sets = np.empty((len(tree), n_patterns), dtype=self.bits.dtype)
+        sets[leaves] = self.bits[rows]
+        steps = np.zeros(n_patterns, dtype=np.uint32)
+        empty = np.empty(n_patterns, dtype=np.uint8)
+        is_empty = empty.view(bool)
+        union = np.empty(n_patterns, dtype=self.bits.dtype)
+        # join every node into its parent, children before their parents
+        parent = tree.parent.tolist()
+        started = [False] * len(tree)
+        for node in range(len(tree) - 1, 0, -1):
+            node_set, parent_set = sets[node], sets[parent[node]]
+            if not started[parent[node]]:
+                parent_set[:] = node_set
+                started[parent[node]] = True
+                continue
+            np.bitwise_or(parent_set, node_set, out=union)
+            parent_set &= node_set
+            np.equal(parent_set, 0, out=is_empty)
+            steps += empty
+            # take the union where the intersection is empty; a uint8 mask would
+            # clear the state bits above 8 of wider bitmasks
+            np.copyto(parent_set, union, where=is_empty)
+        return self.constant_length + int(steps @ self.weights)
+
+    def score_file(self, trees, start=0, processes=None):
+        """Score the trees of a tree file.
+
+        Files of PARSIMONY_POOL_MIN_TREES trees or more are split into
+        ranges of trees scored by a pool of worker processes, which read
+        the trees from the file themselves through its saved index.
+
+        Args:
+            trees: TreeFileIndex of the file.
+            start: Index of the first tree to score, such as the number of
+                trees scored before a refresh of the index.
+            processes: Number of worker processes; the number of CPUs by
+                default, and 1 to score in this process.
+
+        Returns:
+            Integer array of the length of every tree from start, in file
+            order.
+
+        Raises:
+            ValueError: If a leaf label is not a taxon of the matrix.
+        """
+        label_rows = self.label_rows(
+            trees.taxa_hash, first_number=0 if trees.file_type == "tre" else 1
+        )
+        n_trees = len(trees)
+        processes = processes or os.cpu_count() or 1
+        if processes <= 1 or n_trees - start < PARSIMONY_POOL_MIN_TREES:
+            return np.array(
+                [self.score(trees.tree(index), label_rows) for index in range(start, n_trees)],
+                dtype=np.int64,
+            )
+
+        starts = range(start, n_trees, PARSIMONY_CHUNK_TREES)
+        stops = [min(start + PARSIMONY_CHUNK_TREES, n_trees) for start in starts]
+        # spawned workers do not inherit the state of the Qt application
+        with ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_start_parsimony_worker,
+            initargs=(self, label_rows, str(trees.file_path), trees.file_type),
+        ) as pool:
+            lengths = np.concatenate(list(pool.map(_score_tree_range, starts, stops)))
+        return lengths.astype(np.int64)
+
+
+# scorer, leaf label rows and tree file of a parsimony worker process
+_parsimony_worker = None
+
+
+def _start_parsimony_worker(scorer, label_rows, file_path, file_type):
+    global _parsimony_worker
+    _parsimony_worker = (scorer, label_rows, TreeFileIndex(file_path, file_type))
+
+
+def _score_tree_range(start, stop):
+    """Score trees start to stop of the file of a parsimony worker."""
+    scorer, label_rows, trees = _parsimony_worker
+    return np.array(
+        [scorer.score(trees.tree(index), label_rows) for index in range(start, stop)],
+        dtype=np.int64,
+    )
+
+
 # ============================================================================
 # File Path Validation Functions
 # ============================================================================
@@ -1415,7 +3511,8 @@ def validate_phylo_data_file(filepath):
     """Validate phylogenetic data file path and extension.
 
     Convenience function that validates a file is readable and has
-    a recognized phylogenetic data format extension.
+    a recognized phylogenetic data format extension, optionally followed by
+    a .gz, .bz2 or .xz compression suffix.
 
     Args:
         filepath: Path to phylogenetic data file.
@@ -1434,9 +3531,13 @@ def validate_phylo_data_file(filepath):
     validated_path = validate_file_path(filepath, must_exist=True, check_readable=True)
 
     # Check extension
-    allowed_extensions = [".nex", ".nexus", ".phy", ".phylip", ".tnt", ".ss", ".txt"]
+    allowed_extensions = [
+        ".nex", ".nexus", ".phy", ".phylip", ".tnt", ".fas", ".fasta", ".fa", ".fna", ".faa",
+        ".ss", ".txt",
+    ]  # fmt: skip
     try:
-        validate_file_extension(validated_path, allowed_extensions)
+        # compressed files are checked by the extension inside the suffix
+        validate_file_extension(split_compression_ext(validated_path)[0], allowed_extensions)
     except FileOperationError as e:
         logger.warning(f"File has non-standard extension but may still be valid: {e}")
         # Don't raise - allow files with non-standard extensions
@@ -1449,6 +3550,17 @@ def validate_phylo_data_file(filepath):
 # Datamatrix Validation Functions
 # ============================================================================
 
+# states counted as missing data by the datamatrix validation
+MISSING_STATES = frozenset(["?", "-", "N", "n"])
+# cells reported per problem type by validate_encoded_datamatrix()
+MAX_CELL_PROBLEMS = 1000
+# state codes looked up per chunk of rows
+VALIDATION_CHUNK_CELLS = 1 << 24
+# state codes compared one by one instead of through a lookup table
+VALIDATION_MASK_COMPARISONS = 8
+# states that would end a cell or start a comment in exported files
+VALIDATION_BREAKING_STATE_PATTERN = re.compile(r"[\s()\[\]{};,']")
+
 
 def validate_taxa_names(taxa_list, allow_duplicates=False):
     """Validate taxa names for consistency and uniqueness.
@@ -1624,7 +3736,7 @@ def validate_datamatrix_dimensions(taxa_list, character_matrix):
 def validate_complete_datamatrix(taxa_list, character_matrix, matrix_name="datamatrix"):
     """Perform complete validation of a phylogenetic datamatrix.
 
-    Combines all datamatrix validation checks into a single function.
+    Runs validate_datamatrix() and raises on its errors.
 
     Args:
         taxa_list: List of taxon names.
@@ -1635,7 +3747,7 @@ def validate_complete_datamatrix(taxa_list, character_matrix, matrix_name="datam
         dict: Validation results with keys 'valid', 'n_taxa', 'n_characters', 'warnings'.
 
     Raises:
-        DataParsingError: If validation fails critically.
+        DataParsingError: If validation fails critically, listing every error.
 
     Example:
         >>> taxa = ['Taxon1', 'Taxon2']
@@ -1644,46 +3756,981 @@ def validate_complete_datamatrix(taxa_list, character_matrix, matrix_name="datam
         >>> print(result)
         {'valid': True, 'n_taxa': 2, 'n_characters': 2, 'warnings': []}
     """
-    warnings = []
+    report = validate_datamatrix(taxa_list, character_matrix)
+    if not report["valid"]:
+        raise DataParsingError(
+            f"Validation failed for {matrix_name}:\n"
+            + "\n".join(problem["message"] for problem in report["errors"])
+        )
+    return {
+        "valid": True,
+        "n_taxa": report["n_taxa"],
+        "n_characters": report["n_characters"],
+        "warnings": [problem["message"] for problem in report["warnings"]],
+    }
 
-    try:
-        # Validate taxa names
-        validate_taxa_names(taxa_list, allow_duplicates=False)
-    except DataParsingError as e:
-        raise DataParsingError(f"Taxa validation failed for {matrix_name}: {e}")
 
+def validate_datamatrix(taxa_list, datamatrix, n_chars=None, **kwargs):
+    """Find every problem of a datamatrix in one pass.
+
+    The matrix is encoded as with encode_datamatrix() and checked by
+    validate_encoded_datamatrix(). Matrices that cannot be encoded that way,
+    such as ones with more than 254 states, are encoded into a wider array.
+
+    Args:
+        taxa_list: List of taxon names.
+        datamatrix: List of rows of states; polymorphic cells are lists.
+        n_chars: Expected number of characters, or None for the widest row.
+        **kwargs: Passed on to validate_encoded_datamatrix().
+
+    Returns:
+        The report of validate_encoded_datamatrix().
+    """
     try:
-        # Validate dimensions
-        n_taxa, n_characters = validate_datamatrix_dimensions(taxa_list, character_matrix)
-    except DataParsingError as e:
-        raise DataParsingError(f"Dimension validation failed for {matrix_name}: {e}")
+        blob, alphabet, polymorphic_cells = encode_datamatrix(datamatrix)
+    except DataParsingError:
+        codes, alphabet, polymorphic_cells = _encode_wide(datamatrix)
+        return _validate_codes(
+            taxa_list, codes, len(alphabet) + 1, alphabet, polymorphic_cells, n_chars, **kwargs
+        )
+    return validate_encoded_datamatrix(
+        taxa_list, blob, alphabet, polymorphic_cells, n_chars, **kwargs
+    )
 
-    # Validate character data for each taxon
-    for _i, (taxon, char_data) in enumerate(zip(taxa_list, character_matrix)):
-        try:
-            validate_character_states(char_data, valid_states=None)
-        except DataParsingError as e:
-            raise DataParsingError(f"Character validation failed for taxon '{taxon}': {e}")
-
-    # Check for suspicious patterns (warnings only)
-    # Check for taxa with all missing data
-    for _i, (taxon, char_data) in enumerate(zip(taxa_list, character_matrix)):
-        missing_count = sum(1 for c in char_data if str(c) in ["?", "-", "N", "n"])
-        if missing_count == n_characters:
-            warnings.append(f"Taxon '{taxon}' has all missing data")
-        elif missing_count / n_characters > 0.8:
-            warnings.append(
-                f"Taxon '{taxon}' has {missing_count}/{n_characters} ({missing_count * 100 // n_characters}%) missing data"
+
+def validate_encoded_datamatrix(
+    taxa_list,
+    blob,
+    alphabet,
+    polymorphic_cells=None,
+    n_chars=None,
+    valid_states=None,
+    missing_states=MISSING_STATES,
+    max_cell_problems=MAX_CELL_PROBLEMS,
+):
+    """Find every problem of a datamatrix stored by encode_datamatrix().
+
+    The state codes are checked through lookup tables over the alphabet, a
+    chunk of rows at a time, so a large alignment is validated in about the
+    time it takes to read it. All problems are reported at once.
+
+    Errors:
+        - empty_name, duplicate_name: taxon names that are empty, or equal
+          to an earlier one after stripping and lower-casing.
+        - row_count: number of taxa and of rows differ.
+        - ragged_row: row with a number of characters other than n_chars.
+        - invalid_state: cell with a state outside valid_states or, without
+          valid_states, an empty state or one containing whitespace or
+          punctuation that ends a cell in Nexus, Phylip or TNT files.
+        - too_few_taxa, no_characters: matrix smaller than an analysis needs.
+
+    Warnings:
+        - missing_column: character missing in every taxon.
+        - missing_taxon: taxon missing more than 80% of the characters.
+
+    Args:
+        taxa_list: List of taxon names.
+        blob: Header plus row-major uint8 code bytes, or a buffer of them.
+        alphabet: List of states indexed by code - 1.
+        polymorphic_cells: Iterable of (row_index, col_index, states) tuples
+            for cells stored with code 0. Defaults to None.
+        n_chars: Expected number of characters, or None for the widest row.
+        valid_states: Optional set of valid states; polymorphic cells are
+            checked state by state.
+        missing_states: States counted as missing data.
+        max_cell_problems: Cells reported per problem type; the remaining
+            ones are summed up in one more problem.
+
+    Returns:
+        Dictionary with 'valid' (no errors), 'n_taxa', 'n_characters',
+        'errors' and 'warnings'. Problems are dictionaries with 'problem'
+        (the type above), 'row' and 'column' (0-based, None where not
+        applicable) and 'message'.
+
+    Raises:
+        DataParsingError: If the blob is truncated or of an unknown version.
+    """
+    codes = memoryview(blob).cast("B")
+    n_rows, n_cols = _blob_dimensions(codes)
+    codes = np.frombuffer(codes, dtype=np.uint8, offset=DATAMATRIX_BLOB_HEADER.size)
+    return _validate_codes(
+        taxa_list,
+        codes.reshape(n_rows, n_cols),
+        STATE_CODE_ABSENT,
+        alphabet,
+        polymorphic_cells,
+        n_chars,
+        valid_states,
+        missing_states,
+        max_cell_problems,
+    )
+
+
+def _encode_wide(datamatrix):
+    """Encode a matrix into int32 state codes, padded with len(alphabet) + 1.
+
+    Cells that are neither strings nor lists are kept in the alphabet as
+    they are, so they are reported as invalid states.
+    """
+    n_cols = max((len(row) for row in datamatrix), default=0)
+    state_codes = {}
+    alphabet = []
+    polymorphic_cells = []
+    codes = np.zeros((len(datamatrix), n_cols), dtype=np.int32)
+    for row_idx, row in enumerate(datamatrix):
+        row_codes = []
+        for col_idx, cell in enumerate(row):
+            if isinstance(cell, list):
+                polymorphic_cells.append((row_idx, col_idx, cell))
+                row_codes.append(STATE_CODE_POLYMORPHIC)
+                continue
+            key = cell if isinstance(cell, str) else (type(cell), repr(cell))
+            code = state_codes.get(key)
+            if code is None:
+                alphabet.append(cell)
+                code = state_codes[key] = len(alphabet)
+            row_codes.append(code)
+        codes[row_idx, : len(row_codes)] = row_codes
+        codes[row_idx, len(row_codes) :] = -1
+    codes[codes < 0] = len(alphabet) + 1
+    return codes, alphabet, polymorphic_cells
+
+
+def _is_writable_state(state):
+    return (
+        isinstance(state, str)
+        and bool(state)
+        and not VALIDATION_BREAKING_STATE_PATTERN.search(state)
+    )
+
+
+def _code_mask(codes, lookup):
+    """Look up a boolean table of state codes for every cell.
+
+    A few codes are compared one by one, which is faster than indexing the
+    table with every cell.
+    """
+    selected = np.flatnonzero(lookup)
+    if len(selected) > VALIDATION_MASK_COMPARISONS:
+        return lookup[codes]
+    mask = np.zeros(codes.shape, dtype=bool)
+    for code in selected.tolist():
+        mask |= codes == code
+    return mask
+
+
+def _validate_codes(
+    taxa_list,
+    codes,
+    absent_code,
+    alphabet,
+    polymorphic_cells=None,
+    n_chars=None,
+    valid_states=None,
+    missing_states=MISSING_STATES,
+    max_cell_problems=MAX_CELL_PROBLEMS,
+):
+    """Validate a 2D array of state codes; see validate_encoded_datamatrix()."""
+    errors = []
+    warnings = []
+
+    def report(problems, problem, message, row=None, column=None):
+        problems.append({"problem": problem, "row": row, "column": column, "message": message})
+
+    def report_cells(problem, cells, message, total):
+        for row, column in cells[:max_cell_problems]:
+            report(errors, problem, message(row, column), row, column)
+        if total > max_cell_problems:
+            report(errors, problem, f"... and {total - max_cell_problems} more {problem} cells")
+
+    def taxon_name(row):
+        return taxa_list[row] if row < len(taxa_list) else f"row {row + 1}"
+
+    first_rows = {}
+    for row, taxon in enumerate(taxa_list):
+        normalized = str(taxon).strip().lower()
+        if not normalized:
+            report(errors, "empty_name", f"Empty taxon name at position {row + 1}", row)
+        elif normalized in first_rows:
+            report(
+                errors,
+                "duplicate_name",
+                f"Taxon name '{taxon}' at position {row + 1} duplicates position "
+                f"{first_rows[normalized] + 1}",
+                row,
+            )
+        else:
+            first_rows[normalized] = row
+
+    n_rows, n_cols = codes.shape
+    if len(taxa_list) != n_rows:
+        report(
+            errors,
+            "row_count",
+            f"Number of taxa ({len(taxa_list)}) does not match number of matrix rows ({n_rows})",
+        )
+    n_characters = n_cols if n_chars is None else n_chars
+
+    # lookup tables over the state codes; padding is counted as missing
+    n_codes = max(absent_code, len(alphabet)) + 1
+    is_invalid = np.zeros(n_codes, dtype=bool)
+    is_missing = np.zeros(n_codes, dtype=bool)
+    is_missing[absent_code] = True
+    if valid_states is not None:
+        valid_states = {str(state) for state in valid_states}
+    for code, state in enumerate(alphabet, 1):
+        if not isinstance(state, str):
+            is_invalid[code] = True
+        elif valid_states is None:
+            is_invalid[code] = not _is_writable_state(state)
+        else:
+            is_invalid[code] = state not in valid_states
+        is_missing[code] = isinstance(state, str) and state in missing_states
+
+    row_lengths = np.full(n_rows, n_cols, dtype=np.int64)
+    row_missing = np.empty(n_rows, dtype=np.int64)
+    column_missing = np.ones(n_cols, dtype=bool)
+    invalid_cells = []
+    n_invalid = 0
+    chunk_rows = max(1, VALIDATION_CHUNK_CELLS // max(n_cols, 1))
+    for start in range(0, n_rows, chunk_rows):
+        chunk = codes[start : start + chunk_rows]
+        if n_cols:
+            # padding only ever occupies the tail of a row
+            short_rows = np.flatnonzero(chunk[:, -1] == absent_code)
+            row_lengths[start + short_rows] -= np.count_nonzero(
+                chunk[short_rows] == absent_code, axis=1
+            )
+        missing = _code_mask(chunk, is_missing)
+        row_missing[start : start + len(chunk)] = np.count_nonzero(missing, axis=1)
+        column_missing &= missing.all(axis=0)
+        if not is_invalid.any():
+            continue
+        invalid = np.argwhere(_code_mask(chunk, is_invalid))
+        n_invalid += len(invalid)
+        if len(invalid_cells) < max_cell_problems:
+            invalid[:, 0] += start
+            invalid_cells.extend(invalid[: max_cell_problems - len(invalid_cells)].tolist())
+
+    for row in np.flatnonzero(row_lengths != n_characters).tolist():
+        report(
+            errors,
+            "ragged_row",
+            f"Taxon '{taxon_name(row)}' has {row_lengths[row]} characters, expected {n_characters}",
+            row,
+        )
+
+    polymorphic_states = {(row, column): states for row, column, states in polymorphic_cells or []}
+    for (row, column), states in polymorphic_states.items():
+        if valid_states is None:
+            is_valid = all(map(_is_writable_state, states))
+        else:
+            is_valid = valid_states.issuperset(states)
+        if not is_valid:
+            n_invalid += 1
+            if len(invalid_cells) < max_cell_problems:
+                invalid_cells.append([row, column])
+
+    def invalid_state_message(row, column):
+        code = int(codes[row, column])
+        if code == STATE_CODE_POLYMORPHIC:
+            state = polymorphic_states[row, column]
+        else:
+            state = alphabet[code - 1]
+        return (
+            f"Invalid character state {state!r} of taxon '{taxon_name(row)}' "
+            f"at position {column + 1}"
+        )
+
+    report_cells("invalid_state", sorted(invalid_cells), invalid_state_message, n_invalid)
+
+    if n_rows < 2:
+        report(errors, "too_few_taxa", f"Datamatrix must have at least 2 taxa (found {n_rows})")
+    if n_characters < 1:
+        report(
+            errors,
+            "no_characters",
+            f"Datamatrix must have at least 1 character (found {n_characters})",
+        )
+
+    if n_rows:
+        for column in np.flatnonzero(column_missing).tolist():
+            report(
+                warnings,
+                "missing_column",
+                f"Character {column + 1} is missing in every taxon",
+                column=column,
             )
+    if n_characters > 0:
+        for row in np.flatnonzero(row_missing * 5 > n_characters * 4).tolist():
+            missing_count = int(row_missing[row])
+            if missing_count >= n_characters:
+                message = f"Taxon '{taxon_name(row)}' has all missing data"
+            else:
+                message = (
+                    f"Taxon '{taxon_name(row)}' has {missing_count}/{n_characters} "
+                    f"({missing_count * 100 // n_characters}%) missing data"
+                )
+            report(warnings, "missing_taxon", message, row)
 
     return {
-        "valid": True,
-        "n_taxa": n_taxa,
+        "valid": not errors,
+        "n_taxa": n_rows,
         "n_characters": n_characters,
+        "errors": errors,
         "warnings": warnings,
     }
 
 
+# ============================================================================
+# Compact Datamatrix Storage
+# ============================================================================
+
+DATAMATRIX_BLOB_VERSION = 1
+DATAMATRIX_BLOB_HEADER = struct.Struct("<BII")  # version, n_rows, n_cols
+STATE_CODE_POLYMORPHIC = 0
+STATE_CODE_ABSENT = 255
+MAX_STATE_ALPHABET_SIZE = 254
+# cells whose length, as a byte, is not 1
+MULTI_CHARACTER_CELL_PATTERN = re.compile(rb"[^\x01]")
+
+
+def encode_datamatrix(datamatrix):
+    """Encode a character matrix as a dense uint8 state-code array.
+
+    Every distinct single state found in the matrix is assigned a code from
+    1 to 254 in order of first appearance. Polymorphic cells (lists of
+    states) are stored with code 0 and returned separately so they can be
+    kept in a side table. Rows shorter than the widest row are padded with
+    code 255, which is stripped again on decoding.
+
+    Args:
+        datamatrix: List of rows, each a list of state strings or lists of
+            state strings for polymorphic cells.
+
+    Returns:
+        Tuple of (blob, alphabet, polymorphic_cells) where blob is the
+        header plus row-major code bytes, alphabet is the list of states
+        indexed by code - 1, and polymorphic_cells is a list of
+        (row_index, col_index, states) tuples.
+
+    Raises:
+        DataParsingError: If a cell is neither a string nor a list, or the
+            matrix holds more than 254 distinct states.
+
+    Example:
+        >>> blob, alphabet, poly = encode_datamatrix([["0", ["0", "1"]], ["1", "?"]])
+        >>> alphabet
+        ['0', '1', '?']
+        >>> poly
+        [(0, 1, ['0', '1'])]
+    """
+    n_rows = len(datamatrix)
+    n_cols = max((len(row) for row in datamatrix), default=0)
+    encoded = _encode_character_rows(datamatrix, n_cols)
+    if encoded is not None:
+        return encoded
+
+    codes = np.full((n_rows, n_cols), STATE_CODE_ABSENT, dtype=np.uint8)
+    alphabet = []
+    state_codes = {}
+    polymorphic_cells = []
+
+    for row_idx, row in enumerate(datamatrix):
+        row_codes = []
+        for col_idx, cell in enumerate(row):
+            if isinstance(cell, list):
+                polymorphic_cells.append((row_idx, col_idx, cell))
+                row_codes.append(STATE_CODE_POLYMORPHIC)
+                continue
+            code = state_codes.get(cell)
+            if code is None:
+                if not isinstance(cell, str):
+                    raise DataParsingError(
+                        f"Unsupported cell value at row {row_idx}, column {col_idx}: {cell!r}"
+                    )
+                if len(alphabet) >= MAX_STATE_ALPHABET_SIZE:
+                    raise DataParsingError(
+                        f"Too many distinct character states (more than {MAX_STATE_ALPHABET_SIZE})"
+                    )
+                alphabet.append(cell)
+                code = len(alphabet)
+                state_codes[cell] = code
+            row_codes.append(code)
+        codes[row_idx, : len(row_codes)] = row_codes
+
+    blob = DATAMATRIX_BLOB_HEADER.pack(DATAMATRIX_BLOB_VERSION, n_rows, n_cols) + codes.tobytes()
+    return blob, alphabet, polymorphic_cells
+
+
+def _encode_character_rows(datamatrix, n_cols):
+    """Encode a matrix of single Latin-1 character states row by row.
+
+    Polymorphic cells are swapped for NUL characters, which translate to
+    code 0.
+
+    Returns:
+        Same as encode_datamatrix(), or None if a state is not a single
+        Latin-1 character other than NUL or there are too many states.
+    """
+    row_bytes = []
+    polymorphic_cells = []
+    for row_idx, row in enumerate(datamatrix):
+        try:
+            text = "".join(row)
+            is_simple = len(text) == len(row) and "" not in row
+        except TypeError:
+            is_simple = False
+        if is_simple:
+            if "\0" in text:
+                return None
+        else:
+            text = _join_polymorphic_row(row, row_idx, polymorphic_cells)
+            if text is None:
+                return None
+        try:
+            row_bytes.append(text.encode("latin-1"))
+        except UnicodeEncodeError:
+            return None
+
+    state_codes = {}
+    known = b"\0"
+    for data in row_bytes:
+        # only look at the characters of a row that are not known yet
+        new_states = data.translate(None, known)
+        if new_states:
+            for state in dict.fromkeys(new_states.decode("latin-1")):
+                state_codes[state] = len(state_codes) + 1
+            known = ("\0" + "".join(state_codes)).encode("latin-1")
+    if len(state_codes) > MAX_STATE_ALPHABET_SIZE:
+        return None
+    table = bytearray(256)
+    for state, code in state_codes.items():
+        table[ord(state)] = code
+
+    padding = bytes([STATE_CODE_ABSENT])
+    header = DATAMATRIX_BLOB_HEADER.pack(DATAMATRIX_BLOB_VERSION, len(datamatrix), n_cols)
+    blob = header + b"".join(
+        data.translate(table) + padding * (n_cols - len(data)) for data in row_bytes
+    )
+    return blob, list(state_codes), polymorphic_cells
+
+
+def _join_polymorphic_row(row, row_idx, polymorphic_cells):
+    """Join a row of single characters with NUL for its polymorphic cells.
+
+    The polymorphic cells are appended to polymorphic_cells.
+
+    Returns:
+        The joined row, or None if a cell is neither a single character
+        nor a list.
+    """
+    try:
+        cell_sizes = bytes(map(len, row))
+    except (TypeError, ValueError):
+        return None
+    pieces = []
+    start = 0
+    try:
+        for match in MULTI_CHARACTER_CELL_PATTERN.finditer(cell_sizes):
+            col_idx = match.start()
+            if not isinstance(row[col_idx], list):
+                return None
+            polymorphic_cells.append((row_idx, col_idx, row[col_idx]))
+            pieces.append("".join(row[start:col_idx]))
+            start = col_idx + 1
+        pieces.append("".join(row[start:]))
+    except TypeError:
+        return None
+    text = "\0".join(pieces)
+    if text.count("\0") != len(pieces) - 1:
+        return None
+    return text
+
+
+def decode_datamatrix(blob, alphabet, polymorphic_cells=None):
+    """Decode a state-code array produced by encode_datamatrix().
+
+    Args:
+        blob: Header plus row-major uint8 code bytes.
+        alphabet: List of states indexed by code - 1.
+        polymorphic_cells: Iterable of (row_index, col_index, states) tuples
+            for cells stored with code 0. Defaults to None.
+
+    Returns:
+        Datamatrix as a list of rows, identical to the one that was encoded.
+
+    Raises:
+        DataParsingError: If the blob is truncated or of an unknown version.
+    """
+    n_rows, n_cols = _blob_dimensions(blob)
+
+    if all(len(state) == 1 and ord(state) < 256 for state in alphabet):
+        datamatrix = _decode_character_rows(blob, alphabet, n_rows, n_cols)
+        for row_idx, col_idx, states in polymorphic_cells or []:
+            datamatrix[row_idx][col_idx] = list(states)
+        return datamatrix
+
+    codes = np.frombuffer(blob, dtype=np.uint8, offset=DATAMATRIX_BLOB_HEADER.size).reshape(
+        n_rows, n_cols
+    )
+    lookup = np.empty(256, dtype=object)
+    lookup[1 : len(alphabet) + 1] = alphabet
+    datamatrix = lookup[codes].tolist()
+
+    for row_idx, col_idx, states in polymorphic_cells or []:
+        datamatrix[row_idx][col_idx] = list(states)
+
+    # padding only ever occupies the tail of a row
+    absent_counts = np.count_nonzero(codes == STATE_CODE_ABSENT, axis=1)
+    for row_idx in np.flatnonzero(absent_counts):
+        datamatrix[row_idx] = datamatrix[row_idx][: n_cols - absent_counts[row_idx]]
+
+    return datamatrix
+
+
+def iter_decoded_rows(blob, alphabet, polymorphic_cells=None):
+    """Decode a state-code array produced by encode_datamatrix() row by row.
+
+    Only one decoded row is held at a time, and the blob is read through a
+    memoryview rather than copied, so exporting a large matrix does not
+    need memory for all of its cells.
+
+    Args:
+        blob: Header plus row-major uint8 code bytes, or a buffer of them.
+        alphabet: List of states indexed by code - 1.
+        polymorphic_cells: Iterable of (row_index, col_index, states) tuples
+            for cells stored with code 0. Defaults to None.
+
+    Yields:
+        Every row, as in the list returned by decode_datamatrix().
+
+    Raises:
+        DataParsingError: If the blob is truncated or of an unknown version.
+    """
+    codes = memoryview(blob).cast("B")
+    n_rows, n_cols = _blob_dimensions(codes)
+    row_cells = {}
+    for row_idx, col_idx, states in polymorphic_cells or []:
+        row_cells.setdefault(row_idx, []).append((col_idx, states))
+
+    is_character_alphabet = all(len(state) == 1 and ord(state) < 256 for state in alphabet)
+    table = bytearray(256)
+    lookup = np.empty(256, dtype=object)
+    if is_character_alphabet:
+        for code, state in enumerate(alphabet, 1):
+            table[code] = ord(state)
+    else:
+        lookup[1 : len(alphabet) + 1] = alphabet
+    padding = bytes([STATE_CODE_ABSENT])
+    offset = DATAMATRIX_BLOB_HEADER.size
+    for row_idx in range(n_rows):
+        data = bytes(codes[offset : offset + n_cols]).rstrip(padding)
+        offset += n_cols
+        if is_character_alphabet:
+            row = list(data.translate(table).decode("latin-1"))
+        else:
+            row = lookup[np.frombuffer(data, dtype=np.uint8)].tolist()
+        for col_idx, states in row_cells.get(row_idx, ()):
+            row[col_idx] = list(states)
+        yield row
+
+
+def _blob_dimensions(blob):
+    """Check the header of a datamatrix blob.
+
+    Returns:
+        Tuple of (n_rows, n_cols).
+
+    Raises:
+        DataParsingError: If the blob is truncated or of an unknown version.
+    """
+    if len(blob) < DATAMATRIX_BLOB_HEADER.size:
+        raise DataParsingError("Datamatrix blob is truncated")
+    version, n_rows, n_cols = DATAMATRIX_BLOB_HEADER.unpack_from(blob)
+    if version != DATAMATRIX_BLOB_VERSION:
+        raise DataParsingError(f"Unsupported datamatrix blob version: {version}")
+    if len(blob) != DATAMATRIX_BLOB_HEADER.size + n_rows * n_cols:
+        raise DataParsingError("Datamatrix blob size does not match its dimensions")
+    return n_rows, n_cols
+
+
+def _decode_character_rows(blob, alphabet, n_rows, n_cols):
+    """Decode rows of single Latin-1 character states with bytes.translate.
+
+    Polymorphic cells are left as placeholder characters.
+    """
+    table = bytearray(256)
+    for code, state in enumerate(alphabet, 1):
+        table[code] = ord(state)
+    padding = bytes([STATE_CODE_ABSENT])
+    start = DATAMATRIX_BLOB_HEADER.size
+    return [
+        list(blob[offset : offset + n_cols].rstrip(padding).translate(table).decode("latin-1"))
+        for offset in (start + row_idx * n_cols for row_idx in range(n_rows))
+    ]
+
+
+def matrix_content_hash(taxa_list, character_list, datamatrix):
+    """Compute a hash identifying the contents of a character matrix.
+
+    The hash covers taxon names, character names and every cell, so two
+    matrices share a hash only if they are identical.
+
+    Args:
+        taxa_list: List of taxon names (or None).
+        character_list: List of character names (or None).
+        datamatrix: Datamatrix as a list of rows (or None).
+
+    Returns:
+        Hex-encoded SHA-256 digest.
+    """
+    payload = json.dumps(
+        [taxa_list, character_list, datamatrix], separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ============================================================================
+# Parse Cache
+# ============================================================================
+
+PARSE_CACHE_VERSION = 1
+PARSE_CACHE_MAGIC = b"PFPC"
+PARSE_CACHE_HEADER = struct.Struct("<4sBI")  # magic, version, metadata length
+PARSE_CACHE_SUFFIX = ".pfpc"
+DEFAULT_PARSE_CACHE_DIRECTORY = os.path.join(DEFAULT_STORAGE_DIRECTORY, "parse_cache")
+DEFAULT_PARSE_CACHE_SIZE = 512 * 1024 * 1024
+FILE_HASH_CHUNK_SIZE = 1 << 20
+
+
+class ParseCache:
+    """Size-bounded on-disk cache of parsed data files.
+
+    Entries are keyed by a SHA-256 hash of the file content and hold the
+    taxa, character definitions, Nexus commands and the matrix encoded with
+    encode_datamatrix(). An index remembers the hash of each path together
+    with its size and mtime, so a file that has not changed since it was
+    last seen is looked up without reading it. A copy of a cached file at
+    another path is found by its hash.
+
+    The least recently used entries are deleted when the entries grow
+    beyond max_size bytes. Only streamed formats (Nexus, Phylip and FASTA)
+    are cached, since TNT files keep their whole text.
+
+    Attributes:
+        directory: Directory holding the entries and the index.
+        max_size: Maximum total size of the entries in bytes.
+        hits: Number of files loaded from the cache.
+        misses: Number of files that had to be parsed.
+        evictions: Number of entries deleted to stay within max_size.
+    """
+
+    INDEX_FILE_NAME = "index.json"
+
+    def __init__(self, directory, max_size=DEFAULT_PARSE_CACHE_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index = None
+
+    def fingerprint(self, file_path):
+        """Get the content hash of a file.
+
+        The file is only read if its path, size or mtime differ from the
+        last time it was fingerprinted.
+
+        Args:
+            file_path: Path to the file.
+
+        Returns:
+            Hex-encoded SHA-256 digest of the file content.
+
+        Raises:
+            OSError: If the file cannot be read.
+        """
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+        index = self._load_index()
+        known = index.get(str(file_path))
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+
+        digest = hashlib.sha256()
+        with file_path.open("rb") as f:
+            for chunk in iter(partial(f.read, FILE_HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        index[str(file_path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self._save_index()
+        return digest.hexdigest()
+
+    def load(self, digest, datafile):
+        """Fill a PhyloDatafile from the entry of a content hash.
+
+        Returns:
+            True if the entry was found and loaded, False otherwise.
+        """
+        entry_path = self._entry_path(digest)
+        try:
+            data = entry_path.read_bytes()
+            metadata, blob = self._unpack(data)
+            datamatrix = decode_datamatrix(
+                blob, metadata["alphabet"], metadata["polymorphic_cells"]
+            )
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        except (OSError, ValueError, KeyError, struct.error, DataParsingError) as e:
+            logger.warning(f"Discarding unreadable parse cache entry {entry_path}: {e}")
+            entry_path.unlink(missing_ok=True)
+            self.misses += 1
+            return False
+
+        datafile.file_type = metadata["file_type"]
+        datafile.n_taxa = metadata["n_taxa"]
+        datafile.n_chars = metadata["n_chars"]
+        datafile.nexus_command_hash = metadata["nexus_command_hash"]
+        datafile.character_definition_hash = metadata["character_definition_hash"]
+        datafile.block_list = metadata["block_list"]
+        datafile._set_matrix(metadata["taxa_list"], datamatrix)
+        # mark as recently used
+        os.utime(entry_path)
+        self.hits += 1
+        return True
+
+    def store(self, digest, datafile):
+        """Save a parsed PhyloDatafile as the entry of a content hash.
+
+        Returns:
+            True if the entry was written, False if the file cannot be
+            cached.
+        """
+        if datafile.file_text is not None:
+            return False
+        try:
+            blob, alphabet, polymorphic_cells = encode_datamatrix(datafile.datamatrix)
+        except DataParsingError as e:
+            logger.debug(f"Not caching {datafile.dataset_name}: {e}")
+            return False
+        metadata = {
+            "program_version": PROGRAM_VERSION,
+            "file_type": datafile.file_type,
+            "n_taxa": datafile.n_taxa,
+            "n_chars": datafile.n_chars,
+            "taxa_list": list(datafile.taxa_list),
+            "nexus_command_hash": datafile.nexus_command_hash,
+            "character_definition_hash": datafile.character_definition_hash,
+            "block_list": datafile.block_list,
+            "alphabet": alphabet,
+            "polymorphic_cells": polymorphic_cells,
+        }
+        metadata_bytes = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+        header = PARSE_CACHE_HEADER.pack(
+            PARSE_CACHE_MAGIC, PARSE_CACHE_VERSION, len(metadata_bytes)
+        )
+
+        entry_path = self._entry_path(digest)
+        temp_path = entry_path.with_suffix(".tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with temp_path.open("wb") as f:
+                f.write(header)
+                f.write(metadata_bytes)
+                f.write(blob)
+            temp_path.replace(entry_path)
+        except OSError as e:
+            logger.warning(f"Failed to write parse cache entry {entry_path}: {e}")
+            temp_path.unlink(missing_ok=True)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Delete the least recently used entries beyond max_size."""
+        entries = sorted(
+            (path.stat().st_mtime_ns, path.stat().st_size, path) for path in self._entry_paths()
+        )
+        total_size = sum(size for _mtime, size, _path in entries)
+        evicted = set()
+        for _mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+            evicted.add(path)
+            self.evictions += 1
+
+        # forget the paths of files that are not cached
+        cached = {path.stem for _mtime, _size, path in entries if path not in evicted}
+        index = self._load_index()
+        stale = [file_path for file_path, known in index.items() if known[2] not in cached]
+        for file_path in stale:
+            del index[file_path]
+        if stale:
+            self._save_index()
+
+    def clear(self):
+        """Delete all entries and the index, and reset the counters."""
+        for path in self._entry_paths():
+            path.unlink(missing_ok=True)
+        (self.directory / self.INDEX_FILE_NAME).unlink(missing_ok=True)
+        self._index = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Get cache counters and size.
+
+        Returns:
+            Dictionary with hits, misses, evictions, entries (number of
+            cached files), size (total bytes of the entries) and max_size.
+        """
+        sizes = [path.stat().st_size for path in self._entry_paths()]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(sizes),
+            "size": sum(sizes),
+            "max_size": self.max_size,
+        }
+
+    def _entry_path(self, digest):
+        return self.directory / f"{digest}{PARSE_CACHE_SUFFIX}"
+
+    def _entry_paths(self):
+        if not self.directory.is_dir():
+            return []
+        return list(self.directory.glob(f"*{PARSE_CACHE_SUFFIX}"))
+
+    @staticmethod
+    def _unpack(data):
+        """Split an entry into its metadata and matrix blob.
+
+        Raises:
+            ValueError: If the entry is not of the current cache format.
+        """
+        magic, version, metadata_length = PARSE_CACHE_HEADER.unpack_from(data)
+        if magic != PARSE_CACHE_MAGIC or version != PARSE_CACHE_VERSION:
+            raise ValueError("unknown parse cache format")
+        start = PARSE_CACHE_HEADER.size
+        metadata = json.loads(data[start : start + metadata_length])
+        # entries of another program version may come from a different parser
+        if metadata["program_version"] != PROGRAM_VERSION:
+            raise ValueError(f"written by version {metadata['program_version']}")
+        return metadata, data[start + metadata_length :]
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                self._index = json.loads((self.directory / self.INDEX_FILE_NAME).read_text())
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / self.INDEX_FILE_NAME).write_text(json.dumps(self._index))
+        except OSError as e:
+            logger.warning(f"Failed to write parse cache index: {e}")
+
+
+parse_cache = ParseCache(DEFAULT_PARSE_CACHE_DIRECTORY)
+
+
+# ============================================================================
+# Datatype Detection
+# ============================================================================
+
+# alphabets in tie-breaking order: the first alphabet with the most matches wins
+DATATYPE_ALPHABETS = (
+    ("DNA", "ACGT"),
+    ("RNA", "ACGU"),
+    ("Protein", "ARNDCQEGHILKMFPSTWYV"),
+    ("Morphology", "0123456789"),
+)
+
+
+def _build_alphabet_table():
+    # bit i is set for characters whose upper case is in alphabet i; this
+    # covers every code point whose upper case is an ASCII letter or digit
+    # (including dotless i and long s), so larger code points map to 0
+    table = np.zeros(0x180, dtype=np.uint8)
+    for code_point in range(len(table)):
+        upper = chr(code_point).upper()
+        for bit, (_name, alphabet) in enumerate(DATATYPE_ALPHABETS):
+            if len(upper) == 1 and upper in alphabet:
+                table[code_point] |= 1 << bit
+    return table
+
+
+DATATYPE_ALPHABET_TABLE = _build_alphabet_table()
+
+
+def _alphabet_bits(text):
+    code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    outside = code_points >= len(DATATYPE_ALPHABET_TABLE)
+    bits = DATATYPE_ALPHABET_TABLE[np.where(outside, 0, code_points)]
+    bits[outside] = 0
+    return bits
+
+
+def count_column_datatypes(datamatrix, n_chars):
+    """Count the columns of a matrix best explained by each alphabet.
+
+    Every character in a column (all states of polymorphic cells included)
+    is looked up case-insensitively in the DNA, RNA, protein and morphology
+    alphabets, and the column is assigned to the alphabet with the most
+    matches, the first one in DATATYPE_ALPHABETS on ties. The whole matrix
+    is classified through a NumPy lookup table in one pass.
+
+    Args:
+        datamatrix: List of rows of state strings or lists of states.
+        n_chars: Number of columns to classify.
+
+    Returns:
+        Dictionary mapping the datatype names of DATATYPE_ALPHABETS to the
+        number of columns assigned to them.
+    """
+    n_alphabets = len(DATATYPE_ALPHABETS)
+    counts = np.zeros((n_alphabets, n_chars), dtype=np.int64)
+    uniform_rows = []
+    for row in datamatrix:
+        row = row[:n_chars]
+        try:
+            text = "".join(row)
+        except TypeError:
+            text = None
+        # rows of single-character states are classified together below
+        if (
+            text is not None
+            and len(row) == len(text) == n_chars
+            and min(map(len, row), default=1) == 1
+        ):
+            uniform_rows.append(text)
+            continue
+        cell_texts = [cell if isinstance(cell, str) else "".join(cell) for cell in row]
+        columns = np.repeat(np.arange(len(cell_texts)), [len(cell) for cell in cell_texts])
+        bits = _alphabet_bits("".join(cell_texts))
+        for bit in range(n_alphabets):
+            counts[bit] += np.bincount(
+                columns, weights=(bits >> bit) & 1, minlength=n_chars
+            ).astype(np.int64)[:n_chars]
+
+    if uniform_rows and n_chars > 0:
+        bits = _alphabet_bits("".join(uniform_rows)).reshape(len(uniform_rows), n_chars)
+        for bit in range(n_alphabets):
+            counts[bit] += ((bits >> bit) & 1).sum(axis=0, dtype=np.int64)
+
+    winners = np.argmax(counts, axis=0) if n_chars > 0 else np.zeros(0, dtype=np.int64)
+    column_counts = np.bincount(winners, minlength=n_alphabets)
+    return {name: int(column_counts[i]) for i, (name, _) in enumerate(DATATYPE_ALPHABETS)}
+
+
 # ============================================================================
 # Database Backup and Recovery Functions
 # ============================================================================
@@ -1839,8 +4886,12 @@ def restore_database(backup_path, db_path, create_backup=True):
                 logger.warning(f"Failed to backup current database: {e}")
                 # Continue anyway - user may want to proceed
 
-        # Restore backup
+        # Restore backup; a leftover write-ahead log belongs to the replaced
+        # database and must not be replayed onto the restored one
         shutil.copy2(backup_path, db_path)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
         logger.info(f"Database restored from: {backup_path}")
 
         return True
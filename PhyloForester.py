@@ -1,5 +1,6 @@
 # ruff: noqa: F403, F405, N815, N816
 import logging
+import multiprocessing
 import os
 import platform
 import re
@@ -53,6 +54,9 @@ from PfModel import *  # noqa: F403
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+# datamatrix problems listed in the message box when an analysis cannot start
+MAX_REPORTED_PROBLEMS = 10
+
 ICON = {}
 ICON["new_project"] = pu.resource_path("icons/NewProject.png")
 ICON["project"] = pu.resource_path("icons/Project.png")
@@ -528,6 +532,7 @@ class PfTableModel(QAbstractTableModel):
         self._vheader_data = []
         self._hheader_data = []
         self.undo_stack = None  # Will be set by PfTableView
+        self._edited_cells = set()  # (row, col) touched since the last resetColors()
 
     def rowCount(self, parent=QModelIndex()):
         return len(self._data)
@@ -592,6 +597,7 @@ class PfTableModel(QAbstractTableModel):
             return False
 
         self._data[row][col] = {"value": value, "changed": changed}
+        self._edited_cells.add((row, col))
         index = self.index(row, col)
         self.dataChanged.emit(index, index, [Qt.EditRole, Qt.BackgroundRole])
         return True
@@ -615,6 +621,7 @@ class PfTableModel(QAbstractTableModel):
         else:
             # Direct edit without undo (fallback)
             self._data[index.row()][index.column()] = {"value": value, "changed": True}
+            self._edited_cells.add((index.row(), index.column()))
             self.dataChanged.emit(index, index, [role, Qt.BackgroundRole])
 
         return True
@@ -624,14 +631,17 @@ class PfTableModel(QAbstractTableModel):
             return Qt.NoItemFlags
         return super().flags(index) | Qt.ItemIsEditable
 
+    def editedCells(self):
+        """Get (row, col) of cells edited since the last resetColors(), in order"""
+        return sorted(self._edited_cells)
+
     def resetColors(self):
-        for row in range(self.rowCount()):
-            for column in range(self.columnCount()):
-                d = self._data[row][column]
-                if isinstance(d, dict) and d.get("changed", False):
-                    d["changed"] = False
-                # if self._data[row][column].get('changed', False):
-                #    self._data[row][column]['changed'] = False
+        # only edited cells can carry the changed flag
+        for row, column in self._edited_cells:
+            d = self._data[row][column]
+            if isinstance(d, dict) and d.get("changed", False):
+                d["changed"] = False
+        self._edited_cells.clear()
         self.dataChanged.emit(
             self.index(0, 0),
             self.index(self.rowCount() - 1, self.columnCount() - 1),
@@ -643,6 +653,7 @@ class PfTableModel(QAbstractTableModel):
         # check header data and data size
 
         self._data = data
+        self._edited_cells = set()
         self.endResetModel()
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
@@ -920,6 +931,14 @@ class PhyloForesterMainWindow(QMainWindow):
         self.m_app.iqtree_path = os.path.normpath(iqtree_value) if iqtree_value else ""
         mrbayes_value = self.m_app.settings.value("SoftwarePath/MrBayes", "")
         self.m_app.mrbayes_path = os.path.normpath(mrbayes_value) if mrbayes_value else ""
+        # read before check_db() opens the connection, which applies the pragmas
+        self.m_app.database_profile = self.m_app.settings.value(
+            "DatabaseProfile", DEFAULT_DATABASE_PROFILE
+        )
+        if self.m_app.database_profile not in DATABASE_PROFILES:
+            self.logger.warning(f"Unknown database profile: {self.m_app.database_profile}")
+            self.m_app.database_profile = DEFAULT_DATABASE_PROFILE
+        use_database_profile(self.m_app.database_profile)
         # print("tnt path:", self.m_app.tnt_path)
         # print("iqtree path:", self.m_app.iqtree_path)
         # print("mrbayes path:", self.m_app.mrbayes_path)
@@ -964,12 +983,16 @@ class PhyloForesterMainWindow(QMainWindow):
         Runs silently - only logs errors without showing dialogs.
         """
         try:
-            db_path = os.path.join(pu.DEFAULT_STORAGE_DIRECTORY, "PhyloForester.db")
+            db_path = os.path.join(pu.DEFAULT_DB_DIRECTORY, "PhyloForester.db")
 
             # Only backup if database exists
             if not os.path.exists(db_path):
                 return
 
+            # move WAL contents into the main file so the copy is complete
+            if not gDatabase.is_closed():
+                gDatabase.execute_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
             # Create backup
             backup_path = pu.backup_database(db_path, keep_n_backups=10)
             self.logger.info(f"Automatic database backup created: {backup_path}")
@@ -991,11 +1014,7 @@ class PhyloForesterMainWindow(QMainWindow):
         """
         try:
             # Find analyses stuck in RUNNING state
-            interrupted_analyses = (
-                PfAnalysis.select()
-                .where(PfAnalysis.analysis_status == ANALYSIS_STATUS_RUNNING)
-                .order_by(PfAnalysis.start_datetime.desc())
-            )
+            interrupted_analyses = PfAnalysis.select_running()
 
             interrupted_count = interrupted_analyses.count()
 
@@ -1026,12 +1045,13 @@ class PhyloForesterMainWindow(QMainWindow):
 
             if msg.clickedButton() == mark_failed_btn:
                 # Mark all as failed
-                for analysis in interrupted_analyses:
-                    analysis.analysis_status = ANALYSIS_STATUS_FAILED
-                    analysis.save()
-                    self.logger.info(
-                        f"Marked interrupted analysis as failed: {analysis.analysis_name}"
-                    )
+                with bulk_write():
+                    for analysis in interrupted_analyses:
+                        analysis.analysis_status = ANALYSIS_STATUS_FAILED
+                        analysis.save()
+                        self.logger.info(
+                            f"Marked interrupted analysis as failed: {analysis.analysis_name}"
+                        )
 
                 self.statusBar.showMessage(
                     f"Marked {interrupted_count} interrupted analysis(es) as failed", 5000
@@ -1242,17 +1262,13 @@ class PhyloForesterMainWindow(QMainWindow):
         # Command to run (example: list directory contents)
         if not analysis:
             try:
-                analysis_list = (
-                    PfAnalysis.select()
-                    .where(PfAnalysis.analysis_status == ANALYSIS_STATUS_READY)
-                    .order_by(PfAnalysis.created_at)
-                )
+                next_analysis = PfAnalysis.select_ready().first()
 
-                if len(analysis_list) == 0:
+                if next_analysis is None:
                     self.logger.info("No ready analyses to start")
                     return
 
-                self.analysis = analysis_list[0]
+                self.analysis = next_analysis
                 self.logger.info(f"Starting analysis: {self.analysis.analysis_name}")
 
             except OperationalError as e:
@@ -1270,17 +1286,17 @@ class PhyloForesterMainWindow(QMainWindow):
         if self.analysis.analysis_type == ANALYSIS_TYPE_PARSIMONY:
             command = str(self.m_app.tnt_path)
             fileext = ".nex"
-            datamatrix_str = datamatrix.as_nexus_format()
+            file_format = "nexus"
         elif self.analysis.analysis_type == ANALYSIS_TYPE_ML:
             command = str(self.m_app.iqtree_path)
             fileext = ".phy"
-            datamatrix_str = datamatrix.as_phylip_format()
+            file_format = "phylip"
 
         elif self.analysis.analysis_type == ANALYSIS_TYPE_BAYESIAN:
             command = str(self.m_app.mrbayes_path)
             # command = "D:/Phylogenetics/MrBayes-3.2.7-WINbin/mb.3.2.7-win64.exe"
             fileext = ".nex"
-            datamatrix_str = datamatrix.as_nexus_format()
+            file_format = "nexus"
 
         self.logger.info(f"Analysis command: {command}")
         self.logger.info(f"Analysis type: {self.analysis.analysis_type}")
@@ -1297,9 +1313,25 @@ class PhyloForesterMainWindow(QMainWindow):
 
         data_file_location = os.path.join(result_directory, data_filename)  # .replace(" ","_")
 
+        report = datamatrix.validate()
+        for problem in report["warnings"]:
+            self.logger.warning(f"{datamatrix.datamatrix_name}: {problem['message']}")
+        if not report["valid"]:
+            messages = [problem["message"] for problem in report["errors"]]
+            self.logger.error(f"Invalid datamatrix {datamatrix.datamatrix_name}: {messages}")
+            QMessageBox.critical(
+                self,
+                "Data Error",
+                f"Cannot analyze {datamatrix.datamatrix_name}:\n"
+                + "\n".join(messages[:MAX_REPORTED_PROBLEMS]),
+            )
+            self.analysis.analysis_status = ANALYSIS_STATUS_FAILED
+            self.analysis.save()
+            return
+
         # Write data file with error handling
         try:
-            pu.safe_file_write(data_file_location, datamatrix_str)
+            datamatrix.export_file(data_file_location, file_format)
             self.logger.info(f"Data file written: {data_file_location}")
         except pu.FileOperationError as e:
             self.logger.error(f"Failed to write data file: {e}")
@@ -1391,9 +1423,7 @@ class PhyloForesterMainWindow(QMainWindow):
                 )
 
             self.logger.info(f"Process started successfully: {command}")
-            self.data_storage["analysis"][self.analysis.id]["widget"].append_output(
-                "Analysis started successfully"
-            )
+            self.get_analysis_widget(self.analysis).append_output("Analysis started successfully")
 
         except pu.ProcessExecutionError as e:
             self.logger.error(f"Process execution failed: {e}")
@@ -1405,9 +1435,7 @@ class PhyloForesterMainWindow(QMainWindow):
 
             # Update UI
             if self.analysis.id in self.data_storage["analysis"]:
-                self.data_storage["analysis"][self.analysis.id]["widget"].append_output(
-                    f"ERROR: {e}"
-                )
+                self.get_analysis_widget(self.analysis).append_output(f"ERROR: {e}")
                 # Update analysis viewer if visible
                 widget = self.hsplitter.widget(1)
                 if hasattr(widget, "set_analysis"):
@@ -1417,7 +1445,7 @@ class PhyloForesterMainWindow(QMainWindow):
             self.startAnalysis()
             return
 
-        self.data_storage["analysis"][self.analysis.id]["widget"].append_output("process started")
+        self.get_analysis_widget(self.analysis).append_output("process started")
         # edtOutput = self.data_storage['analysis'][self.analysis.id]['output']
         # print("output textedit:", edtOutput)
         # edtOutput.appendPlainText("process started")
@@ -1453,7 +1481,7 @@ end;"""
 
         self.progress_check(output)
 
-        self.data_storage["analysis"][self.analysis.id]["widget"].append_output(output)
+        self.get_analysis_widget(self.analysis).append_output(output)
         # print("output textedit:", self.data_storage['analysis'][self.analysis.id]['output'])
 
         # self.edtAnalysisOutput.append(output)
@@ -1562,6 +1590,8 @@ end;"""
             file.flush()  # Flush internal Python buffer
             os.fsync(file.fileno())
 
+        # only the last progress line of this output chunk is saved
+        percentage = None
         for line in output.splitlines():
             progress_found = False
             if self.analysis.analysis_type == ANALYSIS_TYPE_ML:
@@ -1583,11 +1613,13 @@ end;"""
 
             if progress_found:
                 percentage = float(round((float(curr_step) / float(total_step)) * 1000)) / 10.0
-                self.analysis.completion_percentage = percentage
-                # self.data_storage['analysis'][self.analysis.id]['tree_item'].setData(self.analysis.completion_percentage, Qt.UserRole + 10)
-                self.analysis.save()
 
-                self.update_analysis_info(self.analysis)
+        if percentage is not None:
+            self.analysis.completion_percentage = percentage
+            # self.data_storage['analysis'][self.analysis.id]['tree_item'].setData(self.analysis.completion_percentage, Qt.UserRole + 10)
+            self.analysis.save()
+
+            self.update_analysis_info(self.analysis)
 
     def generate_consensus_tree(self, analysis):
         """Tree file Processing"""
@@ -1599,7 +1631,8 @@ end;"""
             )
             if not os.path.exists(tree_filename):
                 return
-            tree = Phylo.read(tree_filename, "newick")
+            with open(tree_filename, encoding="utf-8") as f:
+                tree = pu.NewickTree.parse(f.read())
         elif analysis.analysis_type == ANALYSIS_TYPE_PARSIMONY:
             tree_name = "Parsimony Consensus tree"
             tree_filename = os.path.join(analysis.result_directory, "aquickie.tre")
@@ -1609,14 +1642,8 @@ end;"""
             tf = pu.PhyloTreefile()
             tf.readtree(tree_filename, "Nexus")
             # print(tf.block_hash)
-            tree = Phylo.read(io.StringIO(tf.tree_text_hash["tnt_1"]), "newick")
-            for clade in tree.find_clades():
-                if clade.name:
-                    taxon_index = int(clade.name) - 1
-                    taxa_list = analysis.datamatrix.get_taxa_list()
-                    clade.name = taxa_list[taxon_index]
-                    # print(clade.name)
-                    # clade.name = tf.taxa_hash[clade.name]
+            tree = pu.NewickTree.parse(tf.tree_text_hash["tnt_1"])
+            tree.translate(analysis.datamatrix.get_taxa_list())
 
         elif analysis.analysis_type == ANALYSIS_TYPE_BAYESIAN:
             # tree_name = "Bayesian Consensus tree"  # Unused for now
@@ -1633,19 +1660,10 @@ end;"""
             # print(tf.tree_text_hash)
             # tree_text = tf.tree_text_hash['con_50_majrule']
             # handle =
-            tree = Phylo.read(io.StringIO(tf.tree_text_hash["con_50_majrule"]), "newick")
-            for clade in tree.find_clades():
-                if clade.name and tf.taxa_hash[clade.name]:
-                    # print(clade.name)
-                    clade.name = tf.taxa_hash[clade.name]
-
-        string_io = io.StringIO()
-        # Write the tree in Newick format to the text stream
-        Phylo.write(tree, string_io, "newick")
-        # Get the Newick string from the text stream
-        newick_string = string_io.getvalue()
-        # Close the StringIO object if it's not needed anymore
-        string_io.close()
+            tree = pu.NewickTree.parse(tf.tree_text_hash["con_50_majrule"])
+            tree.translate(tf.taxa_hash)
+
+        newick_string = tree.to_newick()
 
         consensus_tree = PfTree()
         # consensus_tree.project = analysis.project
@@ -1660,7 +1678,8 @@ end;"""
         analysis = PfAnalysis.get(PfAnalysis.id == analysis.id)
         av = self.data_storage["analysis"][analysis.id]["widget"]
         # analysis_view.set_analysis(analysis)
-        av.update_info(analysis)
+        if av is not None:
+            av.update_info(analysis)
 
         tree_item = self.data_storage["analysis"][analysis.id]["tree_item"]
         if tree_item is not None and not sip.isdeleted(tree_item):
@@ -1709,7 +1728,7 @@ end;"""
 
             # Update UI
             if self.analysis.id in self.data_storage["analysis"]:
-                self.data_storage["analysis"][self.analysis.id]["widget"].append_output(
+                self.get_analysis_widget(self.analysis).append_output(
                     f"ERROR: {error_type}\n{error_detail}"
                 )
 
@@ -1836,7 +1855,7 @@ end;"""
                     and self.selected_datamatrix.id in self.data_storage["datamatrix"]
                 ):
                     self.hsplitter.replaceWidget(
-                        1, self.data_storage["datamatrix"][self.selected_datamatrix.id]["widget"]
+                        1, self.get_datamatrix_widget(self.selected_datamatrix)
                     )
                 # self.reset_tableView()
 
@@ -1948,7 +1967,8 @@ end;"""
                             if self.empty_widget != self.hsplitter.widget(1):
                                 self.hsplitter.replaceWidget(1, self.empty_widget)
                             if an.id in self.data_storage["analysis"]:
-                                self.data_storage["analysis"][an.id]["widget"].close()
+                                if self.data_storage["analysis"][an.id]["widget"] is not None:
+                                    self.data_storage["analysis"][an.id]["widget"].close()
                                 self.data_storage["analysis"][an.id]["object"] = None
                                 self.data_storage["analysis"][an.id]["widget"] = None
                                 self.data_storage["analysis"][an.id]["tree_item"] = None
@@ -2005,7 +2025,8 @@ end;"""
                 try:
                     self.hsplitter.replaceWidget(1, self.empty_widget)
                     if an_id in self.data_storage["analysis"]:
-                        self.data_storage["analysis"][an_id]["widget"].close()
+                        if self.data_storage["analysis"][an_id]["widget"] is not None:
+                            self.data_storage["analysis"][an_id]["widget"].close()
                         self.data_storage["analysis"][an_id]["object"] = None
                         self.data_storage["analysis"][an_id]["widget"] = None
                         self.data_storage["analysis"][an_id]["tree_item"] = None
@@ -2029,7 +2050,9 @@ end;"""
                         "analyses"
                     ][0]
                     self.selected_analysis = self.data_storage["analysis"][an_id]["object"]
-                    self.hsplitter.replaceWidget(1, self.data_storage["analysis"][an_id]["widget"])
+                    self.hsplitter.replaceWidget(
+                        1, self.get_analysis_widget(self.selected_analysis)
+                    )
         except Exception as e:
             error_msg = f"Error deleting analysis:\n{str(e)}"
             self.logger.error(f"{error_msg}\n{traceback.format_exc()}")
@@ -2180,83 +2203,108 @@ end;"""
             # QMessageBox.warning(self, "Warning", "Select a project first.")
             # return
 
-        for file_name in file_name_list:
-            try:
-                file_name = pu.process_dropped_file_name(file_name)
+        progress_dialog = ProgressDialog(self)
+        progress_dialog.setModal(True)
+        progress_dialog.show()
+
+        def report_progress(bytes_read, file_size):
+            if progress_dialog.stop_progress:
+                raise pu.FileOperationError("Import cancelled")
+            progress_dialog.set_max_value(max(file_size, 1))
+            progress_dialog.set_curr_value(bytes_read)
 
-                # Validate file path using new validation functions
+        try:
+            for file_name in file_name_list:
+                if progress_dialog.stop_progress:
+                    self.logger.info("Import cancelled")
+                    break
                 try:
-                    # This validates file exists, is readable, and is not a directory
-                    validated_path = pu.validate_phylo_data_file(file_name)
-                    file_name = validated_path
-                except pu.FileOperationError as e:
-                    error_msg = str(e)
-                    self.logger.error(f"File validation failed: {error_msg}")
-                    QMessageBox.critical(self, "File Validation Error", error_msg)
-                    continue
+                    file_name = pu.process_dropped_file_name(file_name)
 
-                # Create new project if needed
-                if create_new_project:
+                    # Validate file path using new validation functions
+                    try:
+                        # This validates file exists, is readable, and is not a directory
+                        validated_path = pu.validate_phylo_data_file(file_name)
+                        file_name = validated_path
+                    except pu.FileOperationError as e:
+                        error_msg = str(e)
+                        self.logger.error(f"File validation failed: {error_msg}")
+                        QMessageBox.critical(self, "File Validation Error", error_msg)
+                        continue
+
+                    # Create new project if needed
+                    if create_new_project:
+                        try:
+                            project_name = os.path.basename(file_name)
+                            project = PfProject()
+                            project.project_name = project_name
+                            project.save()
+                            self.selected_project = project
+                            self.logger.info(f"Created new project: {project_name}")
+                            create_new_project = False
+                        except Exception as e:
+                            error_msg = f"Failed to create project: {e}"
+                            self.logger.error(error_msg)
+                            QMessageBox.critical(self, "Project Creation Error", error_msg)
+                            return
+
+                    # Create datamatrix and import file
+                    dm = PfDatamatrix()
+                    dm.project = self.selected_project
+                    dm.datamatrix_name = os.path.basename(file_name)
+
+                    # Import file with error handling
+                    progress_dialog.set_progress_text(
+                        f"Reading {os.path.basename(file_name)}: {{}} of {{}} bytes"
+                    )
                     try:
-                        project_name = os.path.basename(file_name)
-                        project = PfProject()
-                        project.project_name = project_name
-                        project.save()
-                        self.selected_project = project
-                        self.logger.info(f"Created new project: {project_name}")
-                        create_new_project = False
+                        if not dm.import_file(file_name, report_progress):
+                            if progress_dialog.stop_progress:
+                                continue
+                            raise ValueError("The file could not be read as a data matrix.")
+                        self.logger.info(f"Successfully imported: {file_name}")
+                    except FileNotFoundError as e:
+                        error_msg = f"File not found during import:\n{file_name}"
+                        self.logger.error(f"{error_msg}\n{e}")
+                        QMessageBox.critical(self, "Import Error", error_msg)
+                        continue
+                    except PermissionError as e:
+                        error_msg = f"Permission denied when reading:\n{file_name}\n\nPlease check file permissions."
+                        self.logger.error(f"{error_msg}\n{e}")
+                        QMessageBox.critical(self, "Import Error", error_msg)
+                        continue
+                    except ValueError as e:
+                        error_msg = f"Invalid file format:\n{file_name}\n\n{str(e)}\n\nSupported formats: Nexus, Phylip, FASTA, TNT (optionally .gz, .bz2 or .xz compressed)"
+                        self.logger.error(f"{error_msg}\n{e}")
+                        QMessageBox.critical(self, "Import Error", error_msg)
+                        continue
                     except Exception as e:
-                        error_msg = f"Failed to create project: {e}"
-                        self.logger.error(error_msg)
-                        QMessageBox.critical(self, "Project Creation Error", error_msg)
-                        return
-
-                # Create datamatrix and import file
-                dm = PfDatamatrix()
-                dm.project = self.selected_project
-                dm.datamatrix_name = os.path.basename(file_name)
+                        error_msg = f"Failed to import file:\n{file_name}\n\n{str(e)}"
+                        self.logger.error(f"{error_msg}\n{traceback.format_exc()}")
+                        QMessageBox.critical(self, "Import Error", error_msg)
+                        continue
 
-                # Import file with error handling
-                try:
-                    dm.import_file(file_name)
-                    self.logger.info(f"Successfully imported: {file_name}")
-                except FileNotFoundError as e:
-                    error_msg = f"File not found during import:\n{file_name}"
-                    self.logger.error(f"{error_msg}\n{e}")
-                    QMessageBox.critical(self, "Import Error", error_msg)
-                    continue
-                except PermissionError as e:
-                    error_msg = f"Permission denied when reading:\n{file_name}\n\nPlease check file permissions."
-                    self.logger.error(f"{error_msg}\n{e}")
-                    QMessageBox.critical(self, "Import Error", error_msg)
-                    continue
-                except ValueError as e:
-                    error_msg = f"Invalid file format:\n{file_name}\n\n{str(e)}\n\nSupported formats: Nexus, Phylip, TNT"
-                    self.logger.error(f"{error_msg}\n{e}")
-                    QMessageBox.critical(self, "Import Error", error_msg)
-                    continue
-                except Exception as e:
-                    error_msg = f"Failed to import file:\n{file_name}\n\n{str(e)}"
-                    self.logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                    QMessageBox.critical(self, "Import Error", error_msg)
-                    continue
+                    # Save to database with error handling
+                    try:
+                        # one commit per file, without the parsing and dialogs around it
+                        with bulk_write():
+                            dm.save()
+                        self.logger.info(f"Saved datamatrix: {dm.datamatrix_name}")
+                    except Exception as e:
+                        error_msg = f"Failed to save datamatrix to database:\n{str(e)}"
+                        self.logger.error(f"{error_msg}\n{traceback.format_exc()}")
+                        QMessageBox.critical(self, "Database Error", error_msg)
+                        continue
 
-                # Save to database with error handling
-                try:
-                    dm.save()
-                    self.logger.info(f"Saved datamatrix: {dm.datamatrix_name}")
                 except Exception as e:
-                    error_msg = f"Failed to save datamatrix to database:\n{str(e)}"
+                    # Catch-all for any unexpected errors
+                    error_msg = f"Unexpected error processing file:\n{file_name}\n\n{str(e)}"
                     self.logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                    QMessageBox.critical(self, "Database Error", error_msg)
+                    QMessageBox.critical(self, "Error", error_msg)
                     continue
-
-            except Exception as e:
-                # Catch-all for any unexpected errors
-                error_msg = f"Unexpected error processing file:\n{file_name}\n\n{str(e)}"
-                self.logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                QMessageBox.critical(self, "Error", error_msg)
-                continue
+        finally:
+            # a modal dialog left open would lock the main window
+            progress_dialog.close()
 
         project = self.selected_project
         # print("load treeview:", file_name, "at", datetime.datetime.now())
@@ -2286,15 +2334,26 @@ end;"""
         if self.selected_analysis is None:
             return
         if self.selected_analysis.id in self.data_storage["analysis"]:
-            # analysis_ref = self.data_storage['analysis'][self.selected_analysis.id]
-            av = self.data_storage["analysis"][self.selected_analysis.id]["widget"]
-            if av is None:
-                av = self.data_storage["analysis"][self.selected_analysis.id]["widget"] = (
-                    AnalysisViewer(logger=self.logger)
-                )
-                av.set_analysis(self.selected_analysis)
-                av.update_info(self.selected_analysis)
-            # print("analysis widget created", analysis_ref['widget'], analysis_ref['output'])
+            self.get_analysis_widget(self.selected_analysis)
+
+    def get_analysis_widget(self, analysis):
+        """Return the viewer of an analysis, building it on first use.
+
+        Viewers read trees and the full datamatrix, so load_treeview() leaves
+        them out and they are created when the analysis is opened or run.
+        """
+        analysis_ref = self.data_storage["analysis"][analysis.id]
+        if analysis_ref["widget"] is None:
+            av = analysis_ref["widget"] = AnalysisViewer(logger=self.logger)
+            av.set_analysis(analysis)
+            av.update_info(analysis)
+        return analysis_ref["widget"]
+
+    def get_datamatrix_widget(self, dm):
+        """Return the table widget of a datamatrix, building it on first use."""
+        if self.data_storage["datamatrix"][dm.id]["widget"] is None:
+            self.create_datamatrix_table(dm)
+        return self.data_storage["datamatrix"][dm.id]["widget"]
 
     def update_datamatrix_table(self):
         # print("update_datamatrix_table", self.selected_datamatrix.id)
@@ -2356,7 +2415,8 @@ end;"""
         # horizontalHeader.resizeSection(0, 200)
         # horizontalHeader.resizeSection(1, 50)
 
-        data_list = dm.datamatrix_as_list()
+        # the table model edits cells in place, so give it its own copy
+        data_list = [list(row) for row in dm.datamatrix_as_list()]
         self.datamatrix = data_list
         if data_list is None:
             return dm_widget
@@ -2616,7 +2676,7 @@ end;"""
                 self.selected_datamatrix = data
                 self.selected_project = self.selected_datamatrix.project
                 self.hsplitter.replaceWidget(
-                    1, self.data_storage["datamatrix"][self.selected_datamatrix.id]["widget"]
+                    1, self.get_datamatrix_widget(self.selected_datamatrix)
                 )
 
             elif isinstance(data, PfProject):
@@ -2626,7 +2686,7 @@ end;"""
                     dm_id = self.data_storage["project"][data.id]["datamatrices"][0]
                     self.selected_datamatrix = self.data_storage["datamatrix"][dm_id]["object"]
                     self.hsplitter.replaceWidget(
-                        1, self.data_storage["datamatrix"][dm_id]["widget"]
+                        1, self.get_datamatrix_widget(self.selected_datamatrix)
                     )
                 else:
                     self.hsplitter.replaceWidget(1, self.empty_widget)
@@ -2707,7 +2767,8 @@ end;"""
         self.selected_project = None
 
         try:
-            project_list = PfProject.select()
+            # one query per level; matrices and snapshots are fetched when a node is opened
+            project_list = PfProject.select_hierarchy()
         except OperationalError as e:
             self.logger.error(f"Database error while loading projects: {e}")
             QMessageBox.critical(self, "Database Error", f"Failed to load projects:\n{e}")
@@ -2731,42 +2792,38 @@ end;"""
             }
 
             self.project_model.appendRow([item1, item2])  # ,item2,item3] )
-            if project.datamatrices.count() > 0:
-                dm_list = PfDatamatrix.select().where(PfDatamatrix.project == project)
-                for dm in dm_list:
-                    item3 = QStandardItem(dm.datamatrix_name)
-                    item3.setIcon(QIcon(pu.resource_path(ICON["datamatrix"])))
-                    item3.setData(dm)
-                    item4 = QStandardItem()
-                    item4.setData(dm.datatype, Qt.UserRole + 10)
-                    item1.appendRow([item3, item4])
-                    self.data_storage["datamatrix"][dm.id] = {
-                        "object": dm,
-                        "item": item3,
-                        "analyses": [],
-                        "widget": None,
+            for dm in project.datamatrices:
+                item3 = QStandardItem(dm.datamatrix_name)
+                item3.setIcon(QIcon(pu.resource_path(ICON["datamatrix"])))
+                item3.setData(dm)
+                item4 = QStandardItem()
+                item4.setData(dm.datatype, Qt.UserRole + 10)
+                item1.appendRow([item3, item4])
+                self.data_storage["datamatrix"][dm.id] = {
+                    "object": dm,
+                    "item": item3,
+                    "analyses": [],
+                    "widget": None,
+                }
+                self.data_storage["project"][project.id]["datamatrices"].append(dm.id)
+                for analysis in dm.analyses:
+                    item5 = QStandardItem(analysis.analysis_name)
+                    item5.setIcon(QIcon(pu.resource_path(ICON["analysis"])))
+                    item5.setData(analysis)
+                    item6 = QStandardItem("")
+                    analysis_status = {
+                        "status": analysis.analysis_status,
+                        "percentage": analysis.completion_percentage,
                     }
-                    self.data_storage["project"][project.id]["datamatrices"].append(dm.id)
-                    if dm.analyses.count() > 0:
-                        for analysis in dm.analyses:
-                            analysis = PfAnalysis.get_by_id(analysis.id)
-                            item5 = QStandardItem(analysis.analysis_name)
-                            item5.setIcon(QIcon(pu.resource_path(ICON["analysis"])))
-                            item5.setData(analysis)
-                            item6 = QStandardItem("")
-                            analysis_status = {
-                                "status": analysis.analysis_status,
-                                "percentage": analysis.completion_percentage,
-                            }
-                            item6.setData(analysis_status, Qt.UserRole + 10)
-                            item3.appendRow([item5, item6])
-                            if analysis.id not in self.data_storage["analysis"]:
-                                self.data_storage["analysis"][analysis.id] = {
-                                    "object": analysis,
-                                    "tree_item": item6,
-                                    "widget": None,
-                                }
-                            self.data_storage["datamatrix"][dm.id]["analyses"].append(analysis.id)
+                    item6.setData(analysis_status, Qt.UserRole + 10)
+                    item3.appendRow([item5, item6])
+                    if analysis.id not in self.data_storage["analysis"]:
+                        self.data_storage["analysis"][analysis.id] = {
+                            "object": analysis,
+                            "tree_item": item6,
+                            "widget": None,
+                        }
+                    self.data_storage["datamatrix"][dm.id]["analyses"].append(analysis.id)
 
             self.selected_project = project
             self.load_datamatrices(project)
@@ -2788,9 +2845,12 @@ end;"""
     def load_datamatrices(self, project=None):
         if project is None:
             return
-        self.datamatrix_list = (
-            project.datamatrices
-        )  # PfDatamatrix.select().where(PfDatamatrix.project == self.selected_project)
+        # reuse the metadata objects loaded by load_treeview(); table widgets and
+        # analysis viewers are built by get_datamatrix_widget()/get_analysis_widget()
+        self.datamatrix_list = [
+            self.data_storage["datamatrix"][dm_id]["object"]
+            for dm_id in self.data_storage["project"][project.id]["datamatrices"]
+        ]
         # taxa_list = self.selected_project.get_taxa_list()
 
         self.datamatrix_model_list = []
@@ -2802,13 +2862,7 @@ end;"""
             # self.add_empty_tabview()
             return
 
-        for dm in self.datamatrix_list:
-            if self.data_storage["datamatrix"][dm.id]["widget"] is None:
-                self.data_storage["datamatrix"][dm.id]["widget"] = self.create_datamatrix_table(dm)
-                # dm_widget = self.create_datamatrix_table(dm)
-                self.load_analyses(dm)
-
-                # self.tabView.addTab(dm_widget, dm.datamatrix_name)
+        self.selected_datamatrix = self.datamatrix_list[0]
 
     def on_btn_add_taxon_clicked(self):
         # print("add taxon")
@@ -2818,16 +2872,16 @@ end;"""
         if not ok or text.strip() == "":
             return
         dm = self.selected_datamatrix
-        dm.taxa_list = dm.get_taxa_list()
+        dm.taxa_list = list(dm.get_taxa_list())
         # print("taxa_list 1", dm.taxa_list)
         dm.taxa_list.append(text)
         dm.taxa_list_json = json.dumps(dm.taxa_list)
         dm.n_taxa = len(dm.taxa_list)
-        dm.datamatrix = dm.datamatrix_as_list()
+        dm.datamatrix = [list(row) for row in dm.datamatrix_as_list()]
         # print("datamatrix 1:", dm.datamatrix)
         # dm.datamatrix
         dm.datamatrix.append(["0"] * dm.n_chars)
-        dm.datamatrix_json = json.dumps(dm.datamatrix, indent=4)
+        dm.set_datamatrix(dm.datamatrix)
         # print("taxa_list 2", dm.taxa_list)
         # print("datamatrix 2:", dm.datamatrix)
         dm.save()
@@ -2843,49 +2897,22 @@ end;"""
         text, ok = QInputDialog.getText(self, "Input Dialog", "Enter new character name", text="")
         dm = self.selected_datamatrix
 
-        dm.characters_list = dm.get_character_list()
+        dm.characters_list = list(dm.get_character_list())
         if len(dm.characters_list) == 0:
             dm.characters_list = ["0"] * dm.n_chars
         dm.characters_list.append(text)
         dm.character_list_json = json.dumps(dm.characters_list)
         dm.n_chars = len(dm.characters_list)
-        dm.datamatrix = dm.datamatrix_as_list()
+        dm.datamatrix = [list(row) for row in dm.datamatrix_as_list()]
         for row in dm.datamatrix:
             row.append("0")
-        dm.datamatrix_json = json.dumps(dm.datamatrix, indent=4)
+        dm.set_datamatrix(dm.datamatrix)
         dm.save()
         self.update_datamatrix_table()
         self.hsplitter.replaceWidget(
             1, self.data_storage["datamatrix"][self.selected_datamatrix.id]["widget"]
         )
 
-    def load_analyses(self, datamatrix=None):
-        if datamatrix is None:
-            return
-        self.analysis_list = datamatrix.analyses
-        if len(self.analysis_list) == 0:
-            return
-
-        for an in self.analysis_list:
-            # analysis_ref =
-            # print("analysis widget:",self.data_storage['analysis'][an.id]['widget'])
-            av = self.data_storage["analysis"][an.id]["widget"]
-            if av is None:
-                # self.data_storage['analysis'][an.id]['widget'] = self.create_analysis_widget(an)
-                av = self.data_storage["analysis"][an.id]["widget"] = AnalysisViewer(
-                    logger=self.logger
-                )
-                av.set_analysis(an)
-                av.update_info(an)
-            # print("analysis widget:",self.data_storage['analysis'][an.id]['widget'])
-
-        # self.analysis_model.clear()
-        # for analysis in self.analysis_list:
-        #    item1 = QStandardItem(analysis.analysis_name)
-        #    item1.setIcon(QIcon(pu.resource_path(ICON['analysis'])))
-        #    item1.setData(analysis)
-        # self.analysis_model.appendRow([item1])
-
     def on_btn_save_dm_clicked(self):
         # idx = self.tabView.selected_index
         # print("save dm", idx)
@@ -2897,39 +2924,30 @@ end;"""
         # self.selected_datamatrix
         dm = self.selected_datamatrix
 
-        self.selected_tableview = self.data_storage["datamatrix"][dm.id]["table"]
-        # iterate through the tableview
-        # print("dm:", self.selected_datamatrix.datamatrix_name)
-
-        data_list = []
-
-        self.selected_tableview.model().resetColors()
-        for row in range(self.selected_tableview.model().rowCount()):
-            data_row = []
-            for column in range(self.selected_tableview.model().columnCount()):
-                idx = self.selected_tableview.model().index(row, column)
-                d = self.selected_tableview.model().data(idx, Qt.DisplayRole)
-                if d.find(" ") > -1:
-                    data = d.split(" ")
-                else:
-                    data = d
-                data_row.append(data)
-                # print(item.text(),)
-                # print(item.data())
-                # print(item.textAlignment())
-                # print(item.textAlignment())
-            data_list.append(data_row)
-        # print(data_list)
-
-        # self.tabView.selected_index
-        # return
-        if self.selected_datamatrix is None:
+        if dm is None:
             self.logger.warning("No datamatrix selected for saving")
             return
-        dm = self.selected_datamatrix
 
-        dm.datamatrix_json = json.dumps(data_list, indent=4)
-        dm.save()
+        self.selected_tableview = self.data_storage["datamatrix"][dm.id]["table"]
+        model = self.selected_tableview.model()
+
+        # only the edited cells go to the cell edit journal
+        edits = []
+        for row, column in model.editedCells():
+            d = model.getCellValue(row, column)
+            if d.find(" ") > -1:
+                data = d.split(" ")
+            else:
+                data = d
+            edits.append((row, column, data))
+        model.resetColors()
+
+        dm.record_cell_edits(edits)
+        # open tree views of analyses of the matrix map the edited characters again
+        for analysis_id in self.data_storage["datamatrix"][dm.id]["analyses"]:
+            av = self.data_storage["analysis"].get(analysis_id, {}).get("widget")
+            if av is not None and not sip.isdeleted(av):
+                av.tree_widget.update_cells(dm, edits)
 
     def on_btn_analyze_clicked(self):
         if self.selected_datamatrix is None:
@@ -2938,6 +2956,8 @@ end;"""
 
 
 if __name__ == "__main__":
+    # worker processes of the frozen application start from this executable
+    multiprocessing.freeze_support()
     # QApplication : 프로그램을 실행시켜주는 클래스
     # with open('log.txt', 'w') as f:
     #    f.write("hello\n")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Benchmark showing trees again with character mapping on
+
+Compares reconstructing the ancestral states of every tree each time it is
+shown, as the tree viewer did when the slider came back to a tree, with
+looking them up in an AncestralStateCache. Every tree is built again from
+its Newick text on each visit, as the viewer does, and the second visits
+of the cached trees take their children in reverse order to check the
+canonical topology key. Both must map the same states and changes.
+Trees of large matrices take about 8 bytes per node and character, so
+fewer of them fit in the cache (see --cache-mb).
+
+Usage:
+    python benchmarks/bench_ancestral_cache.py [--size TAXAxCHARS ...] [--trees N]
+        [--cache-mb N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["50x1000", "200x5000", "500x10000"]
+
+
+def random_newick(taxa_list, rng):
+    """Get a random binary tree of the named taxa, and the same tree with its children reversed."""
+    subtrees = [(taxon, taxon) for taxon in taxa_list]
+    while len(subtrees) > 1:
+        left, left_reversed = subtrees.pop(rng.randrange(len(subtrees)))
+        right, right_reversed = subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append((f"({left},{right})", f"({right_reversed},{left_reversed})"))
+    newick, reversed_newick = subtrees[0]
+    return newick + ";", reversed_newick + ";"
+
+
+def random_matrix(n_taxa, n_chars, rng):
+    """Get a morphological matrix with some missing cells."""
+    return [rng.choices("0123?", weights=[4, 4, 2, 1, 1], k=n_chars) for _ in range(n_taxa)]
+
+
+def show_trees(newick_list, datamatrix, taxa_list, cache=None, matrix_hash=None):
+    """Map the characters on every tree; get the time per tree and the mapped states.
+
+    Like the viewer, only the tree shown is kept.
+    """
+    elapsed = 0
+    mapped = []
+    for newick in newick_list:
+        start = time.perf_counter()
+        tree = pu.NewickTree.parse(newick).to_phylo()
+        pu.reconstruct_ancestral_states(
+            tree, datamatrix, taxa_list, cache=cache, matrix_hash=matrix_hash
+        )
+        elapsed += time.perf_counter() - start
+        mapped.append(mapped_states(tree))
+    return elapsed / len(newick_list), mapped
+
+
+def mapped_states(tree):
+    """Get a digest of the states and changes mapped on the named clades."""
+    return hash(
+        tuple(
+            sorted(
+                (clade.name, tuple(clade.character_states), tuple(clade.changed_characters))
+                for clade in tree.find_clades()
+                if clade.is_terminal()
+            )
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--trees", type=int, default=5)
+    parser.add_argument(
+        "--cache-mb", type=int, help="cache size, the default of the viewer if not given"
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    status = 0
+    for size in args.size or DEFAULT_SIZES:
+        n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+        taxa_list = [f"Taxon_{taxon:05d}" for taxon in range(n_taxa)]
+        datamatrix = random_matrix(n_taxa, n_chars, rng)
+        newick_pairs = [random_newick(taxa_list, rng) for _ in range(args.trees)]
+        newick_list = [newick for newick, _reversed in newick_pairs]
+        reversed_list = [reversed_newick for _newick, reversed_newick in newick_pairs]
+
+        old_time, old_states = show_trees(reversed_list, datamatrix, taxa_list)
+        cache = pu.AncestralStateCache()
+        if args.cache_mb is not None:
+            cache.max_size = args.cache_mb * 1024 * 1024
+        start = time.perf_counter()
+        matrix_hash = pu.matrix_content_hash(taxa_list, None, datamatrix)
+        hash_time = time.perf_counter() - start
+        first_time, _states = show_trees(newick_list, datamatrix, taxa_list, cache, matrix_hash)
+        new_time, new_states = show_trees(reversed_list, datamatrix, taxa_list, cache, matrix_hash)
+
+        print(f"{args.trees} trees of {n_taxa} taxa x {n_chars} characters")
+        print(f"  reconstructed:   {old_time * 1000:9.1f} ms/tree")
+        print(f"  first visit:     {first_time * 1000:9.1f} ms/tree")
+        print(f"  cached revisit:  {new_time * 1000:9.1f} ms/tree")
+        print(f"  matrix hash:     {hash_time * 1000:9.1f} ms once per matrix version")
+        stats = cache.stats()
+        print(
+            f"  speedup {old_time / new_time:.0f}x, {stats['hits']} of {args.trees} revisits "
+            f"cached in {stats['size'] / 1e6:.0f} of {stats['max_size'] / 1e6:.0f} MB"
+        )
+        if old_states != new_states:
+            print("  Cached states differ")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Benchmark datatype detection during import
+
+Compares the per-column Counter classification that import_file used to
+run (PfDatamatrix.count_dna() and friends) with the lookup-table
+classifier PfUtils.count_column_datatypes(), checks that both agree and
+prints the speedup.
+
+Usage:
+    python benchmarks/bench_datatype_detection.py [data file] [--repeat N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfModel as pm
+import PfUtils as pu
+
+DEFAULT_DATA_FILE = Path(__file__).resolve().parent.parent / "data" / "Guidetti18S28s.nex"
+
+
+def count_column_datatypes_reference(datamatrix, n_taxa, n_chars):
+    """Column classification as previously done in PfDatamatrix.import_file."""
+    dm = pm.PfDatamatrix()
+    type_count = {name: 0 for name, _alphabet in pu.DATATYPE_ALPHABETS}
+    for char_idx in range(n_chars):
+        char_str = ""
+        for taxon_idx in range(n_taxa):
+            char = datamatrix[taxon_idx][char_idx]
+            char_str += "".join(char) if isinstance(char, list) else char
+        count = {
+            pm.DATATYPE_DNA: dm.count_dna(char_str),
+            pm.DATATYPE_RNA: dm.count_rna(char_str),
+            pm.DATATYPE_PROTEIN: dm.count_protein(char_str),
+            pm.DATATYPE_MORPHOLOGY: dm.count_morphology(char_str),
+        }
+        type_count[max(count, key=count.get)] += 1
+    return type_count
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("data_file", nargs="?", default=DEFAULT_DATA_FILE)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    datafile = pu.PhyloDatafile()
+    if not datafile.loadfile(str(args.data_file)):
+        print(f"Failed to load {args.data_file}")
+        return 1
+    n_taxa, n_chars = int(datafile.n_taxa), int(datafile.n_chars)
+    datamatrix = datafile.datamatrix
+    print(f"{Path(args.data_file).name}: {n_taxa} taxa x {n_chars} characters")
+
+    old_time, old_result = best_time(
+        lambda: count_column_datatypes_reference(datamatrix, n_taxa, n_chars), args.repeat
+    )
+    new_time, new_result = best_time(
+        lambda: pu.count_column_datatypes(datamatrix[:n_taxa], n_chars), args.repeat
+    )
+
+    print(f"Counter per column: {old_time * 1000:9.2f} ms  {old_result}")
+    print(f"Lookup table:       {new_time * 1000:9.2f} ms  {new_result}")
+    print(f"Speedup:            {old_time / new_time:9.1f}x")
+    if old_result != new_result:
+        print("Results differ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
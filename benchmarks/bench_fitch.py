@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Benchmark ancestral state reconstruction on wide matrices
+
+Compares the set-based Fitch passes reconstruct_ancestral_states() used
+before (a Python set per node and character, and taxa_list.index() per
+leaf) with the FitchMatrix bitmask engine behind it now, on random binary
+trees. Also checks the tree length of the engine against a plain set-based
+Fitch count.
+
+Usage:
+    python benchmarks/bench_fitch.py [--size TAXAxCHARS ...] [--repeat N]
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+from Bio import Phylo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["50x1000", "200x5000", "500x10000"]
+
+
+def random_tree(taxa_list, rng):
+    subtrees = list(taxa_list)
+    while len(subtrees) > 1:
+        left = subtrees.pop(rng.randrange(len(subtrees)))
+        right = subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append(f"({left},{right})")
+    return Phylo.read(io.StringIO(subtrees[0] + ";"), "newick")
+
+
+def random_matrix(n_taxa, n_chars, rng):
+    datamatrix = [rng.choices("0123?", weights=[4, 4, 2, 1, 1], k=n_chars) for _ in range(n_taxa)]
+    for row in datamatrix:
+        row[rng.randrange(n_chars)] = ["0", "1"]
+    return datamatrix
+
+
+def reconstruct_reference(tree, datamatrix, taxa_list):
+    """reconstruct_ancestral_states() as previously implemented."""
+    n_chars = len(datamatrix[0])
+    for node in tree.find_clades():
+        node.character_states = [None] * n_chars
+        node.changed_characters = []
+        if node.is_terminal():
+            taxon_idx = taxa_list.index(node.name)
+            for character, state in enumerate(datamatrix[taxon_idx]):
+                node.character_states[character] = (
+                    set(state) if isinstance(state, list) else {state}
+                )
+
+    def bottom_up(node):
+        if node.is_terminal():
+            return
+        for child in node:
+            bottom_up(child)
+        for character in range(n_chars):
+            children_sets = [child.character_states[character] for child in node]
+            intersection = set.intersection(*children_sets)
+            node.character_states[character] = intersection or set.union(*children_sets)
+            node.character_states[character] = set.union(*children_sets)
+
+    def top_down(node, parent_states=None):
+        for character in range(n_chars):
+            states = node.character_states[character]
+            if not node.is_terminal() and parent_states and parent_states[character] in states:
+                node.character_states[character] = parent_states[character]
+            else:
+                node.character_states[character] = min(states)
+            if parent_states and parent_states[character] != node.character_states[character]:
+                node.changed_characters.append(character)
+        for child in node.clades:
+            top_down(child, node.character_states)
+
+    bottom_up(tree.root)
+    top_down(tree.root)
+
+
+def fitch_length(tree, datamatrix, taxa_list):
+    """Count Fitch changes with sets, missing data allowing any state."""
+    rows = dict(zip(taxa_list, datamatrix))
+    length = 0
+    for character in range(len(datamatrix[0])):
+        all_states = set()
+        for row in datamatrix:
+            cell = row[character]
+            all_states.update(cell if isinstance(cell, list) else [cell])
+        all_states -= {"?"}
+
+        def state_set(node, character=character, all_states=all_states):
+            nonlocal length
+            if node.is_terminal():
+                cell = rows[node.name][character]
+                return set(cell) if isinstance(cell, list) else ({cell} - {"?"} or all_states)
+            left, right = (state_set(child) for child in node)
+            if left & right:
+                return left & right
+            length += 1
+            return left | right
+
+        state_set(tree.root)
+    return length
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    status = 0
+    for size in args.size or DEFAULT_SIZES:
+        n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+        taxa_list = [f"Taxon_{taxon:05d}" for taxon in range(n_taxa)]
+        datamatrix = random_matrix(n_taxa, n_chars, rng)
+        tree = random_tree(taxa_list, rng)
+
+        arguments = (tree, datamatrix, taxa_list)
+        old_time = best_time(partial(reconstruct_reference, *arguments), args.repeat)
+        new_time = best_time(partial(pu.reconstruct_ancestral_states, *arguments), args.repeat)
+
+        print(f"{n_taxa} taxa x {n_chars} characters")
+        print(f"  set-based:   {old_time * 1000:9.0f} ms")
+        print(f"  FitchMatrix: {new_time * 1000:9.0f} ms")
+        print(f"  speedup {old_time / new_time:.0f}x")
+        tree_length = sum(len(clade.changed_characters) for clade in tree.find_clades())
+        if n_taxa * n_chars <= 1_000_000 and tree_length != fitch_length(
+            tree, datamatrix, taxa_list
+        ):
+            print("  Tree length differs from the Fitch count")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Benchmark following single-cell edits in the character mapping
+
+Compares reconstructing the ancestral states of all characters again after
+every edit, as the tree view did, with update_ancestral_states(), which
+redoes only the edited character along the path from its leaf to the
+root. Edits are random cells set to random states, some of them new to
+their character, and both must map the same states and changes.
+
+Usage:
+    python benchmarks/bench_fitch_update.py [--size TAXAxCHARS ...] [--edits N]
+"""
+
+import argparse
+import copy
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+from Bio import Phylo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["50x1000", "200x5000", "500x10000"]
+# edits followed by both ways of updating and checked against each other
+CHECKED_EDITS = 3
+
+
+def random_tree(taxa_list, rng):
+    """Get a random binary Bio.Phylo tree of the named taxa."""
+    subtrees = list(taxa_list)
+    while len(subtrees) > 1:
+        left = subtrees.pop(rng.randrange(len(subtrees)))
+        right = subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append(f"({left},{right})")
+    return Phylo.read(io.StringIO(subtrees[0] + ";"), "newick")
+
+
+def random_matrix(n_taxa, n_chars, rng):
+    """Get a morphological matrix with some missing cells."""
+    return [rng.choices("0123?", weights=[4, 4, 2, 1, 1], k=n_chars) for _ in range(n_taxa)]
+
+
+def random_edits(n_taxa, n_chars, n_edits, rng):
+    return [
+        (rng.randrange(n_taxa), rng.randrange(n_chars), rng.choice("01234?"))
+        for _ in range(n_edits)
+    ]
+
+
+def follow_full(tree, datamatrix, taxa_list, edits):
+    """Reconstruct all characters again after every edit."""
+    times = []
+    for row, col, value in edits:
+        start = time.perf_counter()
+        datamatrix[row][col] = value
+        pu.reconstruct_ancestral_states(tree, datamatrix, taxa_list)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def follow_incremental(tree, datamatrix, taxa_list, edits):
+    """Update the edited character only."""
+    reconstruction = pu.reconstruct_ancestral_states(tree, datamatrix, taxa_list)
+    times = []
+    for row, col, value in edits:
+        start = time.perf_counter()
+        datamatrix[row][col] = value
+        pu.update_ancestral_states(tree, reconstruction, row, col, value)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def mapped_states(tree):
+    return [(clade.character_states, clade.changed_characters) for clade in tree.find_clades()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--edits", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    status = 0
+    for size in args.size or DEFAULT_SIZES:
+        n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+        taxa_list = [f"Taxon_{taxon:05d}" for taxon in range(n_taxa)]
+        datamatrix = random_matrix(n_taxa, n_chars, rng)
+        tree = random_tree(taxa_list, rng)
+        edits = random_edits(n_taxa, n_chars, args.edits, rng)
+
+        # full reconstructions are slow, so only the first few edits are timed
+        checked = edits[:CHECKED_EDITS]
+        full_tree = copy.deepcopy(tree)
+        full_times = follow_full(full_tree, copy.deepcopy(datamatrix), taxa_list, checked)
+        incremental_tree = copy.deepcopy(tree)
+        follow_incremental(incremental_tree, copy.deepcopy(datamatrix), taxa_list, checked)
+        incremental_times = follow_incremental(tree, copy.deepcopy(datamatrix), taxa_list, edits)
+        full_time = min(full_times)
+        incremental_time = min(incremental_times)
+
+        print(f"{n_taxa} taxa x {n_chars} characters, {len(edits)} edits")
+        print(f"  full reconstruction: {full_time * 1000:9.2f} ms/edit")
+        print(f"  incremental update:  {incremental_time * 1000:9.2f} ms/edit")
+        print(f"  speedup {full_time / incremental_time:.0f}x")
+        if mapped_states(full_tree) != mapped_states(incremental_tree):
+            print("  Mapped states differ")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Benchmark exporting large character matrices
+
+Compares the string-building export PfDatamatrix used before (decode the
+whole matrix, build every row and then the file text with +=, and write it
+with safe_file_write) with NexusWriter streaming the rows of
+iter_decoded_rows() to a file. Reports the best time and the peak traced
+memory of each, next to the size of the stored matrix, and checks that
+both write the same file.
+
+Usage:
+    python benchmarks/bench_matrix_export.py [--size TAXAxCHARS ...] [--repeat N]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["500x10000", "2000x20000"]
+
+
+def stored_matrix(n_taxa, n_chars, seed=1):
+    """Get the blob and alphabet of a random DNA matrix."""
+    rng = np.random.default_rng(seed)
+    alphabet = ["A", "C", "G", "T", "-"]
+    codes = rng.integers(1, len(alphabet) + 1, size=(n_taxa, n_chars), dtype=np.uint8)
+    header = pu.DATAMATRIX_BLOB_HEADER.pack(pu.DATAMATRIX_BLOB_VERSION, n_taxa, n_chars)
+    return header + codes.tobytes(), alphabet
+
+
+def export_reference(path, taxa_list, blob, alphabet, n_chars):
+    """Nexus export as previously done by PfDatamatrix.as_nexus_format()."""
+    matrix_string = ""
+    for idx, data in enumerate(pu.decode_datamatrix(blob, alphabet)):
+        taxon_string = taxa_list[idx] + " "
+        for char_state in data:
+            if type(char_state) is list:
+                taxon_string += "(" + " ".join(char_state) + ")"
+            else:
+                taxon_string += char_state
+        matrix_string += taxon_string + "\n"
+    nexus_string = "#NEXUS\n\n"
+    nexus_string += "begin data;\n"
+    nexus_string += f"dimensions ntax={len(taxa_list)} nchar={n_chars};\n"
+    nexus_string += "format datatype=standard gap=- missing=?;\n"
+    nexus_string += "matrix\n"
+    nexus_string += matrix_string
+    nexus_string += ";\n"
+    nexus_string += "end;\n"
+    pu.safe_file_write(path, nexus_string)
+
+
+def export_streaming(path, taxa_list, blob, alphabet, n_chars):
+    with path.open("w", encoding="utf-8", buffering=1 << 20) as f:
+        rows = pu.iter_decoded_rows(blob, alphabet)
+        pu.NexusWriter(f).write(taxa_list, rows, n_chars)
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def traced_peak(func):
+    tracemalloc.start()
+    func()
+    _retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    status = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.size or DEFAULT_SIZES:
+            n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+            blob, alphabet = stored_matrix(n_taxa, n_chars)
+            taxa_list = [f"Taxon_{taxon:05d}" for taxon in range(n_taxa)]
+            old_path = Path(temp_dir) / "reference.nex"
+            new_path = Path(temp_dir) / "streaming.nex"
+            old_export = partial(export_reference, old_path, taxa_list, blob, alphabet, n_chars)
+            new_export = partial(export_streaming, new_path, taxa_list, blob, alphabet, n_chars)
+
+            old_time = best_time(old_export, args.repeat)
+            new_time = best_time(new_export, args.repeat)
+            old_peak = traced_peak(old_export)
+            new_peak = traced_peak(new_export)
+
+            print(f"{n_taxa} taxa x {n_chars} characters, {len(blob) / 1e6:.1f} MB stored")
+            print(f"  string building: {old_time * 1000:8.0f} ms  peak {old_peak / 1e6:8.1f} MB")
+            print(f"  streaming:       {new_time * 1000:8.0f} ms  peak {new_peak / 1e6:8.1f} MB")
+            print(
+                f"  speedup {old_time / new_time:.1f}x, "
+                f"peak memory {old_peak / new_peak:.0f}x lower"
+            )
+            if old_path.read_bytes() != new_path.read_bytes():
+                print("  Exported files differ")
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
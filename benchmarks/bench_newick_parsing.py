@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Benchmark Newick parsing of tree samples
+
+Compares Bio.Phylo.read(), which the tree viewer used for every tree shown,
+with the array-based NewickTree.parse(). Reports the time per tree and the
+traced memory of a sample of parsed trees kept in memory, and checks that
+both write the same Newick text.
+
+Usage:
+    python benchmarks/bench_newick_parsing.py [--taxa N ...] [--trees N] [--repeat N]
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from Bio import Phylo
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_TAXA = [20, 200, 2000]
+
+
+def random_tree(n_taxa, rng):
+    """Get a random binary MrBayes-style tree with numbered taxa."""
+    subtrees = [f"{taxon + 1}:{rng.random():.6f}" for taxon in range(n_taxa)]
+    while len(subtrees) > 1:
+        left = subtrees.pop(rng.randrange(len(subtrees)))
+        right = subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append(f"({left},{right}):{rng.random():.6f}")
+    return f"[&U] {subtrees[0]};"
+
+
+def read_phylo(newick_text):
+    return Phylo.read(io.StringIO(newick_text), "newick")
+
+
+def write_phylo(tree):
+    handle = io.StringIO()
+    Phylo.write(tree, handle, "newick")
+    return handle.getvalue().rstrip("\n")
+
+
+def best_time(func, trees, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for tree in trees:
+            func(tree)
+        times.append(time.perf_counter() - start)
+    return min(times) / len(trees)
+
+
+def kept_memory(func, trees):
+    """Get the traced bytes of all parsed trees kept in a list."""
+    tracemalloc.start()
+    parsed = [func(tree) for tree in trees]
+    retained, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--taxa", type=int, action="append", help="taxa per tree, may be repeated")
+    parser.add_argument("--trees", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    status = 0
+    for n_taxa in args.taxa or DEFAULT_TAXA:
+        n_trees = max(3, min(args.trees, args.trees * 200 // n_taxa))
+        trees = [random_tree(n_taxa, rng) for _ in range(n_trees)]
+
+        old_time = best_time(read_phylo, trees, args.repeat)
+        new_time = best_time(pu.NewickTree.parse, trees, args.repeat)
+        old_memory = kept_memory(read_phylo, trees)
+        new_memory = kept_memory(pu.NewickTree.parse, trees)
+
+        print(f"{n_trees} trees of {n_taxa} taxa")
+        print(f"  Bio.Phylo.read:   {old_time * 1e6:9.0f} us/tree  {old_memory / 1e6:8.1f} MB")
+        print(f"  NewickTree.parse: {new_time * 1e6:9.0f} us/tree  {new_memory / 1e6:8.1f} MB")
+        print(f"  speedup {old_time / new_time:.1f}x, memory {old_memory / new_memory:.1f}x lower")
+        if write_phylo(read_phylo(trees[0])) != pu.NewickTree.parse(trees[0]).to_newick():
+            print("  Newick output differs")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
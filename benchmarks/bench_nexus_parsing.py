@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Benchmark NEXUS parsing on large generated files
+
+Compares the line-based parser PhyloDatafile used before (read the whole
+file, split it into lines and blocks, match every line with regular
+expressions, then build the formatted lists) with the streaming
+NexusReader behind PhyloDatafile.loadfile(). Reports the best time and
+the peak traced memory of each, next to the size of the parsed matrix
+itself, and checks that both produce the same matrix.
+
+Usage:
+    python benchmarks/bench_nexus_parsing.py [--size TAXAxCHARS ...] [--repeat N]
+"""
+
+import argparse
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["200x5000", "500x20000"]
+
+
+def write_nexus(path, n_taxa, n_chars, seed=1):
+    """Write a DNA NEXUS file with a few polymorphic cells per row."""
+    rng = random.Random(seed)
+    with path.open("w", encoding="utf-8") as f:
+        f.write("#NEXUS\n[generated for benchmarking]\nbegin data;\n")
+        f.write(f"  dimensions ntax={n_taxa} nchar={n_chars};\n")
+        f.write("  format datatype=dna gap=- missing=?;\nmatrix\n")
+        for taxon in range(n_taxa):
+            row = rng.choices("ACGT-", k=n_chars)
+            for col in rng.sample(range(n_chars), min(5, n_chars)):
+                row[col] = "{AG}"
+            f.write(f"Taxon_{taxon:05d}  {''.join(row)}\n")
+        f.write(";\nend;\n")
+
+
+def load_nexus_reference(file_path):
+    """Line-based NEXUS parsing as previously done in PhyloDatafile."""
+    file_text = Path(file_path).read_text(encoding="utf-8")
+    line_list = file_text.split("\n")
+    block_hash = {}
+    curr_block = None
+    for line in line_list:
+        if re.match(r"\s*begin\s+(\w+)", line, flags=re.IGNORECASE):
+            curr_block = {"name": re.match(r"\s*begin\s+(\w+)", line, re.I).group(1).upper()}
+            curr_block["text"] = []
+        elif re.match(r"\s*end\s*;", line, flags=re.IGNORECASE):
+            block_hash[curr_block["name"]] = curr_block["text"]
+            curr_block = None
+        elif curr_block is not None:
+            curr_block["text"].append(line)
+
+    taxa_list, data_list, data_hash = [], [], {}
+    in_matrix = False
+    for line in block_hash.get("DATA", []):
+        if re.match(r"\s*matrix\s*", line, flags=re.IGNORECASE):
+            in_matrix = True
+        elif in_matrix:
+            matrix_match = re.match(r"^\s*(\S+)\s+(.+);*", line)
+            if matrix_match:
+                species_name, data_line = matrix_match.group(1), matrix_match.group(2)
+                if species_name not in taxa_list:
+                    taxa_list.append(species_name)
+                data_list.append(data_line)
+                data_hash[species_name] = data_line
+        if re.match(".*;.*", line):
+            in_matrix = False
+
+    datamatrix, formatted_data_list, formatted_data_hash = [], [], {}
+    for species in taxa_list:
+        array_data = []
+        poly_char = ""
+        is_poly = False
+        for char in data_hash[species]:
+            if char in ["(", "{", "["]:
+                is_poly = True
+                array_data.append([])
+            elif char in [")", "}", "]"]:
+                array_data[-1].append(poly_char)
+                poly_char = ""
+                is_poly = False
+            elif is_poly:
+                poly_char += char
+            else:
+                array_data.append(char)
+        formatted_data_hash[species] = array_data
+        formatted_data_list.append([species, *array_data])
+        datamatrix.append(array_data)
+    return file_text, line_list, data_list, formatted_data_list, datamatrix
+
+
+def load_nexus_streaming(file_path):
+    datafile = pu.PhyloDatafile()
+    datafile.loadfile(str(file_path))
+    return datafile.datamatrix
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def traced_memory(func):
+    """Get (peak, retained) traced bytes of a call and its result."""
+    tracemalloc.start()
+    result = func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, retained, result
+
+
+def matrix_size(datamatrix):
+    """Get the traced size of a freshly built copy of a parsed matrix."""
+    _peak, retained, _copy = traced_memory(
+        lambda: [
+            [list(cell) if isinstance(cell, list) else cell for cell in row] for row in datamatrix
+        ]
+    )
+    return retained
+
+
+def normalize(datamatrix):
+    """Join polymorphic states, which the old parser kept as one string."""
+    return [
+        ["".join(cell) if isinstance(cell, list) else cell for cell in row] for row in datamatrix
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    status = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.size or DEFAULT_SIZES:
+            n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+            path = Path(temp_dir) / f"bench_{n_taxa}x{n_chars}.nex"
+            write_nexus(path, n_taxa, n_chars)
+            file_mb = path.stat().st_size / 1e6
+
+            old_time = best_time(partial(load_nexus_reference, path), args.repeat)
+            new_time = best_time(partial(load_nexus_streaming, path), args.repeat)
+            old_peak, _, old_result = traced_memory(partial(load_nexus_reference, path))
+            new_peak, _, new_matrix = traced_memory(partial(load_nexus_streaming, path))
+            matrix_mb = matrix_size(new_matrix) / 1e6
+
+            print(f"{n_taxa} taxa x {n_chars} characters, {file_mb:.1f} MB file")
+            print(f"  parsed matrix:  {matrix_mb:8.1f} MB")
+            print(f"  line-based:     {old_time * 1000:8.0f} ms  peak {old_peak / 1e6:8.1f} MB")
+            print(f"  streaming:      {new_time * 1000:8.0f} ms  peak {new_peak / 1e6:8.1f} MB")
+            print(
+                f"  speedup {old_time / new_time:.1f}x, "
+                f"peak memory {old_peak / new_peak:.1f}x lower"
+            )
+            if normalize(old_result[-1]) != normalize(new_matrix):
+                print("  Matrices differ")
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
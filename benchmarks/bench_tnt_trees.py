@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Benchmark reading TNT tree files
+
+Compares the line-based conversion PhyloTreefile used before (split the
+file into lines and turn every tree line into Newick text by inserting
+commas) with the single-pass read_tnt_trees() tokenizer. Generates files
+of most parsimonious trees as saved by TNT, one tree per line, and checks
+the tokenizer output against the Newick text of the generated trees.
+
+Usage:
+    python benchmarks/bench_tnt_trees.py [--taxa N ...] [--trees N] [--repeat N]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_TAXA = [20, 200, 2000]
+
+
+def random_tree(n_taxa, rng):
+    """Get a random binary tree as (TNT tread text, Newick text)."""
+    subtrees = [(str(taxon), str(taxon)) for taxon in range(n_taxa)]
+    while len(subtrees) > 1:
+        left_tnt, left_newick = subtrees.pop(rng.randrange(len(subtrees)))
+        right_tnt, right_newick = subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append((f"({left_tnt} {right_tnt} )", f"({left_newick},{right_newick})"))
+    return subtrees[0]
+
+
+def tnt_file_text(tnt_trees):
+    return "tread 'generated for benchmarking'\n" + "*\n".join(tnt_trees) + ";\nproc-;\n"
+
+
+def tnt_tree_to_newick_reference(line):
+    """Tree line conversion as previously done in PhyloTreefile."""
+    tree_text = line.replace(";", "").replace("*", "")
+    tree_text = tree_text.replace("(", "( ").replace(")", " ) ")
+    str_list = []
+    for item in tree_text.split(" "):
+        if item == "":
+            continue
+        if str_list:
+            if item == "(":
+                if str_list[-1] != "(":
+                    str_list.append(",")
+            else:
+                try:
+                    int(item)
+                    try:
+                        if int(str_list[-1]) > 0 and int(item) > 0:
+                            str_list.append(",")
+                    except (ValueError, IndexError):
+                        pass
+                except (ValueError, TypeError):
+                    pass
+        str_list.append(item)
+    return "".join(str_list)
+
+
+def read_reference(text):
+    tree_list = []
+    header_found = False
+    for line in text.split("\n"):
+        if re.match(r"tread.*", line, flags=re.IGNORECASE):
+            header_found = True
+        elif re.match(r"proc.*", line, flags=re.IGNORECASE):
+            break
+        elif header_found:
+            tree_list.append(tnt_tree_to_newick_reference(line))
+    return tree_list
+
+
+def read_tokenized(text):
+    return [tree.to_newick(plain=True)[:-1] for tree in pu.read_tnt_trees(text)]
+
+
+def best_time(func, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--taxa", type=int, action="append", help="taxa per tree, may be repeated")
+    parser.add_argument("--trees", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    status = 0
+    for n_taxa in args.taxa or DEFAULT_TAXA:
+        n_trees = max(3, min(args.trees, args.trees * 200 // n_taxa))
+        tnt_trees, newick_trees = zip(*(random_tree(n_taxa, rng) for _ in range(n_trees)))
+        text = tnt_file_text(tnt_trees)
+
+        old_time = best_time(read_reference, text, args.repeat)
+        new_time = best_time(read_tokenized, text, args.repeat)
+
+        print(f"{n_trees} trees of {n_taxa} taxa, {len(text) / 1e6:.1f} MB")
+        print(f"  line-based:      {old_time * 1e6 / n_trees:9.0f} us/tree")
+        print(f"  read_tnt_trees:  {new_time * 1e6 / n_trees:9.0f} us/tree")
+        print(f"  speedup {old_time / new_time:.1f}x")
+        # The line-based output is not compared: it drops the comma between
+        # a closing parenthesis or taxon 0 and the next taxon
+        if read_tokenized(text) != list(newick_trees):
+            print("  Newick output differs")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Benchmark scoring the parsimony length of every tree in a tree file
+
+Compares taking the length of each tree as the tree viewer does for the
+tree shown (build Bio.Phylo clades, reconstruct the ancestral states of all
+characters and count the changes) with ParsimonyScorer.score_file(), which
+encodes the matrix once, drops uninformative characters and merges
+identical ones. Trees are random binary TNT trees, and both must give the
+same lengths.
+
+Usage:
+    python benchmarks/bench_tree_scoring.py [--size TAXAxCHARS ...] [--trees N]
+        [--processes N] [--repeat N]
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["50x1000", "200x5000"]
+
+
+def random_matrix(n_taxa, n_chars, rng):
+    """Get a morphological matrix with some missing and polymorphic cells."""
+    return [rng.choices("0001123?", k=n_chars) for _ in range(n_taxa)]
+
+
+def write_tre(path, n_taxa, n_trees, rng):
+    """Write random binary trees of numbered taxa as TNT tread output."""
+    with path.open("w", encoding="utf-8") as f:
+        f.write("tread 'random trees'\n")
+        for tree in range(n_trees):
+            subtrees = [str(taxon) for taxon in range(n_taxa)]
+            while len(subtrees) > 1:
+                left = subtrees.pop(rng.randrange(len(subtrees)))
+                right = subtrees.pop(rng.randrange(len(subtrees)))
+                subtrees.append(f"({left} {right} )")
+            f.write(subtrees[0] + ("*\n" if tree < n_trees - 1 else ";\n"))
+        f.write("proc-;\n")
+
+
+def score_reference(trees, datamatrix, taxa_list):
+    """Tree lengths as drawn by the tree viewer, one tree at a time."""
+    lengths = []
+    for index in range(len(trees)):
+        newick_tree = trees.tree(index)
+        newick_tree.translate(taxa_list, first_number=0)
+        tree = newick_tree.to_phylo()
+        pu.reconstruct_ancestral_states(tree, datamatrix, taxa_list)
+        lengths.append(sum(len(clade.changed_characters) for clade in tree.find_clades()))
+    return lengths
+
+
+def score_batch(trees, datamatrix, taxa_list, processes):
+    scorer = pu.ParsimonyScorer(datamatrix, taxa_list)
+    return scorer.score_file(trees, processes=processes).tolist()
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--trees", type=int, default=200)
+    parser.add_argument("--processes", type=int, help="worker processes, all CPUs by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    status = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in args.size or DEFAULT_SIZES:
+            n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+            taxa_list = [f"Taxon_{taxon:05d}" for taxon in range(n_taxa)]
+            datamatrix = random_matrix(n_taxa, n_chars, rng)
+            path = Path(temp_dir) / f"bench_{n_taxa}x{n_chars}.tre"
+            write_tre(path, n_taxa, args.trees, rng)
+
+            with pu.TreeFileIndex(path, "tre") as trees:
+                arguments = (trees, datamatrix, taxa_list)
+                old_time = best_time(partial(score_reference, *arguments), args.repeat)
+                new_time = best_time(partial(score_batch, *arguments, args.processes), args.repeat)
+                scorer = pu.ParsimonyScorer(datamatrix, taxa_list)
+                print(
+                    f"{args.trees} trees of {n_taxa} taxa x {n_chars} characters, "
+                    f"{scorer.n_informative} informative in {scorer.bits.shape[1]} patterns"
+                )
+                print(f"  tree by tree:      {old_time * 1000:9.0f} ms")
+                print(f"  ParsimonyScorer:   {new_time * 1000:9.0f} ms")
+                print(f"  speedup {old_time / new_time:.1f}x")
+                if score_reference(*arguments) != score_batch(*arguments, args.processes):
+                    print("  Tree lengths differ")
+                    status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
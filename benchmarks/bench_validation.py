@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark datamatrix validation on large generated matrices
+
+Compares validate_complete_datamatrix() as it was before (per-taxon
+validate_character_states() calls and Python loops over every cell) with
+validate_datamatrix() on the same list of rows, and with
+validate_encoded_datamatrix() on the stored state codes, which is what
+PfDatamatrix.validate() runs before an analysis. Reports the best time of
+each and checks that the new engine finds the planted problems.
+
+Usage:
+    python benchmarks/bench_validation.py [--size TAXAxCHARS ...] [--repeat N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import PfUtils as pu
+
+DEFAULT_SIZES = ["200x5000", "1000x20000"]
+
+
+def generate_matrix(n_taxa, n_chars, seed=1):
+    """Get a DNA matrix with a few polymorphic and missing cells per row."""
+    rng = random.Random(seed)
+    datamatrix = []
+    for _ in range(n_taxa):
+        row = rng.choices("ACGT-?", k=n_chars)
+        for col in rng.sample(range(n_chars), min(5, n_chars)):
+            row[col] = ["A", "G"]
+        datamatrix.append(row)
+    return [f"Taxon_{taxon:05d}" for taxon in range(n_taxa)], datamatrix
+
+
+def validate_reference(taxa_list, character_matrix):
+    """validate_complete_datamatrix() as previously implemented."""
+    pu.validate_taxa_names(taxa_list, allow_duplicates=False)
+    _n_taxa, n_characters = pu.validate_datamatrix_dimensions(taxa_list, character_matrix)
+    for char_data in character_matrix:
+        pu.validate_character_states(char_data, valid_states=None)
+    warnings = []
+    for taxon, char_data in zip(taxa_list, character_matrix):
+        missing_count = sum(1 for c in char_data if str(c) in ["?", "-", "N", "n"])
+        if missing_count == n_characters:
+            warnings.append(f"Taxon '{taxon}' has all missing data")
+    return warnings
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", action="append", help="TAXAxCHARS, may be repeated")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    status = 0
+    for size in args.size or DEFAULT_SIZES:
+        n_taxa, n_chars = (int(n) for n in size.lower().split("x"))
+        taxa_list, datamatrix = generate_matrix(n_taxa, n_chars)
+        blob, alphabet, polymorphic_cells = pu.encode_datamatrix(datamatrix)
+
+        old_time = best_time(partial(validate_reference, taxa_list, datamatrix), args.repeat)
+        list_time = best_time(partial(pu.validate_datamatrix, taxa_list, datamatrix), args.repeat)
+        encoded_time = best_time(
+            partial(pu.validate_encoded_datamatrix, taxa_list, blob, alphabet, polymorphic_cells),
+            args.repeat,
+        )
+
+        print(f"{n_taxa} taxa x {n_chars} characters")
+        print(f"  per-taxon loops:      {old_time * 1000:8.0f} ms")
+        print(f"  validate_datamatrix:  {list_time * 1000:8.0f} ms")
+        print(f"  stored state codes:   {encoded_time * 1000:8.0f} ms")
+        print(f"  speedup {old_time / list_time:.1f}x, {old_time / encoded_time:.0f}x")
+
+        datamatrix[1] = datamatrix[1][:-1]
+        datamatrix[2][3] = "A C"
+        report = pu.validate_datamatrix([*taxa_list[:-1], taxa_list[0]], datamatrix)
+        found = {problem["problem"] for problem in report["errors"]}
+        if found != {"duplicate_name", "ragged_row", "invalid_state"}:
+            print(f"  Problems not found: {found}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,6 +35,16 @@ print("router: ", router)
 migration_name = get_timestamp()
 print("migration_name: ", migration_name)
 ret = router.create(
-    auto=[PfProject, PfDatamatrix, PfPackage, PfAnalysis, PfTree], name=migration_name
+    auto=[
+        PfProject,
+        PfDatamatrix,
+        PfPolymorphicCell,
+        PfCellEdit,
+        PfPackage,
+        PfMatrixSnapshot,
+        PfAnalysis,
+        PfTree,
+    ],
+    name=migration_name,
 )
 print("ret: ", ret)
@@ -0,0 +1,96 @@
+"""Peewee migrations -- 002_20261017.py.
+
+Store datamatrix cells as a dense uint8 state-code BLOB with polymorphic
+cells in a side table, and convert existing JSON matrices to that form.
+Rows that cannot be encoded (see PfUtils.encode_datamatrix) keep their
+JSON storage.
+"""
+
+import json
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+import PfUtils as pu
+
+
+def pack_datamatrices(database: pw.Database):
+    """Convert JSON datamatrices to the compact BLOB storage."""
+    cursor = database.execute_sql(
+        "SELECT id, datamatrix_json FROM pfdatamatrix "
+        "WHERE datamatrix_json IS NOT NULL AND datamatrix_blob IS NULL"
+    )
+    for datamatrix_id, datamatrix_json in cursor.fetchall():
+        try:
+            blob, alphabet, polymorphic_cells = pu.encode_datamatrix(json.loads(datamatrix_json))
+        except (ValueError, pu.DataParsingError):
+            continue
+        database.execute_sql(
+            "UPDATE pfdatamatrix SET datamatrix_blob = ?, state_alphabet_json = ?, "
+            "datamatrix_json = NULL WHERE id = ?",
+            (blob, json.dumps(alphabet), datamatrix_id),
+        )
+        for row_idx, col_idx, states in polymorphic_cells:
+            database.execute_sql(
+                "INSERT INTO pfpolymorphiccell (datamatrix_id, row_index, col_index, states_json) "
+                "VALUES (?, ?, ?, ?)",
+                (datamatrix_id, row_idx, col_idx, json.dumps(states)),
+            )
+
+
+def unpack_datamatrices(database: pw.Database):
+    """Convert compact BLOB datamatrices back to JSON storage."""
+    cursor = database.execute_sql(
+        "SELECT id, datamatrix_blob, state_alphabet_json FROM pfdatamatrix "
+        "WHERE datamatrix_blob IS NOT NULL"
+    )
+    for datamatrix_id, blob, alphabet_json in cursor.fetchall():
+        polymorphic_cells = [
+            (row_idx, col_idx, json.loads(states_json))
+            for row_idx, col_idx, states_json in database.execute_sql(
+                "SELECT row_index, col_index, states_json FROM pfpolymorphiccell "
+                "WHERE datamatrix_id = ?",
+                (datamatrix_id,),
+            ).fetchall()
+        ]
+        datamatrix = pu.decode_datamatrix(
+            bytes(blob), json.loads(alphabet_json or "[]"), polymorphic_cells
+        )
+        database.execute_sql(
+            "UPDATE pfdatamatrix SET datamatrix_json = ? WHERE id = ?",
+            (json.dumps(datamatrix), datamatrix_id),
+        )
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    migrator.add_fields(
+        "pfdatamatrix",
+        datamatrix_blob=pw.BlobField(null=True),
+        state_alphabet_json=pw.CharField(max_length=255, null=True),
+    )
+
+    @migrator.create_model
+    class PfPolymorphicCell(pw.Model):
+        id = pw.AutoField()
+        datamatrix = pw.ForeignKeyField(column_name='datamatrix_id', field='id', model=migrator.orm['pfdatamatrix'], on_delete='CASCADE')
+        row_index = pw.IntegerField()
+        col_index = pw.IntegerField()
+        states_json = pw.CharField(max_length=255)
+
+        class Meta:
+            table_name = "pfpolymorphiccell"
+            indexes = [(('datamatrix', 'row_index', 'col_index'), True)]
+
+    migrator.run(pack_datamatrices, database)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.run(unpack_datamatrices, database)
+
+    migrator.remove_model('pfpolymorphiccell')
+
+    migrator.remove_fields('pfdatamatrix', 'datamatrix_blob', 'state_alphabet_json')
@@ -0,0 +1,132 @@
+"""Peewee migrations -- 003_20261017.py.
+
+Move analysis input matrices into the content-addressed pfmatrixsnapshot
+table. Existing analyses get a snapshot per distinct matrix and their
+copied JSON columns are cleared.
+"""
+
+import json
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+import PfUtils as pu
+
+
+def _loads(text):
+    return json.loads(text) if text else None
+
+
+def move_analysis_snapshots(database: pw.Database):
+    """Replace copied analysis matrices with shared snapshots."""
+    cursor = database.execute_sql(
+        "SELECT id, taxa_list_json, character_list_json, datamatrix_json FROM pfanalysis "
+        "WHERE taxa_list_json IS NOT NULL OR character_list_json IS NOT NULL "
+        "OR datamatrix_json IS NOT NULL"
+    )
+    for analysis_id, taxa_json, character_json, datamatrix_json in cursor.fetchall():
+        try:
+            taxa_list = _loads(taxa_json)
+            character_list = _loads(character_json)
+            datamatrix = _loads(datamatrix_json)
+        except ValueError:
+            continue
+        content_hash = pu.matrix_content_hash(taxa_list, character_list, datamatrix)
+        row = database.execute_sql(
+            "SELECT id FROM pfmatrixsnapshot WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+        if row is None:
+            blob = alphabet_json = polymorphic_json = matrix_json = None
+            try:
+                blob, alphabet, polymorphic_cells = pu.encode_datamatrix(datamatrix or [])
+                alphabet_json = json.dumps(alphabet)
+                polymorphic_json = json.dumps(polymorphic_cells)
+            except pu.DataParsingError:
+                matrix_json = json.dumps(datamatrix)
+            database.execute_sql(
+                "INSERT INTO pfmatrixsnapshot (content_hash, taxa_list_json, "
+                "character_list_json, datamatrix_blob, state_alphabet_json, "
+                "polymorphic_cells_json, datamatrix_json, ref_count, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0, datetime('now', 'localtime'))",
+                (
+                    content_hash,
+                    taxa_json and json.dumps(taxa_list),
+                    character_json and json.dumps(character_list),
+                    blob,
+                    alphabet_json,
+                    polymorphic_json,
+                    matrix_json,
+                ),
+            )
+            row = database.execute_sql(
+                "SELECT id FROM pfmatrixsnapshot WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        database.execute_sql(
+            "UPDATE pfmatrixsnapshot SET ref_count = ref_count + 1 WHERE id = ?", (row[0],)
+        )
+        database.execute_sql(
+            "UPDATE pfanalysis SET snapshot_id = ?, taxa_list_json = NULL, "
+            "character_list_json = NULL, datamatrix_json = NULL WHERE id = ?",
+            (row[0], analysis_id),
+        )
+
+
+def restore_analysis_snapshots(database: pw.Database):
+    """Copy snapshot matrices back into the analysis JSON columns."""
+    cursor = database.execute_sql(
+        "SELECT a.id, s.taxa_list_json, s.character_list_json, s.datamatrix_blob, "
+        "s.state_alphabet_json, s.polymorphic_cells_json, s.datamatrix_json "
+        "FROM pfanalysis a JOIN pfmatrixsnapshot s ON a.snapshot_id = s.id"
+    )
+    for analysis_id, taxa_json, character_json, blob, alphabet_json, poly_json, matrix_json in (
+        cursor.fetchall()
+    ):
+        if blob is not None:
+            datamatrix = pu.decode_datamatrix(
+                bytes(blob), json.loads(alphabet_json or "[]"), json.loads(poly_json or "[]")
+            )
+            matrix_json = json.dumps(datamatrix)
+        database.execute_sql(
+            "UPDATE pfanalysis SET taxa_list_json = ?, character_list_json = ?, "
+            "datamatrix_json = ? WHERE id = ?",
+            (taxa_json, character_json, matrix_json, analysis_id),
+        )
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    @migrator.create_model
+    class PfMatrixSnapshot(pw.Model):
+        id = pw.AutoField()
+        content_hash = pw.CharField(max_length=255, unique=True)
+        taxa_list_json = pw.CharField(max_length=255, null=True)
+        character_list_json = pw.CharField(max_length=255, null=True)
+        datamatrix_blob = pw.BlobField(null=True)
+        state_alphabet_json = pw.CharField(max_length=255, null=True)
+        polymorphic_cells_json = pw.CharField(max_length=255, null=True)
+        datamatrix_json = pw.CharField(max_length=255, null=True)
+        ref_count = pw.IntegerField(default=0)
+        created_at = pw.DateTimeField()
+
+        class Meta:
+            table_name = "pfmatrixsnapshot"
+
+    migrator.add_fields(
+        'pfanalysis',
+
+        snapshot=pw.ForeignKeyField(column_name='snapshot_id', field='id', model=migrator.orm['pfmatrixsnapshot'], null=True))
+
+    migrator.run(move_analysis_snapshots, database)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.run(restore_analysis_snapshots, database)
+
+    migrator.drop_index('pfanalysis', 'snapshot')
+
+    migrator.remove_fields('pfanalysis', 'snapshot')
+
+    migrator.remove_model('pfmatrixsnapshot')
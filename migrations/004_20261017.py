@@ -0,0 +1,98 @@
+"""Peewee migrations -- 004_20261017.py.
+
+Add the pfcelledit journal. Edits saved from the datamatrix table are
+appended here and folded into the stored matrix periodically; rolling back
+folds any pending edits first so no saved edit is lost.
+"""
+
+import json
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+import PfUtils as pu
+
+
+def fold_cell_edits(database: pw.Database):
+    """Write pending cell edits into their datamatrices."""
+    cursor = database.execute_sql(
+        "SELECT DISTINCT datamatrix_id FROM pfcelledit WHERE compacted = 0"
+    )
+    for (datamatrix_id,) in cursor.fetchall():
+        blob, alphabet_json, matrix_json = database.execute_sql(
+            "SELECT datamatrix_blob, state_alphabet_json, datamatrix_json FROM pfdatamatrix "
+            "WHERE id = ?",
+            (datamatrix_id,),
+        ).fetchone()
+        if blob is not None:
+            polymorphic_cells = [
+                (row_idx, col_idx, json.loads(states_json))
+                for row_idx, col_idx, states_json in database.execute_sql(
+                    "SELECT row_index, col_index, states_json FROM pfpolymorphiccell "
+                    "WHERE datamatrix_id = ?",
+                    (datamatrix_id,),
+                ).fetchall()
+            ]
+            datamatrix = pu.decode_datamatrix(
+                bytes(blob), json.loads(alphabet_json or "[]"), polymorphic_cells
+            )
+        else:
+            datamatrix = json.loads(matrix_json) if matrix_json else []
+        for row_idx, col_idx, value_json in database.execute_sql(
+            "SELECT row_index, col_index, new_value_json FROM pfcelledit "
+            "WHERE datamatrix_id = ? AND compacted = 0 ORDER BY id",
+            (datamatrix_id,),
+        ).fetchall():
+            if row_idx < len(datamatrix) and col_idx < len(datamatrix[row_idx]):
+                datamatrix[row_idx][col_idx] = json.loads(value_json)
+
+        database.execute_sql(
+            "DELETE FROM pfpolymorphiccell WHERE datamatrix_id = ?", (datamatrix_id,)
+        )
+        try:
+            blob, alphabet, polymorphic_cells = pu.encode_datamatrix(datamatrix)
+        except pu.DataParsingError:
+            database.execute_sql(
+                "UPDATE pfdatamatrix SET datamatrix_blob = NULL, state_alphabet_json = NULL, "
+                "datamatrix_json = ? WHERE id = ?",
+                (json.dumps(datamatrix), datamatrix_id),
+            )
+            continue
+        database.execute_sql(
+            "UPDATE pfdatamatrix SET datamatrix_blob = ?, state_alphabet_json = ?, "
+            "datamatrix_json = NULL WHERE id = ?",
+            (blob, json.dumps(alphabet), datamatrix_id),
+        )
+        for row_idx, col_idx, states in polymorphic_cells:
+            database.execute_sql(
+                "INSERT INTO pfpolymorphiccell (datamatrix_id, row_index, col_index, states_json) "
+                "VALUES (?, ?, ?, ?)",
+                (datamatrix_id, row_idx, col_idx, json.dumps(states)),
+            )
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    @migrator.create_model
+    class PfCellEdit(pw.Model):
+        id = pw.AutoField()
+        datamatrix = pw.ForeignKeyField(column_name='datamatrix_id', field='id', model=migrator.orm['pfdatamatrix'], on_delete='CASCADE')
+        row_index = pw.IntegerField()
+        col_index = pw.IntegerField()
+        old_value_json = pw.CharField(max_length=255)
+        new_value_json = pw.CharField(max_length=255)
+        edited_at = pw.DateTimeField()
+        compacted = pw.BooleanField(default=False)
+
+        class Meta:
+            table_name = "pfcelledit"
+            indexes = [(('datamatrix', 'compacted'), False)]
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.run(fold_cell_edits, database)
+
+    migrator.remove_model('pfcelledit')
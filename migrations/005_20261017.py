@@ -0,0 +1,25 @@
+"""Peewee migrations -- 005_20261017.py.
+
+Index the analysis status lookups used by the run queue
+(status, created_at) and the interrupted-analysis check
+(status, start_datetime).
+"""
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    migrator.add_index('pfanalysis', 'analysis_status', 'created_at', unique=False)
+
+    migrator.add_index('pfanalysis', 'analysis_status', 'start_datetime', unique=False)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.drop_index('pfanalysis', 'analysis_status', 'start_datetime')
+
+    migrator.drop_index('pfanalysis', 'analysis_status', 'created_at')
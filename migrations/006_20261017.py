@@ -0,0 +1,129 @@
+"""Peewee migrations -- 006_20261017.py.
+
+Let datamatrix copies point at their parent instead of duplicating the
+cells: parent and parent_edit_id give the version copied, row_map_json and
+column_map_json the rows and columns taken from it. Rolling back
+materializes such overlays first.
+"""
+
+import json
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+import PfUtils as pu
+
+
+def _stored_matrix(database: pw.Database, datamatrix_id, last_edit_id):
+    """Decode a datamatrix with its pending cell edits up to last_edit_id."""
+    blob, alphabet_json, matrix_json = database.execute_sql(
+        "SELECT datamatrix_blob, state_alphabet_json, datamatrix_json FROM pfdatamatrix "
+        "WHERE id = ?",
+        (datamatrix_id,),
+    ).fetchone()
+    if blob is not None:
+        polymorphic_cells = [
+            (row_idx, col_idx, json.loads(states_json))
+            for row_idx, col_idx, states_json in database.execute_sql(
+                "SELECT row_index, col_index, states_json FROM pfpolymorphiccell "
+                "WHERE datamatrix_id = ?",
+                (datamatrix_id,),
+            ).fetchall()
+        ]
+        datamatrix = pu.decode_datamatrix(
+            bytes(blob), json.loads(alphabet_json or "[]"), polymorphic_cells
+        )
+    else:
+        datamatrix = json.loads(matrix_json) if matrix_json else []
+    for row_idx, col_idx, value_json in database.execute_sql(
+        "SELECT row_index, col_index, new_value_json FROM pfcelledit "
+        "WHERE datamatrix_id = ? AND compacted = 0 AND id <= ? ORDER BY id",
+        (datamatrix_id, last_edit_id or 0),
+    ).fetchall():
+        if row_idx < len(datamatrix) and col_idx < len(datamatrix[row_idx]):
+            datamatrix[row_idx][col_idx] = json.loads(value_json)
+    return datamatrix
+
+
+def _project(datamatrix, row_map, column_map):
+    """Take the mapped rows and columns of a matrix; unmapped cells are missing."""
+    if row_map is None:
+        row_map = range(len(datamatrix))
+    if column_map is not None:
+        n_columns = len(column_map)
+    else:
+        n_columns = len(datamatrix[0]) if datamatrix else 0
+    projected = []
+    for row_idx in row_map:
+        if row_idx is None or row_idx >= len(datamatrix):
+            projected.append(["?"] * n_columns)
+        elif column_map is None:
+            projected.append(list(datamatrix[row_idx]))
+        else:
+            row = datamatrix[row_idx]
+            projected.append(
+                [
+                    row[col_idx] if col_idx is not None and col_idx < len(row) else "?"
+                    for col_idx in column_map
+                ]
+            )
+    return projected
+
+
+def materialize_overlays(database: pw.Database):
+    """Store the resolved cells of every overlay datamatrix in its own row."""
+    while True:
+        overlays = database.execute_sql(
+            "SELECT c.id, c.parent_id, c.parent_edit_id, c.row_map_json, c.column_map_json "
+            "FROM pfdatamatrix c JOIN pfdatamatrix p ON p.id = c.parent_id "
+            "WHERE c.datamatrix_blob IS NULL AND c.datamatrix_json IS NULL "
+            "AND (p.datamatrix_blob IS NOT NULL OR p.datamatrix_json IS NOT NULL)"
+        ).fetchall()
+        if not overlays:
+            return
+        for datamatrix_id, parent_id, parent_edit_id, row_map_json, column_map_json in overlays:
+            datamatrix = _project(
+                _stored_matrix(database, parent_id, parent_edit_id),
+                json.loads(row_map_json) if row_map_json else None,
+                json.loads(column_map_json) if column_map_json else None,
+            )
+            try:
+                blob, alphabet, polymorphic_cells = pu.encode_datamatrix(datamatrix)
+            except pu.DataParsingError:
+                database.execute_sql(
+                    "UPDATE pfdatamatrix SET datamatrix_json = ? WHERE id = ?",
+                    (json.dumps(datamatrix), datamatrix_id),
+                )
+                continue
+            database.execute_sql(
+                "UPDATE pfdatamatrix SET datamatrix_blob = ?, state_alphabet_json = ? WHERE id = ?",
+                (blob, json.dumps(alphabet), datamatrix_id),
+            )
+            for row_idx, col_idx, states in polymorphic_cells:
+                database.execute_sql(
+                    "INSERT INTO pfpolymorphiccell (datamatrix_id, row_index, col_index, states_json) "
+                    "VALUES (?, ?, ?, ?)",
+                    (datamatrix_id, row_idx, col_idx, json.dumps(states)),
+                )
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    migrator.add_fields(
+        'pfdatamatrix',
+
+        parent=pw.ForeignKeyField(column_name='parent_id', field='id', model=migrator.orm['pfdatamatrix'], null=True, on_delete='SET NULL'),
+        parent_edit_id=pw.IntegerField(null=True),
+        row_map_json=pw.CharField(max_length=255, null=True),
+        column_map_json=pw.CharField(max_length=255, null=True))
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.run(materialize_overlays, database)
+
+    migrator.drop_index('pfdatamatrix', 'parent')
+
+    migrator.remove_fields('pfdatamatrix', 'parent', 'parent_edit_id', 'row_map_json', 'column_map_json')
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+Query plan audit for the PhyloForester database
+
+Builds a synthetic database with tens of thousands of analyses, runs
+EXPLAIN QUERY PLAN over the queries the application issues on hot paths
+and fails if any of them scans a whole table or sorts through a temporary
+B-tree. Run it after changing models, indexes or the queries below.
+
+Usage:
+    python query_audit.py [--analyses N] [--database PATH]
+"""
+
+import argparse
+import datetime
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+from peewee import SqliteDatabase, chunked
+
+import PfModel as pm
+
+MODELS = [
+    pm.PfProject,
+    pm.PfDatamatrix,
+    pm.PfPolymorphicCell,
+    pm.PfCellEdit,
+    pm.PfPackage,
+    pm.PfMatrixSnapshot,
+    pm.PfAnalysis,
+    pm.PfTree,
+]
+
+ANALYSES_PER_DATAMATRIX = 20
+DATAMATRICES_PER_PROJECT = 5
+
+# "SCAN pfanalysis" (SQLite >= 3.36) or "SCAN TABLE pfanalysis"; scans
+# through an index ("... USING INDEX ...") are not full table scans
+FULL_SCAN_PATTERN = re.compile(r"^SCAN (TABLE )?\w+( AS \w+)?$")
+TEMP_SORT_PATTERN = re.compile(r"USE TEMP B-TREE")
+
+
+def known_queries():
+    """Get the hot-path queries of the application.
+
+    Returns:
+        List of (name, query) tuples.
+    """
+    return [
+        ("run queue", pm.PfAnalysis.select_ready().limit(1)),
+        ("interrupted analyses", pm.PfAnalysis.select_running()),
+        (
+            "datamatrices of project",
+            pm.PfDatamatrix.select_summary().where(pm.PfDatamatrix.project == 1),
+        ),
+        (
+            "analyses of datamatrix",
+            pm.PfAnalysis.select_summary().where(pm.PfAnalysis.datamatrix == 1),
+        ),
+        ("trees of analysis", pm.PfTree.select().where(pm.PfTree.analysis == 1)),
+        (
+            "polymorphic cells of datamatrix",
+            pm.PfPolymorphicCell.select().where(pm.PfPolymorphicCell.datamatrix == 1),
+        ),
+        (
+            "pending cell edits",
+            pm.PfCellEdit.select()
+            .where((pm.PfCellEdit.datamatrix == 1) & (pm.PfCellEdit.compacted == False))  # noqa: E712
+            .order_by(pm.PfCellEdit.id),
+        ),
+        (
+            "snapshot by content hash",
+            pm.PfMatrixSnapshot.select().where(pm.PfMatrixSnapshot.content_hash == "0" * 64),
+        ),
+    ]
+
+
+def populate(n_analyses):
+    """Fill the bound database with synthetic rows.
+
+    Most analyses are completed; a few are ready or running, as in a
+    long-used database.
+
+    Args:
+        n_analyses: Number of analyses to create.
+    """
+    now = datetime.datetime.now()
+    n_datamatrices = max(1, n_analyses // ANALYSES_PER_DATAMATRIX)
+    n_projects = max(1, n_datamatrices // DATAMATRICES_PER_PROJECT)
+
+    projects = [{"project_name": f"Project {i}"} for i in range(n_projects)]
+    datamatrices = [
+        {
+            "project": i % n_projects + 1,
+            "datamatrix_name": f"Matrix {i}",
+            "n_taxa": 3,
+            "n_chars": 3,
+        }
+        for i in range(n_datamatrices)
+    ]
+    statuses = [pm.ANALYSIS_STATUS_FINISHED] * 97 + [
+        pm.ANALYSIS_STATUS_READY,
+        pm.ANALYSIS_STATUS_RUNNING,
+        pm.ANALYSIS_STATUS_FAILED,
+    ]
+    analyses = [
+        {
+            "datamatrix": i % n_datamatrices + 1,
+            "analysis_type": pm.ANALYSIS_TYPE_PARSIMONY,
+            "analysis_name": f"Analysis {i}",
+            "analysis_status": statuses[i % len(statuses)],
+            "start_datetime": now - datetime.timedelta(minutes=i),
+            "created_at": now - datetime.timedelta(minutes=i),
+        }
+        for i in range(n_analyses)
+    ]
+    trees = [
+        {
+            "analysis": i + 1,
+            "tree_name": "Consensus Tree",
+            "tree_type": pm.TREE_TYPE_CONSENSUS,
+            "newick_text": "(A,(B,C));",
+        }
+        for i in range(n_analyses)
+    ]
+
+    with pm.bulk_write():
+        for model, rows in (
+            (pm.PfProject, projects),
+            (pm.PfDatamatrix, datamatrices),
+            (pm.PfAnalysis, analyses),
+            (pm.PfTree, trees),
+        ):
+            for batch in chunked(rows, 500):
+                model.insert_many(batch).execute()
+
+
+def explain(database, query):
+    """Get the EXPLAIN QUERY PLAN details of a query.
+
+    Returns:
+        List of plan detail strings.
+    """
+    sql, params = query.sql()
+    return [row[-1] for row in database.execute_sql("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def plan_problems(plan):
+    """Get the plan steps that do not scale with table size."""
+    return [
+        detail
+        for detail in plan
+        if FULL_SCAN_PATTERN.match(detail) or TEMP_SORT_PATTERN.search(detail)
+    ]
+
+
+def audit(n_analyses=20000, database_path=None, verbose=False):
+    """Audit the plans of known_queries() against a synthetic database.
+
+    Args:
+        n_analyses: Number of synthetic analyses.
+        database_path: Database file to build; a temporary file if None.
+        verbose: Print the plan of every query.
+
+    Returns:
+        List of (name, problems) tuples for queries with bad plans.
+    """
+    temporary = database_path is None
+    if temporary:
+        fd, database_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        Path(database_path).unlink()
+    database = SqliteDatabase(database_path, pragmas=pm.database_pragmas())
+
+    failures = []
+    try:
+        with database.bind_ctx(MODELS):
+            database.create_tables(MODELS)
+            populate(n_analyses)
+            database.execute_sql("ANALYZE")
+            for name, query in known_queries():
+                plan = explain(database, query)
+                problems = plan_problems(plan)
+                if problems:
+                    failures.append((name, problems))
+                if verbose:
+                    print(f"{'FAIL' if problems else 'ok  '} {name}")
+                    for detail in plan:
+                        print(f"       {detail}")
+    finally:
+        database.close()
+        if temporary:
+            for suffix in ("", "-wal", "-shm"):
+                Path(database_path + suffix).unlink(missing_ok=True)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--analyses", type=int, default=20000, help="synthetic analysis count")
+    parser.add_argument("--database", help="keep the synthetic database at this path")
+    args = parser.parse_args()
+
+    failures = audit(args.analyses, args.database, verbose=True)
+    print("-" * 60)
+    if failures:
+        print(f"{len(failures)} queries do not use an index")
+        return 1
+    print("All queries use indexes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -41,6 +41,22 @@ def qapp():
     # Don't quit the app as it may be needed by other tests
 
 
+@pytest.fixture(autouse=True)
+def parse_cache(tmp_path, monkeypatch):
+    """Give every test an empty parse cache of its own"""
+    cache = pu.ParseCache(tmp_path / "parse_cache")
+    monkeypatch.setattr(pu, "parse_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def ancestral_state_cache(monkeypatch):
+    """Give every test an empty ancestral state cache of its own"""
+    cache = pu.AncestralStateCache()
+    monkeypatch.setattr(pu, "ancestral_state_cache", cache)
+    return cache
+
+
 @pytest.fixture
 def test_db():
     """Create a temporary test database"""
@@ -49,12 +65,24 @@ def test_db():
     test_database = SqliteDatabase(test_db_path, pragmas={"foreign_keys": 1})
 
     # Bind models to test database
-    models = [pm.PfProject, pm.PfDatamatrix, pm.PfPackage, pm.PfAnalysis, pm.PfTree]
+    models = [
+        pm.PfProject,
+        pm.PfDatamatrix,
+        pm.PfPolymorphicCell,
+        pm.PfCellEdit,
+        pm.PfPackage,
+        pm.PfMatrixSnapshot,
+        pm.PfAnalysis,
+        pm.PfTree,
+    ]
     test_database.bind(models, bind_refs=False, bind_backrefs=False)
 
     # Create tables
     test_database.create_tables(models)
 
+    # row ids restart in every test database, so drop values cached by id
+    pm.parsed_value_cache.clear()
+
     yield test_database
 
     # Cleanup
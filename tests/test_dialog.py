@@ -16,6 +16,7 @@ from PyQt5.QtWidgets import QDialog, QWidget
 sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
 
 import PfDialog as pd
+import PfUtils as pu
 
 
 class TestPfInputDialog:
@@ -349,6 +350,23 @@ class TestPreferencesDialog:
         dialog.rbToolbarIconSmall.click()
         assert dialog.rbToolbarIconSmall.isChecked() is True
 
+    def test_database_profile_setting(self, qapp, qtbot):
+        """Test that the database profile is read and saved"""
+        parent = Mock()
+        parent.pos = Mock(return_value=Mock())
+        parent.update_settings = Mock()
+
+        qapp.settings.setValue("DatabaseProfile", "network")
+
+        dialog = pd.PreferencesDialog(parent)
+        qtbot.addWidget(dialog)
+
+        assert dialog.comboDatabaseProfile.currentData() == "network"
+
+        dialog.comboDatabaseProfile.setCurrentIndex(dialog.comboDatabaseProfile.findData("local"))
+        dialog.write_settings()
+        assert qapp.settings.value("DatabaseProfile") == "local"
+
 
 class TestAnalysisViewer:
     """Tests for AnalysisViewer class"""
@@ -448,6 +466,111 @@ class TestTreeViewer:
         viewer.set_analysis(test_analysis)
         assert viewer.analysis == test_analysis
 
+    def test_load_trees_indexed(self, qapp, qtbot, test_analysis, temp_dir):
+        """Test that trees are read lazily through a saved tree file index"""
+        tree_path = Path(temp_dir) / "tmp.tre"
+        tree_path.write_text("tread 'trees'\n(0 (1 2 ))*\n(0 (2 1 ))*\n;\nproc-;\n")
+        test_analysis.result_directory = temp_dir
+        viewer = pd.TreeViewer()
+        qtbot.addWidget(viewer)
+
+        viewer.set_analysis(test_analysis)
+
+        assert isinstance(viewer.newick_tree_list, pu.TreeFileIndex)
+        assert list(viewer.newick_tree_list) == ["(0,(1,2))", "(0,(2,1))"]
+        assert viewer.lbl_total_trees.text() == "/2"
+        assert (Path(temp_dir) / "tmp.tre.pfidx").exists()
+
+    def test_refresh_trees_running(self, qapp, qtbot, test_analysis, temp_dir):
+        """Test that trees written by a running analysis are added as they appear"""
+        tree_path = Path(temp_dir) / "tmp.tre"
+        test_analysis.result_directory = temp_dir
+        test_analysis.analysis_status = pd.ANALYSIS_STATUS_RUNNING
+        viewer = pd.TreeViewer()
+        qtbot.addWidget(viewer)
+        viewer.set_analysis(test_analysis)
+        assert len(viewer.newick_tree_list) == 0
+
+        # the second tree is still being written
+        tree_path.write_text("tread 'trees'\n(0 (1 2 ))*\n(0 (2")
+        viewer.update_info(test_analysis)
+        assert list(viewer.newick_tree_list) == ["(0,(1,2))"]
+        trees = viewer.newick_tree_list
+
+        with tree_path.open("a") as f:
+            f.write(" 1 ))*\n(2 (1 3 ))*\n")
+        viewer.update_info(test_analysis)
+        assert viewer.newick_tree_list is trees
+        assert list(trees) == ["(0,(1,2))", "(0,(2,1))", "(2,(1,3))"]
+        assert viewer.lbl_total_trees.text() == "/3"
+        assert viewer.slider.maximum() == 2
+
+    def test_refresh_trees_restarted(self, qapp, qtbot, test_analysis, temp_dir):
+        """Test that trees of a run written again from the start replace the old ones"""
+        tree_path = Path(temp_dir) / "tmp.tre"
+        tree_path.write_text("tread 'trees'\n(0 (1 2 ))*\n(1 (0 2 ))*\n(2 (0 1 ))*\n")
+        test_analysis.result_directory = temp_dir
+        test_analysis.analysis_status = pd.ANALYSIS_STATUS_RUNNING
+        viewer = pd.TreeViewer()
+        qtbot.addWidget(viewer)
+        viewer.set_analysis(test_analysis)
+        viewer.on_btn_tree_lengths_clicked()
+        viewer.slider.setValue(2)
+        assert viewer.tree_lengths == [3, 3, 3]
+
+        # the restarted run has written no trees yet
+        tree_path.write_text("tread 'trees'\n")
+        viewer.update_info(test_analysis)
+        assert viewer.lbl_total_trees.text() == "/0"
+        assert viewer.tree_lengths == []
+        assert viewer.treeobj_hash == {}
+        assert viewer.tree_label.tree is None
+
+        with tree_path.open("a") as f:
+            f.write("(0 (2 1 ))*\n")
+        viewer.update_info(test_analysis)
+        assert list(viewer.newick_tree_list) == ["(0,(2,1))"]
+        assert viewer.tree_lengths == [3]
+        assert viewer.lbl_total_trees.text() == "/1"
+
+    def test_tree_lengths(self, qapp, qtbot, test_analysis, temp_dir):
+        """Test that the tree length table scores the trees and selects one when clicked"""
+        tree_path = Path(temp_dir) / "tmp.tre"
+        tree_path.write_text("tread 'trees'\n(0 (1 2 ))*\n(1 (0 2 ))*\n;\nproc-;\n")
+        test_analysis.result_directory = temp_dir
+        viewer = pd.TreeViewer()
+        qtbot.addWidget(viewer)
+        viewer.set_analysis(test_analysis)
+        assert viewer.tree_lengths is None
+
+        viewer.on_btn_tree_lengths_clicked()
+
+        assert viewer.tree_lengths == [3, 3]
+        assert viewer.tbl_tree_lengths.rowCount() == 2
+        viewer.on_tbl_tree_lengths_cellClicked(1, 1)
+        tree_number = viewer.tbl_tree_lengths.item(1, 0).data(pd.Qt.DisplayRole)
+        assert viewer.slider.value() == tree_number - 1
+
+    def test_bookmark_tree(self, qapp, qtbot, test_analysis, temp_dir):
+        """Test that the shown tree is translated and bookmarked as Newick text"""
+        tree_path = Path(temp_dir) / "tmp.tre"
+        tree_path.write_text("tread 'trees'\n(0 (1 2 ))*\n;\nproc-;\n")
+        test_analysis.result_directory = temp_dir
+        viewer = pd.TreeViewer()
+        qtbot.addWidget(viewer)
+        viewer.set_analysis(test_analysis)
+
+        assert [clade.name for clade in viewer.current_tree.get_terminals()] == [
+            "Taxon_A",
+            "Taxon_B",
+            "Taxon_C",
+        ]
+        assert isinstance(viewer.treeobj_hash[0], pu.NewickTree)
+
+        viewer.on_btn_bookmark_clicked()
+        bookmark = pd.PfTree.get(pd.PfTree.analysis == test_analysis)
+        assert bookmark.newick_text == "(Taxon_A:0,(Taxon_B:0,Taxon_C:0):0):0;"
+
 
 class TestDatamatrixDialog:
     """Tests for DatamatrixDialog class"""
@@ -687,3 +810,50 @@ class TestTreeLabel:
         result = label.set_tree(None)
         assert result is None
         assert label.tree is None
+
+    def test_update_cells(self, qapp, qtbot, test_analysis):
+        """Test that saved cell edits update the mapped characters"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        label = pd.TreeLabel()
+        qtbot.addWidget(label)
+        label.set_tree(Phylo.read(StringIO("((Taxon_A,Taxon_B),Taxon_C);"), "newick"))
+        label.set_analysis(test_analysis)
+        label.map_characters_to_nodes()
+        reconstruction = label.reconstruction
+        taxon_a = label.tree.root.clades[0].clades[0]
+        assert taxon_a.character_states == ["0", "1", "0"]
+
+        label.update_cells([(0, 2, "1")])
+
+        taxon_a = label.tree.root.clades[0].clades[0]
+        assert taxon_a.character_states == ["0", "1", "1"]
+        assert sum(len(clade.changed_characters) for clade in label.tree.find_clades()) == 2
+        # the cached reconstruction of the matrix before the edit is left alone
+        assert label.reconstruction is not reconstruction
+        label.set_tree(Phylo.read(StringIO("((Taxon_A,Taxon_B),Taxon_C);"), "newick"))
+        label.map_characters_to_nodes()
+        assert label.reconstruction is reconstruction
+        assert label.tree.root.clades[0].clades[0].character_states == ["0", "1", "0"]
+
+    def test_map_characters_cached(self, qapp, qtbot, test_analysis, ancestral_state_cache):
+        """Test that trees shown again take their cached reconstruction"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        label = pd.TreeLabel()
+        qtbot.addWidget(label)
+        label.set_analysis(test_analysis)
+        for newick in ["((Taxon_A,Taxon_B),Taxon_C);", "(Taxon_A,(Taxon_B,Taxon_C));"] * 2:
+            label.set_tree(Phylo.read(StringIO(newick), "newick"))
+            label.set_analysis(test_analysis)
+            label.map_characters_to_nodes()
+
+        assert ancestral_state_cache.stats()["misses"] == 2
+        assert ancestral_state_cache.stats()["hits"] == 2
+        # repaints keep the reconstruction of the tree shown
+        label.map_characters_to_nodes()
+        assert ancestral_state_cache.stats()["hits"] == 2
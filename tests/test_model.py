@@ -4,6 +4,9 @@ Tests for PfModel module - Database models and operations
 
 import json
 from datetime import datetime
+from pathlib import Path
+
+import pytest
 
 import PfModel as pm
 import PfUtils as pu
@@ -79,7 +82,7 @@ class TestPfDatamatrix:
         assert copy_dm.datamatrix_name == test_datamatrix.datamatrix_name
         assert copy_dm.n_taxa == test_datamatrix.n_taxa
         assert copy_dm.n_chars == test_datamatrix.n_chars
-        assert copy_dm.datamatrix_json == test_datamatrix.datamatrix_json
+        assert copy_dm.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
 
     def test_timetable_valid(self, test_datamatrix):
         """Test timetable validation"""
@@ -135,6 +138,22 @@ class TestPfDatamatrix:
         assert test_datamatrix.n_chars > 0
         assert test_datamatrix.taxa_list_json is not None
 
+    def test_import_file_cached(self, test_project, sample_nexus_file, parse_cache):
+        """Test that importing a file again loads it from the parse cache"""
+        first = pm.PfDatamatrix(project=test_project)
+        second = pm.PfDatamatrix(project=test_project)
+
+        assert first.import_file(sample_nexus_file) is True
+        assert second.import_file(sample_nexus_file) is True
+
+        assert parse_cache.stats()["hits"] == 1
+        assert second.datamatrix == first.datamatrix
+        assert (second.n_taxa, second.n_chars, second.datatype) == (
+            first.n_taxa,
+            first.n_chars,
+            first.datatype,
+        )
+
     def test_import_file_nonexistent(self, test_datamatrix):
         """Test importing non-existent file"""
         result = test_datamatrix.import_file("/nonexistent/file.nex")
@@ -292,6 +311,659 @@ class TestPfDatamatrix:
         assert "2 3" in phylip_str  # dimensions
         assert "TaxonA" in phylip_str
 
+    def test_as_tnt_format(self, test_datamatrix):
+        """Test converting to TNT xread format"""
+        tnt_str = test_datamatrix.as_tnt_format()
+        assert tnt_str.startswith("xread\n'Test Matrix'\n3 3\n")
+        assert "Taxon_A 010\n" in tnt_str
+        assert tnt_str.endswith(";\n")
+
+    def test_export_file(self, test_project, temp_dir):
+        """Test exporting a compactly stored matrix with pending cell edits"""
+        dm = pm.PfDatamatrix(
+            project=test_project,
+            datamatrix_name="Export",
+            n_taxa=2,
+            n_chars=3,
+            taxa_list_json=json.dumps(["TaxonA", "TaxonB"]),
+        )
+        dm.set_datamatrix([["0", ["0", "1"], "1"], ["1", "0", "1"]])
+        dm.save()
+        dm.record_cell_edits([(1, 2, "2")])
+        dm = pm.PfDatamatrix.get_by_id(dm.id)
+
+        assert list(dm.iter_rows()) == [["0", ["0", "1"], "1"], ["1", "0", "2"]]
+        file_path = Path(temp_dir) / "export" / "data.phy"
+        dm.export_file(file_path, "phylip")
+        assert file_path.read_text() == "2 3\nTaxonA 0(0 1)1\nTaxonB 102\n"
+        assert dm.as_phylip_format() == file_path.read_text()
+
+        with pytest.raises(ValueError):
+            dm.export_file(file_path, "fasta")
+
+    def test_validate(self, test_project):
+        """Test validating the stored matrix and its pending cell edits"""
+        dm = pm.PfDatamatrix(
+            project=test_project,
+            datamatrix_name="Validate",
+            n_taxa=2,
+            n_chars=3,
+            taxa_list_json=json.dumps(["TaxonA", "TaxonB"]),
+        )
+        dm.set_datamatrix([["0", ["0", "1"], "?"], ["1", "0", "?"]])
+        dm.save()
+
+        report = dm.validate()
+        assert report["valid"]
+        assert [p["problem"] for p in report["warnings"]] == ["missing_column"]
+
+        dm.record_cell_edits([(1, 0, "0 1")])
+        report = dm.validate(valid_states={"0", "1", "?"})
+        assert [(p["row"], p["column"]) for p in report["errors"]] == [(1, 0)]
+
+
+class TestDatatypeDetection:
+    """Tests for lookup-table datatype detection"""
+
+    def _reference(self, datamatrix, n_chars):
+        dm = pm.PfDatamatrix()
+        type_count = {name: 0 for name, _alphabet in pu.DATATYPE_ALPHABETS}
+        for char_idx in range(n_chars):
+            char_str = "".join(
+                "".join(row[char_idx]) if isinstance(row[char_idx], list) else row[char_idx]
+                for row in datamatrix
+            )
+            count = {
+                pm.DATATYPE_DNA: dm.count_dna(char_str),
+                pm.DATATYPE_RNA: dm.count_rna(char_str),
+                pm.DATATYPE_PROTEIN: dm.count_protein(char_str),
+                pm.DATATYPE_MORPHOLOGY: dm.count_morphology(char_str),
+            }
+            type_count[max(count, key=count.get)] += 1
+        return type_count
+
+    def test_matches_counter_classification(self):
+        """Test agreement with count_dna() and friends on mixed input"""
+        datamatrix = [
+            ["A", "c", "u", "0", "?", "L", "ı", "-"],
+            ["G", "t", "U", "1", "N", ["0", "1"], "ſ", "é"],
+            ["a", "T", "g", "10", "-", "K", ["A", "C"], "Ω"],
+        ]
+
+        assert pu.count_column_datatypes(datamatrix, 8) == self._reference(datamatrix, 8)
+
+    def test_uniform_rows(self):
+        """Test the fast path for rows of single-character states"""
+        datamatrix = [list("ACGTACGU"), list("acgtRRRR"), list("01234567")]
+
+        assert pu.count_column_datatypes(datamatrix, 8) == self._reference(datamatrix, 8)
+
+    def test_import_detects_morphology(self, sample_nexus_file, test_project):
+        """Test that imported 0/1 data is detected as morphology"""
+        dm = pm.PfDatamatrix(project=test_project)
+        dm.import_file(sample_nexus_file)
+
+        assert dm.datatype == pm.DATATYPE_MORPHOLOGY
+
+
+class TestDatamatrixCompactStorage:
+    """Tests for the compact BLOB storage of datamatrix cells"""
+
+    def _create(self, project, matrix):
+        dm = pm.PfDatamatrix(
+            project=project, datamatrix_name="Compact", n_taxa=len(matrix), n_chars=3
+        )
+        dm.set_datamatrix(matrix)
+        dm.save()
+        return dm
+
+    def test_round_trip_with_polymorphism(self, test_project):
+        """Test storing and reloading a matrix with polymorphic cells"""
+        matrix = [["0", ["0", "1"], "?"], ["1", "-", ["1", "2"]], ["0", "0", "1"]]
+        dm = self._create(test_project, matrix)
+
+        assert dm.datamatrix_json is None
+        assert len(dm.datamatrix_blob) == pu.DATAMATRIX_BLOB_HEADER.size + 9
+        assert (
+            pm.PfPolymorphicCell.select().where(pm.PfPolymorphicCell.datamatrix == dm.id).count()
+            == 2
+        )
+
+        reloaded = pm.PfDatamatrix.get_by_id(dm.id)
+        assert reloaded.datamatrix_as_list() == matrix
+
+    def test_resave_replaces_polymorphic_cells(self, test_project):
+        """Test that saving a new matrix rewrites the side table"""
+        dm = self._create(test_project, [["0", ["0", "1"]], ["1", ["1", "2"]]])
+        dm.set_datamatrix([["0", "1"], ["1", ["0", "2"]]])
+        dm.save()
+
+        reloaded = pm.PfDatamatrix.get_by_id(dm.id)
+        assert reloaded.datamatrix_as_list() == [["0", "1"], ["1", ["0", "2"]]]
+        assert reloaded.polymorphic_cells.count() == 1
+
+    def test_copy_keeps_polymorphic_cells(self, test_project):
+        """Test that copying a compact datamatrix copies its side table"""
+        matrix = [["0", ["0", "1"]], ["1", "1"]]
+        dm = self._create(test_project, matrix)
+
+        copy_dm = pm.PfDatamatrix.get_by_id(dm.copy().id)
+        assert copy_dm.datamatrix_as_list() == matrix
+
+    def test_polymorphic_cells_cascade_delete(self, test_project):
+        """Test that deleting the datamatrix removes its polymorphic cells"""
+        dm = self._create(test_project, [[["0", "1"], "1"]])
+        dm.delete_instance()
+        assert pm.PfPolymorphicCell.select().count() == 0
+
+    def test_fallback_to_json(self, test_project):
+        """Test that unencodable matrices are stored as JSON"""
+        matrix = [[str(i) for i in range(300)]]
+        dm = self._create(test_project, matrix)
+
+        assert dm.datamatrix_blob is None
+        assert json.loads(dm.datamatrix_json) == matrix
+        assert pm.PfDatamatrix.get_by_id(dm.id).datamatrix_as_list() == matrix
+
+    def test_corrupt_blob(self, test_datamatrix):
+        """Test datamatrix_as_list with a truncated blob"""
+        test_datamatrix.datamatrix_blob = b"\x01\x02"
+        test_datamatrix.state_alphabet_json = "[]"
+        assert test_datamatrix.datamatrix_as_list() == []
+
+    def test_migration_packs_json_rows(self, test_datamatrix):
+        """Test the 002 migration helpers convert JSON rows and back"""
+        import importlib.util
+
+        migration_path = Path(__file__).parent.parent / "migrations" / "002_20261017.py"
+        spec = importlib.util.spec_from_file_location("migration_002", migration_path)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        matrix = [["0", ["0", "1"], "0"], ["1", "0", "1"], ["0", "0", "1"]]
+        test_datamatrix.datamatrix_json = json.dumps(matrix)
+        test_datamatrix.save()
+
+        database = pm.PfDatamatrix._meta.database
+        migration.pack_datamatrices(database)
+        packed = pm.PfDatamatrix.get_by_id(test_datamatrix.id)
+        assert packed.datamatrix_json is None
+        assert packed.datamatrix_as_list() == matrix
+
+        migration.unpack_datamatrices(database)
+        unpacked = pm.PfDatamatrix.get_by_id(test_datamatrix.id)
+        assert json.loads(unpacked.datamatrix_json) == matrix
+
+
+class TestDeferredFields:
+    """Tests for lightweight summary selects with deferred heavy columns"""
+
+    def test_datamatrix_summary_excludes_heavy_columns(self, test_datamatrix):
+        """Test that select_summary leaves the deferred columns out"""
+        dm = pm.PfDatamatrix.select_summary().where(pm.PfDatamatrix.id == test_datamatrix.id).get()
+        assert "datamatrix_json" not in dm.__data__
+        assert "whole_text" not in dm.__data__
+        assert dm.datamatrix_name == "Test Matrix"
+
+    def test_deferred_columns_load_on_access(self, test_datamatrix):
+        """Test that reading a deferred column fetches it transparently"""
+        dm = pm.PfDatamatrix.select_summary().where(pm.PfDatamatrix.id == test_datamatrix.id).get()
+        assert dm.get_taxa_list() == ["Taxon_A", "Taxon_B", "Taxon_C"]
+        assert dm.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
+        assert "datamatrix_json" in dm.__data__
+
+    def test_save_summary_keeps_heavy_columns(self, test_datamatrix):
+        """Test that saving a summary instance does not clear unloaded columns"""
+        dm = pm.PfDatamatrix.select_summary().where(pm.PfDatamatrix.id == test_datamatrix.id).get()
+        dm.datamatrix_name = "Renamed"
+        dm.save()
+
+        reloaded = pm.PfDatamatrix.get_by_id(test_datamatrix.id)
+        assert reloaded.datamatrix_name == "Renamed"
+        assert reloaded.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
+
+    def test_analysis_summary(self, test_analysis):
+        """Test summary select of analyses"""
+        test_analysis.datamatrix_json = json.dumps([["0"]])
+        test_analysis.save()
+
+        analysis = pm.PfAnalysis.select_summary().where(pm.PfAnalysis.id == test_analysis.id).get()
+        assert "datamatrix_json" not in analysis.__data__
+        assert analysis.analysis_status == pm.ANALYSIS_STATUS_READY
+        assert json.loads(analysis.datamatrix_json) == [["0"]]
+
+    def test_new_instance_does_not_query(self, test_db):
+        """Test that unsaved instances return None for unset deferred columns"""
+        dm = pm.PfDatamatrix(datamatrix_name="New", n_taxa=0, n_chars=0)
+        assert dm.whole_text is None
+
+
+class TestParsedValueCache:
+    """Tests for caching of parsed datamatrix values"""
+
+    def test_repeated_get_is_cached(self, test_datamatrix):
+        """Test that the second call returns the cached list"""
+        first = test_datamatrix.datamatrix_as_list()
+        before = pm.PfDatamatrix.parse_cache_stats()
+        second = test_datamatrix.datamatrix_as_list()
+        after = pm.PfDatamatrix.parse_cache_stats()
+
+        assert second is first
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+
+    def test_assignment_invalidates(self, test_datamatrix):
+        """Test that setting a source column drops the cached value"""
+        assert test_datamatrix.get_taxa_list() == ["Taxon_A", "Taxon_B", "Taxon_C"]
+        test_datamatrix.taxa_list_json = json.dumps(["X", "Y", "Z"])
+
+        assert test_datamatrix.get_taxa_list() == ["X", "Y", "Z"]
+
+    def test_set_datamatrix_invalidates(self, test_datamatrix):
+        """Test that unsaved matrix edits are visible to getters"""
+        test_datamatrix.datamatrix_as_list()
+        test_datamatrix.set_datamatrix([["1", "1", "1"], ["1", "1", "1"], ["1", "1", "1"]])
+
+        assert test_datamatrix.datamatrix_as_list()[0] == ["1", "1", "1"]
+
+    def test_save_bumps_modified_at(self, test_datamatrix):
+        """Test that saving changed data starts a new cache version"""
+        old_modified = test_datamatrix.modified_at
+        test_datamatrix.character_list_json = json.dumps(["a", "b", "c"])
+        test_datamatrix.save()
+
+        assert test_datamatrix.modified_at > old_modified
+        reloaded = pm.PfDatamatrix.get_by_id(test_datamatrix.id)
+        assert reloaded.get_character_list() == ["a", "b", "c"]
+
+    def test_unchanged_save_keeps_modified_at(self, test_datamatrix):
+        """Test that saving metadata only does not bump modified_at"""
+        old_modified = test_datamatrix.modified_at
+        test_datamatrix.datamatrix_name = "Renamed"
+        test_datamatrix.save()
+
+        assert test_datamatrix.modified_at == old_modified
+
+    def test_shared_between_instances(self, test_datamatrix):
+        """Test that another instance of the same row reuses parsed values"""
+        first = test_datamatrix.datamatrix_as_list()
+        reloaded = pm.PfDatamatrix.get_by_id(test_datamatrix.id)
+        before = pm.PfDatamatrix.parse_cache_stats()
+
+        assert reloaded.datamatrix_as_list() is first
+        assert pm.PfDatamatrix.parse_cache_stats()["misses"] == before["misses"]
+
+    def test_lru_eviction(self):
+        """Test that the cache keeps at most max_entries values"""
+        cache = pm.ParsedValueCache(max_entries=2)
+        cache.store("a", 1)
+        cache.store("b", 2)
+        cache.lookup("a")
+        cache.store("c", 3)
+
+        assert cache.lookup("a") == (True, 1)
+        assert cache.lookup("b") == (False, None)
+        assert cache.stats()["entries"] == 2
+
+
+class TestCellEditJournal:
+    """Tests for journaled datamatrix cell edits"""
+
+    def test_record_applies_edits(self, test_datamatrix):
+        """Test that recorded edits show up in the datamatrix"""
+        count = test_datamatrix.record_cell_edits([(0, 1, "2"), (2, 0, ["0", "1"])])
+        reloaded = pm.PfDatamatrix.get_by_id(test_datamatrix.id)
+
+        assert count == 2
+        assert reloaded.datamatrix_as_list()[0] == ["0", "2", "0"]
+        assert reloaded.datamatrix_as_list()[2][0] == ["0", "1"]
+
+    def test_unchanged_cells_skipped(self, test_datamatrix):
+        """Test that edits to the current value are not journaled"""
+        assert test_datamatrix.record_cell_edits([(0, 0, "0")]) == 0
+        assert pm.PfCellEdit.select().count() == 0
+
+    def test_history(self, test_datamatrix):
+        """Test that the journal keeps old and new values per cell"""
+        test_datamatrix.record_cell_edits([(1, 1, "1")])
+        test_datamatrix.record_cell_edits([(1, 1, "2")])
+
+        history = test_datamatrix.cell_history(1, 1)
+        assert [(json.loads(e.old_value_json), json.loads(e.new_value_json)) for e in history] == [
+            ("0", "1"),
+            ("1", "2"),
+        ]
+
+    def test_compact(self, test_datamatrix):
+        """Test that compaction folds edits into the stored matrix"""
+        test_datamatrix.record_cell_edits([(0, 0, "1")])
+        assert test_datamatrix.compact_cell_edits() == 1
+
+        assert pm.PfCellEdit.get().compacted
+        assert test_datamatrix.datamatrix_json is None
+        assert test_datamatrix.datamatrix_as_list()[0] == ["1", "1", "0"]
+        assert len(test_datamatrix.cell_history()) == 1
+
+    def test_automatic_compaction(self, test_datamatrix, monkeypatch):
+        """Test that reaching the threshold compacts pending edits"""
+        monkeypatch.setattr(pm, "CELL_EDIT_COMPACT_THRESHOLD", 2)
+        test_datamatrix.record_cell_edits([(0, 0, "1"), (0, 1, "0")])
+
+        assert test_datamatrix._get_cell_edits() == []
+        assert test_datamatrix.datamatrix_as_list()[0] == ["1", "0", "0"]
+
+    def test_copy_includes_pending_edits(self, test_datamatrix):
+        """Test that copying a datamatrix keeps its journaled edits"""
+        test_datamatrix.record_cell_edits([(2, 2, "0")])
+        copied = test_datamatrix.copy()
+
+        assert copied.datamatrix_as_list()[2] == ["0", "0", "0"]
+
+    def test_unsaved_datamatrix_rejected(self, test_project):
+        """Test that an unsaved datamatrix cannot journal edits"""
+        dm = pm.PfDatamatrix(project=test_project, datamatrix_name="Unsaved")
+        with pytest.raises(ValueError):
+            dm.record_cell_edits([(0, 0, "1")])
+
+
+class TestDatamatrixVersions:
+    """Tests for copy-on-write datamatrix copies"""
+
+    def test_copy_is_overlay(self, test_datamatrix):
+        """Test that a copy stores no cells of its own"""
+        copied = pm.PfDatamatrix.get_by_id(test_datamatrix.copy().id)
+
+        assert copied.is_overlay()
+        assert copied.parent_id == test_datamatrix.id
+        assert copied.datamatrix_blob is None
+        assert copied.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
+
+    def test_parent_edits_after_copy_not_seen(self, test_datamatrix):
+        """Test that a copy keeps the parent version it was made from"""
+        test_datamatrix.record_cell_edits([(0, 0, "1")])
+        copied = test_datamatrix.copy()
+        test_datamatrix.record_cell_edits([(1, 1, "1")])
+
+        assert copied.datamatrix_as_list() == [["1", "1", "0"], ["1", "0", "1"], ["0", "0", "1"]]
+
+    def test_copy_edits_not_seen_by_parent(self, test_datamatrix):
+        """Test that edits to a copy stay in the copy"""
+        copied = test_datamatrix.copy()
+        copied.record_cell_edits([(2, 2, "0")])
+
+        assert copied.datamatrix_as_list()[2] == ["0", "0", "0"]
+        assert test_datamatrix.datamatrix_as_list()[2] == ["0", "0", "1"]
+
+    def test_rearrange_overlay(self, test_datamatrix):
+        """Test that excluding and adding rows of an overlay only updates its maps"""
+        copied = test_datamatrix.copy()
+        copied.rearrange([2, 0, None], [1, 2])
+        copied.save()
+
+        reloaded = pm.PfDatamatrix.get_by_id(copied.id)
+        assert reloaded.is_overlay()
+        assert json.loads(reloaded.row_map_json) == [2, 0, None]
+        assert reloaded.datamatrix_as_list() == [["0", "1"], ["1", "0"], ["?", "?"]]
+
+        reloaded.rearrange([1], [1, 0])
+        assert reloaded.datamatrix_as_list() == [["0", "1"]]
+
+    def test_rearrange_stored_matrix(self, test_datamatrix):
+        """Test that rearranging a datamatrix with its own cells rewrites them"""
+        test_datamatrix.rearrange([1, 0], [0, None])
+        test_datamatrix.save()
+
+        assert test_datamatrix.datamatrix_as_list() == [["1", "?"], ["0", "?"]]
+
+    def test_parent_change_materializes_copy(self, test_datamatrix):
+        """Test that replacing the parent matrix keeps the copy's cells"""
+        copied = test_datamatrix.copy()
+        copied.rearrange([0, 1], [0])
+        copied.save()
+        test_datamatrix.set_datamatrix([["2", "2", "2"]] * 3)
+        test_datamatrix.save()
+
+        reloaded = pm.PfDatamatrix.get_by_id(copied.id)
+        assert not reloaded.is_overlay()
+        assert reloaded.parent_id == test_datamatrix.id
+        assert reloaded.datamatrix_as_list() == [["0"], ["1"]]
+
+    def test_parent_compaction_materializes_copy(self, test_datamatrix):
+        """Test that compacting the parent journal keeps the copy's version"""
+        copied = test_datamatrix.copy()
+        test_datamatrix.record_cell_edits([(0, 0, "1")])
+        test_datamatrix.compact_cell_edits()
+
+        assert pm.PfDatamatrix.get_by_id(copied.id).datamatrix_as_list()[0] == ["0", "1", "0"]
+
+    def test_parent_delete_materializes_copy(self, test_project, test_datamatrix):
+        """Test that copies in other projects survive deleting the parent's project"""
+        other_project = pm.PfProject.create(project_name="Other")
+        copied = test_datamatrix.copy()
+        copied.project = other_project
+        copied.save()
+        expected = test_datamatrix.datamatrix_as_list()
+
+        test_project.delete_instance()
+
+        reloaded = pm.PfDatamatrix.get_by_id(copied.id)
+        assert reloaded.parent_id is None
+        assert reloaded.datamatrix_as_list() == expected
+
+    def test_copy_of_unmodified_copy_shares_parent(self, test_datamatrix):
+        """Test that copying an overlay without edits does not grow a chain"""
+        copied = test_datamatrix.copy().copy()
+
+        assert copied.parent_id == test_datamatrix.id
+        assert copied.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
+
+
+class TestProjectHierarchy:
+    """Tests for loading the project tree in a fixed number of queries"""
+
+    def _count_queries(self, database, monkeypatch):
+        queries = []
+        execute_sql = database.execute_sql
+
+        def counting_execute_sql(sql, params=None, *args, **kwargs):
+            queries.append(sql)
+            return execute_sql(sql, params, *args, **kwargs)
+
+        monkeypatch.setattr(database, "execute_sql", counting_execute_sql)
+        return queries
+
+    def test_query_count_independent_of_size(self, test_db, monkeypatch):
+        """Test that the hierarchy loads with one query per level"""
+        for p in range(3):
+            project = pm.PfProject.create(project_name=f"Project {p}")
+            for d in range(2):
+                dm = pm.PfDatamatrix.create(
+                    project=project, datamatrix_name=f"Matrix {p}.{d}", n_taxa=0, n_chars=0
+                )
+                for a in range(2):
+                    pm.PfAnalysis.create(
+                        datamatrix=dm,
+                        analysis_type=pm.ANALYSIS_TYPE_PARSIMONY,
+                        analysis_name=f"Analysis {p}.{d}.{a}",
+                    )
+        queries = self._count_queries(test_db, monkeypatch)
+
+        names = [
+            (project.project_name, dm.datamatrix_name, analysis.analysis_name)
+            for project in pm.PfProject.select_hierarchy()
+            for dm in project.datamatrices
+            for analysis in dm.analyses
+        ]
+
+        assert len(names) == 12
+        assert names[0] == ("Project 0", "Matrix 0.0", "Analysis 0.0.0")
+        assert len(queries) == 3
+
+    def test_hierarchy_is_metadata_only(self, test_datamatrix):
+        """Test that matrix columns are left for lazy loading"""
+        project = pm.PfProject.select_hierarchy()[0]
+        dm = project.datamatrices[0]
+
+        assert "datamatrix_json" not in dm.__data__
+        assert dm.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
+
+
+class TestPfMatrixSnapshot:
+    """Tests for content-addressed analysis input snapshots"""
+
+    def _analysis(self, datamatrix, snapshot, name="Run"):
+        return pm.PfAnalysis.create(
+            datamatrix=datamatrix,
+            snapshot=snapshot,
+            analysis_type=pm.ANALYSIS_TYPE_PARSIMONY,
+            analysis_name=name,
+        )
+
+    def test_snapshot_round_trip(self, test_datamatrix):
+        """Test that a snapshot reproduces the datamatrix contents"""
+        snapshot = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+        snapshot = pm.PfMatrixSnapshot.get_by_id(snapshot.id)
+
+        assert snapshot.get_taxa_list() == test_datamatrix.get_taxa_list()
+        assert snapshot.get_character_list() == test_datamatrix.get_character_list()
+        assert snapshot.datamatrix_as_list() == test_datamatrix.datamatrix_as_list()
+
+    def test_identical_matrices_share_snapshot(self, test_datamatrix):
+        """Test dedup and reference counting across analyses"""
+        for name in ("Parsimony", "ML", "Bayesian"):
+            snapshot = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+            self._analysis(test_datamatrix, snapshot, name)
+
+        assert pm.PfMatrixSnapshot.select().count() == 1
+        assert pm.PfMatrixSnapshot.get().ref_count == 3
+
+    def test_changed_matrix_gets_new_snapshot(self, test_datamatrix):
+        """Test that edited data is stored as a separate snapshot"""
+        first = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+        test_datamatrix.set_datamatrix([["1", "1", "1"], ["1", "0", "1"], ["0", "0", "1"]])
+        test_datamatrix.save()
+        second = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+
+        assert first.content_hash != second.content_hash
+
+    def test_delete_analysis_releases_snapshot(self, test_datamatrix):
+        """Test that the last analysis deletion removes the snapshot"""
+        snapshot = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+        first = self._analysis(test_datamatrix, snapshot, "A")
+        second = self._analysis(test_datamatrix, snapshot, "B")
+
+        first.delete_instance()
+        assert pm.PfMatrixSnapshot.get_by_id(snapshot.id).ref_count == 1
+        second.delete_instance()
+        assert pm.PfMatrixSnapshot.select().count() == 0
+
+    def test_reassign_snapshot(self, test_datamatrix):
+        """Test that replacing a snapshot moves the reference"""
+        snapshot = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+        analysis = self._analysis(test_datamatrix, snapshot)
+        other = pm.PfMatrixSnapshot.store(["X"], ["c"], [["0"]])
+
+        analysis.snapshot = other
+        analysis.save()
+
+        assert pm.PfMatrixSnapshot.get_or_none(pm.PfMatrixSnapshot.id == snapshot.id) is None
+        assert pm.PfMatrixSnapshot.get_by_id(other.id).ref_count == 1
+
+    def test_cascade_delete_collects_garbage(self, test_datamatrix):
+        """Test that deleting a datamatrix collects its analyses' snapshots"""
+        snapshot = pm.PfMatrixSnapshot.from_datamatrix(test_datamatrix)
+        self._analysis(test_datamatrix, snapshot)
+
+        test_datamatrix.delete_instance()
+        assert pm.PfMatrixSnapshot.select().count() == 0
+
+
+class TestDatabaseSetup:
+    """Tests for connection profiles and bulk writes"""
+
+    def test_local_profile(self, temp_dir):
+        """Test that the default profile enables WAL and tuning pragmas"""
+        database = pm.setup_database_location(temp_dir)
+        database.connect()
+        try:
+            assert database.database == str(Path(temp_dir) / "PhyloForester.db")
+            assert database.execute_sql("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert database.execute_sql("PRAGMA synchronous").fetchone()[0] == 1
+            assert database.execute_sql("PRAGMA foreign_keys").fetchone()[0] == 1
+        finally:
+            database.close()
+
+    def test_network_profile_with_override(self, temp_dir):
+        """Test selecting another profile and overriding a pragma"""
+        database = pm.setup_database_location(temp_dir, "network", synchronous=2)
+        database.connect()
+        try:
+            assert database.execute_sql("PRAGMA journal_mode").fetchone()[0] == "truncate"
+            assert database.execute_sql("PRAGMA synchronous").fetchone()[0] == 2
+        finally:
+            database.close()
+
+    def test_unknown_profile(self):
+        """Test that unknown profiles are rejected"""
+        with pytest.raises(ValueError):
+            pm.database_pragmas("floppy")
+
+    def test_use_database_profile(self, temp_dir, monkeypatch):
+        """Test switching the application database to another profile"""
+        monkeypatch.setattr(pm, "database_path", str(Path(temp_dir) / "PhyloForester.db"))
+        try:
+            pm.use_database_profile("network")
+            pm.gDatabase.connect()
+            assert pm.gDatabase.execute_sql("PRAGMA journal_mode").fetchone()[0] == "truncate"
+            with pytest.raises(ValueError):
+                pm.use_database_profile("floppy")
+            assert not pm.gDatabase.is_closed()
+        finally:
+            pm.gDatabase.close()
+            monkeypatch.undo()
+            pm.use_database_profile()
+
+    def test_bulk_write_commits_together(self, test_db):
+        """Test that saves inside bulk_write are committed"""
+        with pm.bulk_write():
+            for i in range(5):
+                pm.PfProject.create(project_name=f"Project {i}")
+
+        assert pm.PfProject.select().count() == 5
+
+    def test_bulk_write_rolls_back(self, test_db):
+        """Test that an error inside bulk_write discards all saves"""
+        with pytest.raises(RuntimeError), pm.bulk_write():
+            pm.PfProject.create(project_name="Kept?")
+            raise RuntimeError("abort")
+
+        assert pm.PfProject.select().count() == 0
+
+
+class TestQueryPlans:
+    """Tests for indexes on hot query paths"""
+
+    def test_known_queries_use_indexes(self):
+        """Test that no known query scans a table or sorts in a temp B-tree"""
+        import query_audit
+
+        assert query_audit.audit(n_analyses=500) == []
+
+    def test_ready_queue_order(self, test_datamatrix):
+        """Test that the run queue returns the oldest ready analysis"""
+        for i, status in enumerate(
+            [pm.ANALYSIS_STATUS_FINISHED, pm.ANALYSIS_STATUS_READY, pm.ANALYSIS_STATUS_READY]
+        ):
+            pm.PfAnalysis.create(
+                datamatrix=test_datamatrix,
+                analysis_type=pm.ANALYSIS_TYPE_PARSIMONY,
+                analysis_name=f"Run {i}",
+                analysis_status=status,
+                created_at=datetime(2024, 1, 3 - i),
+            )
+
+        assert pm.PfAnalysis.select_ready().first().analysis_name == "Run 2"
+
 
 class TestPfPackage:
     """Tests for PfPackage model"""
@@ -2,6 +2,7 @@
 Tests for PfUtils module
 """
 
+import math
 import sys
 from pathlib import Path
 
@@ -394,6 +395,8 @@ class TestPhyloDatafile:
 
         assert result is True
         assert datafile.file_type == "Phylip"
+        assert datafile.taxa_list == ["Taxon1", "Taxon2", "Taxon3"]
+        assert datafile.datamatrix[1] == list("1010110101")
 
     def test_phylip_whitespace_variations(self, temp_dir):
         """Test PHYLIP format with various whitespace patterns"""
@@ -646,6 +649,10 @@ class TestPhyloDatafile:
 
         assert result is True
         assert datafile.file_type == "Nexus"
+        assert datafile.taxa_list == ["Taxon1", "Taxon2", "Taxon3"]
+        assert datafile.datamatrix[0] == list("0101001010")
+        assert datafile.datamatrix[2] == list("1100111001")
+        assert "INTERLEAVE" not in datafile.nexus_command_hash.get("FORMAT", {})
 
     def test_nexus_dna_datatype(self, temp_dir):
         """Test NEXUS format with DNA datatype"""
@@ -1197,6 +1204,413 @@ class TestPhyloDatafile:
         assert result is True
 
 
+class TestDecodeRow:
+    """Tests for splitting Phylip and TNT rows into cells"""
+
+    def test_plain_row(self):
+        """Test that a row without brackets has one cell per character"""
+        from PfUtils import decode_row
+
+        assert decode_row("AC-?") == ["A", "C", "-", "?"]
+
+    def test_polymorphic_cells(self):
+        """Test ( ), { } and [ ] groups with space-separated states"""
+        from PfUtils import decode_row
+
+        assert decode_row("0(0 1)1{12}[0 2]") == ["0", ["0", "1"], "1", ["12"], ["0", "2"]]
+
+    def test_blanks_between_cells(self):
+        """Test that blanks between blocks of cells are not cells"""
+        from PfUtils import decode_row
+
+        assert decode_row("AC GT\t-?") == ["A", "C", "G", "T", "-", "?"]
+        assert decode_row("01 (0 1)1 [0 2] 2") == ["0", "1", ["0", "1"], "1", ["0", "2"], "2"]
+
+    def test_unclosed_group(self):
+        """Test that an unclosed group keeps the states followed by a space"""
+        from PfUtils import decode_row
+
+        assert decode_row("0(1 2") == ["0", ["1"]]
+
+    def test_formatted_rows_shared(self, sample_tnt_file):
+        """Test that the formatted views share the datamatrix rows"""
+        from PfUtils import PhyloDatafile
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(sample_tnt_file)
+
+        taxon = datafile.taxa_list[0]
+        assert datafile.formatted_data_hash[taxon] is datafile.datamatrix[0]
+        assert datafile.formatted_data_list[0] == [taxon, *datafile.datamatrix[0]]
+
+
+class TestInterleaveAssembler:
+    """Tests for assembling rows from interleaved chunks"""
+
+    def test_chunks_fill_preallocated_rows(self):
+        """Test that chunks are appended per taxon in place"""
+        from PfUtils import InterleaveAssembler
+
+        rows = InterleaveAssembler(n_chars=4)
+        rows.add("A", ["0", "1"])
+        rows.add("B", ["1", "1"])
+        first_row = rows.rows[0]
+        rows.add("A", ["0", ["0", "1"]])
+        rows.add("B", ["0", "0"])
+
+        assert rows.finish() == [["0", "1", "0", ["0", "1"]], ["1", "1", "0", "0"]]
+        assert rows.rows[0] is first_row
+        assert rows.taxa_list == ["A", "B"]
+
+    def test_short_and_long_rows(self):
+        """Test rows shorter or longer than the declared character count"""
+        from PfUtils import InterleaveAssembler
+
+        rows = InterleaveAssembler(n_chars=3)
+        rows.add("A", ["0"])
+        rows.add("B", ["0", "1", "0"])
+        rows.add("B", ["1"])
+
+        assert rows.finish() == [["0"], ["0", "1", "0", "1"]]
+
+    def test_interleaved_phylip_with_spaces(self, temp_dir):
+        """Test interleaved PHYLIP continuation lines after a blank line"""
+        from PfUtils import PhyloDatafile
+
+        phy_path = Path(temp_dir) / "interleaved_dna.phy"
+        phy_path.write_text("2 8\nAlpha ACGT\nBeta  TTGA\n\n    CC(A G)A\n    GGTT\n")
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(phy_path)
+
+        assert datafile.datamatrix == [
+            ["A", "C", "G", "T", "C", "C", ["A", "G"], "A"],
+            ["T", "T", "G", "A", "G", "G", "T", "T"],
+        ]
+
+    def test_interleaved_phylip_blocks(self, temp_dir):
+        """Test interleaved PHYLIP with the cells written in blocks of ten"""
+        from PfUtils import PhyloDatafile
+
+        phy_path = Path(temp_dir) / "blocks.phy"
+        phy_path.write_text(
+            "  5    42\n"
+            "Turkey    AAGCTNGGGC ATTTCAGGGT\n"
+            "Salmo     AAGCCTTGGC AGTGCAGGGT\n"
+            "Human     ACCGGTTGGC CGTTCAGGGT\n"
+            "Chimp     AAACCCTTGC CGTTACGCTT\n"
+            "Gorilla   AAACCCTTGC CGGTACGCTT\n"
+            "\n"
+            "GAGCCCGGGC AATACAGGGT AT\n"
+            "GAGCCGTGGC CGGGCACGGT AT\n"
+            "ACAGGTTGGC CGTTCAGGGT AA\n"
+            "AAACCGAGGC CGGGACACTC AT\n"
+            "AAACCCTTGC CGGTACGCTT AA\n"
+        )
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(phy_path)
+
+        assert [len(row) for row in datafile.datamatrix] == [42] * 5
+        assert "".join(datafile.datamatrix[2]) == "ACCGGTTGGCCGTTCAGGGTACAGGTTGGCCGTTCAGGGTAA"
+
+    def test_phylip_row_length_mismatch(self, temp_dir):
+        """Test that rows not matching the characters of the header are reported"""
+        from PfUtils import DataParsingError, PhyloDatafile
+
+        phy_path = Path(temp_dir) / "short.phy"
+        phy_path.write_text("2 6\nAlpha 0101 01\nBeta  0110\n")
+
+        with pytest.raises(DataParsingError, match="Beta"):
+            PhyloDatafile().loadfile(phy_path)
+
+
+class TestNexusReader:
+    """Tests for the streaming NEXUS reader"""
+
+    def test_comments_quotes_and_multiline_commands(self):
+        """Test comments, quoted names and commands spanning lines"""
+        from PfUtils import NexusReader
+
+        lines = [
+            "#NEXUS [written by\n",
+            "  a [nested] program]\n",
+            "begin data;\n",
+            "dimensions\n",
+            "  ntax=2 nchar=4;\n",
+            "format datatype=standard gap=- missing=?;\n",
+            "matrix\n",
+            "'Taxon [A]' 01[comment]10\n",
+            "Taxon_B 1(0 1){12}?\n",
+            ";\n",
+            "end;\n",
+        ]
+        reader = NexusReader().read(lines)
+
+        assert reader.taxa_list == ["Taxon [A]", "Taxon_B"]
+        assert reader.datamatrix == [["0", "1", "1", "0"], ["1", ["0", "1"], ["1", "2"], "?"]]
+        assert reader.command_hash == {
+            "DIMENSIONS": {"NTAX": "2", "NCHAR": "4"},
+            "FORMAT": {"DATATYPE": "STANDARD", "GAP": "-", "MISSING": "?"},
+        }
+        assert reader.block_names == ["DATA"]
+
+    def test_matrix_end_on_row_line(self):
+        """Test a semicolon ending the matrix on the last row"""
+        from PfUtils import NexusReader
+
+        reader = NexusReader().read(["begin data;", "matrix A 01", "B 10;", "end;"])
+
+        assert reader.taxa_list == ["A", "B"]
+        assert reader.datamatrix == [["0", "1"], ["1", "0"]]
+
+    def test_other_blocks_ignored(self):
+        """Test that commands of other blocks are not collected"""
+        from PfUtils import NexusReader
+
+        reader = NexusReader().read(["begin mrbayes;", "lset rates=gamma;", "end;"])
+
+        assert reader.command_hash == {}
+        assert reader.block_names == ["MRBAYES"]
+
+    def test_loadfile_shares_rows(self, sample_nexus_file):
+        """Test that the row views of a loaded file share the matrix rows"""
+        from PfUtils import PhyloDatafile
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(sample_nexus_file)
+
+        assert datafile.file_text is None
+        assert datafile.data_hash["Taxon_B"] is datafile.datamatrix[1]
+        assert datafile.formatted_data_list[1] == ["Taxon_B", "1", "0", "1"]
+        assert list(datafile.formatted_data_list)[2] == ["Taxon_C", "0", "0", "1"]
+
+
+class TestFastaAndCompressedFiles:
+    """Tests for FASTA import and compressed data files"""
+
+    FASTA_TEXT = ">Taxon_A sample one\nACGT\nAC\n>Taxon_B\nACG-\nTT\n\n>Taxon_C\nAC(G T)T\nAA\n"
+
+    def test_fasta_wrapped_sequences(self, temp_dir):
+        """Test that wrapped FASTA sequences are joined per taxon"""
+        from PfUtils import PhyloDatafile
+
+        fasta_path = Path(temp_dir) / "test.fasta"
+        fasta_path.write_text(self.FASTA_TEXT)
+
+        datafile = PhyloDatafile()
+        assert datafile.loadfile(fasta_path) is True
+
+        assert datafile.file_type == "FASTA"
+        assert datafile.dataset_name == "TEST"
+        assert datafile.taxa_list == ["Taxon_A", "Taxon_B", "Taxon_C"]
+        assert datafile.datamatrix[0] == list("ACGTAC")
+        assert datafile.datamatrix[2] == ["A", "C", ["G", "T"], "T", "A", "A"]
+        assert datafile.n_taxa == 3
+        assert datafile.n_chars == 6
+
+    def test_fasta_by_content(self, temp_dir):
+        """Test FASTA detection by a leading sequence header"""
+        from PfUtils import PhyloDatafile
+
+        txt_path = Path(temp_dir) / "alignment.txt"
+        txt_path.write_text(self.FASTA_TEXT)
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(txt_path)
+
+        assert datafile.file_type == "FASTA"
+        assert len(datafile.taxa_list) == 3
+
+    def test_compressed_files(self, temp_dir):
+        """Test that compressed files are decompressed while parsing"""
+        import bz2
+        import gzip
+        import lzma
+
+        from PfUtils import PhyloDatafile
+
+        for module, suffix in ((gzip, ".gz"), (bz2, ".bz2"), (lzma, ".xz")):
+            compressed_path = Path(temp_dir) / f"test.fas{suffix}"
+            with module.open(compressed_path, "wt") as f:
+                f.write(self.FASTA_TEXT)
+
+            datafile = PhyloDatafile()
+            assert datafile.loadfile(compressed_path) is True
+
+            assert datafile.file_type == "FASTA"
+            assert datafile.dataset_name == "TEST"
+            assert datafile.datamatrix[1] == list("ACG-TT")
+
+    def test_compressed_nexus_by_content(self, temp_dir):
+        """Test type detection inside a compressed file"""
+        import gzip
+
+        from PfUtils import PhyloDatafile
+
+        compressed_path = Path(temp_dir) / "matrix.gz"
+        with gzip.open(compressed_path, "wt") as f:
+            f.write("#NEXUS\nbegin data;\ndimensions ntax=2 nchar=2;\nmatrix\nA 01\nB 10\n;\nend;")
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(compressed_path)
+
+        assert datafile.file_type == "Nexus"
+        assert datafile.datamatrix == [["0", "1"], ["1", "0"]]
+
+    def test_truncated_compressed_file(self, temp_dir):
+        """Test that a truncated compressed file fails to load"""
+        import gzip
+
+        from PfUtils import PhyloDatafile
+
+        compressed_path = Path(temp_dir) / "test.fas.gz"
+        compressed_path.write_bytes(gzip.compress(self.FASTA_TEXT.encode() * 100)[:-20])
+
+        assert PhyloDatafile().loadfile(compressed_path) is False
+
+    def test_progress_callback(self, temp_dir, monkeypatch):
+        """Test that read progress is reported up to the file size"""
+        import PfUtils
+        from PfUtils import PhyloDatafile
+
+        monkeypatch.setattr(PfUtils, "PROGRESS_REPORT_SIZE", 16)
+        fasta_path = Path(temp_dir) / "test.fasta"
+        fasta_path.write_text(self.FASTA_TEXT * 20)
+        reports = []
+
+        PhyloDatafile().loadfile(fasta_path, lambda done, total: reports.append((done, total)))
+
+        file_size = fasta_path.stat().st_size
+        assert reports[0] == (0, file_size)
+        assert reports[-1] == (file_size, file_size)
+        assert len(reports) > 2
+        assert [done for done, _ in reports] == sorted(done for done, _ in reports)
+
+    def test_validate_compressed_extension(self, temp_dir, caplog):
+        """Test that compressed FASTA files pass extension validation"""
+        from PfUtils import validate_phylo_data_file
+
+        compressed_path = Path(temp_dir) / "test.fasta.xz"
+        compressed_path.write_bytes(b"")
+
+        with caplog.at_level("WARNING"):
+            validate_phylo_data_file(str(compressed_path))
+
+        assert "non-standard extension" not in caplog.text
+
+
+class TestParseCache:
+    """Tests for the on-disk parse cache"""
+
+    NEXUS_TEXT = (
+        "#NEXUS\nbegin data;\ndimensions ntax=2 nchar=3;\nformat datatype=standard;\n"
+        "matrix\nA 0{01}1\nB 10?\n;\nend;"
+    )
+
+    def test_repeat_load_hits(self, temp_dir, parse_cache):
+        """Test that a second load is answered from the cache"""
+        from PfUtils import PhyloDatafile
+
+        nex_path = Path(temp_dir) / "test.nex"
+        nex_path.write_text(self.NEXUS_TEXT)
+
+        parsed = PhyloDatafile()
+        assert parsed.loadfile(nex_path, cache=parse_cache) is True
+        cached = PhyloDatafile()
+        assert cached.loadfile(nex_path, cache=parse_cache) is True
+
+        assert parse_cache.stats()["hits"] == 1
+        assert parse_cache.stats()["misses"] == 1
+        assert cached.file_type == "Nexus"
+        assert cached.taxa_list == parsed.taxa_list
+        assert cached.datamatrix == [["0", ["0", "1"], "1"], ["1", "0", "?"]]
+        assert cached.nexus_command_hash == parsed.nexus_command_hash
+        assert (cached.n_taxa, cached.n_chars) == (2, 3)
+        assert cached.formatted_data_list[1] == ["B", "1", "0", "?"]
+
+    def test_changed_file_misses(self, temp_dir, parse_cache):
+        """Test that a modified file is parsed again"""
+        import os
+
+        from PfUtils import PhyloDatafile
+
+        nex_path = Path(temp_dir) / "test.nex"
+        nex_path.write_text(self.NEXUS_TEXT)
+        PhyloDatafile().loadfile(nex_path, cache=parse_cache)
+        nex_path.write_text(self.NEXUS_TEXT.replace("B 10?", "B 111"))
+        os.utime(nex_path, ns=(0, 10**9))
+
+        datafile = PhyloDatafile()
+        datafile.loadfile(nex_path, cache=parse_cache)
+
+        assert parse_cache.stats()["misses"] == 2
+        assert datafile.datamatrix[1] == ["1", "1", "1"]
+
+    def test_copy_found_by_content(self, temp_dir, parse_cache):
+        """Test that a copy of a cached file at another path hits"""
+        from PfUtils import PhyloDatafile
+
+        first_path = Path(temp_dir) / "first.nex"
+        first_path.write_text(self.NEXUS_TEXT)
+        second_path = Path(temp_dir) / "second.nex"
+        second_path.write_text(self.NEXUS_TEXT)
+
+        PhyloDatafile().loadfile(first_path, cache=parse_cache)
+        datafile = PhyloDatafile()
+        datafile.loadfile(second_path, cache=parse_cache)
+
+        assert parse_cache.stats()["hits"] == 1
+        assert datafile.dataset_name == "SECOND"
+
+    def test_least_recently_used_evicted(self, temp_dir, parse_cache):
+        """Test that entries beyond max_size are evicted oldest first"""
+        import os
+
+        from PfUtils import PhyloDatafile
+
+        paths = []
+        for i in range(3):
+            path = Path(temp_dir) / f"test{i}.nex"
+            path.write_text(self.NEXUS_TEXT.replace("B 10?", f"B 10{i}"))
+            PhyloDatafile().loadfile(path, cache=parse_cache)
+            paths.append(path)
+        entries = sorted(parse_cache.directory.glob("*.pfpc"))
+        for age, entry in enumerate(entries):
+            os.utime(entry, ns=(age * 10**9, age * 10**9))
+        parse_cache.max_size = sum(entry.stat().st_size for entry in entries[1:])
+
+        parse_cache.evict()
+
+        assert parse_cache.stats()["entries"] == 2
+        assert parse_cache.stats()["evictions"] == 1
+        assert not entries[0].exists()
+
+    def test_corrupt_entry_discarded(self, temp_dir, parse_cache):
+        """Test that an unreadable entry is deleted and the file parsed"""
+        from PfUtils import PhyloDatafile
+
+        nex_path = Path(temp_dir) / "test.nex"
+        nex_path.write_text(self.NEXUS_TEXT)
+        PhyloDatafile().loadfile(nex_path, cache=parse_cache)
+        entry = next(parse_cache.directory.glob("*.pfpc"))
+        entry.write_bytes(b"PFPC garbage")
+
+        datafile = PhyloDatafile()
+        assert datafile.loadfile(nex_path, cache=parse_cache) is True
+
+        assert datafile.datamatrix[1] == ["1", "0", "?"]
+        assert parse_cache.stats()["hits"] == 0
+
+    def test_tnt_not_cached(self, sample_tnt_file, parse_cache):
+        """Test that TNT files, which keep their text, are not cached"""
+        from PfUtils import PhyloDatafile
+
+        PhyloDatafile().loadfile(sample_tnt_file, cache=parse_cache)
+
+        assert parse_cache.stats()["entries"] == 0
+
+
 class TestPhyloTreefile:
     """Tests for PhyloTreefile class"""
 
@@ -1337,6 +1751,363 @@ end;
         assert result is not False
 
 
+class TestTreeFileIndex:
+    """Tests for the memory-mapped tree file index"""
+
+    NEXUS_TREES = """#NEXUS
+[ID: 42]
+begin trees;
+   [Param: tree]
+   translate
+      1 TaxonA,
+      2 TaxonB,
+      3 TaxonC;
+   tree gen.0 = [&U] ((1:0.1,2:0.2):0.1,3:0.3);
+   tree gen.100 = [&U] ((1:0.1,3:0.2):0.1,
+      2:0.3);
+   tree gen.200 = [&U] (1:0.1,(2:0.2,3:0.3):0.1);
+end;
+"""
+
+    def test_nexus_matches_readtree(self, temp_dir):
+        """Test that indexed trees equal the trees of readtree()"""
+        from PfUtils import PhyloTreefile, TreeFileIndex
+
+        tree_path = Path(temp_dir) / "run.nex.t"
+        tree_path.write_text(self.NEXUS_TREES)
+        treefile = PhyloTreefile()
+        treefile.readtree(tree_path, "Nexus")
+
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 3
+            assert list(trees) == treefile.tree_list
+            assert trees[-1] == "[&U] (1:0.1,(2:0.2,3:0.3):0.1)"
+            assert trees[1:] == treefile.tree_list[1:]
+            assert trees.tree_names == ["gen.0", "gen.100", "gen.200"]
+            assert trees.taxa_hash == {"1": "TaxonA", "2": "TaxonB", "3": "TaxonC"}
+
+    def test_saved_index_reused(self, temp_dir, monkeypatch):
+        """Test that a saved index is used while the file is unchanged"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "run.nex.t"
+        tree_path.write_text(self.NEXUS_TREES)
+        TreeFileIndex(tree_path, "Nexus").close()
+
+        def fail_scan(self):
+            raise AssertionError("index rebuilt")
+
+        monkeypatch.setattr(TreeFileIndex, "_scan", fail_scan)
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 3
+            assert trees.taxa_list == ["TaxonA", "TaxonB", "TaxonC"]
+
+    def test_index_replaced_whole(self, temp_dir, monkeypatch):
+        """Test that the index is written to a temporary file and then moved in place"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "run.nex.t"
+        tree_path.write_text(self.NEXUS_TREES)
+        TreeFileIndex(tree_path, "Nexus").close()
+        index_path = Path(temp_dir) / "run.nex.t.pfidx"
+        saved_index = index_path.read_bytes()
+
+        def fail_replace(self, target):
+            raise OSError("disk full")
+
+        tree_path.write_text(self.NEXUS_TREES + "\n")
+        monkeypatch.setattr(Path, "replace", fail_replace)
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 3
+        monkeypatch.undo()
+        # the failed save left the previous index whole and no temporary file
+        assert index_path.read_bytes() == saved_index
+        assert sorted(path.name for path in Path(temp_dir).iterdir()) == [
+            "run.nex.t",
+            "run.nex.t.pfidx",
+        ]
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 3
+
+    def test_changed_file_reindexed(self, temp_dir):
+        """Test that a saved index is resumed when the file grows"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "run.nex.t"
+        # the last tree is still being written
+        partial_text = self.NEXUS_TREES[: self.NEXUS_TREES.index("(2:0.2,3:0.3)")]
+        tree_path.write_text(partial_text)
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 2
+
+        tree_path.write_text(self.NEXUS_TREES)
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 3
+
+    def test_refresh_appended_trees(self, temp_dir):
+        """Test that refresh() indexes only complete trees appended to the file"""
+        from PfUtils import PhyloTreefile, TreeFileIndex
+
+        tree_path = Path(temp_dir) / "run.nex.t"
+        split_at = self.NEXUS_TREES.index("tree gen.100")
+        partial_at = self.NEXUS_TREES.index("2:0.3);")
+        tree_path.write_text(self.NEXUS_TREES[:split_at])
+        with TreeFileIndex(tree_path, "Nexus") as trees:
+            assert len(trees) == 1
+            with tree_path.open("a") as f:
+                f.write(self.NEXUS_TREES[split_at:partial_at])
+            assert trees.refresh() == 0
+            with tree_path.open("a") as f:
+                f.write(self.NEXUS_TREES[partial_at:])
+            assert trees.refresh() == 2
+            assert trees.refresh() == 0
+
+            treefile = PhyloTreefile()
+            treefile.readtree(tree_path, "Nexus")
+            assert list(trees) == treefile.tree_list
+            assert trees.tree_names == ["gen.0", "gen.100", "gen.200"]
+
+    def test_refresh_rewritten_file(self, temp_dir):
+        """Test that refresh() indexes a rewritten file again from the start"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "data.phy.boottrees"
+        tree_path.write_text("((A,B),C);\n((A,C)")
+        with TreeFileIndex(tree_path, "treefile") as trees:
+            assert list(trees) == ["((A,B),C)"]
+            tree_path.write_text("((B,C),A);\n((A,C),B);\n(A,(B,C));\n")
+            assert trees.refresh() == 3
+            assert list(trees) == ["((B,C),A)", "((A,C),B)", "(A,(B,C))"]
+
+    def test_refresh_truncated_file(self, temp_dir):
+        """Test that a file rewritten with no trees yet is reported as rewritten"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "tmp.tre"
+        tree_path.write_text("tread 'trees'\n" + "(0 (1 2 ))*\n" * 4 + "(0 (1 2 ));\n")
+        with TreeFileIndex(tree_path, "tre") as trees:
+            assert len(trees) == 5
+            tree_path.write_text("tread 'trees'\n")
+            assert trees.refresh() == 0
+            assert len(trees) == 0
+            assert trees.generation == 1
+            with tree_path.open("a") as f:
+                f.write("(2 (1 0 ))*\n")
+            assert trees.refresh() == 1
+            assert trees.generation == 1
+            assert list(trees) == ["(2,(1,0))"]
+
+    def test_treefile(self, temp_dir):
+        """Test one Newick tree per line, as in IQ-TREE bootstrap trees"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "data.phy.boottrees"
+        tree_path.write_text("((A,B),C);\n((A,C),B);\n\n")
+
+        with TreeFileIndex(tree_path, "treefile") as trees:
+            assert list(trees) == ["((A,B),C)", "((A,C),B)"]
+
+    def test_empty_file(self, temp_dir):
+        """Test that an empty tree file has no trees"""
+        from PfUtils import TreeFileIndex
+
+        tree_path = Path(temp_dir) / "tmp.tre"
+        tree_path.write_text("")
+
+        assert len(TreeFileIndex(tree_path, "tre")) == 0
+
+
+class TestParameterFileReader:
+    """Tests for the incremental MrBayes parameter file reader"""
+
+    PARAMETERS = (
+        "[ID: 42]\n"
+        "Gen\tLnL\tLnPr\tTL\n"
+        "1\t-1203.5\t2.3\t1.1\n"
+        "100\t-1150.25\t2.5\t1.3\n"
+        "200\t-1148.0\t2.6\t1.2\n"
+    )
+
+    def test_refresh_reads_complete_lines(self, temp_dir):
+        """Test that samples are read as they are appended, line by line"""
+        from PfUtils import ParameterFileReader
+
+        p_path = Path(temp_dir) / "run.nex.run1.p"
+        partial_at = self.PARAMETERS.index("-1150.25")
+        p_path.write_text(self.PARAMETERS[:partial_at])
+        trace = ParameterFileReader(p_path)
+        assert trace.header == ["Gen", "LnL", "LnPr", "TL"]
+        assert len(trace) == 1
+
+        with p_path.open("a") as f:
+            f.write(self.PARAMETERS[partial_at:])
+        assert trace.refresh() == 2
+        assert trace.refresh() == 0
+        assert list(trace.columns["Gen"]) == [1, 100, 200]
+        assert list(trace.columns["LnL"]) == [-1203.5, -1150.25, -1148.0]
+
+    def test_file_created_later(self, temp_dir):
+        """Test following a parameter file that does not exist yet"""
+        from PfUtils import ParameterFileReader
+
+        p_path = Path(temp_dir) / "run.nex.run1.p"
+        trace = ParameterFileReader(p_path)
+        assert len(trace) == 0
+
+        p_path.write_text(self.PARAMETERS)
+        assert trace.refresh() == 3
+        assert trace.columns["TL"][-1] == 1.2
+
+
+class TestNewickTree:
+    """Tests for the array-based Newick parser and writer"""
+
+    @staticmethod
+    def write_with_phylo(tree):
+        from io import StringIO
+
+        from Bio import Phylo
+
+        handle = StringIO()
+        Phylo.write(tree, handle, "newick")
+        return handle.getvalue().rstrip("\n")
+
+    def test_parse_arrays(self):
+        """Test the parent, child and label arrays of a parsed tree"""
+        from PfUtils import NewickTree
+
+        tree = NewickTree.parse("[&U] ((1:0.1,2:0.2)0.95:0.05,3:0.3);")
+
+        assert len(tree) == 5
+        assert list(tree.parent) == [-1, 0, 1, 1, 0]
+        assert list(tree.child_nodes(0)) == [1, 4]
+        assert list(tree.child_nodes(1)) == [2, 3]
+        assert list(tree.terminals()) == [2, 3, 4]
+        assert tree.is_terminal(4) and not tree.is_terminal(1)
+        assert tree.names == [None, None, "1", "2", "3"]
+        assert tree.branch_lengths[3] == 0.2
+        assert math.isnan(tree.branch_lengths[0])
+        assert tree.support[1] == 0.95
+        assert tree.comments[0] == "&U"
+
+    def test_matches_phylo(self):
+        """Test that parsing and writing agree with Bio.Phylo"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import NewickTree
+
+        for newick_text in [
+            "((A,B),C);",
+            "(('a b':1e-3,'it''s'),(C , D)x:2)r;",
+            "((A[&c=1]:0.1,B)[&prob=1.0]:0.2,(,));",
+            "A;",
+        ]:
+            expected = self.write_with_phylo(Phylo.read(StringIO(newick_text), "newick"))
+            tree = NewickTree.parse(newick_text)
+            assert tree.to_newick() == expected
+            assert self.write_with_phylo(tree.to_phylo()) == expected
+
+    def test_large_tree(self):
+        """Test a tree long enough to be parsed with array operations"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import NEWICK_ARRAY_PARSE_SIZE, NewickTree
+
+        subtrees = [f"T{i}:0.{i + 1}" for i in range(300)]
+        while len(subtrees) > 1:
+            subtrees = [
+                f"({subtrees[i]},{subtrees[i + 1]})90:0.5" if i + 1 < len(subtrees) else subtrees[i]
+                for i in range(0, len(subtrees), 2)
+            ]
+        newick_text = f"[&U] {subtrees[0]};"
+        assert len(newick_text) > NEWICK_ARRAY_PARSE_SIZE
+
+        tree = NewickTree.parse(newick_text)
+        assert len(tree.terminals()) == 300
+        assert tree.comments[0] == "&U"
+        assert tree.to_newick() == self.write_with_phylo(
+            Phylo.read(StringIO(newick_text), "newick")
+        )
+
+    def test_translate(self):
+        """Test renaming taxa by a translate table or by taxon numbers"""
+        from PfUtils import NewickTree
+
+        tree = NewickTree.parse("((1,2),3,X);")
+        tree.translate({"1": "TaxonA", "3": "TaxonC"})
+        assert tree.names[2:] == ["TaxonA", "2", "TaxonC", "X"]
+
+        tree = NewickTree.parse("((1,2),3,X);")
+        tree.translate(["TaxonA", "TaxonB", "TaxonC"])
+        assert tree.to_newick() == "((TaxonA:0,TaxonB:0):0,TaxonC:0,X:0):0;"
+
+    def test_unbalanced_parentheses(self):
+        """Test that malformed trees raise DataParsingError"""
+        from PfUtils import DataParsingError, NewickTree
+
+        for newick_text in ["((A,B),C;", "(A,B));", "A,B;", "(" * 1000 + "A);"]:
+            with pytest.raises(DataParsingError):
+                NewickTree.parse(newick_text)
+
+
+class TestTntTrees:
+    """Tests for reading TNT tread tree files"""
+
+    TREAD_TEXT = (
+        "tread 'trees from mult'\n"
+        "(0 (1 2 ))*\n"
+        "(0 (2 (1\n"
+        "  3 )))*\n"
+        "(Taxon_A (Taxon_B Taxon_C ));\n"
+        "proc-;\n"
+    )
+
+    def test_read_tnt_trees(self):
+        """Test taxon numbers, names and trees split over lines"""
+        from PfUtils import read_tnt_trees
+
+        trees = list(read_tnt_trees(self.TREAD_TEXT))
+
+        assert [tree.to_newick(plain=True) for tree in trees] == [
+            "(0,(1,2));",
+            "(0,(2,(1,3)));",
+            "(Taxon_A,(Taxon_B,Taxon_C));",
+        ]
+        assert list(trees[1].parent) == [-1, 0, 0, 2, 2, 4, 4]
+
+    def test_readtree_incomplete_tree(self, temp_dir):
+        """Test that readtree() keeps the trees before an incomplete one"""
+        from PfUtils import PhyloTreefile
+
+        tre_path = Path(temp_dir) / "tmp.tre"
+        tre_path.write_text("tread\n(0 (1 2 ))*\n(0 (1 2 )*\n;\nproc-;\n")
+
+        treefile = PhyloTreefile()
+        assert treefile.readtree(tre_path, "tre")
+        assert treefile.tree_list == ["(0,(1,2))"]
+
+    def test_tree_file_index(self, temp_dir):
+        """Test indexing TNT trees, including a tree still being written"""
+        from PfUtils import TreeFileIndex
+
+        tre_path = Path(temp_dir) / "tmp.tre"
+        partial_at = self.TREAD_TEXT.index("  3 )))")
+        tre_path.write_text(self.TREAD_TEXT[:partial_at])
+        with TreeFileIndex(tre_path, "tre") as trees:
+            assert list(trees) == ["(0,(1,2))"]
+            with tre_path.open("a") as f:
+                f.write(self.TREAD_TEXT[partial_at:])
+            assert trees.refresh() == 2
+            assert trees[1] == "(0,(2,(1,3)))"
+            tree = trees.tree(2)
+            tree.translate(["A", "B", "C"], first_number=0)
+            assert tree.names[tree.terminals()[0]] == "Taxon_A"
+
+
 class TestPhyloMatrix:
     """Tests for PhyloMatrix class"""
 
@@ -1543,6 +2314,420 @@ class TestFitchAlgorithm:
         for node in tree.find_clades():
             assert hasattr(node, "character_states")
 
+    def test_reconstruct_ancestral_states_changes(self):
+        """Test inferred states and changes on a hand-checked tree"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import reconstruct_ancestral_states
+
+        tree = Phylo.read(StringIO("((A,B),(C,(D,E)));"), "newick")
+        taxa_list = ["A", "B", "C", "D", "E"]
+        datamatrix = [
+            ["0", "1", "?", ["0", "1"]],
+            ["0", "0", "1", "1"],
+            ["1", "1", "1", "0"],
+            ["1", "0", "0", "0"],
+            ["1", "?", "0", "2"],
+        ]
+
+        reconstruct_ancestral_states(tree, datamatrix, taxa_list)
+
+        root = tree.root
+        ab, cde = root.clades
+        de = cde.clades[1]
+        a, e = ab.clades[0], de.clades[1]
+        assert root.character_states == ["0", "0", "1", "0"]
+        assert root.changed_characters == []
+        assert ab.changed_characters == [3]
+        assert a.character_states == ["0", "1", "?", "1"]
+        assert a.changed_characters == [1]
+        assert cde.changed_characters == [0]
+        assert cde.clades[0].changed_characters == [1]
+        assert de.changed_characters == [2]
+        assert e.character_states == ["1", "?", "0", "2"]
+        assert e.changed_characters == [3]
+        # the tree length is the Fitch score of the matrix
+        assert sum(len(clade.changed_characters) for clade in tree.find_clades()) == 6
+
+    def test_update_ancestral_states(self):
+        """Test that cell edits give the states of a new reconstruction"""
+        import copy
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import reconstruct_ancestral_states, update_ancestral_states
+
+        tree = Phylo.read(StringIO("((A,B),(C,(D,E,F)));"), "newick")
+        taxa_list = ["A", "B", "C", "D", "E", "F"]
+        datamatrix = [
+            ["0", "1", "?"],
+            ["0", "0", "1"],
+            ["1", "1", "1"],
+            ["1", "0", "0"],
+            ["1", "?", "0"],
+            ["0", "1", ["0", "1"]],
+        ]
+        reconstruction = reconstruct_ancestral_states(tree, datamatrix, taxa_list)
+
+        # a known state, a new state, a missing state and a polymorphic cell
+        for row, col, value in [(0, 0, "1"), (3, 1, "2"), (2, 0, "?"), (1, 2, ["0", "1"])]:
+            datamatrix[row][col] = value
+            update_ancestral_states(tree, reconstruction, row, col, value)
+            expected = copy.deepcopy(tree)
+            reconstruct_ancestral_states(expected, datamatrix, taxa_list)
+            for clade, expected_clade in zip(tree.find_clades(), expected.find_clades()):
+                assert clade.character_states == expected_clade.character_states
+                assert clade.changed_characters == expected_clade.changed_characters
+
+    def test_reconstruct_ancestral_states_cached(self, ancestral_state_cache):
+        """Test that a tree of a cached topology takes the cached states"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import matrix_content_hash, reconstruct_ancestral_states
+
+        taxa_list = ["A", "B", "C", "D"]
+        datamatrix = [["0", "1"], ["0", "?"], ["1", "1"], ["1", "0"]]
+        matrix_hash = matrix_content_hash(taxa_list, None, datamatrix)
+        tree = Phylo.read(StringIO("((A,B),(C,D));"), "newick")
+        reconstruction = reconstruct_ancestral_states(
+            tree, datamatrix, taxa_list, cache=ancestral_state_cache, matrix_hash=matrix_hash
+        )
+
+        # the same topology with its children written in another order
+        reordered = Phylo.read(StringIO("((D,C),(B,A));"), "newick")
+        cached = reconstruct_ancestral_states(
+            reordered, datamatrix, taxa_list, cache=ancestral_state_cache, matrix_hash=matrix_hash
+        )
+
+        assert cached is reconstruction
+        assert ancestral_state_cache.stats()["hits"] == 1
+        expected = Phylo.read(StringIO("((D,C),(B,A));"), "newick")
+        reconstruct_ancestral_states(expected, datamatrix, taxa_list)
+        for clade, expected_clade in zip(reordered.find_clades(), expected.find_clades()):
+            assert clade.character_states == expected_clade.character_states
+            assert clade.changed_characters == expected_clade.changed_characters
+
+        # another topology and another matrix are reconstructed
+        other = Phylo.read(StringIO("((A,C),(B,D));"), "newick")
+        reconstruct_ancestral_states(other, datamatrix, taxa_list, cache=ancestral_state_cache)
+        edited = [["1", "1"], ["0", "?"], ["1", "1"], ["1", "0"]]
+        reconstruct_ancestral_states(tree, edited, taxa_list, cache=ancestral_state_cache)
+        assert ancestral_state_cache.stats()["misses"] == 3
+        assert tree.root.character_states == ["1", "1"]
+
+    def test_ancestral_state_cache_eviction(self):
+        """Test that the least recently used entries go beyond max_size"""
+        from PfUtils import AncestralStateCache
+
+        cache = AncestralStateCache(max_size=100)
+        cache.store("a", "entry a", 60)
+        cache.store("b", "entry b", 30)
+        assert cache.lookup("a") == (True, "entry a")
+        cache.store("c", "entry c", 40)
+
+        assert cache.lookup("b") == (False, None)
+        assert cache.lookup("a") == (True, "entry a")
+        # an entry larger than max_size is still kept on its own
+        cache.store("d", "entry d", 200)
+        assert cache.stats()["entries"] == 1
+        assert cache.stats()["evictions"] == 3
+        assert cache.lookup("d") == (True, "entry d")
+
+    def test_reconstruct_ancestral_states_unknown_taxon(self):
+        """Test that a tree taxon missing from the matrix is reported"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import reconstruct_ancestral_states
+
+        tree = Phylo.read(StringIO("((A,B),C);"), "newick")
+        with pytest.raises(ValueError, match="C"):
+            reconstruct_ancestral_states(tree, [["0"], ["1"]], ["A", "B"])
+
+    def test_fitch_matrix(self):
+        """Test the state bitmasks of single, polymorphic and missing cells"""
+        from PfUtils import FitchMatrix
+
+        matrix = FitchMatrix([["1", "A", "?"], [["0", "2"], "-", "?"], ["2", "B"]])
+
+        assert matrix.bits.tolist() == [[2, 1, 0], [5, 3, 0], [4, 2, 0]]
+        assert matrix.missing.tolist() == [
+            [False, False, True],
+            [False, True, True],
+            [False, False, True],
+        ]
+        assert matrix.decode(matrix.bits[0]) == ["1", "A", "?"]
+        assert matrix.decode(matrix.bits[1] & -matrix.bits[1]) == ["0", "A", "?"]
+
+        # states are ranked again when one is added or no longer found
+        assert matrix.set_cell(0, 0, "3")
+        assert matrix.bits[:, 0].tolist() == [4, 3, 2]
+        assert not matrix.set_cell(2, 0, "0")
+        assert matrix.bits[:, 0].tolist() == [4, 3, 1]
+        assert matrix.set_cell(2, 2, "01")
+        assert matrix.bits[:, 2].tolist() == [1, 1, 1]
+        assert matrix.decode(matrix.bits[2]) == ["0", "B", "01"]
+
+
+class TestParsimonyScorer:
+    """Tests for scoring the parsimony length of trees"""
+
+    DATAMATRIX = [
+        ["0", "1", "?", ["0", "1"], "0"],
+        ["0", "0", "1", "1", "0"],
+        ["1", "1", "1", "0", "1"],
+        ["1", "0", "0", "0", "0"],
+        ["1", "?", "0", "2", "0"],
+    ]
+    TAXA_LIST = ["A", "B", "C", "D", "E"]
+
+    def test_score(self):
+        """Test that the length matches the changes of the reconstructed states"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import NewickTree, ParsimonyScorer, reconstruct_ancestral_states
+
+        scorer = ParsimonyScorer(self.DATAMATRIX, self.TAXA_LIST)
+        newick = "((A,B),(C,(D,E)));"
+        tree = Phylo.read(StringIO(newick), "newick")
+        reconstruct_ancestral_states(tree, self.DATAMATRIX, self.TAXA_LIST)
+
+        # the last character has a single taxon of state 1
+        assert scorer.n_informative == 4
+        assert scorer.constant_length == 1
+        assert scorer.weights.sum() == 4
+        assert scorer.score(NewickTree.parse(newick)) == 7
+        assert sum(len(clade.changed_characters) for clade in tree.find_clades()) == 7
+        assert scorer.score(NewickTree.parse("((A,D),(C,(B,E)));")) == 9
+
+    def test_score_many_states(self):
+        """Test the length of a character with more states than bits in a byte"""
+        from io import StringIO
+
+        from Bio import Phylo
+
+        from PfUtils import NewickTree, ParsimonyScorer, reconstruct_ancestral_states
+
+        taxa_list = [f"t{taxon}" for taxon in range(9)]
+        states = ["0", "5", "9", "10", "7", ["4", "3"], "9", "2", ["8"]]
+        datamatrix = [[state] for state in states]
+        newick = "((((t8,t4),t1),((t0,t6),t2)),((t7,t3),t5));"
+        tree = Phylo.read(StringIO(newick), "newick")
+        reconstruct_ancestral_states(tree, datamatrix, taxa_list)
+
+        scorer = ParsimonyScorer(datamatrix, taxa_list)
+        assert scorer.bits.dtype.itemsize > 1
+        assert scorer.score(NewickTree.parse(newick)) == 7
+        assert sum(len(clade.changed_characters) for clade in tree.find_clades()) == 7
+
+    def test_score_unknown_taxon(self):
+        """Test that a leaf missing from the matrix is reported"""
+        from PfUtils import NewickTree, ParsimonyScorer
+
+        scorer = ParsimonyScorer(self.DATAMATRIX, self.TAXA_LIST)
+        with pytest.raises(ValueError, match="F"):
+            scorer.score(NewickTree.parse("((A,B),(C,(D,F)));"))
+
+    def test_score_file(self, temp_dir, monkeypatch):
+        """Test scoring TNT trees in this process and in worker processes"""
+        # the polytomy (2 3 4) is scored as (2 (3 4))
+        import PfUtils
+        from PfUtils import ParsimonyScorer, TreeFileIndex
+
+        tre_path = Path(temp_dir) / "tmp.tre"
+        tre_path.write_text(
+            "tread 'trees'\n((0 1 )(2 (3 4 )))*\n((0 3 )(2 (1 4 )))*\n(0 (1 (2 3 4 )));\nproc-;\n"
+        )
+        scorer = ParsimonyScorer(self.DATAMATRIX, self.TAXA_LIST)
+
+        with TreeFileIndex(tre_path, "tre") as trees:
+            assert scorer.score_file(trees).tolist() == [7, 9, 7]
+            assert scorer.score_file(trees, start=2).tolist() == [7]
+            monkeypatch.setattr(PfUtils, "PARSIMONY_POOL_MIN_TREES", 1)
+            monkeypatch.setattr(PfUtils, "PARSIMONY_CHUNK_TREES", 2)
+            assert scorer.score_file(trees, processes=2).tolist() == [7, 9, 7]
+
+
+class TestDatamatrixValidation:
+    """Tests for whole-matrix validation"""
+
+    def test_reports_all_problems(self):
+        """Test that every problem is reported with its coordinates"""
+        from PfUtils import validate_datamatrix
+
+        report = validate_datamatrix(
+            ["TaxonA", "taxona ", "TaxonC", ""],
+            [["0", "1", ["0", "1 "]], ["0", "?"], ["?", "?", "?"], ["0", "x y", "1"]],
+        )
+
+        assert not report["valid"]
+        assert [(p["problem"], p["row"], p["column"]) for p in report["errors"]] == [
+            ("duplicate_name", 1, None),
+            ("empty_name", 3, None),
+            ("ragged_row", 1, None),
+            ("invalid_state", 0, 2),
+            ("invalid_state", 3, 1),
+        ]
+        assert [(p["problem"], p["row"], p["column"]) for p in report["warnings"]] == [
+            ("missing_taxon", 2, None),
+        ]
+
+    def test_valid_states_and_problem_limit(self):
+        """Test checking against valid states, beyond the encodable alphabet"""
+        from PfUtils import validate_datamatrix
+
+        matrix = [[str(i) for i in range(300)], ["0", 1] * 150]
+        report = validate_datamatrix(
+            ["TaxonA", "TaxonB"], matrix, valid_states={"0", "1"}, max_cell_problems=3
+        )
+
+        assert [p["column"] for p in report["errors"]] == [2, 3, 4, None]
+        assert report["errors"][-1]["message"] == "... and 445 more invalid_state cells"
+
+    def test_validate_complete_datamatrix(self):
+        """Test that errors are raised together and warnings returned"""
+        from PfUtils import validate_complete_datamatrix
+
+        result = validate_complete_datamatrix(["T1", "T2"], [["0", "?"], ["1", "?"]])
+        assert result == {
+            "valid": True,
+            "n_taxa": 2,
+            "n_characters": 2,
+            "warnings": ["Character 2 is missing in every taxon"],
+        }
+        with pytest.raises(DataParsingError, match="(?s)position 2.*has 1 characters"):
+            validate_complete_datamatrix(["T1", "t1"], [["0", "1"], ["1"]])
+
+
+class TestDatamatrixEncoding:
+    """Tests for compact datamatrix encoding"""
+
+    def test_round_trip(self):
+        """Test encode/decode round trip with polymorphism and ragged rows"""
+        from PfUtils import decode_datamatrix, encode_datamatrix
+
+        matrix = [["A", "C", ["A", "G"]], ["T", "-"], [], ["?", "N", "A"]]
+        blob, alphabet, poly = encode_datamatrix(matrix)
+
+        assert alphabet == ["A", "C", "T", "-", "?", "N"]
+        assert poly == [(0, 2, ["A", "G"])]
+        assert decode_datamatrix(blob, alphabet, poly) == matrix
+
+    def test_multi_character_states(self):
+        """Test rows whose cell lengths only add up to the row length"""
+        from PfUtils import decode_datamatrix, encode_datamatrix
+
+        matrix = [["AB", "", "C"], ["10", "1", ["0", "1"]], ["\0", "ÿ"]]
+        blob, alphabet, poly = encode_datamatrix(matrix)
+
+        assert alphabet == ["AB", "", "C", "10", "1", "\0", "ÿ"]
+        assert decode_datamatrix(blob, alphabet, poly) == matrix
+
+    def test_blob_size_scales_with_cells(self):
+        """Test that the blob holds one byte per cell"""
+        from PfUtils import DATAMATRIX_BLOB_HEADER, encode_datamatrix
+
+        matrix = [["0", "1"] * 50 for _ in range(20)]
+        blob, _, _ = encode_datamatrix(matrix)
+        assert len(blob) == DATAMATRIX_BLOB_HEADER.size + 20 * 100
+
+    def test_empty_matrix(self):
+        """Test encoding an empty matrix"""
+        from PfUtils import decode_datamatrix, encode_datamatrix
+
+        blob, alphabet, poly = encode_datamatrix([])
+        assert decode_datamatrix(blob, alphabet, poly) == []
+
+    def test_too_many_states(self):
+        """Test that more than 254 distinct states is rejected"""
+        from PfUtils import encode_datamatrix
+
+        with pytest.raises(DataParsingError):
+            encode_datamatrix([[str(i) for i in range(255)]])
+
+    def test_unsupported_cell(self):
+        """Test that non-string cells are rejected"""
+        from PfUtils import encode_datamatrix
+
+        with pytest.raises(DataParsingError):
+            encode_datamatrix([["0", 1]])
+
+    def test_bad_version(self):
+        """Test decoding a blob with an unknown version"""
+        from PfUtils import decode_datamatrix, encode_datamatrix
+
+        blob, alphabet, poly = encode_datamatrix([["0"]])
+        with pytest.raises(DataParsingError):
+            decode_datamatrix(b"\x09" + blob[1:], alphabet, poly)
+
+    def test_iter_decoded_rows(self):
+        """Test decoding row by row, for character and multi-character states"""
+        from PfUtils import decode_datamatrix, encode_datamatrix, iter_decoded_rows
+
+        for matrix in (
+            [["A", "C", ["A", "G"]], ["T", "-"], [], ["?", "N", "A"]],
+            [["AB", "", "C"], ["10", "1", ["0", "1"]]],
+        ):
+            blob, alphabet, poly = encode_datamatrix(matrix)
+            rows = iter_decoded_rows(blob, alphabet, poly)
+            assert list(rows) == decode_datamatrix(blob, alphabet, poly) == matrix
+
+
+class TestMatrixWriters:
+    """Tests for the streaming character matrix writers"""
+
+    TAXA = ["Taxon_A", "Taxon B"]
+    MATRIX = [["0", ["0", "1"], "?"], ["1", "-", "1"]]
+
+    def _write(self, writer_class, **kwargs):
+        from io import StringIO
+
+        output = StringIO()
+        writer_class(output, **kwargs).write(self.TAXA, iter(self.MATRIX), 3)
+        return output.getvalue()
+
+    def test_nexus_writer(self):
+        """Test quoting names and reading the written file back"""
+        from PfUtils import NexusReader, NexusWriter
+
+        text = self._write(NexusWriter)
+
+        assert "dimensions ntax=2 nchar=3;" in text
+        assert "Taxon_A 0(0 1)?\n'Taxon B' 1-1\n;\nend;\n" in text
+        reader = NexusReader().read(text.splitlines(keepends=True))
+        assert reader.taxa_list == self.TAXA
+        assert reader.datamatrix == self.MATRIX
+
+    def test_tnt_writer(self, temp_dir):
+        """Test that a written TNT file loads with the same cells"""
+        from PfUtils import PhyloDatafile, TntWriter
+
+        text = self._write(TntWriter, title="Test")
+        assert text.startswith("xread\n'Test'\n3 2\n")
+        assert "Taxon_A 0[0 1]?\n" in text
+
+        tnt_path = Path(temp_dir) / "test.tnt"
+        tnt_path.write_text(text)
+        datafile = PhyloDatafile()
+        assert datafile.loadfile(str(tnt_path))
+        assert datafile.taxa_list == ["Taxon_A", "Taxon_B"]
+        assert datafile.datamatrix == self.MATRIX
+
+    def test_phylip_writer(self):
+        """Test the Phylip header and custom polymorphism brackets"""
+        from PfUtils import PhylipWriter
+
+        text = self._write(PhylipWriter, parens=("{", "}"), separator="")
+        assert text == "2 3\nTaxon_A0{01}?\nTaxon B1-1\n"
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])